@@ -103,3 +103,44 @@ def migrate() -> None:
 
     raise SystemExit(1 if failures else 0)
 
+
+
+def process_statements() -> None:
+    """Process statements, parsing files in parallel worker processes.
+
+    Usage:
+      - poetry run process-statements                        -> all unprocessed statements
+      - poetry run process-statements <id...>                -> the given statements
+      - poetry run process-statements --workers <n> [id...]  -> limit worker processes
+    """
+    from server.services.batch_processing import process_statements_batch
+    from server.services.database import get_db
+
+    args = sys.argv[1:]
+    max_workers: int | None = None
+
+    if args[:1] == ["--workers"]:
+        if len(args) < 2 or not args[1].isdigit() or int(args[1]) < 1:
+            raise SystemExit("--workers expects a positive integer")
+        max_workers = int(args[1])
+        args = args[2:]
+
+    db = get_db("main")
+    try:
+        results = process_statements_batch(args or None, db, max_workers=max_workers)
+    finally:
+        db.close()
+
+    for item in results["successful_statements"]:
+        print(
+            f"ok   {item['statement_id']} {item['filename']}: "
+            f"{item['transactions_created']} created, {item['duplicates_skipped']} duplicates"
+        )
+    for item in results["failed_statements"]:
+        print(f"fail {item['statement_id']} {item['filename'] or '-'}: {item['error']}")
+
+    print(
+        f"{results['successful_count']}/{results['total_statements']} statements processed, "
+        f"{results['transactions_created']} transactions created"
+    )
+    raise SystemExit(1 if results["failed_count"] else 0)
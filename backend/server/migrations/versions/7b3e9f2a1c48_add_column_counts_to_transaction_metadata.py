@@ -0,0 +1,31 @@
+"""add_column_counts_to_transaction_metadata
+
+Revision ID: 7b3e9f2a1c48
+Revises: 4c110656893e
+Create Date: 2025-10-20 09:12:03.418522
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e9f2a1c48'
+down_revision: Union[str, Sequence[str], None] = '4c110656893e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Per-column row counts; left NULL so the registry is rebuilt on first use
+    op.add_column('transaction_metadata', sa.Column('ingested_column_counts', sa.JSON(), nullable=True))
+    op.add_column('transaction_metadata', sa.Column('computed_column_counts', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('transaction_metadata', 'computed_column_counts')
+    op.drop_column('transaction_metadata', 'ingested_column_counts')
@@ -0,0 +1,34 @@
+"""add_rule_set_fingerprints
+
+Revision ID: b83d61f0c2e7
+Revises: f7c2a9d41e83
+Create Date: 2025-10-24 09:12:37.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b83d61f0c2e7'
+down_revision: Union[str, Sequence[str], None] = 'f7c2a9d41e83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'rule_set_fingerprints',
+        sa.Column('fingerprint', sa.String(length=32), nullable=False),
+        sa.Column('target_fingerprints', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('fingerprint', name=op.f('pk_rule_set_fingerprints'))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rule_set_fingerprints')
@@ -0,0 +1,29 @@
+"""add_currency_fields_to_transaction_metadata
+
+Revision ID: c81d5e0f3a27
+Revises: 7b3e9f2a1c48
+Create Date: 2025-10-20 14:37:51.902117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81d5e0f3a27'
+down_revision: Union[str, Sequence[str], None] = '7b3e9f2a1c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Left NULL so currency fields are classified on first use
+    op.add_column('transaction_metadata', sa.Column('currency_fields', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('transaction_metadata', 'currency_fields')
@@ -0,0 +1,55 @@
+"""add_report_rollups
+
+Revision ID: d4a82c19e6b5
+Revises: c81d5e0f3a27
+Create Date: 2025-10-21 10:05:12.518340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a82c19e6b5'
+down_revision: Union[str, Sequence[str], None] = 'c81d5e0f3a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'report_rollups',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('dimension', sa.String(length=255), nullable=False),
+        sa.Column('measure', sa.String(length=255), nullable=False),
+        sa.Column('date_field', sa.String(length=255), nullable=False),
+        sa.Column('currency_field', sa.String(length=255), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_report_rollups')),
+        sa.UniqueConstraint('dimension', 'measure', 'date_field', 'currency_field', name='uq_report_rollup_fields')
+    )
+    op.create_table(
+        'report_rollup_cells',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('rollup_id', sa.String(length=64), nullable=False),
+        sa.Column('day', sa.String(length=10), nullable=False),
+        sa.Column('label', sa.Text(), nullable=False),
+        sa.Column('currency', sa.String(length=64), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('value_sum', sa.Float(), nullable=False),
+        sa.Column('value_min', sa.Float(), nullable=True),
+        sa.Column('value_max', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['rollup_id'], ['report_rollups.id'], name=op.f('fk_report_rollup_cells_rollup_id_report_rollups'), ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_report_rollup_cells')),
+        sa.UniqueConstraint('rollup_id', 'day', 'label', 'currency', name='uq_report_rollup_cell')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('report_rollup_cells')
+    op.drop_table('report_rollups')
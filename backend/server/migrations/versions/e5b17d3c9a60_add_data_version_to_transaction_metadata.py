@@ -0,0 +1,29 @@
+"""add_data_version_to_transaction_metadata
+
+Revision ID: e5b17d3c9a60
+Revises: d4a82c19e6b5
+Create Date: 2025-10-21 16:48:27.093114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b17d3c9a60'
+down_revision: Union[str, Sequence[str], None] = 'd4a82c19e6b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Left NULL until the next write, which disables result caching until then
+    op.add_column('transaction_metadata', sa.Column('data_version', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('transaction_metadata', 'data_version')
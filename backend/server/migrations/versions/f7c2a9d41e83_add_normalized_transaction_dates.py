@@ -0,0 +1,35 @@
+"""add_normalized_transaction_dates
+
+Revision ID: f7c2a9d41e83
+Revises: e5b17d3c9a60
+Create Date: 2025-10-22 10:31:45.218907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7c2a9d41e83'
+down_revision: Union[str, Sequence[str], None] = 'e5b17d3c9a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('transactions', sa.Column('txn_date', sa.String(length=10), nullable=True))
+    op.add_column('transactions', sa.Column('txn_day', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_transactions_txn_day'), 'transactions', ['txn_day'], unique=False)
+    # Left NULL so the dates are computed on first use
+    op.add_column('transaction_metadata', sa.Column('date_field', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('transaction_metadata', 'date_field')
+    op.drop_index(op.f('ix_transactions_txn_day'), table_name='transactions')
+    op.drop_column('transactions', 'txn_day')
+    op.drop_column('transactions', 'txn_date')
@@ -2,7 +2,7 @@ from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import (
     MetaData, String, Integer, Boolean, DateTime, ForeignKey, CheckConstraint, 
-    Numeric, Text, JSON, UniqueConstraint, Index
+    Numeric, Text, JSON, UniqueConstraint, Index, Float
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import uuid
@@ -48,6 +48,9 @@ class Transaction(Base):
     computed_content: Mapped[dict] = mapped_column(JSON, nullable=True)
     computed_content_hash: Mapped[str] = mapped_column(String(64), nullable=True)
     computed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    # TRANSACTION_DATE_FIELD parsed on write: ISO date and days since 1970-01-01, NULL when it doesn't parse
+    txn_date: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    txn_day: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
 
     __table_args__ = (
         CheckConstraint("length(id) >= 1", name="transaction_id_nonempty"),
@@ -61,6 +64,15 @@ class TransactionMetadata(Base):
     id: Mapped[str] = mapped_column(String(64), primary_key=True, default=1)
     ingested_columns: Mapped[dict] = mapped_column(JSON, default=dict)
     computed_columns: Mapped[dict] = mapped_column(JSON, default=dict)
+    # Number of stored transactions carrying each column, maintained on write
+    ingested_column_counts: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True, default=dict)
+    computed_column_counts: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True, default=dict)
+    # Columns classified as currency fields, maintained alongside the counts
+    currency_fields: Mapped[Optional[list]] = mapped_column(JSON, nullable=True, default=list)
+    # Changed to a fresh random token by every write to transactions; keys cached results
+    data_version: Mapped[Optional[str]] = mapped_column(String(32), nullable=True, default=lambda: uuid.uuid4().hex)
+    # Date field the transactions' txn_date/txn_day were computed from; NULL until they are
+    date_field: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -79,4 +91,57 @@ class Report(Base):
     __table_args__ = (
         CheckConstraint("length(id) >= 1", name="report_id_nonempty"),
         CheckConstraint("length(name) >= 1", name="report_name_nonempty"),
-    )
\ No newline at end of file
+    )
+
+
+class ReportRollup(Base):
+    """A pre-aggregated (dimension, measure, date field, currency field) combination"""
+    __tablename__ = "report_rollups"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True, default=lambda: str(uuid.uuid4()))
+    dimension: Mapped[str] = mapped_column(String(255), nullable=False)
+    measure: Mapped[str] = mapped_column(String(255), nullable=False)
+    date_field: Mapped[str] = mapped_column(String(255), nullable=False)
+    # Empty when the rollup is not split by currency
+    currency_field: Mapped[str] = mapped_column(String(255), nullable=False, default="")
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    cells: Mapped[list["ReportRollupCell"]] = relationship("ReportRollupCell", back_populates="rollup", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        UniqueConstraint("dimension", "measure", "date_field", "currency_field", name="uq_report_rollup_fields"),
+    )
+
+
+class ReportRollupCell(Base):
+    """Count, sum, min and max of a rollup's measure for one day, dimension value and currency"""
+    __tablename__ = "report_rollup_cells"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    rollup_id: Mapped[str] = mapped_column(String(64), ForeignKey("report_rollups.id", ondelete="CASCADE"), nullable=False)
+    rollup: Mapped["ReportRollup"] = relationship("ReportRollup", back_populates="cells")
+    # ISO date, empty when the date field is missing or doesn't parse
+    day: Mapped[str] = mapped_column(String(10), nullable=False, default="")
+    label: Mapped[str] = mapped_column(Text, nullable=False)
+    # Empty when the rollup is not split by currency
+    currency: Mapped[str] = mapped_column(String(64), nullable=False, default="")
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    value_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    value_min: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    value_max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    __table_args__ = (
+        # Also serves date range lookups within a rollup
+        UniqueConstraint("rollup_id", "day", "label", "currency", name="uq_report_rollup_cell"),
+    )
+
+
+class RuleSetFingerprint(Base):
+    """Fingerprint of each target field of a rule set that transactions were executed with"""
+    __tablename__ = "rule_set_fingerprints"
+
+    fingerprint: Mapped[str] = mapped_column(String(32), primary_key=True)
+    # target field -> fingerprint of its rules and of the fields they read
+    target_fingerprints: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
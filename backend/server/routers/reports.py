@@ -5,10 +5,16 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel
 import logging
-import re
 
 from server.models.main import Report, Transaction
 from server.services.database import get_db
+from server.services.aggregation import ORDER_BY, aggregate_transactions
+from server.services.filters import parse_field_filters
+from server.services.report_data import compute_report_data
+from server.services.sql_functions import DATE_BUCKETS
+from server.services.result_cache import report_cache
+from server.services.column_store import column_store
+from server.services.duckdb_mirror import duckdb_mirror
 
 logger = logging.getLogger(__name__)
 
@@ -112,6 +118,40 @@ async def get_report(
         raise HTTPException(status_code=500, detail=f"Failed to get report: {str(e)}")
 
 
+@router.get("/{report_id}/data")
+async def get_report_data(
+    report_id: str,
+    date_from: Optional[str] = Query(None, description="Start date overriding the report's date range"),
+    date_to: Optional[str] = Query(None, description="End date overriding the report's date range"),
+    date_field: Optional[str] = Query(None, description="Date field overriding the report's date range"),
+    db: Session = Depends(lambda: get_db("main"))
+):
+    """
+    Get the data of every chart and stats widget of a report.
+    
+    The report's date range and global filters are applied once and all
+    widgets are aggregated together.
+    
+    Args:
+        report_id: Report ID
+        date_from: Optional start date override
+        date_to: Optional end date override
+        date_field: Optional date field override
+        db: Database session
+    
+    Returns:
+        Aggregated data per widget id
+    """
+    report = db.query(Report).filter(Report.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    try:
+        return compute_report_data(db, report, date_from=date_from, date_to=date_to, date_field=date_field)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to compute report data: {str(e)}")
+
+
 @router.post("/", response_model=ReportResponse)
 async def create_report(
     report: ReportCreate,
@@ -253,14 +293,19 @@ async def get_aggregated_data(
     request: Request,
     x_field: str = Query(..., description="Field to group by (x-axis)"),
     y_field: str = Query(..., description="Field to aggregate (y-axis)"),
-    aggregation: str = Query("sum", description="Aggregation method: sum, avg, count"),
+    aggregation: str = Query("sum", description="Aggregation method: sum, avg, count, min, max, median, p90, distinct_count"),
     date_from: Optional[str] = Query(None, description="Start date (ISO format)"),
     date_to: Optional[str] = Query(None, description="End date (ISO format)"),
     date_field: str = Query("date", description="Field name to use for date filtering"),
+    date_bucket: Optional[str] = Query(None, description="Group x_field 'date' by day, week or month"),
     currency_field: Optional[str] = Query(None, description="Currency field name for grouping"),
     split_by_currency: bool = Query(False, description="Split data into separate series by currency"),
     global_local_connector: str = Query("AND", description="How to combine global and local filters: AND or OR"),
     global_filter_count: int = Query(0, description="Number of global filters (rest are local)"),
+    top_n: Optional[int] = Query(None, ge=1, description="Keep the top N labels by value and fold the rest into 'Other'"),
+    order_by: Optional[str] = Query(None, description="Label order: label, value_desc or value_asc (default: value_desc with top_n, else label)"),
+    max_points: Optional[int] = Query(None, ge=2, description="Most labels returned when x_field is 'date': coarser date buckets, then LTTB downsampling"),
+    fill_gaps: bool = Query(False, description="Add 0 values for empty periods when x_field is 'date'"),
     db: Session = Depends(lambda: get_db("main"))
 ):
     """
@@ -269,349 +314,94 @@ async def get_aggregated_data(
     Args:
         x_field: Field to group by (e.g., 'date', 'category', 'description')
         y_field: Field to aggregate (e.g., 'amount')
-        aggregation: Aggregation method (sum, avg, count)
+        aggregation: Aggregation method (sum, avg, count, min, max, median, p90, distinct_count)
         date_from: Optional start date filter
         date_to: Optional end date filter
         date_field: Field name to use for date filtering (default: 'date')
+        date_bucket: Optional day, week or month grouping when x_field is 'date'
+        top_n: Optional number of labels to keep, the rest summed into 'Other'
+        order_by: Order labels by label or by value (value_desc, value_asc)
+        max_points: Optional label budget for x_field 'date'
+        fill_gaps: Fill empty periods of x_field 'date' with 0
         db: Database session
     
     Returns:
         Aggregated data with labels and values
     """
+    if date_bucket is not None and date_bucket not in DATE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"date_bucket must be one of: {', '.join(DATE_BUCKETS)}")
+    if order_by is not None and order_by not in ORDER_BY:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of: {', '.join(ORDER_BY)}")
+    
     try:
-        import json
-        from collections import defaultdict
-        
-        # Parse field filters from query parameters
-        query_params = dict(request.query_params)
-        filter_params = {}
-        for key, value in query_params.items():
-            if key.startswith('filter_') and '_' in key[7:]:
-                parts = key.split('_')
-                if len(parts) >= 3:
-                    filter_index = parts[1]
-                    filter_type = parts[2]
-                    
-                    if filter_index not in filter_params:
-                        filter_params[filter_index] = {}
-                    filter_params[filter_index][filter_type] = value
-        
+        filter_params = parse_field_filters(dict(request.query_params))
         logger.info(f"Field filters received: {filter_params}")
-        
-        # Build base query
-        query = db.query(Transaction)
-        
-        # Get all transactions
-        transactions = query.all()
-        
-        # Aggregate data in Python (since JSON field querying is complex)
-        # Structure: aggregated[x_value][currency] = [values...]
-        if split_by_currency and currency_field:
-            aggregated = defaultdict(lambda: defaultdict(list))
-        else:
-            aggregated = defaultdict(list)
-        
-        for txn in transactions:
-            # Merge ingested and computed content
-            content = {**(txn.ingested_content or {}), **(txn.computed_content or {})}
-            
-            # Apply date filters on the transaction's date field (from content, NOT created_at)
-            if date_from or date_to:
-                txn_date_str = content.get(date_field)
-                if txn_date_str:
-                    try:
-                        # Parse transaction date
-                        if isinstance(txn_date_str, str):
-                            # Try multiple date formats
-                            txn_date = None
-                            date_formats = [
-                                '%Y-%m-%d',  # ISO format
-                                '%m/%d/%Y',  # MM/DD/YYYY
-                                '%d/%m/%Y',  # DD/MM/YYYY
-                                '%Y/%m/%d',  # YYYY/MM/DD
-                            ]
-                            
-                            # Try ISO format first (handles YYYY-MM-DDTHH:MM:SS)
-                            try:
-                                txn_date = datetime.fromisoformat(txn_date_str.split('T')[0])
-                            except ValueError:
-                                # Try other formats
-                                for fmt in date_formats:
-                                    try:
-                                        txn_date = datetime.strptime(txn_date_str, fmt)
-                                        break
-                                    except ValueError:
-                                        continue
-                            
-                            if txn_date is None:
-                                continue
-                        else:
-                            continue  # Skip if not a string
-                        
-                        # Check date range
-                        if date_from:
-                            date_from_dt = datetime.fromisoformat(date_from)
-                            if txn_date.date() < date_from_dt.date():
-                                continue  # Skip transaction outside range
-                        
-                        if date_to:
-                            date_to_dt = datetime.fromisoformat(date_to)
-                            if txn_date.date() > date_to_dt.date():
-                                continue  # Skip transaction outside range
-                    except (ValueError, AttributeError):
-                        # Skip transactions with invalid dates
-                        continue
-                else:
-                    # Skip transactions without a date field when filtering by date
-                    if date_from or date_to:
-                        continue
-            
-            # Apply field filters
-            if filter_params:
-                # Helper function to evaluate a single filter
-                def evaluate_filter(filter_data, content):
-                    if 'field' not in filter_data or 'operator' not in filter_data or 'value' not in filter_data:
-                        return True  # Skip invalid filters
-                    
-                    field = filter_data['field']
-                    operator = filter_data['operator']
-                    filter_value = filter_data['value']
-                    
-                    if not field or not filter_value:
-                        return True
-                    
-                    # Get field value from content
-                    field_value = content.get(field)
-                    if field_value is None:
-                        # Try case-insensitive search
-                        for key, val in content.items():
-                            if key.lower() == field.lower():
-                                field_value = val
-                                break
-                    
-                    # Field not found
-                    if field_value is None:
-                        return False
-                    
-                    # Convert to string for comparison
-                    field_value_str = str(field_value)
-                    filter_value_str = str(filter_value)
-                    
-                    # Try numeric comparison
-                    try:
-                        field_value_num = float(field_value)
-                        filter_value_num = float(filter_value)
-                        is_numeric = True
-                    except (ValueError, TypeError):
-                        is_numeric = False
-                    
-                    # Apply operator
-                    match = False
-                    if operator == 'equals':
-                        if is_numeric:
-                            match = field_value_num == filter_value_num
-                        else:
-                            match = field_value_str.lower() == filter_value_str.lower()
-                    elif operator == 'contains':
-                        match = filter_value_str.lower() in field_value_str.lower()
-                    elif operator == 'startswith':
-                        match = field_value_str.lower().startswith(filter_value_str.lower())
-                    elif operator == 'endswith':
-                        match = field_value_str.lower().endswith(filter_value_str.lower())
-                    elif operator == 'not_equals':
-                        if is_numeric:
-                            match = field_value_num != filter_value_num
-                        else:
-                            match = field_value_str.lower() != filter_value_str.lower()
-                    elif operator == 'gt' and is_numeric:
-                        match = field_value_num > filter_value_num
-                    elif operator == 'gte' and is_numeric:
-                        match = field_value_num >= filter_value_num
-                    elif operator == 'lt' and is_numeric:
-                        match = field_value_num < filter_value_num
-                    elif operator == 'lte' and is_numeric:
-                        match = field_value_num <= filter_value_num
-                    
-                    return match
-                
-                # Separate global and local filters
-                global_filters = {}
-                local_filters = {}
-                
-                for filter_index, filter_data in filter_params.items():
-                    try:
-                        idx = int(filter_index)
-                        if idx < global_filter_count:
-                            global_filters[filter_index] = filter_data
-                        else:
-                            local_filters[filter_index] = filter_data
-                    except ValueError:
-                        # If index is not an integer, treat as global
-                        global_filters[filter_index] = filter_data
-                
-                # Evaluate global filters (with AND logic within)
-                global_pass = True
-                if global_filters:
-                    for filter_data in global_filters.values():
-                        if not evaluate_filter(filter_data, content):
-                            global_pass = False
-                            break
-                
-                # Evaluate local filters (with AND logic within)
-                local_pass = True
-                if local_filters:
-                    for filter_data in local_filters.values():
-                        if not evaluate_filter(filter_data, content):
-                            local_pass = False
-                            break
-                
-                # Combine global and local based on connector
-                skip_transaction = False
-                if global_filters and local_filters:
-                    # Both exist, use connector
-                    if global_local_connector.upper() == 'OR':
-                        # At least one set must pass
-                        if not (global_pass or local_pass):
-                            skip_transaction = True
-                    else:  # AND (default)
-                        # Both must pass
-                        if not (global_pass and local_pass):
-                            skip_transaction = True
-                elif global_filters:
-                    # Only global filters
-                    if not global_pass:
-                        skip_transaction = True
-                elif local_filters:
-                    # Only local filters
-                    if not local_pass:
-                        skip_transaction = True
-                
-                if skip_transaction:
-                    continue
-            
-            # Extract x-axis value
-            x_value = None
-            if x_field == 'date':
-                # Use the actual transaction date from content, not created_at
-                x_value = content.get(date_field, '').split('T')[0] if content.get(date_field) else None
-            elif x_field in content:
-                x_value = str(content[x_field])
-            else:
-                # Try to find field in nested structures (case-insensitive)
-                for key, val in content.items():
-                    if key.lower() == x_field.lower():
-                        x_value = str(val)
-                        break
-            
-            if x_value is None:
-                continue
-            
-            # Extract y-axis value
-            y_value = None
-            if y_field in content:
-                try:
-                    y_value = float(content[y_field])
-                except (ValueError, TypeError):
-                    continue
-            else:
-                # Try to find field in nested structures (case-insensitive)
-                for key, val in content.items():
-                    if key.lower() == y_field.lower():
-                        try:
-                            y_value = float(val)
-                            break
-                        except (ValueError, TypeError):
-                            continue
-            
-            if y_value is not None:
-                # Handle currency grouping
-                if split_by_currency and currency_field:
-                    # Extract currency code or symbol
-                    currency = content.get(currency_field, 'UNKNOWN')
-                    if isinstance(currency, str):
-                        # Map common symbols to codes for consistency
-                        symbol_to_code = {
-                            '$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY',
-                            '₹': 'INR', '₽': 'RUB', 'R$': 'BRL', '₩': 'KRW',
-                            'kr': 'NOK', 'zł': 'PLN', '฿': 'THB', 'Rp': 'IDR',
-                            'RM': 'MYR', '₱': 'PHP', 'R': 'ZAR', '₺': 'TRY'
-                        }
-                        currency = symbol_to_code.get(currency, currency.upper())
-                    aggregated[x_value][currency].append(y_value)
-                else:
-                    aggregated[x_value].append(y_value)
-        
-        # Apply aggregation
-        if split_by_currency and currency_field:
-            # Build multi-currency response
-            labels = sorted(aggregated.keys())
-            
-            # Collect all currencies
-            all_currencies = set()
-            for label in labels:
-                all_currencies.update(aggregated[label].keys())
-            all_currencies = sorted(all_currencies)
-            
-            # Build values by currency
-            values_by_currency = {}
-            for currency in all_currencies:
-                currency_values = []
-                for label in labels:
-                    data_points = aggregated[label].get(currency, [])
-                    
-                    if aggregation == 'sum':
-                        value = sum(data_points)
-                    elif aggregation == 'avg':
-                        value = sum(data_points) / len(data_points) if data_points else 0
-                    elif aggregation == 'count':
-                        value = len(data_points)
-                    else:
-                        value = sum(data_points)
-                    
-                    currency_values.append(round(value, 2))
-                
-                values_by_currency[currency] = currency_values
-            
-            return {
-                "labels": labels,
-                "values_by_currency": values_by_currency,
-                "currencies": all_currencies,
-                "x_field": x_field,
-                "y_field": y_field,
-                "aggregation": aggregation,
-                "split_by_currency": True,
-                "total_records": len(transactions)
-            }
-        else:
-            # Single series response
-            labels = []
-            values = []
-            
-            for label in sorted(aggregated.keys()):
-                data_points = aggregated[label]
-                
-                if aggregation == 'sum':
-                    value = sum(data_points)
-                elif aggregation == 'avg':
-                    value = sum(data_points) / len(data_points) if data_points else 0
-                elif aggregation == 'count':
-                    value = len(data_points)
-                else:
-                    value = sum(data_points)  # default to sum
-                
-                labels.append(label)
-                values.append(round(value, 2))
-            
-            return {
-                "labels": labels,
-                "values": values,
-                "x_field": x_field,
-                "y_field": y_field,
-                "aggregation": aggregation,
-                "split_by_currency": False,
-                "total_records": len(transactions),
-                "filtered_records": sum(len(v) for v in aggregated.values())
-            }
+
+        return aggregate_transactions(
+            db,
+            x_field=x_field,
+            y_field=y_field,
+            aggregation=aggregation,
+            date_from=date_from,
+            date_to=date_to,
+            date_field=date_field,
+            date_bucket=date_bucket,
+            currency_field=currency_field,
+            split_by_currency=split_by_currency,
+            filter_params=filter_params,
+            global_filter_count=global_filter_count,
+            global_local_connector=global_local_connector,
+            top_n=top_n,
+            order_by=order_by,
+            max_points=max_points,
+            fill_gaps=fill_gaps
+        )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to aggregate data: {str(e)}")
+
+
+# Result Cache Diagnostics
+@router.get("/data/cache/")
+async def get_cache_stats():
+    """
+    Get report result cache statistics.
+    
+    Returns:
+        Entry count, memory use and budget, hit/miss/eviction counters and the cached data version
+    """
+    return report_cache.stats()
+
+
+@router.delete("/data/cache/")
+async def clear_cache():
+    """
+    Drop every cached report result. Counters are kept.
+    
+    Returns:
+        Cache statistics after clearing
+    """
+    report_cache.clear()
+    return report_cache.stats()
+
+
+@router.get("/data/store/")
+async def get_store_stats():
+    """
+    Get column store statistics.
+    
+    Returns:
+        Loaded fields, row count, memory footprint and load/refresh/query/fallback counters
+    """
+    return column_store.stats()
+
+
+@router.get("/data/mirror/")
+async def get_mirror_stats():
+    """
+    Get DuckDB mirror statistics.
+    
+    Returns:
+        Whether the mirror is enabled, its file, row count and size, and load/refresh/query/fallback counters
+    """
+    return duckdb_mirror.stats()
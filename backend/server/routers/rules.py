@@ -5,6 +5,8 @@ Provides endpoints for managing computed field rules and executing
 them against transaction data.
 """
 
+import logging
+from collections import Counter
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session, joinedload
@@ -14,8 +16,16 @@ from pydantic import BaseModel, Field
 
 from server.services.database import get_db
 from server.models.configurations import ComputedFieldRule, RULE_TYPES
-from server.services.rule_engine import rule_engine, RuleExecutionContext
+from server.services.rule_engine import rule_engine, RuleExecutionContext, RULE_BATCH_SIZE
+from server.services.compiled_rules import CompiledRule, compiled_rules
+from server.services.rule_graph import RuleGraph
+from server.services.incremental_rules import computed_content_stamp, plan_execution, save_rule_set, stale_transactions
 from server.models.main import Transaction, TransactionMetadata
+from server.services.metadata import adjust_column_counts, CURRENCY_SAMPLE_SIZE
+from server.services.rollups import apply_rollup_changes, collect_rollup_cells
+from server.services.transaction_dates import set_transaction_date
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/rules", tags=["rules"])
 
@@ -83,6 +93,8 @@ class RuleExecuteRequest(BaseModel):
     rule_ids: Optional[List[str]] = Field(None, description="Only execute these specific rules")
     dry_run: bool = Field(False, description="If true, don't save results, just return what would be computed")
     force_reprocess: bool = Field(False, description="If true, reprocess all fields even if they already have values")
+    vectorized: bool = Field(True, description="If true, evaluate rules over batches of transactions; rules that can't be vectorized run row by row")
+    incremental: bool = Field(False, description="If true, only process transactions not yet processed with the current rules, for the fields whose rules changed")
 
 
 class RuleExecuteResponse(BaseModel):
@@ -92,6 +104,7 @@ class RuleExecuteResponse(BaseModel):
     updated_fields: Dict[str, int]  # field_name -> count of transactions updated
     errors: List[str] = []
     dry_run_results: Optional[Dict[str, Any]] = None
+    skipped_transactions: int = 0  # Transactions incremental execution found up to date
 
 
 class RuleTestRequest(BaseModel):
@@ -108,6 +121,22 @@ class RuleTestResponse(BaseModel):
     error: Optional[str] = None
 
 
+def _check_dependency_cycle(db: Session, rule: ComputedFieldRule):
+    """Reject saving a rule that makes the active rules' target fields depend on themselves"""
+    if not rule.active:
+        return
+    active_rules = db.query(ComputedFieldRule).filter(ComputedFieldRule.active == True).order_by(
+        ComputedFieldRule.priority, ComputedFieldRule.created_at
+    ).all()
+    rules = [active_rule for active_rule in active_rules if rule.id is None or active_rule.id != rule.id]
+    cycle = RuleGraph(rules + [rule]).find_cycle()
+    if cycle:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Rule creates a dependency cycle between target fields: {' -> '.join(cycle)}"
+        )
+
+
 @router.post("/", response_model=RuleResponse)
 async def create_rule(rule: RuleCreate, db: Session = Depends(lambda: get_db("configurations"))):
     """
@@ -136,6 +165,7 @@ async def create_rule(rule: RuleCreate, db: Session = Depends(lambda: get_db("co
             active=rule.active,
             updated_at=datetime.utcnow()
         )
+        _check_dependency_cycle(db, db_rule)
         
         db.add(db_rule)
         db.commit()
@@ -228,9 +258,15 @@ async def update_rule(
             setattr(db_rule, field, value)
             
         db_rule.updated_at = datetime.utcnow()
+        try:
+            _check_dependency_cycle(db, db_rule)
+        except HTTPException:
+            db.rollback()
+            raise
         
         db.commit()
         db.refresh(db_rule)
+        compiled_rules.invalidate(rule_id)
         
         return RuleResponse.from_orm(db_rule)
         
@@ -252,6 +288,7 @@ async def delete_rule(rule_id: str, db: Session = Depends(lambda: get_db("config
             
         db.delete(db_rule)
         db.commit()
+        compiled_rules.invalidate(rule_id)
         
         return {"message": "Rule deleted successfully", "id": rule_id}
         
@@ -308,12 +345,11 @@ async def test_rule(request: RuleTestRequest):
         
         # Create execution context
         from server.services.formula_commands import command_registry
-        commands = command_registry.list_commands()
         context = RuleExecutionContext(
             transaction_data=request.sample_transaction,
             ingested_fields=list(request.sample_transaction.keys()),
             computed_fields=[],
-            available_commands=[cmd.name for cmd in commands]
+            available_commands=command_registry.command_names()
         )
         
         # Evaluate the rule
@@ -411,6 +447,41 @@ async def get_test_transaction(
         raise HTTPException(status_code=500, detail=f"Error fetching transaction: {str(e)}")
 
 
+def _execute_batch(
+    rules: List[CompiledRule],
+    transactions: List[Transaction],
+    ingested_fields: List[str],
+    computed_fields: List[str],
+    force_reprocess: bool
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Computed results of a batch of transactions by id, executed together.
+    
+    A batch that fails returns no results, so its transactions are executed
+    one by one and errors are reported per transaction.
+    """
+    try:
+        transactions_data = []
+        for transaction in transactions:
+            transaction_data = dict(transaction.ingested_content)
+            if transaction.computed_content:
+                transaction_data.update(transaction.computed_content)
+            transactions_data.append(transaction_data)
+        results = rule_engine.execute_rules_for_batch(
+            rules, transactions_data, ingested_fields, computed_fields, force_reprocess=force_reprocess
+        )
+    except Exception:
+        # Keep the traceback: the row-by-row results hide what went wrong in the batch
+        logger.exception("Batch execution of %d transactions failed, executing them row by row", len(transactions))
+        return {}
+    return {transaction.id: computed for transaction, computed in zip(transactions, results)}
+
+
+def _unchanged(stored: Dict[str, Any], key: str, value: Any) -> bool:
+    """Whether a computed value is already stored, with the same type"""
+    return key in stored and type(stored[key]) is type(value) and stored[key] == value
+
+
 @router.post("/execute", response_model=RuleExecuteResponse)
 async def execute_rules(
     request: RuleExecuteRequest,
@@ -421,8 +492,19 @@ async def execute_rules(
     Execute rules against transaction data
     
     Processes transactions through the rules engine to compute field values.
-    Rules are executed in priority order, with first successful rule winning for each field.
+    Rules are executed in priority order, with first successful rule winning for each field;
+    rules reading another rule's target field run after the rules writing it.
+    
+    Transactions processed with every active rule record the rule set in
+    computed_content_hash; incremental execution skips transactions recorded
+    with the current rules and processes the others only for the target
+    fields whose rules, or the fields they read, changed.
     """
+    if request.incremental and (request.target_fields or request.rule_ids):
+        raise HTTPException(
+            status_code=400,
+            detail="Incremental execution runs every active rule and can't be limited to target_fields or rule_ids"
+        )
     try:
         errors = []
         updated_fields = {}
@@ -436,8 +518,12 @@ async def execute_rules(
         if request.rule_ids:
             rules_query = rules_query.filter(ComputedFieldRule.id.in_(request.rule_ids))
         
-        # Sort by priority (lower = higher priority)
-        rules = rules_query.order_by(ComputedFieldRule.priority, ComputedFieldRule.created_at).all()
+        # Sort by priority (lower = higher priority), then run rules after the rules whose targets they read
+        graph = RuleGraph(rules_query.order_by(ComputedFieldRule.priority, ComputedFieldRule.created_at).all())
+        rules = graph.schedule()
+        # Transactions are stamped with the rule set only when processed with all of it
+        full_rule_set = not request.target_fields and not request.rule_ids and not request.dry_run
+        rule_set = graph.fingerprint()
         
         if not rules:
             return RuleExecuteResponse(
@@ -448,14 +534,25 @@ async def execute_rules(
             )
         
         # 2. Load transactions from main database
-        transactions_query = main_db.query(Transaction)
-        
-        if request.transaction_ids:
-            transactions_query = transactions_query.filter(Transaction.id.in_(request.transaction_ids))
-        
-        transactions = transactions_query.all()
+        skipped_count = 0
+        if request.incremental:
+            # Only stale transactions, in chunks sharing the target fields they need
+            plan = plan_execution(main_db, graph, request.transaction_ids)
+            skipped_count = plan.skipped
+            work = (
+                ([rule for rule in rules if targets is None or rule.target_field in targets], transactions)
+                for targets, transactions in stale_transactions(main_db, plan, RULE_BATCH_SIZE)
+            )
+        else:
+            transactions_query = main_db.query(Transaction)
+            
+            if request.transaction_ids:
+                transactions_query = transactions_query.filter(Transaction.id.in_(request.transaction_ids))
+            
+            transactions = transactions_query.all()
+            work = [(rules, transactions)]
         
-        if not transactions:
+        if not request.incremental and not transactions:
             return RuleExecuteResponse(
                 success=True,
                 processed_transactions=0,
@@ -470,71 +567,122 @@ async def execute_rules(
         
         processed_count = 0
         dry_run_results = {} if request.dry_run else None
+        new_computed_columns = Counter()
+        computed_sample = []
+        # (ingested, computed) content before and after of every changed transaction
+        previous_contents = []
+        updated_contents = []
         
         # 4. Process each transaction
-        for transaction in transactions:
-            try:
-                # Combine ingested and computed content
-                transaction_data = dict(transaction.ingested_content)
-                if transaction.computed_content:
-                    transaction_data.update(transaction.computed_content)
-                
-                # Execute rules for this transaction
-                computed_results = rule_engine.execute_rules_for_transaction(
-                    rules=rules,
-                    transaction_data=transaction_data,
-                    ingested_fields=ingested_fields,
-                    computed_fields=computed_fields,
-                    force_reprocess=request.force_reprocess
-                )
-                
-                if computed_results:
-                    print(f"DEBUG: Transaction {transaction.id} has computed results: {computed_results}")
-                    # Track updated fields
-                    for field_name in computed_results.keys():
-                        updated_fields[field_name] = updated_fields.get(field_name, 0) + 1
-                    
-                    # Serialize datetime objects to ISO format strings for JSON storage
-                    serialized_results = {}
-                    for key, value in computed_results.items():
-                        if isinstance(value, datetime):
-                            serialized_results[key] = value.isoformat()
-                        else:
-                            serialized_results[key] = value
-                    print(f"DEBUG: Serialized results: {serialized_results}")
+        for work_rules, transactions in work:
+            # Compile the rules once for all transactions instead of once per transaction
+            work_rules = rule_engine.compile_rules(work_rules)
+            batch_results = {}
+            for transaction_index, transaction in enumerate(transactions):
+                try:
+                    # Combine ingested and computed content
+                    transaction_data = dict(transaction.ingested_content)
+                    if transaction.computed_content:
+                        transaction_data.update(transaction.computed_content)
                     
-                    if request.dry_run:
-                        # Store dry run results
-                        dry_run_results[transaction.id] = serialized_results
+                    if request.vectorized:
+                        if transaction_index % RULE_BATCH_SIZE == 0:
+                            batch_results = _execute_batch(
+                                work_rules, transactions[transaction_index:transaction_index + RULE_BATCH_SIZE],
+                                ingested_fields, computed_fields, request.force_reprocess
+                            )
+                        computed_results = batch_results.get(transaction.id)
                     else:
-                        # Update transaction with computed results
-                        # Create a new dict to ensure SQLAlchemy detects the change
-                        if transaction.computed_content:
-                            new_computed_content = dict(transaction.computed_content)
-                            new_computed_content.update(serialized_results)
-                            transaction.computed_content = new_computed_content
-                        else:
-                            transaction.computed_content = serialized_results
+                        computed_results = None
+                    if computed_results is None:
+                        # Execute rules for this transaction
+                        computed_results = rule_engine.execute_rules_for_transaction(
+                            rules=work_rules,
+                            transaction_data=transaction_data,
+                            ingested_fields=ingested_fields,
+                            computed_fields=computed_fields,
+                            force_reprocess=request.force_reprocess
+                        )
+                    
+                    if request.incremental and transaction.computed_content:
+                        # Only values that change are written
+                        stored = transaction.computed_content
+                        computed_results = {
+                            key: value for key, value in computed_results.items()
+                            if not _unchanged(stored, key, value.isoformat() if isinstance(value, datetime) else value)
+                        }
+                    
+                    if computed_results:
+                        # Track updated fields
+                        for field_name in computed_results.keys():
+                            updated_fields[field_name] = updated_fields.get(field_name, 0) + 1
                         
-                        transaction.computed_at = datetime.utcnow()
-                        # Force flush to ensure changes are written to database
-                        main_db.flush()
-                        # You might want to update computed_content_hash here too
-                
-                processed_count += 1
+                        # Serialize datetime objects to ISO format strings for JSON storage
+                        serialized_results = {}
+                        for key, value in computed_results.items():
+                            if isinstance(value, datetime):
+                                serialized_results[key] = value.isoformat()
+                            else:
+                                serialized_results[key] = value
+                        
+                        if request.dry_run:
+                            # Store dry run results
+                            dry_run_results[transaction.id] = serialized_results
+                        else:
+                            # Count columns this transaction gains into the metadata registry
+                            new_computed_columns.update(
+                                set(serialized_results) - set(transaction.computed_content or {})
+                            )
+                            if len(computed_sample) < CURRENCY_SAMPLE_SIZE:
+                                computed_sample.append(serialized_results)
+                            
+                            previous_contents.append((transaction.ingested_content, transaction.computed_content))
+                            
+                            # Update transaction with computed results
+                            # Create a new dict to ensure SQLAlchemy detects the change
+                            if transaction.computed_content:
+                                new_computed_content = dict(transaction.computed_content)
+                                new_computed_content.update(serialized_results)
+                                transaction.computed_content = new_computed_content
+                            else:
+                                transaction.computed_content = serialized_results
+                            
+                            transaction.computed_at = datetime.utcnow()
+                            set_transaction_date(transaction)
+                            updated_contents.append((transaction.ingested_content, transaction.computed_content))
+                    
+                    if full_rule_set:
+                        # Record the rule set so incremental execution can skip the transaction
+                        transaction.computed_content_hash = computed_content_stamp(
+                            rule_set, transaction.ingested_content_hash
+                        )
+                    
+                    processed_count += 1
+                    
+                except Exception as e:
+                    errors.append(f"Error processing transaction {transaction.id}: {str(e)}")
                 
-            except Exception as e:
-                errors.append(f"Error processing transaction {transaction.id}: {str(e)}")
-                continue
-        
+                if not request.dry_run and (transaction_index + 1) % RULE_BATCH_SIZE == 0:
+                    # Write updates once per batch rather than once per transaction
+                    main_db.flush()
+            
         # 5. Commit changes if not dry run
         if not request.dry_run and processed_count > 0:
-            print(f"DEBUG: About to commit {processed_count} transactions")
+            logger.debug("Committing %d processed transactions", processed_count)
             try:
+                if full_rule_set:
+                    save_rule_set(main_db, graph)
+                if new_computed_columns or computed_sample:
+                    adjust_column_counts(main_db, computed=dict(new_computed_columns), sample_rows=computed_sample)
+                if updated_contents:
+                    apply_rollup_changes(
+                        main_db,
+                        added=collect_rollup_cells(main_db, contents=updated_contents),
+                        removed=collect_rollup_cells(main_db, contents=previous_contents)
+                    )
                 main_db.commit()
-                print(f"DEBUG: Commit successful")
             except Exception as e:
-                print(f"DEBUG: Commit failed: {e}")
+                logger.exception("Committing executed rules failed")
                 errors.append(f"Database commit failed: {str(e)}")
                 main_db.rollback()
         
@@ -543,11 +691,12 @@ async def execute_rules(
             processed_transactions=processed_count,
             updated_fields=updated_fields,
             errors=errors,
-            dry_run_results=dry_run_results
+            dry_run_results=dry_run_results,
+            skipped_transactions=skipped_count
         )
         
     except Exception as e:
-        print(f"DEBUG: Exception caught: {e}")
+        logger.exception("Rule execution failed")
         if not request.dry_run:
             main_db.rollback()
         raise HTTPException(status_code=500, detail=f"Error executing rules: {str(e)}")
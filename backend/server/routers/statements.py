@@ -1,24 +1,79 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Optional
-import tempfile
+from pydantic import BaseModel
+from typing import List, Optional, Tuple
 import os
-import shutil
 from pathlib import Path
-from datetime import datetime
 
 from server.models.main import Statement
 from server.services.database import get_db
 from server.services.file_management import FileStorageService
 from server.services.csv_processor import CSVProcessor
+from server.services.jobs import job_manager
+from server.services.batch_processing import batch_message, batch_succeeded, process_statements_batch
+from server.services.metadata import adjust_column_counts, column_counts
+from server.services.rollups import apply_rollup_changes, collect_rollup_cells
 from server.settings import ALLOWED_FILE_EXTENSIONS
 
 router = APIRouter(prefix="/statements", tags=["statements"])
 
+class ProcessBatchRequest(BaseModel):
+    statement_ids: Optional[List[str]] = None  # None processes all unprocessed statements
+    max_workers: Optional[int] = None
+
 # Initialize file storage service
 file_storage = FileStorageService(base_dir=os.path.join(os.path.dirname(__file__), "..", "..", "data", "uploads"))
 
+async def _save_uploaded_statement(file: UploadFile, db: Session) -> Tuple[Optional[Statement], Optional[Statement]]:
+    """
+    Stream an upload to storage and create its Statement record.
+    
+    The file is written and hashed in a single pass off the event loop, and
+    the duplicate check runs before the file is moved into place, so
+    duplicates never reach the storage directory.
+    
+    Returns:
+        (statement, None) for a new statement or (None, existing_statement)
+        when a statement with the same file hash already exists
+    """
+    file_extension = Path(file.filename).suffix.lower()
+    temp_file_path, file_hash = await run_in_threadpool(file_storage.write_stream, file.file, file_extension)
+    final_file_path = None
+    
+    try:
+        # Check if statement with same hash already exists
+        existing_statement = db.query(Statement).filter(Statement.file_hash == file_hash).first()
+        if existing_statement:
+            temp_file_path.unlink()
+            return None, existing_statement
+        
+        # Move file to storage location
+        final_file_path = file_storage.commit_file(temp_file_path, file.filename)
+        
+        # Create new statement record
+        statement = Statement(
+            filename=final_file_path.name,
+            file_path=str(final_file_path),
+            file_hash=file_hash,
+            mime_type=file_storage.get_mime_type(final_file_path),
+            processed=False
+        )
+        
+        db.add(statement)
+        db.commit()
+        db.refresh(statement)
+        return statement, None
+        
+    except Exception:
+        # Clean up the file if something goes wrong
+        db.rollback()
+        for path in (temp_file_path, final_file_path):
+            if path is not None and path.exists():
+                path.unlink()
+        raise
+
 @router.post("/upload")
 async def upload_statement(
     file: UploadFile = File(...),
@@ -43,70 +98,29 @@ async def upload_statement(
                 detail=f"File type not allowed. Allowed types: {ALLOWED_FILE_EXTENSIONS}"
             )
         
-        # Create temporary file to store uploaded content
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = Path(temp_file.name)
-        
-        try:
-            # Move file to storage location
-            sanitized_filename = file_storage.sanitize_filename(file.filename)
-            today_date = file_storage.base_dir / "raw_data_dir" / datetime.utcnow().strftime("%Y-%m-%d")
-            today_date.mkdir(parents=True, exist_ok=True)
-            
-            final_file_path = today_date / sanitized_filename
-            shutil.move(str(temp_file_path), str(final_file_path))
-            
-            # Calculate file hash and get metadata
-            file_hash = file_storage.calculate_file_hash(final_file_path)
-            mime_type = file_storage.get_mime_type(final_file_path)
-            
-            # Check if statement with same hash already exists
-            existing_statement = db.query(Statement).filter(Statement.file_hash == file_hash).first()
-            if existing_statement:
-                # Clean up the duplicate file
-                final_file_path.unlink()
-                return JSONResponse(
-                    status_code=409,
-                    content={
-                        "message": "Statement with this file hash already exists",
-                        "statement_id": existing_statement.id,
-                        "filename": existing_statement.filename
-                    }
-                )
-            
-            # Create new statement record
-            statement = Statement(
-                filename=sanitized_filename,
-                file_path=str(final_file_path),
-                file_hash=file_hash,
-                mime_type=mime_type,
-                processed=False
-            )
-            
-            db.add(statement)
-            db.commit()
-            db.refresh(statement)
-            
+        statement, existing_statement = await _save_uploaded_statement(file, db)
+        if existing_statement:
             return JSONResponse(
-                status_code=201,
+                status_code=409,
                 content={
-                    "message": "Statement uploaded successfully",
-                    "statement_id": statement.id,
-                    "filename": statement.filename,
-                    "file_hash": statement.file_hash,
-                    "mime_type": statement.mime_type,
-                    "created_at": statement.created_at.isoformat(),
-                    "processed": statement.processed
+                    "message": "Statement with this file hash already exists",
+                    "statement_id": existing_statement.id,
+                    "filename": existing_statement.filename
                 }
             )
-            
-        except Exception as e:
-            # Clean up temporary file if something goes wrong
-            if temp_file_path.exists():
-                temp_file_path.unlink()
-            raise e
+        
+        return JSONResponse(
+            status_code=201,
+            content={
+                "message": "Statement uploaded successfully",
+                "statement_id": statement.id,
+                "filename": statement.filename,
+                "file_hash": statement.file_hash,
+                "mime_type": statement.mime_type,
+                "created_at": statement.created_at.isoformat(),
+                "processed": statement.processed
+            }
+        )
             
     except HTTPException:
         raise
@@ -156,69 +170,24 @@ async def upload_multiple_statements(
                 results["failed_count"] += 1
                 continue
             
-            # Create temporary file to store uploaded content
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_file_path = Path(temp_file.name)
-            
-            try:
-                # Move file to storage location
-                sanitized_filename = file_storage.sanitize_filename(file.filename)
-                today_date = file_storage.base_dir / "raw_data_dir" / datetime.utcnow().strftime("%Y-%m-%d")
-                today_date.mkdir(parents=True, exist_ok=True)
-                
-                final_file_path = today_date / sanitized_filename
-                shutil.move(str(temp_file_path), str(final_file_path))
-                
-                # Calculate file hash and get metadata
-                file_hash = file_storage.calculate_file_hash(final_file_path)
-                mime_type = file_storage.get_mime_type(final_file_path)
-                
-                # Check if statement with same hash already exists
-                existing_statement = db.query(Statement).filter(Statement.file_hash == file_hash).first()
-                if existing_statement:
-                    # Clean up the duplicate file
-                    final_file_path.unlink()
-                    results["duplicate_files"].append({
-                        "filename": file.filename,
-                        "statement_id": existing_statement.id,
-                        "existing_filename": existing_statement.filename
-                    })
-                    results["duplicate_count"] += 1
-                    continue
-                
-                # Create new statement record
-                statement = Statement(
-                    filename=sanitized_filename,
-                    file_path=str(final_file_path),
-                    file_hash=file_hash,
-                    mime_type=mime_type,
-                    processed=False
-                )
-                
-                db.add(statement)
-                db.commit()
-                db.refresh(statement)
-                
-                results["successful_uploads"].append({
-                    "filename": file.filename,
-                    "statement_id": statement.id,
-                    "file_hash": statement.file_hash,
-                    "mime_type": statement.mime_type,
-                    "created_at": statement.created_at.isoformat()
-                })
-                results["successful_count"] += 1
-                
-            except Exception as e:
-                # Clean up temporary file if something goes wrong
-                if temp_file_path.exists():
-                    temp_file_path.unlink()
-                results["failed_uploads"].append({
+            statement, existing_statement = await _save_uploaded_statement(file, db)
+            if existing_statement:
+                results["duplicate_files"].append({
                     "filename": file.filename,
-                    "error": str(e)
+                    "statement_id": existing_statement.id,
+                    "existing_filename": existing_statement.filename
                 })
-                results["failed_count"] += 1
+                results["duplicate_count"] += 1
+                continue
+            
+            results["successful_uploads"].append({
+                "filename": file.filename,
+                "statement_id": statement.id,
+                "file_hash": statement.file_hash,
+                "mime_type": statement.mime_type,
+                "created_at": statement.created_at.isoformat()
+            })
+            results["successful_count"] += 1
                 
         except Exception as e:
             results["failed_uploads"].append({
@@ -246,20 +215,90 @@ async def upload_multiple_statements(
         }
     )
 
+@router.post("/process-batch")
+async def process_statements_in_batch(
+    request: ProcessBatchRequest,
+    wait: bool = False,
+    db: Session = Depends(lambda: get_db("main"))
+):
+    """
+    Process several statements in one request.
+    
+    Files are parsed in parallel worker processes and stored by the batch's
+    writer, which shares the ingestion write lock with every other statement
+    being processed. Without statement_ids every unprocessed statement is
+    processed. By default the batch is queued as a background job and a job
+    id is returned immediately (202), like POST /statements/{statement_id}/process;
+    with ``wait=true`` it runs before responding and returns the results.
+    
+    Args:
+        request: Statement IDs to process and optional worker count
+        wait: Process synchronously and return the results
+        db: Database session
+    
+    Returns:
+        JSON response with the queued job or per-statement processing results
+    """
+    if request.statement_ids is not None and not request.statement_ids:
+        raise HTTPException(status_code=400, detail="No statements provided")
+    if request.max_workers is not None and request.max_workers < 1:
+        raise HTTPException(status_code=400, detail="max_workers must be at least 1")
+    
+    if not wait:
+        job = job_manager.submit_batch(request.statement_ids, request.max_workers)
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "Statements queued for processing",
+                "job_id": job.id,
+                "status": job.status
+            }
+        )
+    
+    try:
+        results = await run_in_threadpool(
+            process_statements_batch, request.statement_ids, db, request.max_workers
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    
+    # Determine response status
+    if results["total_statements"] == 0 or results["failed_count"] == 0:
+        status_code = 200
+    elif batch_succeeded(results):
+        status_code = 207  # Multi-Status
+    else:
+        status_code = 400
+    
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "message": batch_message(results),
+            "results": results
+        }
+    )
+
 @router.post("/{statement_id}/process")
 async def process_statement(
     statement_id: str,
+    wait: bool = False,
     db: Session = Depends(lambda: get_db("main"))
 ):
     """
     Process a statement file and extract transactions.
     
+    By default the statement is queued on the background worker pool and a
+    job id is returned immediately (202); poll GET /statements/jobs/{job_id}
+    for progress. With ``wait=true`` the statement is processed before
+    responding, off the event loop, and the processing results are returned.
+    
     Args:
         statement_id: The statement ID to process
+        wait: Process synchronously and return the results
         db: Database session
     
     Returns:
-        JSON response with processing results
+        JSON response with the queued job or the processing results
     """
     try:
         # Get the statement
@@ -273,9 +312,21 @@ async def process_statement(
         if not file_path.exists():
             raise HTTPException(status_code=404, detail="Statement file not found")
         
-        # Process the statement
+        if not wait:
+            job = job_manager.submit_statement(statement_id)
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "message": "Statement queued for processing",
+                    "statement_id": statement_id,
+                    "job_id": job.id,
+                    "status": job.status
+                }
+            )
+        
+        # Process the statement without blocking the event loop
         processor = CSVProcessor()
-        result = processor.process_statement(statement, db)
+        result = await run_in_threadpool(processor.process_statement, statement, db)
         
         if result["success"]:
             return JSONResponse(
@@ -304,6 +355,39 @@ async def process_statement(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.get("/jobs")
+async def list_processing_jobs(statement_id: Optional[str] = None):
+    """
+    List known processing jobs, optionally for a single statement.
+    
+    Args:
+        statement_id: Only return jobs for this statement
+    
+    Returns:
+        List of processing jobs
+    """
+    jobs = job_manager.list_jobs(statement_id=statement_id)
+    return {
+        "jobs": [job.to_dict() for job in jobs],
+        "total": len(jobs)
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_processing_job(job_id: str):
+    """
+    Get the progress of a processing job.
+    
+    Args:
+        job_id: The job ID returned by POST /statements/{statement_id}/process or /statements/process-batch
+    
+    Returns:
+        Job status with rows parsed/inserted/duplicates, throughput and ETA
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @router.get("/{statement_id}/transactions")
 async def get_statement_transactions(
     statement_id: str,
@@ -438,8 +522,19 @@ async def delete_statement(
         if file_path.exists():
             file_path.unlink()
         
+        # Count the statement's columns out of the metadata registry
+        removed_ingested, removed_computed = column_counts(db, statement_id=statement_id)
+        removed_cells = collect_rollup_cells(db, statement_id=statement_id)
+        
         # Delete from database
         db.delete(statement)
+        db.flush()
+        adjust_column_counts(
+            db,
+            ingested={column: -count for column, count in removed_ingested.items()},
+            computed={column: -count for column, count in removed_computed.items()}
+        )
+        apply_rollup_changes(db, removed=removed_cells)
         db.commit()
         
         return {"message": "Statement deleted successfully"}
@@ -2,10 +2,20 @@ from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import String
 from typing import List, Optional
-from datetime import datetime
 
 from server.models.main import Transaction, Statement, TransactionMetadata
 from server.services.database import get_db
+from server.services.filters import compile_filters, parse_field_filters
+from server.services.sql_functions import UnsupportedQuery, prepare_sql
+from server.services.rollups import apply_rollup_changes, collect_rollup_cells, reset_rollups
+from server.services.transaction_dates import refresh_transaction_dates
+from server.services.metadata import (
+    adjust_column_counts,
+    count_columns,
+    rebuild_transaction_metadata,
+    refresh_currency_fields,
+    reset_transaction_metadata,
+)
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
@@ -94,6 +104,8 @@ async def delete_all_transactions(
         
         # Delete all transactions
         db.query(Transaction).delete()
+        reset_transaction_metadata(db)
+        reset_rollups(db)
         db.commit()
         
         return {
@@ -105,11 +117,26 @@ async def delete_all_transactions(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete transactions: {str(e)}")
 
+def _metadata_response(meta: TransactionMetadata) -> dict:
+    return {
+        "ingested_columns": meta.ingested_columns or {},
+        "computed_columns": meta.computed_columns or {},
+        "ingested_column_counts": meta.ingested_column_counts or {},
+        "computed_column_counts": meta.computed_column_counts or {},
+        "currency_fields": meta.currency_fields or [],
+        "date_field": meta.date_field,
+        "updated_at": meta.updated_at.isoformat() if meta.updated_at else None,
+        "created_at": meta.created_at.isoformat() if meta.created_at else None
+    }
+
 @router.get("/metadata")
 async def get_transaction_metadata(db: Session = Depends(lambda: get_db("main"))):
     """
     Get the metadata for all transactions (singleton pattern).
     
+    Columns, per-column counts and currency fields are maintained on write,
+    so this is a single-row read.
+    
     Args:
         db: Database session
     
@@ -117,76 +144,44 @@ async def get_transaction_metadata(db: Session = Depends(lambda: get_db("main"))
         Metadata for all transactions
     """
     try:
-        # Try to get the singleton metadata record
         meta = db.query(TransactionMetadata).first()
         
-        if not meta:
-            # Create the singleton record if it doesn't exist
-            meta = TransactionMetadata(
-                id="1",
-                ingested_columns={},
-                computed_columns={}
-            )
-            db.add(meta)
+        # Only a registry that predates per-column counts or currency
+        # classification needs a one-off rebuild
+        if not meta or meta.ingested_column_counts is None or meta.computed_column_counts is None:
+            meta = rebuild_transaction_metadata(db)
+            db.commit()
+        elif meta.currency_fields is None:
+            meta = refresh_currency_fields(db)
             db.commit()
-            db.refresh(meta)
-        
-        # Regenerate metadata from all existing transactions on each call
-        all_ingested_columns = set()
-        all_computed_columns = set()
-        
-        # Get all transactions and collect unique columns
-        transactions = db.query(Transaction).all()
-        for transaction in transactions:
-            if transaction.ingested_content:
-                all_ingested_columns.update(transaction.ingested_content.keys())
-            if transaction.computed_content:
-                all_computed_columns.update(transaction.computed_content.keys())
-        
-        # Detect currency fields
-        currency_fields = []
-        currency_patterns = ['currency', 'curr', 'ccy', 'crncy']
-        common_currencies = {'USD', 'EUR', 'GBP', 'JPY', 'CHF', 'CAD', 'AUD', 'CNY', 'INR', 'RUB'}
-        currency_symbols = {'$', '€', '£', '¥', '₹', '₽', 'R$', '₩', 'kr', 'zł', '฿', 'Rp', 'RM', '₱', 'R', '₺'}
-        
-        # Check column names for currency patterns
-        all_columns = list(all_ingested_columns) + list(all_computed_columns)
-        for col in all_columns:
-            col_lower = col.lower()
-            if any(pattern in col_lower for pattern in currency_patterns):
-                currency_fields.append(col)
-                continue
-            
-            # Check if column values contain currency codes or symbols
-            has_currency_values = False
-            for transaction in transactions[:100]:  # Sample first 100 transactions
-                content = {**(transaction.ingested_content or {}), **(transaction.computed_content or {})}
-                value = content.get(col)
-                if value and isinstance(value, str):
-                    # Check for currency codes or symbols
-                    if value.upper() in common_currencies or value in currency_symbols:
-                        has_currency_values = True
-                        break
-            
-            if has_currency_values:
-                currency_fields.append(col)
-        
-        # Update metadata with collected columns
-        meta.ingested_columns = {col: True for col in all_ingested_columns}
-        meta.computed_columns = {col: True for col in all_computed_columns}
-        meta.updated_at = datetime.utcnow()
-        db.commit()
         
-        return {
-            "ingested_columns": meta.ingested_columns or {},
-            "computed_columns": meta.computed_columns or {},
-            "currency_fields": currency_fields,
-            "updated_at": meta.updated_at.isoformat() if meta.updated_at else None,
-            "created_at": meta.created_at.isoformat() if meta.created_at else None
-        }
+        return _metadata_response(meta)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve transaction metadata: {str(e)}")
 
+@router.post("/metadata/refresh")
+async def refresh_transaction_metadata(db: Session = Depends(lambda: get_db("main"))):
+    """
+    Rebuild the metadata registry from the stored transactions.
+    
+    Recounts every column, reclassifies currency fields and recomputes the
+    stored transaction dates, e.g. after rules were changed.
+    
+    Args:
+        db: Database session
+    
+    Returns:
+        The refreshed metadata
+    """
+    try:
+        meta = rebuild_transaction_metadata(db)
+        refresh_transaction_dates(db)
+        db.commit()
+        return _metadata_response(meta)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to refresh transaction metadata: {str(e)}")
+
 @router.get("/filtered")
 async def get_filtered_transactions(
     request: Request,
@@ -237,123 +232,22 @@ async def get_filtered_transactions(
                 )
             )
         
-        # Implement field-specific filtering
-        query_params = dict(request.query_params)
-        filter_params = {}
-        for key, value in query_params.items():
-            if key.startswith('filter_') and '_' in key[7:]:
-                parts = key.split('_')
-                if len(parts) >= 3:
-                    filter_index = parts[1]
-                    filter_type = parts[2]
-                    
-                    if filter_index not in filter_params:
-                        filter_params[filter_index] = {}
-                    filter_params[filter_index][filter_type] = value
-        
-        if filter_params:
-            print(f"DEBUG: Filter parameters received: {filter_params}")
-            
-            # Apply field filters
-            for filter_index, filter_data in filter_params.items():
-                if 'field' in filter_data and 'operator' in filter_data and 'value' in filter_data:
-                    field = filter_data['field']
-                    operator = filter_data['operator']
-                    value = filter_data['value']
-                    
-                    if not field or not value:
-                        continue
-                    
-                    # Convert value to appropriate type for numeric comparisons
-                    try:
-                        # Try to convert to float for numeric fields
-                        numeric_value = float(value)
-                        is_numeric = True
-                    except (ValueError, TypeError):
-                        is_numeric = False
-                    
-                    # Apply filter based on operator using raw SQL for JSON field access
-                    if operator == 'equals':
-                        if is_numeric:
-                            query = query.filter(
-                                or_(
-                                    text(f"json_extract(ingested_content, '$.{field}') = :value"),
-                                    text(f"json_extract(computed_content, '$.{field}') = :value")
-                                )
-                            ).params(value=value)
-                        else:
-                            query = query.filter(
-                                or_(
-                                    text(f"json_extract(ingested_content, '$.{field}') LIKE :value"),
-                                    text(f"json_extract(computed_content, '$.{field}') LIKE :value")
-                                )
-                            ).params(value=f"%{value}%")
-                    elif operator == 'contains':
-                        query = query.filter(
-                            or_(
-                                text(f"json_extract(ingested_content, '$.{field}') LIKE :value"),
-                                text(f"json_extract(computed_content, '$.{field}') LIKE :value")
-                            )
-                        ).params(value=f"%{value}%")
-                    elif operator == 'startswith':
-                        query = query.filter(
-                            or_(
-                                text(f"json_extract(ingested_content, '$.{field}') LIKE :value"),
-                                text(f"json_extract(computed_content, '$.{field}') LIKE :value")
-                            )
-                        ).params(value=f"{value}%")
-                    elif operator == 'endswith':
-                        query = query.filter(
-                            or_(
-                                text(f"json_extract(ingested_content, '$.{field}') LIKE :value"),
-                                text(f"json_extract(computed_content, '$.{field}') LIKE :value")
-                            )
-                        ).params(value=f"%{value}")
-                    elif operator == 'not_equals':
-                        if is_numeric:
-                            query = query.filter(
-                                and_(
-                                    text(f"json_extract(ingested_content, '$.{field}') != :value"),
-                                    text(f"json_extract(computed_content, '$.{field}') != :value")
-                                )
-                            ).params(value=value)
-                        else:
-                            query = query.filter(
-                                and_(
-                                    ~text(f"json_extract(ingested_content, '$.{field}') LIKE :value"),
-                                    ~text(f"json_extract(computed_content, '$.{field}') LIKE :value")
-                                )
-                            ).params(value=f"%{value}%")
-                    elif operator in ['gt', 'gte', 'lt', 'lte'] and is_numeric:
-                        # Numeric comparisons
-                        if operator == 'gt':
-                            query = query.filter(
-                                or_(
-                                    text(f"CAST(json_extract(ingested_content, '$.{field}') AS REAL) > :value"),
-                                    text(f"CAST(json_extract(computed_content, '$.{field}') AS REAL) > :value")
-                                )
-                            ).params(value=numeric_value)
-                        elif operator == 'gte':
-                            query = query.filter(
-                                or_(
-                                    text(f"CAST(json_extract(ingested_content, '$.{field}') AS REAL) >= :value"),
-                                    text(f"CAST(json_extract(computed_content, '$.{field}') AS REAL) >= :value")
-                                )
-                            ).params(value=numeric_value)
-                        elif operator == 'lt':
-                            query = query.filter(
-                                or_(
-                                    text(f"CAST(json_extract(ingested_content, '$.{field}') AS REAL) < :value"),
-                                    text(f"CAST(json_extract(computed_content, '$.{field}') AS REAL) < :value")
-                                )
-                            ).params(value=numeric_value)
-                        elif operator == 'lte':
-                            query = query.filter(
-                                or_(
-                                    text(f"CAST(json_extract(ingested_content, '$.{field}') AS REAL) <= :value"),
-                                    text(f"CAST(json_extract(computed_content, '$.{field}') AS REAL) <= :value")
-                                )
-                            ).params(value=numeric_value)
+        # Apply field filters
+        filters = compile_filters(parse_field_filters(dict(request.query_params)))
+        if filters.active:
+            try:
+                sql = prepare_sql(db)
+                query = query.filter(text(filters.to_sql(sql)).bindparams(**sql.params))
+            except UnsupportedQuery:
+                passes = filters.to_python()
+                matching_ids = [
+                    transaction_id
+                    for transaction_id, ingested, computed in db.query(
+                        Transaction.id, Transaction.ingested_content, Transaction.computed_content
+                    )
+                    if passes({**(ingested or {}), **(computed or {})})
+                ]
+                query = query.filter(Transaction.id.in_(matching_ids))
         
         # Apply sorting
         if sort_by:
@@ -460,6 +354,8 @@ async def delete_all_transactions(
         
         # Delete all transactions
         db.query(Transaction).delete()
+        reset_transaction_metadata(db)
+        reset_rollups(db)
         db.commit()
         
         return {
@@ -542,6 +438,8 @@ async def delete_all_transactions(
         
         # Delete all transactions
         db.query(Transaction).delete()
+        reset_transaction_metadata(db)
+        reset_rollups(db)
         db.commit()
         
         return {
@@ -574,7 +472,18 @@ async def delete_transaction(
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
+        removed_ingested = count_columns([transaction.ingested_content])
+        removed_computed = count_columns([transaction.computed_content])
+        removed_cells = collect_rollup_cells(db, contents=[(transaction.ingested_content, transaction.computed_content)])
+        
         db.delete(transaction)
+        db.flush()
+        adjust_column_counts(
+            db,
+            ingested={column: -count for column, count in removed_ingested.items()},
+            computed={column: -count for column, count in removed_computed.items()}
+        )
+        apply_rollup_changes(db, removed=removed_cells)
         db.commit()
         
         return {"message": "Transaction deleted successfully"}
@@ -611,6 +520,8 @@ async def delete_all_transactions(
         
         # Delete all transactions
         db.query(Transaction).delete()
+        reset_transaction_metadata(db)
+        reset_rollups(db)
         db.commit()
         
         return {
@@ -709,6 +620,8 @@ async def delete_all_transactions(
         
         # Delete all transactions
         db.query(Transaction).delete()
+        reset_transaction_metadata(db)
+        reset_rollups(db)
         db.commit()
         
         return {
@@ -807,6 +720,8 @@ async def delete_all_transactions(
         
         # Delete all transactions
         db.query(Transaction).delete()
+        reset_transaction_metadata(db)
+        reset_rollups(db)
         db.commit()
         
         return {
@@ -0,0 +1,714 @@
+"""
+Report data aggregation.
+
+Charts group transactions by one field and aggregate another. The grouping,
+date range, field filters and sum/avg/count all run inside SQLite: fields
+are read from the JSON content columns with json_extract and the
+conversions the reports rely on come from server.services.sql_functions,
+so only one row per group leaves the database. Databases that cannot run
+the query fall back to an equivalent scan in Python. Results are cached
+per data version in server.services.result_cache.
+
+Unfiltered charts over the fields loaded into the optional NumPy column
+store (server.services.column_store) are grouped in memory instead, and
+with REPORT_ENGINE=duckdb the others go to an embedded DuckDB mirror of
+the transactions (server.services.duckdb_mirror).
+
+Several charts can be aggregated together with aggregate_charts, which
+computes all charts sharing a date range and global filters in one scan.
+
+Charts over many labels can keep their top_n groups by value and fold the
+rest into one OTHER_LABEL group. Date series can be limited to max_points labels and have their empty
+periods filled (server.services.downsampling); both shape the cached
+result, so they never change which rows are read.
+"""
+import heapq
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from server.models.main import Transaction
+from server.services.aggregators import QUANTILES, Aggregator, make_aggregator
+from server.services.column_store import column_store
+from server.services.downsampling import downsample_series, fill_series_gaps, fitting_bucket
+from server.services.duckdb_mirror import duckdb_mirror
+from server.services.filters import FilterTree, compile_filters
+from server.services.metadata import get_data_version
+from server.services.result_cache import report_cache
+from server.services.rollups import ensure_rollup, query_rollup
+from server.services.transaction_dates import ensure_transaction_dates, undated_transaction_count
+from server.services.sql_functions import (
+    FieldSQL,
+    UnsupportedQuery,
+    content_label,
+    content_measure,
+    date_label,
+    normalize_currency,
+    parse_date,
+    period_start,
+    prepare_sql,
+)
+from server.settings import TRANSACTION_DATE_FIELD
+
+logger = logging.getLogger(__name__)
+
+# Aggregations rollup cells can answer (they hold count, sum, min and max)
+ROLLUP_AGGREGATIONS = ('sum', 'avg', 'count', 'min', 'max')
+
+# Group key -> [aggregated y value, number of y values]; the value is the sum for sum/avg/count
+Groups = Dict[Tuple[str, Optional[str]], List[float]]
+
+# Label order of a chart: by label, or by aggregated value
+ORDER_BY = ('label', 'value_desc', 'value_asc')
+
+# Label of the group the labels beyond top_n are folded into
+OTHER_LABEL = 'Other'
+
+# Aggregations whose groups don't combine from their [value, count]; the others (and unknown ones, which sum) do
+SKETCH_AGGREGATIONS = (*QUANTILES, 'distinct_count')
+
+
+def _parse_date_bound(value: Optional[str]):
+    if not value:
+        return None
+    return datetime.fromisoformat(value).date()
+
+
+@dataclass
+class ChartQuery:
+    """A chart aggregation with its parameters normalized"""
+    x_field: str
+    y_field: str
+    aggregation: str
+    date_from: Optional[str]
+    date_to: Optional[str]
+    date_field: str
+    date_bucket: Optional[str]
+    currency_field: Optional[str]  # Only set when splitting by currency
+    split: bool
+    filters: FilterTree
+    top_n: Optional[int] = None
+    order_by: str = 'label'
+    max_points: Optional[int] = None  # Only set for x_field 'date' series in label order
+    fill_gaps: bool = False
+
+    @classmethod
+    def from_params(
+        cls,
+        x_field: str,
+        y_field: str,
+        aggregation: str = "sum",
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        date_field: str = "date",
+        date_bucket: Optional[str] = None,
+        currency_field: Optional[str] = None,
+        split_by_currency: bool = False,
+        filter_params: Optional[Dict[str, Dict[str, str]]] = None,
+        global_filter_count: int = 0,
+        global_local_connector: str = "AND",
+        top_n: Optional[int] = None,
+        order_by: Optional[str] = None,
+        max_points: Optional[int] = None,
+        fill_gaps: bool = False
+    ) -> "ChartQuery":
+        split = bool(split_by_currency and currency_field)
+        order_by = order_by or ('value_desc' if top_n else 'label')
+        series = x_field == 'date' and not top_n and order_by == 'label'
+        return cls(
+            x_field=x_field,
+            y_field=y_field,
+            aggregation=aggregation,
+            date_from=date_from,
+            date_to=date_to,
+            date_field=date_field,
+            date_bucket=date_bucket if x_field == 'date' else None,
+            currency_field=currency_field if split else None,
+            split=split,
+            filters=compile_filters(filter_params, global_filter_count, global_local_connector),
+            top_n=top_n,
+            order_by=order_by,
+            max_points=max_points if series else None,
+            fill_gaps=fill_gaps and series
+        )
+
+    @property
+    def filtered(self) -> bool:
+        return self.filters.active
+
+    @property
+    def shaped(self) -> bool:
+        """Whether the date series is fitted to a point budget or gap-filled after aggregation"""
+        return bool(self.max_points or self.fill_gaps)
+
+    def cache_key(self) -> Tuple:
+        return (
+            "aggregated", self.x_field, self.y_field, self.aggregation,
+            self.date_from, self.date_to, self.date_field, self.date_bucket, self.currency_field,
+            self.filters.key(), self.top_n, self.order_by
+        )
+
+    def scope_key(self) -> Tuple:
+        """Charts with the same scope read the same rows before their local filters"""
+        global_group = self.filters.global_group
+        return (self.date_from, self.date_to, self.date_field, global_group.key() if global_group else None)
+
+    def bounds(self):
+        """Parsed (date_from, date_to), or None when a bound is unparseable"""
+        try:
+            return _parse_date_bound(self.date_from), _parse_date_bound(self.date_to)
+        except ValueError:
+            return None
+
+    def scan_params(self) -> Dict[str, Any]:
+        """Keyword arguments of _aggregate_sql and _aggregate_python"""
+        date_from, date_to = self.bounds()
+        return dict(
+            x_field=self.x_field,
+            y_field=self.y_field,
+            aggregation=self.aggregation,
+            date_from=date_from,
+            date_to=date_to,
+            date_field=self.date_field,
+            date_bucket=self.date_bucket,
+            currency_field=self.currency_field,
+            filters=self.filters
+        )
+
+
+def aggregate_transactions(
+    db: Session,
+    x_field: str,
+    y_field: str,
+    aggregation: str = "sum",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    date_field: str = "date",
+    date_bucket: Optional[str] = None,
+    currency_field: Optional[str] = None,
+    split_by_currency: bool = False,
+    filter_params: Optional[Dict[str, Dict[str, str]]] = None,
+    global_filter_count: int = 0,
+    global_local_connector: str = "AND",
+    top_n: Optional[int] = None,
+    order_by: Optional[str] = None,
+    max_points: Optional[int] = None,
+    fill_gaps: bool = False
+) -> Dict[str, Any]:
+    """
+    Aggregate transactions for a chart.
+
+    Args:
+        db: Database session
+        x_field: Field to group by ('date' groups by the date part of date_field)
+        y_field: Field to aggregate
+        aggregation: One of AGGREGATIONS (anything else sums)
+        date_from: Optional ISO start date, inclusive
+        date_to: Optional ISO end date, inclusive
+        date_field: Field the date range and 'date' grouping use
+        date_bucket: Group x_field 'date' by day, week or month of the parsed date
+        currency_field: Currency field used when splitting by currency
+        split_by_currency: Return one series per currency
+        filter_params: Field filters as returned by parse_field_filters
+        global_filter_count: Number of global filters (the rest are local)
+        global_local_connector: AND or OR between the global and local filter sets
+        top_n: Keep the top_n labels by value and fold the others into OTHER_LABEL
+        order_by: One of ORDER_BY; value_desc with top_n, label otherwise
+        max_points: Most labels an x_field 'date' chart returns; a coarser
+            date_bucket is used when it fits, else the series is downsampled
+        fill_gaps: Add 0 values for the empty periods of an x_field 'date' chart
+
+    Returns:
+        The /reports/data/aggregated/ response
+    """
+    return aggregate_charts(db, [dict(
+        x_field=x_field,
+        y_field=y_field,
+        aggregation=aggregation,
+        date_from=date_from,
+        date_to=date_to,
+        date_field=date_field,
+        date_bucket=date_bucket,
+        currency_field=currency_field,
+        split_by_currency=split_by_currency,
+        filter_params=filter_params,
+        global_filter_count=global_filter_count,
+        global_local_connector=global_local_connector,
+        top_n=top_n,
+        order_by=order_by,
+        max_points=max_points,
+        fill_gaps=fill_gaps
+    )])[0]
+
+
+def aggregate_charts(db: Session, charts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aggregate transactions for several charts at once.
+
+    Cached charts are returned as is and unfiltered ones are answered from
+    the column store when it holds their fields, else from the DuckDB
+    mirror when it is enabled, else from rollups. The remaining charts are grouped by their date range and global
+    filters, and each group is aggregated in a single scan of the
+    transactions, so a dashboard costs about one scan however many charts
+    it has. Date series with a point budget or gap filling are shaped last.
+
+    Args:
+        db: Database session
+        charts: Keyword arguments of aggregate_transactions, one dict per chart
+
+    Returns:
+        One /reports/data/aggregated/ response per chart, in order
+    """
+    queries = [ChartQuery.from_params(**chart) for chart in charts]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+
+    version = get_data_version(db) if report_cache.enabled else None
+    if version is not None:
+        for index, query in enumerate(queries):
+            results[index] = report_cache.get(version, query.cache_key())
+    if all(result is not None for result in results):
+        return _shape_series(db, charts, queries, results)
+
+    total_records = db.query(func.count(Transaction.id)).scalar() or 0
+    undated_records = None
+    if ensure_transaction_dates(db) and any(
+        query.date_field == TRANSACTION_DATE_FIELD and (query.date_from or query.date_to) for query in queries
+    ):
+        undated_records = undated_transaction_count(db)
+
+    scopes: Dict[Tuple, List[int]] = defaultdict(list)
+    for index, query in enumerate(queries):
+        if results[index] is not None:
+            continue
+        bounds = query.bounds()
+        rollup = None
+        if bounds is None:
+            # Every transaction fails an unparseable date bound
+            groups = {}
+        else:
+            groups = column_store.aggregate(db, **query.scan_params())
+            if groups is None:
+                groups = duckdb_mirror.aggregate(db, **query.scan_params())
+        if groups is None:
+            if query.filtered or query.aggregation not in ROLLUP_AGGREGATIONS or not (
+                rollup := ensure_rollup(db, query.x_field, query.y_field, query.date_field, query.currency_field)
+            ):
+                scopes[query.scope_key()].append(index)
+                continue
+            # Unfiltered charts are answered from a rollup
+            groups = query_rollup(
+                db, rollup, bounds[0], bounds[1], query.date_bucket, query.split, query.aggregation
+            )
+        results[index] = _finish(query, groups, version, total_records, undated_records)
+
+    for indexes in scopes.values():
+        scoped = [queries[index] for index in indexes]
+        try:
+            if len(scoped) == 1:
+                all_groups = [_aggregate_sql(db, **scoped[0].scan_params())]
+            else:
+                all_groups = _aggregate_sql_many(db, scoped)
+        except UnsupportedQuery as e:
+            logger.info(f"Aggregating in Python: {e}")
+            all_groups = [_aggregate_python(db, **query.scan_params()) for query in scoped]
+        for index, groups in zip(indexes, all_groups):
+            results[index] = _finish(queries[index], groups, version, total_records, undated_records)
+
+    return _shape_series(db, charts, queries, results)
+
+
+def _shape_series(
+    db: Session,
+    charts: List[Dict[str, Any]],
+    queries: List[ChartQuery],
+    results: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Fit date series to their max_points and fill their gaps.
+
+    Series with too many labels are aggregated again, together, with the
+    finest date bucket that fits; LTTB then reduces the ones that are still
+    too long. Cached results are copied, never modified.
+    """
+    buckets = {index: query.date_bucket for index, query in enumerate(queries) if query.shaped}
+    if not buckets:
+        return results
+
+    coarser = {}
+    for index, bucket in buckets.items():
+        query = queries[index]
+        if query.max_points:
+            fitted = fitting_bucket(results[index]["labels"], bucket, query.max_points, query.fill_gaps)
+            if fitted != bucket:
+                coarser[index] = buckets[index] = fitted
+    if coarser:
+        regrouped = aggregate_charts(db, [
+            dict(charts[index], date_bucket=bucket, max_points=None, fill_gaps=False)
+            for index, bucket in coarser.items()
+        ])
+        for index, result in zip(coarser, regrouped):
+            results[index] = result
+
+    for index, bucket in buckets.items():
+        query = queries[index]
+        result = fill_series_gaps(results[index], bucket) if query.fill_gaps else results[index]
+        if query.max_points:
+            result = downsample_series(result, bucket, query.max_points)
+        results[index] = dict(result, date_bucket=bucket, downsampled=result.get("downsampled", False))
+    return results
+
+
+def _finish(
+    query: ChartQuery,
+    groups: Groups,
+    version: Optional[str],
+    total_records: int,
+    undated_records: Optional[int]
+) -> Dict[str, Any]:
+    ranked, labels, other_groups = _rank_groups(groups, query.aggregation, query.top_n, query.order_by)
+    result = _build_response(
+        ranked, query.x_field, query.y_field, query.aggregation, query.split, total_records, labels
+    )
+    if query.top_n:
+        # Labels folded into OTHER_LABEL (or dropped, for aggregations that don't merge)
+        result["other_groups"] = other_groups
+        if not query.split:
+            result["filtered_records"] = sum(count for _, count in groups.values())
+    if undated_records is not None and query.date_field == TRANSACTION_DATE_FIELD and (query.date_from or query.date_to):
+        # Transactions left out of the date range because their date doesn't parse
+        result["undated_records"] = undated_records
+    if version is not None:
+        report_cache.put(version, query.cache_key(), result)
+    return result
+
+
+def _aggregate_value(group: Optional[List[float]], aggregation: str):
+    if not group:
+        return 0
+    total, count = group
+    if aggregation == 'avg':
+        return total / count
+    if aggregation == 'count':
+        return count
+    return total
+
+
+def _merge_group(group: List[float], other: List[float], aggregation: str) -> List[float]:
+    if aggregation == 'min':
+        return [min(group[0], other[0]), group[1] + other[1]]
+    if aggregation == 'max':
+        return [max(group[0], other[0]), group[1] + other[1]]
+    return [group[0] + other[0], group[1] + other[1]]
+
+
+def _label_value(currency_groups: List[List[float]], aggregation: str) -> float:
+    """Value of a label across its currencies, used to rank labels"""
+    if aggregation not in SKETCH_AGGREGATIONS:
+        merged = currency_groups[0]
+        for group in currency_groups[1:]:
+            merged = _merge_group(merged, group, aggregation)
+        return _aggregate_value(merged, aggregation)
+    # Sketches don't combine; rank by the sum of the currency values
+    return sum(_aggregate_value(group, aggregation) or 0 for group in currency_groups)
+
+
+def _rank_groups(
+    groups: Groups,
+    aggregation: str,
+    top_n: Optional[int],
+    order_by: str
+) -> Tuple[Groups, List[str], int]:
+    """
+    Order a chart's labels and keep its top_n.
+
+    The top_n labels are picked with a bounded heap, never sorting all of
+    them. The other labels are folded into OTHER_LABEL, which comes last,
+    when the aggregation merges exactly; they are dropped otherwise.
+
+    Returns:
+        (groups, ordered labels, number of labels folded or dropped)
+    """
+    by_label: Dict[str, Dict[Optional[str], List[float]]] = defaultdict(dict)
+    for (label, currency), group in groups.items():
+        by_label[label][currency] = group
+    if order_by not in ORDER_BY[1:] and not (top_n and len(by_label) > top_n):
+        return groups, sorted(by_label), 0
+
+    scores = {label: _label_value(list(currency_groups.values()), aggregation) for label, currency_groups in by_label.items()}
+    sign = 1 if order_by == 'value_asc' else -1
+
+    def rank(label: str) -> Tuple[float, str]:
+        return sign * scores[label], label
+
+    if not top_n or len(by_label) <= top_n:
+        return groups, sorted(by_label, key=rank if order_by in ORDER_BY[1:] else None), 0
+
+    # An existing OTHER_LABEL group is folded too, so the label stays unambiguous
+    candidates = [label for label in by_label if label != OTHER_LABEL]
+    kept = heapq.nsmallest(top_n, candidates, key=rank)
+    if order_by == 'label':
+        kept.sort()
+    kept_set = set(kept)
+
+    ranked: Groups = {}
+    for label in kept:
+        for currency, group in by_label[label].items():
+            ranked[(label, currency)] = group
+    folded = [label for label in by_label if label not in kept_set]
+    if aggregation not in SKETCH_AGGREGATIONS:
+        for label in folded:
+            for currency, group in by_label[label].items():
+                key = (OTHER_LABEL, currency)
+                ranked[key] = _merge_group(ranked[key], group, aggregation) if key in ranked else list(group)
+        if folded:
+            kept.append(OTHER_LABEL)
+    return ranked, kept, len(folded)
+
+
+def _build_response(
+    groups: Groups,
+    x_field: str,
+    y_field: str,
+    aggregation: str,
+    split: bool,
+    total_records: int,
+    labels: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    if labels is None:
+        labels = sorted({label for label, _ in groups})
+
+    if split:
+        currencies = sorted({currency for _, currency in groups})
+        values_by_currency = {
+            currency: [round(_aggregate_value(groups.get((label, currency)), aggregation), 2) for label in labels]
+            for currency in currencies
+        }
+        return {
+            "labels": labels,
+            "values_by_currency": values_by_currency,
+            "currencies": currencies,
+            "x_field": x_field,
+            "y_field": y_field,
+            "aggregation": aggregation,
+            "split_by_currency": True,
+            "total_records": total_records
+        }
+
+    return {
+        "labels": labels,
+        "values": [round(_aggregate_value(groups.get((label, None)), aggregation), 2) for label in labels],
+        "x_field": x_field,
+        "y_field": y_field,
+        "aggregation": aggregation,
+        "split_by_currency": False,
+        "total_records": total_records,
+        "filtered_records": sum(count for _, count in groups.values())
+    }
+
+
+# SQL path
+
+def _date_range(sql: FieldSQL, date_field: str, date_from, date_to) -> Tuple[str, str, List[str]]:
+    """
+    Restrict rows to a date range: returns a condition on the transactions
+    table, the txn_date expression to select and conditions on txn_date.
+
+    The stored date field is a range on the indexed txn_day column; other
+    fields are parsed row by row.
+    """
+    # The stored date is passed through: bucketed labels may read it
+    stored = "txn_date" if sql.dated_field else "NULL"
+    if not (date_from or date_to):
+        return "1", stored, []
+    day_range = sql.day_range(date_field, date_from, date_to)
+    if day_range:
+        return day_range, stored, []
+
+    conditions = ["txn_date IS NOT NULL"]
+    if date_from:
+        conditions.append(f"txn_date >= {sql.bind(date_from.isoformat())}")
+    if date_to:
+        conditions.append(f"txn_date <= {sql.bind(date_to.isoformat())}")
+    return "1", sql.date(date_field), conditions
+
+
+def _value_sql(aggregation: str, y: str) -> str:
+    """SQL aggregate computing a group's value"""
+    if aggregation in ('min', 'max'):
+        return f"{aggregation.upper()}({y})"
+    if aggregation in QUANTILES or aggregation == 'distinct_count':
+        return f"moneta_{aggregation}({y})"
+    return f"SUM({y})"
+
+
+def _y_sql(sql: FieldSQL, aggregation: str, y_field: str) -> str:
+    """The y value: distinct counts compare values as labels, the rest need numbers"""
+    if aggregation == 'distinct_count':
+        return sql.value_label(y_field)
+    return sql.measure(y_field)
+
+
+def _aggregate_sql(
+    db: Session,
+    x_field: str,
+    y_field: str,
+    aggregation: str,
+    date_from,
+    date_to,
+    date_field: str,
+    date_bucket: Optional[str],
+    currency_field: Optional[str],
+    filters: FilterTree
+) -> Groups:
+    sql = prepare_sql(db)
+
+    x_expr = sql.label(x_field, date_field, date_bucket)
+    y_expr = _y_sql(sql, aggregation, y_field)
+    currency_expr = sql.currency(currency_field)
+
+    table_condition, date_expr, date_conditions = _date_range(sql, date_field, date_from, date_to)
+    conditions = ["label IS NOT NULL", "y IS NOT NULL", *date_conditions]
+
+    where = f"{filters.to_sql(sql)} AND {table_condition}"
+
+    statement = text(
+        f"SELECT label, currency, {_value_sql(aggregation, 'y')}, COUNT(y) FROM ("
+        f"SELECT {x_expr} AS label, {y_expr} AS y, {currency_expr} AS currency, {date_expr} AS txn_date "
+        f"FROM transactions WHERE {where}"
+        f") AS grouped WHERE {' AND '.join(conditions)} GROUP BY label, currency"
+    )
+
+    return {
+        (label, currency): [total, count]
+        for label, currency, total, count in db.execute(statement, sql.params)
+    }
+
+
+def _aggregate_sql_many(db: Session, queries: List[ChartQuery]) -> List[Groups]:
+    """
+    Aggregate charts sharing a date range and global filters in one scan.
+
+    A common table expression reads the transactions once, applies the
+    shared scope and computes every chart's label, measure, currency and
+    local filter result as columns; each chart then groups its own columns.
+    """
+    sql = prepare_sql(db)
+    scope = queries[0]
+    date_from, date_to = scope.bounds()
+
+    table_condition, date_expr, date_conditions = _date_range(sql, scope.date_field, date_from, date_to)
+
+    global_group = scope.filters.global_group
+    has_global = global_group is not None
+    global_condition = global_group.to_sql(sql) if has_global else "1"
+    # Under OR a row failing the global filters can still pass a chart's local
+    # ones, so the global filters are only applied up front when no chart uses OR
+    shared_global = has_global and not any(q.filters.use_or and q.filters.combines for q in queries)
+
+    columns = []
+    if has_global and not shared_global:
+        columns.append(f"{global_condition} AS global_pass")
+
+    selects = []
+    for index, query in enumerate(queries):
+        columns += [
+            f"{sql.label(query.x_field, query.date_field, query.date_bucket)} AS label_{index}",
+            f"{_y_sql(sql, query.aggregation, query.y_field)} AS y_{index}",
+            f"{sql.currency(query.currency_field)} AS currency_{index}"
+        ]
+        local = None
+        if query.filters.local_group is not None:
+            columns.append(f"{query.filters.local_group.to_sql(sql)} AS local_{index}")
+            local = f"local_{index}"
+
+        if has_global and not shared_global:
+            passed = f"(global_pass {'OR' if query.filters.use_or else 'AND'} {local})" if local else "global_pass"
+        else:
+            passed = local or "1"
+
+        selects.append(
+            f"SELECT {index} AS chart, label_{index}, currency_{index}, "
+            f"{_value_sql(query.aggregation, f'y_{index}')}, COUNT(y_{index}) "
+            f"FROM scoped WHERE label_{index} IS NOT NULL AND y_{index} IS NOT NULL AND {passed} "
+            f"GROUP BY label_{index}, currency_{index}"
+        )
+
+    statement = text(
+        f"WITH scoped AS ("
+        f"SELECT {', '.join(columns)} FROM ("
+        f"SELECT ingested_content, computed_content, {date_expr} AS txn_date "
+        f"FROM transactions WHERE {global_condition if shared_global else '1'} AND {table_condition}"
+        f") AS dated WHERE {' AND '.join(date_conditions) or '1'}"
+        f") {' UNION ALL '.join(selects)}"
+    )
+
+    all_groups: List[Groups] = [{} for _ in queries]
+    for chart, label, currency, total, count in db.execute(statement, sql.params):
+        all_groups[chart][(label, currency)] = [total, count]
+    return all_groups
+
+
+# Python fallback
+
+def _aggregate_python(
+    db: Session,
+    x_field: str,
+    y_field: str,
+    aggregation: str,
+    date_from,
+    date_to,
+    date_field: str,
+    date_bucket: Optional[str],
+    currency_field: Optional[str],
+    filters: FilterTree
+) -> Groups:
+    aggregators: Dict[Tuple[str, Optional[str]], Aggregator] = {}
+    passes = filters.to_python()
+
+    for ingested, computed in db.query(Transaction.ingested_content, Transaction.computed_content).yield_per(1000):
+        content = {**(ingested or {}), **(computed or {})}
+
+        if date_from or date_to:
+            txn_date = parse_date(content.get(date_field))
+            if txn_date is None:
+                continue
+            if date_from and txn_date.date() < date_from:
+                continue
+            if date_to and txn_date.date() > date_to:
+                continue
+
+        if not passes(content):
+            continue
+
+        if x_field == 'date' and date_bucket:
+            txn_date = parse_date(content.get(date_field))
+            x_value = period_start(txn_date.date().isoformat(), date_bucket) if txn_date else None
+        elif x_field == 'date':
+            x_value = date_label(content.get(date_field))
+        else:
+            x_value = content_label(content, x_field)
+        if x_value is None:
+            continue
+
+        if aggregation == 'distinct_count':
+            y_value = content_label(content, y_field)
+        else:
+            y_value = content_measure(content, y_field)
+        if y_value is None:
+            continue
+
+        currency = None
+        if currency_field:
+            currency = normalize_currency(content.get(currency_field))
+
+        key = (x_value, currency)
+        if key not in aggregators:
+            aggregators[key] = make_aggregator(aggregation)
+        aggregators[key].add(y_value)
+
+    return {key: [aggregator.result(), aggregator.count] for key, aggregator in aggregators.items()}
@@ -0,0 +1,265 @@
+"""
+Streaming aggregators for report groups.
+
+Each aggregator keeps a constant amount of state per group however many
+values it sees, and two aggregators of the same kind merge into the state
+of their combined values. sum/avg/count keep a running total, min/max the
+extreme value, median/p90 a t-digest (exact until a group holds a few dozen
+values, approximate after) and distinct_count a HyperLogLog sketch.
+
+The same classes run inside SQLite as aggregate functions (registered with
+the other report functions in server.services.sql_functions) and in the
+Python fallback, so both paths compute the same values.
+"""
+import hashlib
+import math
+from typing import Any, List, Optional, Tuple
+
+# Aggregations a chart can request
+AGGREGATIONS = ('sum', 'avg', 'count', 'min', 'max', 'median', 'p90', 'distinct_count')
+
+# Quantile aggregations and the quantile they estimate
+QUANTILES = {'median': 0.5, 'p90': 0.9}
+
+# Size bound of a t-digest: higher keeps more centroids and is more accurate
+TDIGEST_COMPRESSION = 100
+
+# Values buffered by a t-digest before they are merged into its centroids
+TDIGEST_BUFFER_SIZE = 5 * TDIGEST_COMPRESSION
+
+# A HyperLogLog sketch has 2 ** precision one-byte registers (about 1.6% error at 12)
+HLL_PRECISION = 12
+
+
+class Aggregator:
+    """Constant-size state of one group; ``count`` is the number of values added"""
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value: Any):
+        raise NotImplementedError
+
+    def merge(self, other: "Aggregator"):
+        raise NotImplementedError
+
+    def result(self) -> Optional[float]:
+        raise NotImplementedError
+
+
+class SumAggregator(Aggregator):
+    """Running total; avg and count are derived from the total and the count"""
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: "SumAggregator"):
+        self.total += other.total
+        self.count += other.count
+
+    def result(self) -> float:
+        return self.total
+
+
+class MinAggregator(Aggregator):
+    def __init__(self):
+        super().__init__()
+        self.value: Optional[float] = None
+
+    def add(self, value: float):
+        if self.value is None or value < self.value:
+            self.value = value
+        self.count += 1
+
+    def merge(self, other: "MinAggregator"):
+        if other.value is not None and (self.value is None or other.value < self.value):
+            self.value = other.value
+        self.count += other.count
+
+    def result(self) -> Optional[float]:
+        return self.value
+
+
+class MaxAggregator(Aggregator):
+    def __init__(self):
+        super().__init__()
+        self.value: Optional[float] = None
+
+    def add(self, value: float):
+        if self.value is None or value > self.value:
+            self.value = value
+        self.count += 1
+
+    def merge(self, other: "MaxAggregator"):
+        if other.value is not None and (self.value is None or other.value > self.value):
+            self.value = other.value
+        self.count += other.count
+
+    def result(self) -> Optional[float]:
+        return self.value
+
+
+class TDigest(Aggregator):
+    """
+    Merging t-digest estimating one quantile.
+
+    Values are buffered and merged into at most about TDIGEST_COMPRESSION
+    weighted centroids, small ones near the tails and larger ones in the
+    middle. Quantiles interpolate linearly between centroid centers like
+    numpy's default, so they are exact while every centroid holds one value.
+    """
+
+    def __init__(self, quantile: float, compression: int = TDIGEST_COMPRESSION):
+        super().__init__()
+        self.quantile = quantile
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []  # (mean, weight), sorted by mean
+        self._buffer: List[Tuple[float, float]] = []
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float):
+        self._buffer.append((value, 1.0))
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self._buffer) >= TDIGEST_BUFFER_SIZE:
+            self._compress()
+
+    def merge(self, other: "TDigest"):
+        if not other.count:
+            return
+        self._buffer.extend(other.centroids)
+        self._buffer.extend(other._buffer)
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if len(self._buffer) >= TDIGEST_BUFFER_SIZE:
+            self._compress()
+
+    def _scale(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _inverse_scale(self, k: float) -> float:
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        centroids = []
+        mean, weight = points[0]
+        before = 0.0
+        limit = self._inverse_scale(self._scale(0.0) + 1)
+        for next_mean, next_weight in points[1:]:
+            if (before + weight + next_weight) / total <= limit:
+                mean += (next_mean - mean) * next_weight / (weight + next_weight)
+                weight += next_weight
+            else:
+                centroids.append((mean, weight))
+                before += weight
+                limit = self._inverse_scale(self._scale(before / total) + 1)
+                mean, weight = next_mean, next_weight
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def result(self) -> Optional[float]:
+        if not self.count:
+            return None
+        self._compress()
+        position = self.quantile * (self.count - 1)
+
+        # Position of each centroid's center among the sorted values
+        centers = []
+        before = 0.0
+        for mean, weight in self.centroids:
+            centers.append((before + (weight - 1) / 2, mean))
+            before += weight
+        centers = [(0.0, self.min)] + centers + [(self.count - 1.0, self.max)]
+
+        for (left, low), (right, high) in zip(centers, centers[1:]):
+            if position <= right:
+                if right <= left:
+                    return high
+                return low + (high - low) * (position - left) / (right - left)
+        return self.max
+
+
+class HyperLogLog(Aggregator):
+    """Approximate number of distinct values, with linear counting for small sets"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        super().__init__()
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: Any):
+        self.count += 1
+        digest = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = digest >> (64 - self.precision)
+        rest = digest & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        registers = self.registers
+        for index, rank in enumerate(other.registers):
+            if rank > registers[index]:
+                registers[index] = rank
+        self.count += other.count
+
+    def result(self) -> float:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return float(round(estimate))
+
+
+def make_aggregator(aggregation: str) -> Aggregator:
+    """A fresh aggregator for an aggregation; unknown ones sum"""
+    if aggregation == 'min':
+        return MinAggregator()
+    if aggregation == 'max':
+        return MaxAggregator()
+    if aggregation in QUANTILES:
+        return TDigest(QUANTILES[aggregation])
+    if aggregation == 'distinct_count':
+        return HyperLogLog()
+    return SumAggregator()
+
+
+class SQLiteAggregate:
+    """SQLite aggregate function class running an aggregator; NULLs are skipped"""
+
+    aggregation = 'sum'
+
+    def __init__(self):
+        self.aggregator = make_aggregator(self.aggregation)
+
+    def step(self, value):
+        if value is not None:
+            self.aggregator.add(value)
+
+    def finalize(self):
+        return self.aggregator.result()
+
+
+def sqlite_aggregate(aggregation: str) -> type:
+    """The SQLiteAggregate subclass of an aggregation"""
+    return type(f"SQLite_{aggregation}", (SQLiteAggregate,), {"aggregation": aggregation})
@@ -0,0 +1,360 @@
+"""
+Batch evaluation of rule expressions.
+
+compile_batch_expression turns a parsed condition or formula into a function
+evaluating it for a batch of transactions at once. Fields are read as NumPy
+object columns, comparisons and operators are applied column-wise with one
+ufunc call, the whitelisted string methods run as pandas string operations
+and formula commands through BaseCommand.execute_batch.
+
+Each row gets exactly the value of the closures in
+server.services.expression_compiler: the same Python operator is applied to
+the same values, 'and'/'or' only evaluate their right side on the rows that
+need it, and a row on which the closure would raise is marked as an error
+instead of failing the batch. Expressions using anything without a batch
+form (chained comparisons, unsupported nodes, operators or methods, calls
+of anything but a formula command) compile to None and are left to the row
+evaluator.
+"""
+import ast
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from server.services.expression_compiler import SAFE_OPERATORS, SAFE_STRING_METHODS
+from server.services.formula_commands import command_registry
+
+# Values of an expression for the rows of a view: an ndarray with one value
+# per row, or a plain value shared by every row (constants), and a mask of
+# the rows whose evaluation failed (None when none did)
+BatchValues = Tuple[Any, Optional[np.ndarray]]
+
+
+def object_column(values: Iterable[Any], size: int) -> np.ndarray:
+    """1-d object array of the values, nested lists and dicts kept as values"""
+    return np.fromiter(values, dtype=object, count=size)
+
+
+class RuleBatch:
+    """Transaction data of a batch of transactions, read field by field as columns"""
+
+    def __init__(self, rows: List[Dict[str, Any]], available_commands: List[str]):
+        self.rows = rows
+        self.size = len(rows)
+        self.available_commands = available_commands
+        self._columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def column(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(values, missing) of a field, values None where the field is missing"""
+        column = self._columns.get(name)
+        if column is None:
+            values = object_column((row.get(name) for row in self.rows), self.size)
+            missing = np.fromiter((name not in row for row in self.rows), dtype=bool, count=self.size)
+            column = self._columns[name] = (values, missing)
+        return column
+
+    def assign(self, name: str, positions: np.ndarray, values: List[Any]):
+        """Set a field on the rows at ``positions``, keeping its column current"""
+        rows = self.rows
+        for position, value in zip(positions.tolist(), values):
+            rows[position][name] = value
+        column = self._columns.get(name)
+        if column is not None:
+            column[0][positions] = object_column(values, len(values))
+            column[1][positions] = False
+
+    def view(self, positions: Optional[np.ndarray] = None) -> "BatchView":
+        return BatchView(self, positions)
+
+
+class BatchView:
+    """The rows of a batch at ``positions``, all of them when None"""
+
+    def __init__(self, batch: RuleBatch, positions: Optional[np.ndarray]):
+        self.batch = batch
+        self.positions = positions
+        self.size = batch.size if positions is None else len(positions)
+        self.available_commands = batch.available_commands
+
+    def column(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        values, missing = self.batch.column(name)
+        if self.positions is None:
+            return values, missing
+        return values[self.positions], missing[self.positions]
+
+    def subset(self, indexes: np.ndarray) -> "BatchView":
+        """View of the rows at ``indexes`` of this view"""
+        return BatchView(self.batch, indexes if self.positions is None else self.positions[indexes])
+
+
+# A batch-compiled expression: view -> values of its rows
+BatchExpression = Callable[[BatchView], BatchValues]
+
+
+def compile_batch_expression(node: ast.AST) -> Optional[BatchExpression]:
+    """Compile an expression node for batches; None when it has no batch form"""
+    compiler = _COMPILERS.get(type(node))
+    return compiler(node) if compiler is not None else None
+
+
+def truth(values: BatchValues, size: int) -> np.ndarray:
+    """Rows whose value is truthy; rows that failed are not"""
+    values, errors = values
+    if not isinstance(values, np.ndarray):
+        try:
+            result = np.full(size, bool(values))
+        except Exception:
+            result = np.zeros(size, dtype=bool)
+    elif values.dtype == bool:
+        result = values.copy()
+    else:
+        # Rows where bool() raises are left None, which is falsy
+        truthy, _ = _apply(bool, size, (values, errors))
+        result = truthy.astype(bool)
+    if errors is not None:
+        result &= ~errors
+    return result
+
+
+def row_values(values: Any, size: int) -> List[Any]:
+    """Python values of a batch result, one per row"""
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return [values] * size
+
+
+def _combine_errors(size: int, *errors: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    present = [error for error in errors if error is not None]
+    if not present:
+        return None
+    combined = np.zeros(size, dtype=bool)
+    for error in present:
+        combined |= error
+    return combined
+
+
+def _broadcastable(value: Any) -> np.ndarray:
+    """0-d object array holding ``value``, broadcast to every row without conversion"""
+    holder = np.empty((), dtype=object)
+    holder[()] = value
+    return holder
+
+
+def _apply_rows(function: Callable, arguments: List[Any], size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """function called row by row; rows where it raises are marked failed"""
+    columns = [argument if isinstance(argument, np.ndarray) else [argument] * size for argument in arguments]
+    values = np.empty(size, dtype=object)
+    failed = np.zeros(size, dtype=bool)
+    for index, row in enumerate(zip(*columns)):
+        try:
+            values[index] = function(*row)
+        except Exception:
+            failed[index] = True
+    return values, failed
+
+
+def _apply(function: Callable, size: int, *operands: BatchValues) -> BatchValues:
+    """
+    ``function`` applied to the operands' values of every row.
+
+    It is called as one ufunc over the rows whose operands didn't fail; if it
+    raises on any of them, the rows are called one by one and those raising
+    are marked failed.
+    """
+    errors = _combine_errors(size, *(error for _, error in operands))
+    arguments = [values for values, _ in operands]
+    if not any(isinstance(argument, np.ndarray) for argument in arguments):
+        try:
+            return function(*arguments), errors
+        except Exception:
+            return None, np.ones(size, dtype=bool)
+
+    valid = None
+    if errors is not None:
+        valid = np.flatnonzero(~errors)
+        arguments = [argument[valid] if isinstance(argument, np.ndarray) else argument for argument in arguments]
+    count = size if valid is None else len(valid)
+    try:
+        result = np.frompyfunc(function, len(arguments), 1)(
+            *(argument if isinstance(argument, np.ndarray) else _broadcastable(argument) for argument in arguments)
+        )
+        failed = None
+    except Exception:
+        result, failed = _apply_rows(function, arguments, count)
+    if valid is None:
+        return result, failed
+    values = np.empty(size, dtype=object)
+    values[valid] = result
+    if failed is not None:
+        errors[valid[failed]] = True
+    return values, errors
+
+
+def _constant(node: ast.Constant) -> BatchExpression:
+    value = node.value
+    return lambda view: (value, None)
+
+
+def _name(node: ast.Name) -> BatchExpression:
+    name = node.id
+
+    def load(view):
+        values, missing = view.column(name)
+        return values, missing if missing.any() else None
+    return load
+
+
+def _compare(node: ast.Compare) -> Optional[BatchExpression]:
+    if len(node.ops) != 1:
+        return None
+    compare = SAFE_OPERATORS.get(type(node.ops[0]))
+    left = compile_batch_expression(node.left)
+    right = compile_batch_expression(node.comparators[0])
+    if compare is None or left is None or right is None:
+        return None
+    return lambda view: _apply(compare, view.size, left(view), right(view))
+
+
+def _bool_op(node: ast.BoolOp) -> Optional[BatchExpression]:
+    values = [compile_batch_expression(value) for value in node.values]
+    if any(value is None for value in values) or not isinstance(node.op, (ast.And, ast.Or)):
+        return None
+    # 'and' stops at the first falsy value, 'or' at the first truthy one
+    stop_at = isinstance(node.op, ast.Or)
+
+    def evaluate(view):
+        result = np.full(view.size, not stop_at)
+        errors = np.zeros(view.size, dtype=bool)
+        pending = np.arange(view.size)
+        for value in values:
+            rows = view if len(pending) == view.size else view.subset(pending)
+            evaluated = value(rows)
+            valid = np.ones(rows.size, dtype=bool) if evaluated[1] is None else ~evaluated[1]
+            errors[pending[~valid]] = True
+            stopped = (truth(evaluated, rows.size) == stop_at) & valid
+            result[pending[stopped]] = stop_at
+            pending = pending[~stopped & valid]
+            if not len(pending):
+                break
+        return result, errors if errors.any() else None
+    return evaluate
+
+
+def _unary_op(node: ast.UnaryOp) -> Optional[BatchExpression]:
+    operand = compile_batch_expression(node.operand)
+    apply = SAFE_OPERATORS.get(type(node.op))
+    if operand is None or apply is None:
+        return None
+    if isinstance(node.op, ast.Not):
+        def negate(view):
+            evaluated = operand(view)
+            return ~truth(evaluated, view.size), evaluated[1]
+        return negate
+    return lambda view: _apply(apply, view.size, operand(view))
+
+
+def _bin_op(node: ast.BinOp) -> Optional[BatchExpression]:
+    left = compile_batch_expression(node.left)
+    right = compile_batch_expression(node.right)
+    apply = SAFE_OPERATORS.get(type(node.op))
+    if left is None or right is None or apply is None:
+        return None
+    return lambda view: _apply(apply, view.size, left(view), right(view))
+
+
+# String methods run with pandas: method -> (number of arguments, Series.str operation)
+_STRING_OPERATIONS = {
+    'contains': (1, lambda strings, part: strings.str.lower().str.contains(str(part).lower(), regex=False)),
+    'startswith': (1, lambda strings, prefix: strings.str.lower().str.startswith(str(prefix).lower())),
+    'endswith': (1, lambda strings, suffix: strings.str.lower().str.endswith(str(suffix).lower())),
+    'lower': (0, lambda strings: strings.str.lower()),
+    'upper': (0, lambda strings: strings.str.upper()),
+    'strip': (0, lambda strings: strings.str.strip()),
+}
+
+
+def _string_method(name: str, view: BatchView, target: BatchValues, arguments: List[BatchValues]) -> BatchValues:
+    values, errors = target
+    arity, operation = _STRING_OPERATIONS[name]
+    if (
+        not isinstance(values, np.ndarray) or len(arguments) != arity
+        or any(isinstance(value, np.ndarray) or error is not None for value, error in arguments)
+    ):
+        return _apply(SAFE_STRING_METHODS[name], view.size, target, *arguments)
+
+    valid = None if errors is None else np.flatnonzero(~errors)
+    if valid is not None:
+        values = values[valid]
+    # Every value is matched as str(value), like the method itself does
+    strings = pd.Series(object_column((str(value) for value in values), len(values)), dtype=object)
+    result = operation(strings, *(value for value, _ in arguments))
+    result = result.to_numpy(dtype=bool if arity else object)
+    if valid is None:
+        return result, None
+    column = np.zeros(view.size, dtype=bool) if arity else np.empty(view.size, dtype=object)
+    column[valid] = result
+    return column, errors
+
+
+def _call(node: ast.Call) -> Optional[BatchExpression]:
+    arguments = [compile_batch_expression(argument) for argument in node.args]
+    if any(argument is None for argument in arguments):
+        return None
+
+    if isinstance(node.func, ast.Attribute):
+        # Method call like obj.method()
+        name = node.func.attr
+        target = compile_batch_expression(node.func.value)
+        if name not in SAFE_STRING_METHODS or target is None:
+            return None
+        return lambda view: _string_method(name, view, target(view), [argument(view) for argument in arguments])
+
+    if isinstance(node.func, ast.Name) and arguments:
+        # Formula command like amount_to_float(amount)
+        name = node.func.id
+        command = command_registry.get_command(name)
+
+        def run_command(view):
+            evaluated = [argument(view) for argument in arguments]
+            instance = command or command_registry.get_command(name)
+            if name not in view.available_commands or not instance:
+                return None, np.ones(view.size, dtype=bool)
+            errors = _combine_errors(view.size, *(error for _, error in evaluated))
+            valid = None if errors is None else np.flatnonzero(~errors)
+            count = view.size if valid is None else len(valid)
+            columns = [
+                (value if valid is None else value[valid]) if isinstance(value, np.ndarray)
+                else object_column([value] * count, count)
+                for value, _ in evaluated
+            ]
+            values, failed = instance.execute_batch(*columns)
+            if valid is None:
+                return values, failed if failed.any() else None
+            result = np.empty(view.size, dtype=object)
+            result[valid] = values
+            errors[valid[failed]] = True
+            return result, errors
+        return run_command
+
+    return None
+
+
+def _attribute(node: ast.Attribute) -> Optional[BatchExpression]:
+    value = compile_batch_expression(node.value)
+    if value is None:
+        return None
+    name = node.attr
+    return lambda view: _apply(lambda target: getattr(target, name, None), view.size, value(view))
+
+
+_COMPILERS: Dict[type, Callable[[Any], Optional[BatchExpression]]] = {
+    ast.Constant: _constant,
+    ast.Name: _name,
+    ast.Compare: _compare,
+    ast.BoolOp: _bool_op,
+    ast.UnaryOp: _unary_op,
+    ast.BinOp: _bin_op,
+    ast.Call: _call,
+    ast.Attribute: _attribute,
+}
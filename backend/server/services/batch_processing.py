@@ -0,0 +1,205 @@
+"""
+Parallel processing of many statements at once.
+
+Reading, cleaning and hashing statement files is CPU-bound, so it is spread
+over a process pool. Workers never write: every insert of a batch runs in
+the calling process, one statement at a time. Other writers in the server
+(processing jobs, other batches, synchronous processing) may ingest at the
+same time; CSVProcessor serializes their chunk commits with a shared lock,
+so within the server SQLite still sees one ingestion write at a time. A
+batch run from the command line is a separate process and relies on
+SQLite's own locking against a running server.
+
+Workers stream their rows to a parsed file per statement in a temporary
+directory instead of returning them, and only a few statements per worker
+are in flight at once, so memory doesn't grow with file size or count. The
+pool uses the spawn start method: forking from the API's threads could copy
+locks held by other threads into the workers.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from server.models.main import Statement
+from server.services.csv_processor import CSVProcessor, parse_statement_file
+from server.settings import BATCH_PROCESSING_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Statements submitted to the pool per worker; each is at most one parsed file on disk
+IN_FLIGHT_PER_WORKER = 2
+
+
+def _worker_count(statement_count: int, max_workers: Optional[int]) -> int:
+    workers = max_workers or BATCH_PROCESSING_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, statement_count))
+
+
+def batch_succeeded(results: Dict[str, Any]) -> bool:
+    """Whether a batch stored anything, or had nothing to fail on"""
+    return results["successful_count"] > 0 or results["failed_count"] == 0
+
+
+def batch_message(results: Dict[str, Any]) -> str:
+    """Summary of batch results for API responses and jobs"""
+    if results["total_statements"] == 0:
+        return "No statements to process"
+    if results["failed_count"] == 0:
+        return f"All {results['successful_count']} statements processed successfully"
+    if results["successful_count"] > 0:
+        return f"Partial success: {results['successful_count']} processed, {results['failed_count']} failed"
+    return "All statements failed to process"
+
+
+def process_statements_batch(
+    statement_ids: Optional[List[str]],
+    db: Session,
+    max_workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Process several statements, parsing them in parallel worker processes.
+
+    Args:
+        statement_ids: Statements to process; None processes every unprocessed statement
+        db: Database session used for all inserts
+        max_workers: Worker processes (defaults to BATCH_PROCESSING_WORKERS or the CPU count)
+        progress_callback: Called after every statement with rows_parsed, rows_inserted,
+            duplicates and progress (fraction of the statements done)
+
+    Returns:
+        Per-statement results in the same layout as multi-file uploads
+    """
+    if statement_ids is None:
+        statements = db.query(Statement).filter(Statement.processed == False).all()
+        statement_ids = [statement.id for statement in statements]
+    else:
+        # Keep the requested order and drop repeated ids
+        statement_ids = list(dict.fromkeys(statement_ids))
+        statements = db.query(Statement).filter(Statement.id.in_(statement_ids)).all()
+
+    by_id = {statement.id: statement for statement in statements}
+    results = {
+        "successful_statements": [],
+        "failed_statements": [],
+        "total_statements": len(statement_ids),
+        "successful_count": 0,
+        "failed_count": 0,
+        "transactions_processed": 0,
+        "transactions_created": 0,
+        "duplicates_skipped": 0
+    }
+
+    def report_progress():
+        if progress_callback and results["total_statements"]:
+            progress_callback({
+                "rows_parsed": results["transactions_processed"],
+                "rows_inserted": results["transactions_created"],
+                "duplicates": results["duplicates_skipped"],
+                "progress": (results["successful_count"] + results["failed_count"]) / results["total_statements"]
+            })
+
+    def record_failure(statement_id: str, filename: Optional[str], error: str):
+        results["failed_statements"].append({
+            "statement_id": statement_id,
+            "filename": filename,
+            "error": error
+        })
+        results["failed_count"] += 1
+        report_progress()
+
+    runnable = []
+    for statement_id in statement_ids:
+        statement = by_id.get(statement_id)
+        if not statement:
+            record_failure(statement_id, None, "Statement not found")
+        elif not Path(statement.file_path).exists():
+            record_failure(statement_id, statement.filename, "Statement file not found")
+        else:
+            runnable.append(statement)
+
+    if not runnable:
+        return results
+
+    processor = CSVProcessor()
+
+    def store(statement: Statement, parsed_path: str):
+        try:
+            result = processor.process_parsed_statement(statement, parsed_path, db)
+        finally:
+            os.remove(parsed_path)
+        if not result["success"]:
+            record_failure(statement.id, statement.filename, result["message"])
+            return
+
+        results["successful_statements"].append({
+            "statement_id": statement.id,
+            "filename": statement.filename,
+            "transactions_processed": result["transactions_processed"],
+            "transactions_created": result["transactions_created"],
+            "duplicates_skipped": result["duplicates_skipped"]
+        })
+        results["successful_count"] += 1
+        results["transactions_processed"] += result["transactions_processed"]
+        results["transactions_created"] += result["transactions_created"]
+        results["duplicates_skipped"] += result["duplicates_skipped"]
+        report_progress()
+
+    def parse_failed(statement: Statement, parsed_path: str, error: Exception):
+        logger.error(f"Error parsing statement {statement.id}: {str(error)}")
+        record_failure(statement.id, statement.filename, f"Error processing statement: {str(error)}")
+        if os.path.exists(parsed_path):
+            os.remove(parsed_path)
+
+    workers = _worker_count(len(runnable), max_workers)
+    with tempfile.TemporaryDirectory(prefix="moneta-batch-") as parsed_dir:
+        parsed_paths = {statement.id: os.path.join(parsed_dir, f"{statement.id}.jsonl") for statement in runnable}
+
+        if workers == 1:
+            # Not worth starting a pool for a single parser
+            for statement in runnable:
+                parsed_path = parsed_paths[statement.id]
+                try:
+                    parse_statement_file(statement.file_path, statement.filename, parsed_path)
+                except Exception as e:
+                    parse_failed(statement, parsed_path, e)
+                    continue
+                store(statement, parsed_path)
+            return results
+
+        logger.info(f"Processing {len(runnable)} statements with {workers} worker processes")
+        pending = iter(runnable)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            in_flight = {}
+
+            def submit_next():
+                statement = next(pending, None)
+                if statement is not None:
+                    future = pool.submit(
+                        parse_statement_file, statement.file_path, statement.filename, parsed_paths[statement.id]
+                    )
+                    in_flight[future] = statement
+
+            for _ in range(workers * IN_FLIGHT_PER_WORKER):
+                submit_next()
+
+            # Store each statement as soon as its parse finishes; this loop is the batch's only writer
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    statement = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        future.result()
+                    except Exception as e:
+                        parse_failed(statement, parsed_paths[statement.id], e)
+                        continue
+                    store(statement, parsed_paths[statement.id])
+
+    return results
@@ -0,0 +1,380 @@
+"""
+In-process columnar store for report aggregation.
+
+The store keeps the report fields named in ANALYTICS_STORE_FIELDS as NumPy
+columns, one row per transaction: the measure as float64 (NaN where it
+isn't a number), the x-axis label and the normalized currency as
+dictionary-encoded int32 codes, plus the stored date of
+TRANSACTION_DATE_FIELD as int32 days since 1970-01-01. Unfiltered charts
+over loaded fields are then grouped with np.bincount (np.minimum.at and
+np.maximum.at for min and max) instead of a scan of the JSON content; anything else (field filters, fields that aren't loaded,
+another date field) returns None and is left to the SQL path.
+
+Values are derived with the functions of server.services.sql_functions, so
+the store answers exactly like the Python and SQL paths. It follows the
+data version of the transaction metadata: when the version changes, rows
+ingested or recomputed since the last refresh are re-read and appended or
+overwritten in place, and a row count that doesn't add up (rows were
+deleted) reloads everything.
+"""
+import logging
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from server.models.main import Transaction
+from server.services.filters import FilterTree
+from server.services.metadata import get_data_version
+from server.services.sql_functions import (
+    EPOCH,
+    content_label,
+    content_measure,
+    date_label,
+    epoch_day,
+    normalize_currency,
+    period_start,
+)
+from server.services.transaction_dates import transaction_date
+from server.settings import ANALYTICS_STORE_FIELDS, TRANSACTION_DATE_FIELD
+
+logger = logging.getLogger(__name__)
+
+# Aggregations grouped from the columns; the others need the SQL aggregators
+COLUMN_AGGREGATIONS = ('sum', 'avg', 'count', 'min', 'max')
+
+# Day value of transactions whose date is missing or doesn't parse
+UNDATED = np.iinfo(np.int32).min
+
+# (label, currency) -> [sum of y values, number of y values], as in server.services.aggregation
+Groups = Dict[Tuple[str, Optional[str]], List[float]]
+
+
+def report_values(
+    ingested: Optional[dict],
+    computed: Optional[dict],
+    fields: Iterable[str],
+    date_field: str
+) -> Tuple[Tuple[Optional[str], Optional[int]], Optional[str], Dict[str, Tuple[Optional[str], Optional[float], str]]]:
+    """
+    Everything reports read from a transaction for the given fields.
+
+    Returns:
+        ((ISO date, epoch day) of date_field, its 'date' x-axis label,
+        {field: (x-axis label, measure, normalized currency)})
+    """
+    content = {**(ingested or {}), **(computed or {})}
+    values = {
+        field: (content_label(content, field), content_measure(content, field), normalize_currency(content.get(field)))
+        for field in fields
+    }
+    return transaction_date(ingested, computed, date_field), date_label(content.get(date_field)), values
+
+
+class Categorical:
+    """Dictionary-encoded strings: int32 codes into ``values``, -1 where missing"""
+
+    def __init__(self):
+        self.codes = np.empty(0, dtype=np.int32)
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self._index.get(value)
+        if code is None:
+            code = len(self.values)
+            self._index[value] = code
+            self.values.append(value)
+        return code
+
+    @property
+    def dictionary_bytes(self) -> int:
+        return sys.getsizeof(self._index) + sum(sys.getsizeof(value) for value in self.values)
+
+
+class ColumnStore:
+    """NumPy columns of the report fields of every transaction"""
+
+    def __init__(self, fields: Iterable[str] = ANALYTICS_STORE_FIELDS, date_field: str = TRANSACTION_DATE_FIELD):
+        self.fields = tuple(dict.fromkeys(field for field in fields if field))
+        self.date_field = date_field
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.refreshes = 0
+        self.queries = 0
+        self.fallbacks = 0
+        self._clear()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fields)
+
+    def _clear(self):
+        self.version: Optional[str] = None
+        # Latest ingested_at/computed_at read; rows changed since are re-read
+        self.watermark: Optional[datetime] = None
+        self.rows: Dict[str, int] = {}
+        self.days = np.empty(0, dtype=np.int32)
+        self.date_labels = Categorical()
+        self.labels = {field: Categorical() for field in self.fields}
+        self.currencies = {field: Categorical() for field in self.fields}
+        self.measures = {field: np.empty(0, dtype=np.float64) for field in self.fields}
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # Loading
+
+    def _encode(self, ingested: Optional[dict], computed: Optional[dict]) -> Tuple:
+        """One row's values: (day, date label code, {field: (label code, measure, currency code)})"""
+        (_, day), label, values = report_values(ingested, computed, self.fields, self.date_field)
+        fields = {}
+        for field, (field_label, measure, currency) in values.items():
+            fields[field] = (
+                self.labels[field].encode(field_label),
+                np.nan if measure is None else measure,
+                self.currencies[field].encode(currency)
+            )
+        return UNDATED if day is None else day, self.date_labels.encode(label), fields
+
+    def _write(self, positions: List[int], encoded: List[Tuple]):
+        """Overwrite rows at ``positions`` and append the rest of ``encoded``"""
+        updated = len(positions)
+        appended = encoded[updated:]
+
+        def column(values, dtype):
+            return np.array(values, dtype=dtype) if values else np.empty(0, dtype=dtype)
+
+        def apply(current: np.ndarray, values: List, dtype) -> np.ndarray:
+            if updated:
+                current[positions] = values[:updated]
+            if appended:
+                current = np.concatenate([current, column(values[updated:], dtype)])
+            return current
+
+        self.days = apply(self.days, [row[0] for row in encoded], np.int32)
+        self.date_labels.codes = apply(self.date_labels.codes, [row[1] for row in encoded], np.int32)
+        for field in self.fields:
+            values = [row[2][field] for row in encoded]
+            self.labels[field].codes = apply(self.labels[field].codes, [v[0] for v in values], np.int32)
+            self.measures[field] = apply(self.measures[field], [v[1] for v in values], np.float64)
+            self.currencies[field].codes = apply(self.currencies[field].codes, [v[2] for v in values], np.int32)
+
+    def _read(self, db: Session, since: Optional[datetime]) -> Tuple[List[int], List[Tuple]]:
+        """Encode the rows changed since ``since`` (all rows when None); known rows come first"""
+        query = db.query(
+            Transaction.id, Transaction.ingested_content, Transaction.computed_content,
+            Transaction.ingested_at, Transaction.computed_at
+        )
+        if since is not None:
+            query = query.filter(or_(Transaction.ingested_at >= since, Transaction.computed_at >= since))
+
+        positions, updated, added, added_ids = [], [], [], []
+        for transaction_id, ingested, computed, ingested_at, computed_at in query.yield_per(1000):
+            for stamp in (ingested_at, computed_at):
+                if stamp is not None and (self.watermark is None or stamp > self.watermark):
+                    self.watermark = stamp
+            encoded = self._encode(ingested, computed)
+            position = self.rows.get(transaction_id)
+            if position is None:
+                added.append(encoded)
+                added_ids.append(transaction_id)
+            else:
+                positions.append(position)
+                updated.append(encoded)
+
+        for transaction_id in added_ids:
+            self.rows[transaction_id] = len(self.rows)
+        return positions, updated + added
+
+    def sync(self, db: Session) -> bool:
+        """
+        Bring the columns up to the current data version.
+
+        Returns:
+            Whether the store reflects the stored transactions
+        """
+        version = get_data_version(db)
+        if version is None:
+            return False
+        if version == self.version:
+            return True
+
+        total = db.query(func.count(Transaction.id)).scalar() or 0
+        if self.version is not None:
+            known = len(self.rows)
+            positions, encoded = self._read(db, self.watermark)
+            if known + len(encoded) - len(positions) == total:
+                self._write(positions, encoded)
+                self.version = version
+                self.refreshes += 1
+                return True
+            # Rows were deleted
+            logger.info("Reloading the column store")
+
+        self._clear()
+        positions, encoded = self._read(db, None)
+        self._write(positions, encoded)
+        self.version = version
+        self.loads += 1
+        return True
+
+    # Querying
+
+    def covers(
+        self,
+        x_field: str,
+        y_field: str,
+        date_ranged: bool,
+        date_field: str,
+        currency_field: Optional[str],
+        filters: FilterTree
+    ) -> bool:
+        """Whether a chart can be answered from the loaded columns"""
+        if filters.active or y_field not in self.fields:
+            return False
+        if currency_field and currency_field not in self.fields:
+            return False
+        if x_field != 'date' and x_field not in self.fields:
+            return False
+        if (x_field == 'date' or date_ranged) and date_field != self.date_field:
+            return False
+        return True
+
+    def aggregate(
+        self,
+        db: Session,
+        x_field: str,
+        y_field: str,
+        aggregation: str,
+        date_from: Optional[date],
+        date_to: Optional[date],
+        date_field: str,
+        date_bucket: Optional[str],
+        currency_field: Optional[str],
+        filters: FilterTree
+    ) -> Optional[Groups]:
+        """
+        Group a chart from the loaded columns.
+
+        Returns:
+            The chart's groups, None when it needs a field that isn't loaded,
+            field filters or a sketch aggregation
+        """
+        if not self.enabled:
+            return None
+        if aggregation not in COLUMN_AGGREGATIONS or not self.covers(
+            x_field, y_field, bool(date_from or date_to), date_field, currency_field, filters
+        ):
+            self.fallbacks += 1
+            return None
+
+        with self._lock:
+            if not self.sync(db):
+                self.fallbacks += 1
+                return None
+            self.queries += 1
+            return self._group(x_field, y_field, aggregation, date_from, date_to, date_bucket, currency_field)
+
+    def _group(
+        self,
+        x_field: str,
+        y_field: str,
+        aggregation: str,
+        date_from: Optional[date],
+        date_to: Optional[date],
+        date_bucket: Optional[str],
+        currency_field: Optional[str]
+    ) -> Groups:
+        measures = self.measures[y_field]
+        keep = ~np.isnan(measures)
+        if date_from or date_to:
+            keep &= self.days != UNDATED
+            if date_from:
+                keep &= self.days >= epoch_day(date_from)
+            if date_to:
+                keep &= self.days <= epoch_day(date_to)
+
+        if x_field == 'date' and date_bucket:
+            keep &= self.days != UNDATED
+            days, day_codes = np.unique(self.days[keep], return_inverse=True)
+            labels = Categorical()
+            period_codes = np.array(
+                [labels.encode(period_start((EPOCH + timedelta(days=int(day))).isoformat(), date_bucket)) for day in days],
+                dtype=np.int32
+            )
+            codes = period_codes[day_codes] if len(days) else np.empty(0, dtype=np.int32)
+            label_values = labels.values
+        else:
+            labels = self.date_labels if x_field == 'date' else self.labels[x_field]
+            keep &= labels.codes >= 0
+            codes = labels.codes[keep]
+            label_values = labels.values
+
+        values = measures[keep]
+        if currency_field:
+            currencies = self.currencies[currency_field]
+            width = max(len(currencies.values), 1)
+            keys = codes.astype(np.int64) * width + currencies.codes[keep]
+        else:
+            currencies = None
+            width = 1
+            keys = codes.astype(np.int64)
+
+        size = len(label_values) * width
+        counts = np.bincount(keys, minlength=size)
+        if aggregation == 'min':
+            sums = np.full(size, np.inf)
+            np.minimum.at(sums, keys, values)
+        elif aggregation == 'max':
+            sums = np.full(size, -np.inf)
+            np.maximum.at(sums, keys, values)
+        else:
+            sums = np.bincount(keys, weights=values, minlength=size)
+
+        groups: Groups = {}
+        for key in np.flatnonzero(counts):
+            label, currency = divmod(int(key), width)
+            groups[(label_values[label], currencies.values[currency] if currencies else None)] = [
+                float(sums[key]), int(counts[key])
+            ]
+        return groups
+
+    # Diagnostics
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes held by the column arrays, the category dictionaries and the row index"""
+        categoricals = [self.date_labels, *self.labels.values(), *self.currencies.values()]
+        arrays = self.days.nbytes + sum(c.codes.nbytes for c in categoricals)
+        arrays += sum(column.nbytes for column in self.measures.values())
+        dictionaries = sum(c.dictionary_bytes for c in categoricals)
+        index = sys.getsizeof(self.rows) + sum(sys.getsizeof(key) for key in self.rows)
+        return {"array_bytes": arrays, "dictionary_bytes": dictionaries, "index_bytes": index}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            memory = self.memory_bytes()
+            return {
+                "enabled": self.enabled,
+                "fields": list(self.fields),
+                "date_field": self.date_field,
+                "rows": len(self.rows),
+                "data_version": self.version,
+                **memory,
+                "size_bytes": sum(memory.values()),
+                "loads": self.loads,
+                "refreshes": self.refreshes,
+                "queries": self.queries,
+                "fallbacks": self.fallbacks
+            }
+
+
+# Shared store for report data endpoints
+column_store = ColumnStore()
@@ -0,0 +1,191 @@
+"""
+Compiled computed field rules.
+
+A rule's condition and action are parsed and compiled into closures
+(server.services.expression_compiler) once per rule version, instead of
+parsed once per transaction they are evaluated against. The
+process-wide compiled_rules cache keeps them per rule id together with the
+rule's updated_at; the rule CRUD endpoints invalidate a rule's entry, and
+an entry whose expressions no longer match the rule (a rule changed in
+memory, or the /rules/test dry run reusing its id) is compiled again.
+
+The compiled rule also keeps a snapshot of the rule's id, name, target
+field and active flag, so executing rules against many transactions reads
+plain attributes instead of the ORM instance's instrumented ones.
+
+Parse errors are kept on the compiled rule and reported with the same
+messages as evaluating the expressions directly. Conditions and formulas
+are also compiled for batches (server.services.batch_expressions) when they
+have a batch form; a rule whose expressions don't is not ``vectorized`` and
+is executed row by row in batches too.
+"""
+import ast
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from server.models.configurations import ComputedFieldRule
+from server.services.batch_expressions import BatchExpression, compile_batch_expression
+from server.services.expression_compiler import Expression, compile_expression
+
+# Rules kept compiled; the least recently used beyond this are compiled again when needed
+COMPILED_RULE_CACHE_SIZE = 10000
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Compiled condition and action of one rule version"""
+    source: Tuple[Any, ...]  # rule_source of the rule it was compiled from
+    rule_id: Optional[str]
+    name: Optional[str]
+    target_field: Optional[str]
+    active: bool
+    rule_type: Optional[str]
+    condition: Optional[Expression]  # None always matches
+    condition_error: Optional[str]
+    action: Any  # Compiled formula, the value of other rule types
+    action_error: Optional[str]
+    batch_condition: Optional[BatchExpression] = None
+    batch_action: Optional[BatchExpression] = None
+    vectorized: bool = False  # Whether batches can evaluate the rule from its batch forms
+
+
+def rule_source(rule: ComputedFieldRule) -> Tuple[Any, ...]:
+    """Rule fields a compiled rule is built from; it is compiled again when any changes"""
+    return (rule.condition, rule.action, rule.rule_type, rule.target_field, rule.active, rule.name)
+
+
+def parse_literal(value_expr: str) -> Any:
+    """Value of a value_assignment action: the Python literal, else the text itself"""
+    value_expr = value_expr.strip()
+    try:
+        tree = ast.parse(value_expr, mode='eval')
+    except Exception:
+        return value_expr
+    return tree.body.value if isinstance(tree.body, ast.Constant) else value_expr
+
+
+def compile_condition(condition_expr: Optional[str]) -> Tuple[Optional[Expression], Optional[str]]:
+    """Compile a condition; returns (expression or None when empty, error)"""
+    if not condition_expr or not condition_expr.strip():
+        return None, None
+    try:
+        return compile_expression(ast.parse(condition_expr.strip(), mode='eval').body), None
+    except Exception as e:
+        return None, f"Condition evaluation error: {str(e)}"
+
+
+def compile_action(action_expr: Optional[str], rule_type: Optional[str]) -> Tuple[Any, Optional[str]]:
+    """Compile an action; returns (formula expression or assigned value, error)"""
+    try:
+        if rule_type == "value_assignment":
+            return parse_literal(action_expr), None
+        elif rule_type == "model_mapping":
+            # Model mappings like Account('Cash') are returned as written
+            return action_expr.strip(), None
+        elif rule_type == "formula":
+            try:
+                return compile_expression(ast.parse(action_expr.strip(), mode='eval').body), None
+            except Exception as e:
+                return None, f"Formula evaluation error: {str(e)}"
+        else:
+            return None, f"Unknown rule type: {rule_type}"
+    except Exception as e:
+        return None, f"Action evaluation error: {str(e)}"
+
+
+def compile_batch(expr: str) -> Optional[BatchExpression]:
+    """Batch form of a valid expression, None when it has none"""
+    return compile_batch_expression(ast.parse(expr.strip(), mode='eval').body)
+
+
+def compile_rule(rule: ComputedFieldRule) -> CompiledRule:
+    condition, condition_error = compile_condition(rule.condition)
+    action, action_error = compile_action(rule.action, rule.rule_type)
+    # Expressions that fail to parse never match, in batches as well
+    batch_condition = compile_batch(rule.condition) if condition is not None else None
+    batch_action = compile_batch(rule.action) if rule.rule_type == "formula" and action is not None else None
+    return CompiledRule(
+        source=rule_source(rule),
+        rule_id=rule.id,
+        name=rule.name,
+        target_field=rule.target_field,
+        active=bool(rule.active),
+        rule_type=rule.rule_type,
+        condition=condition,
+        condition_error=condition_error,
+        action=action,
+        action_error=action_error,
+        batch_condition=batch_condition,
+        batch_action=batch_action,
+        vectorized=(condition is None or batch_condition is not None)
+        and (rule.rule_type != "formula" or action is None or batch_action is not None)
+    )
+
+
+class CompiledRuleCache:
+    """LRU cache of compiled rules keyed by rule id and version"""
+
+    def __init__(self, max_rules: int = COMPILED_RULE_CACHE_SIZE):
+        self.max_rules = max_rules
+        self._entries: "OrderedDict[str, Tuple[Hashable, CompiledRule]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, rule: ComputedFieldRule) -> CompiledRule:
+        """The compiled rule, compiling it when its id or version isn't cached"""
+        if rule.id is None:
+            # Unsaved rules have no identity to cache them under
+            return compile_rule(rule)
+
+        version = (rule.id, rule.updated_at)
+        source = rule_source(rule)
+        with self._lock:
+            entry = self._entries.get(rule.id)
+            if entry is not None and entry[0] == version and entry[1].source == source:
+                self._entries.move_to_end(rule.id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        compiled = compile_rule(rule)
+        with self._lock:
+            self._entries[rule.id] = (version, compiled)
+            self._entries.move_to_end(rule.id)
+            while len(self._entries) > self.max_rules:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return compiled
+
+    def get_all(self, rules: Sequence[Union[ComputedFieldRule, CompiledRule]]) -> List[CompiledRule]:
+        """Compiled rules in order; rules that are already compiled are kept as they are"""
+        return [rule if isinstance(rule, CompiledRule) else self.get(rule) for rule in rules]
+
+    def invalidate(self, rule_id: str):
+        """Drop a rule's compiled versions, after it is updated or deleted"""
+        with self._lock:
+            if self._entries.pop(rule_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rules": len(self._entries),
+                "max_rules": self.max_rules,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+# Shared cache used by the rule engine
+compiled_rules = CompiledRuleCache()
@@ -1,26 +1,114 @@
 import csv
 import hashlib
+import itertools
+from collections import Counter
 import json
+import math
 import re
-from datetime import datetime
+import threading
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Iterable, Iterator, Tuple, Sequence, Callable
+import numpy as np
 import pandas as pd
+import openpyxl
 import logging
 
 from server.models.main import Transaction, Statement
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
-from server.services.metadata import update_transaction_metadata
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from server.services.metadata import adjust_column_counts, CURRENCY_SAMPLE_SIZE
+from server.services.rollups import apply_rollup_changes, collect_rollup_cells
+from server.services.transaction_dates import date_columns
+from server.settings import INGEST_BATCH_SIZE, INGEST_CHUNK_SIZE, EXCEL_STREAMING_THRESHOLD_BYTES, TRANSACTION_DATE_FIELD
 
 logger = logging.getLogger(__name__)
 
+# Held while a chunk of statement rows is inserted and committed, so processing
+# jobs, batches and synchronous requests in this process write one at a time
+INGEST_WRITE_LOCK = threading.Lock()
+
+# Patterns used by column name normalization, compiled once per process
+_CURRENCY_SYMBOLS_RE = re.compile(r'[$€£¥₹₽₩₪₫₨₴₸₺₼₾₿]')
+_PARENTHESES_RE = re.compile(r'\([^)]*\)')
+_SQUARE_BRACKETS_RE = re.compile(r'\[[^\]]*\]')
+_SEPARATORS_RE = re.compile(r'[\s\-\.\/\\]+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w_]')
+_MULTIPLE_UNDERSCORES_RE = re.compile(r'_+')
+
+
+@lru_cache(maxsize=4096)
+def _normalize_column_name_cached(column_name: str) -> str:
+    """Normalize a single column name (see CSVProcessor.normalize_column_name)."""
+    # Strip whitespace and convert to lowercase
+    normalized = column_name.strip().lower()
+    
+    # Remove currency symbols and common financial symbols
+    normalized = _CURRENCY_SYMBOLS_RE.sub('', normalized)
+    
+    # Remove parentheses and their contents
+    normalized = _PARENTHESES_RE.sub('', normalized)
+    
+    # Remove square brackets and their contents
+    normalized = _SQUARE_BRACKETS_RE.sub('', normalized)
+    
+    # Replace spaces, hyphens, and other separators with underscores
+    normalized = _SEPARATORS_RE.sub('_', normalized)
+    
+    # Remove special characters except underscores
+    normalized = _SPECIAL_CHARS_RE.sub('', normalized)
+    
+    # Remove multiple consecutive underscores
+    normalized = _MULTIPLE_UNDERSCORES_RE.sub('_', normalized)
+    
+    # Strip leading and trailing underscores
+    normalized = normalized.strip('_')
+    
+    # Ensure we have a valid name (not empty)
+    if not normalized or normalized.strip() == "":
+        normalized = "unnamed_column"
+    
+    return normalized
+
+
+def _cell_text(value: Any) -> Optional[str]:
+    """Stripped text of a cell value; None for missing and blank cells."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _excel_cell_text(value: Any) -> Optional[str]:
+    """
+    Text of a cell value as openpyxl reads it, whichever Excel reader ran.
+    
+    Both readers hand over raw cell values (pandas with dtype=object), so
+    numbers, dates and times are stringified the same way and a workbook
+    gets the same content hashes above and below the streaming threshold.
+    pandas marks blank cells with NaN where openpyxl gives None.
+    """
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return _cell_text(value)
+
+
+# Column kinds (pandas infer_dtype) of numbers and booleans, whose str() is never padded or blank
+_EXCEL_NUMBER_KINDS = {"integer", "floating", "mixed-integer-float", "boolean"}
+
+# Cell values stringified one by one
+_EXCEL_TEMPORAL_TYPES = (date, time, timedelta)
+
+
 class CSVProcessor:
     """Service for processing CSV statement files and extracting transactions."""
     
     def __init__(self):
         self.supported_formats = ['.csv', '.xlsx', '.xls']
+        # Set by the row iterators: maps rows parsed so far to the fraction of the file read
+        self._read_progress: Optional[Callable[[int], Optional[float]]] = None
     
     @staticmethod
     def normalize_column_name(column_name: str) -> str:
@@ -36,6 +124,8 @@ class CSVProcessor:
         - Removes multiple consecutive underscores
         - Strips leading/trailing underscores
         
+        Results are memoized, so repeated headers are only normalized once.
+        
         Args:
             column_name: Original column name
             
@@ -45,44 +135,72 @@ class CSVProcessor:
         if not column_name or not isinstance(column_name, str):
             return ""
         
-        # Strip whitespace and convert to lowercase
-        normalized = column_name.strip().lower()
-        
-        # Remove currency symbols and common financial symbols
-        currency_symbols = r'[$€£¥₹₽₩₪₫₨₴₸₺₼₾₿]'
-        normalized = re.sub(currency_symbols, '', normalized)
-        
-        # Remove parentheses and their contents
-        normalized = re.sub(r'\([^)]*\)', '', normalized)
-        
-        # Remove square brackets and their contents
-        normalized = re.sub(r'\[[^\]]*\]', '', normalized)
-        
-        # Replace spaces, hyphens, and other separators with underscores
-        normalized = re.sub(r'[\s\-\.\/\\]+', '_', normalized)
-        
-        # Remove special characters except underscores
-        normalized = re.sub(r'[^\w_]', '', normalized)
+        return _normalize_column_name_cached(column_name)
+    
+    @classmethod
+    def build_header_plan(cls, headers: Iterable[Any]) -> List[Tuple[int, str]]:
+        """
+        Build a column-index -> normalized-name plan for a file's header row.
         
-        # Remove multiple consecutive underscores
-        normalized = re.sub(r'_+', '_', normalized)
+        Normalization runs once per header instead of once per cell. Headers
+        that normalize to a name already taken get a numeric suffix
+        (``amount``, ``amount_2``, ...) so no column silently overwrites
+        another. ``None`` headers are skipped.
         
-        # Strip leading and trailing underscores
-        normalized = normalized.strip('_')
+        Args:
+            headers: Header row values in column order
+            
+        Returns:
+            List of (column_index, normalized_name) tuples
+        """
+        plan = []
+        used_names = set()
         
-        # Ensure we have a valid name (not empty)
-        if not normalized or normalized.strip() == "":
-            normalized = "unnamed_column"
+        for index, header in enumerate(headers):
+            if header is None:
+                continue
+            
+            base_name = cls.normalize_column_name(str(header))
+            name = base_name
+            suffix = 2
+            while name in used_names:
+                name = f"{base_name}_{suffix}"
+                suffix += 1
+            
+            if name != base_name:
+                logger.warning(f"Column {header!r} normalizes to existing name '{base_name}', using '{name}'")
+            
+            used_names.add(name)
+            plan.append((index, name))
         
-        return normalized
+        return plan
     
-    def process_statement(self, statement: Statement, db: Session) -> Dict[str, Any]:
+    def process_statement(
+        self,
+        statement: Statement,
+        db: Session,
+        chunk_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
         """
         Process a statement file and extract transactions.
         
+        Rows are streamed through read -> clean -> hash -> insert in chunks of
+        ``chunk_size`` rows, and every chunk is committed as soon as it is
+        inserted, so memory stays bounded regardless of file size. A failure
+        part-way through leaves the already committed chunks in place; the
+        statement is only marked processed once the whole file went through
+        and reprocessing skips the stored rows as duplicates. Chunks are
+        written under INGEST_WRITE_LOCK, so statements ingested concurrently
+        in this process never interleave their write transactions.
+        
         Args:
             statement: Statement object with file path
             db: Database session
+            chunk_size: Rows per insert chunk (defaults to INGEST_CHUNK_SIZE)
+            progress_callback: Called after every chunk with rows_parsed,
+                rows_inserted, duplicates and progress (fraction of the file
+                read, or None when unknown)
             
         Returns:
             Dictionary with processing results
@@ -93,50 +211,50 @@ class CSVProcessor:
             if not file_path.exists():
                 raise FileNotFoundError(f"Statement file not found: {file_path}")
             
-            # Read the file based on its extension
-            if file_path.suffix.lower() == '.csv':
-                transactions_data = self._process_csv(file_path)
-            elif file_path.suffix.lower() in ['.xlsx', '.xls']:
-                transactions_data = self._process_excel(file_path)
-            else:
-                raise ValueError(f"Unsupported file format: {file_path.suffix}")
-            
-            if not transactions_data:
-                return {
-                    "success": False,
-                    "message": "No transactions found in file",
-                    "transactions_processed": 0,
-                    "transactions_created": 0
-                }
-            
-            # Extract column information from the first transaction
-            if transactions_data:
-                columns_info = self._extract_columns_info(transactions_data[0])
-                statement.columns = columns_info
-            
-            # Process and save transactions
-            save_result = self._save_transactions(statement, transactions_data, db)
-            created_count = save_result["created_count"]
-            duplicate_count = save_result["duplicate_count"]
-            
-            # Update columns info with transaction count after processing
-            if statement.columns:
-                statement.columns["transaction_count"] = created_count
-                statement.columns["total_processed"] = len(transactions_data)
-                statement.columns["duplicate_count"] = duplicate_count
-            
-            # Mark statement as processed
-            statement.processed = True
-            db.commit()
+            rows = self._iter_rows(file_path)
+            return self._ingest_rows(statement, rows, db, chunk_size, progress_callback)
             
+        except Exception as e:
+            logger.error(f"Error processing statement {statement.id}: {str(e)}")
             return {
-                "success": True,
-                "message": f"Successfully processed {created_count} transactions ({duplicate_count} duplicates skipped)",
-                "transactions_processed": len(transactions_data),
-                "transactions_created": created_count,
-                "duplicates_skipped": duplicate_count
+                "success": False,
+                "message": f"Error processing statement: {str(e)}",
+                "transactions_processed": 0,
+                "transactions_created": 0
             }
+    
+    def process_parsed_statement(
+        self,
+        statement: Statement,
+        parsed_path: str,
+        db: Session,
+        chunk_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Store rows that were already read and hashed by parse_statement_file.
+        
+        This is the writer half of batch processing: parsing happens in worker
+        processes and only the inserts run here, with the same chunking,
+        duplicate handling and result shape as process_statement. The parsed
+        file is streamed, so memory stays bounded as in process_statement.
+        
+        Args:
+            statement: Statement the rows belong to
+            parsed_path: File written by parse_statement_file
+            db: Database session
+            chunk_size: Rows per insert chunk (defaults to INGEST_CHUNK_SIZE)
             
+        Returns:
+            Dictionary with processing results
+        """
+        try:
+            with open(parsed_path, 'r', encoding='utf-8') as parsed:
+                # Rows and hashes are read in step, so tee only holds the current chunk
+                row_entries, hash_entries = itertools.tee(json.loads(line) for line in parsed)
+                return self._ingest_rows(
+                    statement, (row for _, row in row_entries), db, chunk_size,
+                    content_hashes=(content_hash for content_hash, _ in hash_entries)
+                )
         except Exception as e:
             logger.error(f"Error processing statement {statement.id}: {str(e)}")
             return {
@@ -146,10 +264,109 @@ class CSVProcessor:
                 "transactions_created": 0
             }
     
+    def _ingest_rows(
+        self,
+        statement: Statement,
+        rows: Iterator[Dict[str, Any]],
+        db: Session,
+        chunk_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        content_hashes: Optional[Iterator[str]] = None
+    ) -> Dict[str, Any]:
+        """Chunk, insert and account for a stream of cleaned rows."""
+        chunk_size = chunk_size or INGEST_CHUNK_SIZE
+        
+        first_row = next(rows, None)
+        if first_row is None:
+            return {
+                "success": False,
+                "message": "No transactions found in file",
+                "transactions_processed": 0,
+                "transactions_created": 0
+            }
+        
+        # Extract column information from the first transaction
+        columns_info = self._extract_columns_info(first_row)
+        
+        processed_count = 0
+        created_count = 0
+        duplicate_count = 0
+        undated_count = 0
+        
+        for chunk in self._iter_chunks(itertools.chain([first_row], rows), chunk_size):
+            chunk_hashes = list(itertools.islice(content_hashes, len(chunk))) if content_hashes is not None else None
+            with INGEST_WRITE_LOCK:
+                save_result = self._save_transactions(statement, chunk, db, content_hashes=chunk_hashes)
+            processed_count += len(chunk)
+            created_count += save_result["created_count"]
+            duplicate_count += save_result["duplicate_count"]
+            undated_count += save_result["undated_count"]
+            logger.debug(f"Statement {statement.id}: {processed_count} rows ingested so far")
+            
+            if progress_callback:
+                progress_callback({
+                    "rows_parsed": processed_count,
+                    "rows_inserted": created_count,
+                    "duplicates": duplicate_count,
+                    "progress": self._current_progress(processed_count)
+                })
+        
+        # Update columns info with transaction count after processing
+        columns_info["transaction_count"] = created_count
+        columns_info["total_processed"] = processed_count
+        columns_info["duplicate_count"] = duplicate_count
+        statement.columns = columns_info
+        
+        # Mark statement as processed
+        statement.processed = True
+        with INGEST_WRITE_LOCK:
+            db.commit()
+        
+        return {
+            "success": True,
+            "message": f"Successfully processed {created_count} transactions ({duplicate_count} duplicates skipped)",
+            "transactions_processed": processed_count,
+            "transactions_created": created_count,
+            "duplicates_skipped": duplicate_count,
+            "transactions_undated": undated_count
+        }
+    
+    def _current_progress(self, rows_parsed: int) -> Optional[float]:
+        """Fraction of the current file read so far, if the reader can tell."""
+        if self._read_progress is None:
+            return None
+        try:
+            progress = self._read_progress(rows_parsed)
+        except Exception:
+            return None
+        return None if progress is None else min(max(progress, 0.0), 1.0)
+    
+    @staticmethod
+    def _iter_chunks(rows: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Group a row stream into lists of at most ``chunk_size`` rows."""
+        iterator = iter(rows)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    
+    def _iter_rows(self, file_path: Path) -> Iterator[Dict[str, Any]]:
+        """Stream cleaned rows from a statement file based on its extension."""
+        self._read_progress = None
+        if file_path.suffix.lower() == '.csv':
+            return self._iter_csv_rows(file_path)
+        elif file_path.suffix.lower() in ['.xlsx', '.xls']:
+            return self._iter_excel_rows(file_path)
+        else:
+            raise ValueError(f"Unsupported file format: {file_path.suffix}")
+    
     def _process_csv(self, file_path: Path) -> List[Dict[str, Any]]:
         """Process CSV file and extract transaction data."""
-        transactions = []
-        
+        return list(self._iter_csv_rows(file_path))
+    
+    def _iter_csv_rows(self, file_path: Path) -> Iterator[Dict[str, Any]]:
+        """Stream cleaned rows from a CSV file one at a time."""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
                 # Try to detect delimiter with a larger sample and fallback
@@ -177,72 +394,183 @@ class CSVProcessor:
                             continue
                     file.seek(0)  # Reset file position
                 
-                reader = csv.DictReader(file, delimiter=delimiter)
+                reader = csv.reader(file, delimiter=delimiter)
+                header = next(reader, None)
+                if header is None:
+                    return
+                plan = self.build_header_plan(header)
                 
-                for row_num, row in enumerate(reader, start=2):  # Start at 2 because header is row 1
+                # Text-mode tell() is disabled while iterating, the byte buffer's is not
+                file_size = file_path.stat().st_size
+                if file_size:
+                    self._read_progress = lambda _rows: file.buffer.tell() / file_size
+                
+                for row_num, values in enumerate(reader, start=2):  # Start at 2 because header is row 1
                     try:
                         # Clean and process the row
-                        processed_row = self._clean_row_data(row)
-                        if processed_row:
-                            transactions.append(processed_row)
+                        processed_row = self._clean_row_values(values, plan)
                     except Exception as e:
                         logger.warning(f"Error processing row {row_num} in {file_path}: {str(e)}")
                         continue
+                    if processed_row:
+                        yield processed_row
+                
+                # Whole file read; the buffer is closed by the time progress is asked for
+                self._read_progress = lambda _rows: 1.0
                         
         except Exception as e:
             logger.error(f"Error reading CSV file {file_path}: {str(e)}")
             raise
-        
-        return transactions
     
     def _process_excel(self, file_path: Path) -> List[Dict[str, Any]]:
         """Process Excel file and extract transaction data."""
-        transactions = []
+        return list(self._iter_excel_rows(file_path))
+    
+    def _iter_excel_rows(self, file_path: Path) -> Iterator[Dict[str, Any]]:
+        """
+        Stream cleaned rows from an Excel file.
+        
+        Large .xlsx workbooks (>= EXCEL_STREAMING_THRESHOLD_BYTES) are read
+        with openpyxl in read-only mode so the sheet is never fully loaded;
+        everything else goes through the vectorized pandas path. Both clean
+        cells with _excel_cell_text, so they produce the same rows.
+        """
+        if file_path.suffix.lower() == '.xlsx' and file_path.stat().st_size >= EXCEL_STREAMING_THRESHOLD_BYTES:
+            return self._iter_excel_rows_streaming(file_path)
+        return self._iter_excel_rows_vectorized(file_path)
+    
+    def _iter_excel_rows_vectorized(self, file_path: Path) -> Iterator[Dict[str, Any]]:
+        """Read an Excel sheet with pandas and clean it column-wise."""
+        try:
+            # Raw cell values, so integer columns with blanks don't turn into floats, and the
+            # header as a row, so repeated headers aren't renamed the pandas way
+            df = pd.read_excel(file_path, dtype=object, header=None)
+        except Exception as e:
+            logger.error(f"Error reading Excel file {file_path}: {str(e)}")
+            raise
+        
+        if len(df) < 2:
+            return
+        header = df.iloc[0].tolist()
+        df = df.iloc[1:]
         
+        # Normalize headers once per file instead of once per cell
+        cleaned = pd.DataFrame(index=df.index)
+        for position, name in self._excel_header_plan(header):
+            cleaned[name] = self._clean_excel_column(df.iloc[:, position])
+        
+        # Drop rows where every cell is empty
+        cleaned = cleaned[cleaned.notna().any(axis=1)]
+        total_rows = len(cleaned)
+        if total_rows:
+            self._read_progress = lambda rows: rows / total_rows
+        
+        # Emit row dicts from column lists, which is much cheaper than to_dict/iterrows
+        names = list(cleaned.columns)
+        for start in range(0, len(cleaned), INGEST_CHUNK_SIZE):
+            block = cleaned.iloc[start:start + INGEST_CHUNK_SIZE]
+            for values in zip(*(block[name].tolist() for name in names)):
+                yield dict(zip(names, values))
+    
+    @classmethod
+    def _excel_header_plan(cls, header: Sequence[Any]) -> List[Tuple[int, str]]:
+        """Header plan of an Excel header row; blank header cells are named the way pandas names them."""
+        return cls.build_header_plan(
+            f"Unnamed: {index}" if _excel_cell_text(name) is None else name
+            for index, name in enumerate(header)
+        )
+    
+    @staticmethod
+    def _clean_excel_column(column: pd.Series) -> pd.Series:
+        """
+        Stringify, strip and null out a whole column of raw cell values, the
+        way _excel_cell_text cleans one cell.
+        
+        Strings, numbers and booleans are stringified column-wise (numbers need
+        no stripping); only dates and times are cleaned cell by cell.
+        """
+        cleaned = np.full(len(column), None, dtype=object)
+        present = column.notna().to_numpy()
+        kind = pd.api.types.infer_dtype(column, skipna=True)
+        if kind == "empty":
+            return pd.Series(cleaned, index=column.index, dtype=object)
+        
+        if kind == "string":
+            strings, numbers, temporal = present, None, None
+        elif kind in _EXCEL_NUMBER_KINDS:
+            strings, numbers, temporal = None, present, None
+        else:
+            # Mixed column: strings and anything else but dates and times are stripped as text
+            temporal = present & column.map(lambda value: isinstance(value, _EXCEL_TEMPORAL_TYPES)).to_numpy(dtype=bool)
+            strings, numbers = present & ~temporal, None
+        
+        if strings is not None:
+            text = column[strings].astype(str).str.strip().to_numpy(dtype=object)
+            text[text == ""] = None
+            cleaned[strings] = text
+        if numbers is not None:
+            cleaned[numbers] = column[numbers].astype(str).to_numpy(dtype=object)
+        if temporal is not None and temporal.any():
+            cleaned[temporal] = [_excel_cell_text(value) for value in column[temporal].tolist()]
+        return pd.Series(cleaned, index=column.index, dtype=object)
+    
+    def _iter_excel_rows_streaming(self, file_path: Path) -> Iterator[Dict[str, Any]]:
+        """Read a large .xlsx sheet row by row using openpyxl's read-only mode."""
         try:
-            # Read Excel file
-            df = pd.read_excel(file_path)
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        except Exception as e:
+            logger.error(f"Error reading Excel file {file_path}: {str(e)}")
+            raise
+        
+        try:
+            worksheet = workbook.worksheets[0]
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            
+            plan = self._excel_header_plan(header)
             
-            # Convert to list of dictionaries
-            for row_num, (_, row) in enumerate(df.iterrows(), start=2):
+            # Read-only sheets only know their size when the file records its dimensions;
+            # blank rows are skipped, so this slightly underestimates progress
+            if worksheet.max_row and worksheet.max_row > 1:
+                data_rows = worksheet.max_row - 1
+                self._read_progress = lambda rows: rows / data_rows
+            
+            for row_num, values in enumerate(rows, start=2):
                 try:
-                    # Convert pandas row to dict and clean
-                    row_dict = row.to_dict()
-                    processed_row = self._clean_row_data(row_dict)
-                    if processed_row:
-                        transactions.append(processed_row)
+                    processed_row = self._clean_row_values(values, plan, _excel_cell_text)
                 except Exception as e:
                     logger.warning(f"Error processing row {row_num} in {file_path}: {str(e)}")
                     continue
-                    
-        except Exception as e:
-            logger.error(f"Error reading Excel file {file_path}: {str(e)}")
-            raise
-        
-        return transactions
+                if processed_row:
+                    yield processed_row
+        finally:
+            workbook.close()
     
-    def _clean_row_data(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Clean and standardize row data using normalized column names."""
-        # Remove empty rows
-        if not any(str(value).strip() for value in row.values() if value is not None):
-            return None
+    @staticmethod
+    def _clean_row_values(
+        values: Sequence[Any],
+        plan: List[Tuple[int, str]],
+        cell_text: Callable[[Any], Optional[str]] = _cell_text
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Clean a positional row using a header plan from build_header_plan.
         
-        # Clean the data with normalized column names
+        Missing trailing cells become None and cells beyond the header are
+        ignored. Returns None for rows without any non-empty value.
+        """
         cleaned_row = {}
-        for key, value in row.items():
-            if key is None:
-                continue
-                
-            # Normalize key name using the normalization function
-            normalized_key = self.normalize_column_name(str(key))
-            
-            # Clean value
-            if value is None or (isinstance(value, str) and not value.strip()):
-                cleaned_row[normalized_key] = None
-            else:
-                cleaned_row[normalized_key] = str(value).strip()
+        has_value = False
+        row_length = len(values)
+        
+        for index, name in plan:
+            text = cell_text(values[index]) if index < row_length else None
+            cleaned_row[name] = text
+            if text is not None:
+                has_value = True
         
-        return cleaned_row
+        return cleaned_row if has_value else None
     
     def _extract_columns_info(self, sample_transaction: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -268,113 +596,131 @@ class CSVProcessor:
         
         return columns_info
 
-    def _save_transactions(self, statement: Statement, transactions_data: List[Dict[str, Any]], db: Session) -> Dict[str, int]:
-        """Save transactions to database."""
+    @staticmethod
+    def _hash_content(transaction_data: Dict[str, Any]) -> str:
+        """Create the content hash used for duplicate detection."""
+        return hashlib.sha256(
+            json.dumps(transaction_data, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def _insert_batch(self, rows: List[Dict[str, Any]], db: Session) -> Set[str]:
+        """
+        Insert a batch of transaction rows with a single executemany.
+
+        Rows that collide with the (statement_id, ingested_content_hash) unique
+        constraint are skipped by the database instead of aborting the batch,
+        whether the colliding row was stored earlier or comes earlier in the
+        same batch.
+
+        Returns:
+            Content hashes of the rows actually inserted
+        """
+        if not rows:
+            return set()
+
+        stmt = sqlite_insert(Transaction.__table__).on_conflict_do_nothing(
+            index_elements=["statement_id", "ingested_content_hash"]
+        ).returning(Transaction.__table__.c.ingested_content_hash)
+        return set(db.execute(stmt, rows).scalars())
+
+    def _save_transactions(
+        self,
+        statement: Statement,
+        transactions_data: List[Dict[str, Any]],
+        db: Session,
+        content_hashes: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """
+        Save a chunk of transactions to database using set-based bulk inserts.
+        
+        Rows are inserted in batches of INGEST_BATCH_SIZE with ON CONFLICT DO
+        NOTHING, which drops rows already stored for the statement as well as
+        repeats within the file. The statement's stored hashes are not
+        preloaded: the unique constraint on (statement_id, ingested_content_hash)
+        already answers the lookup, so no hashes are kept between batches and
+        memory stays bounded by the batch. The rows the database reports as
+        inserted (RETURNING) are counted into the metadata registry and report
+        rollups, and the chunk is committed as a single transaction.
+        ``content_hashes`` may carry hashes computed ahead of time, one per row.
+        """
         created_count = 0
         duplicate_count = 0
         
-        # Collect all unique columns from all transactions
-        all_ingested_columns = set()
-        all_computed_columns = set()
+        # Rows carrying each column among the rows inserted
+        inserted_columns = Counter()
+        undated_count = 0
+        currency_sample = []
+        inserted_contents = []
         
-        for transaction_data in transactions_data:
-            try:
-                # Add statement filename to ingested content for easy reference
-                transaction_data['statement_filename'] = statement.filename
-                
-                # Collect unique columns
-                all_ingested_columns.update(transaction_data.keys())
-                
-                # For future: collect computed columns when they exist
-                # This will be populated when computed content is available
-                # all_computed_columns.update(transaction_data.get('computed_columns', {}).keys())
-                
-                # Create hash of the transaction content
-                content_hash = hashlib.sha256(
-                    json.dumps(transaction_data, sort_keys=True).encode('utf-8')
-                ).hexdigest()
-                
-                # Check if transaction already exists (application-level check for performance)
-                existing_transaction = db.query(Transaction).filter(
-                    Transaction.statement_id == statement.id,
-                    Transaction.ingested_content_hash == content_hash
-                ).first()
-                
-                if existing_transaction:
-                    logger.info(f"Transaction already exists, skipping: {content_hash}")
+        ingested_at = datetime.utcnow()
+        pending_rows = []
+        
+        def insert_pending():
+            nonlocal created_count, duplicate_count, undated_count
+            inserted = self._insert_batch(pending_rows, db)
+            for row in pending_rows:
+                # A hash repeated within the batch was inserted once
+                if row["ingested_content_hash"] not in inserted:
                     duplicate_count += 1
                     continue
-                
-                # Create new transaction
-                transaction = Transaction(
-                    statement_id=statement.id,
-                    ingested_content=transaction_data,
-                    ingested_content_hash=content_hash,
-                    ingested_at=datetime.utcnow()
-                )
-
-                db.add(transaction)
-                db.flush()  # Flush to trigger database constraint check
+                inserted.discard(row["ingested_content_hash"])
                 created_count += 1
+                transaction_data = row["ingested_content"]
+                inserted_columns.update(transaction_data.keys())
+                inserted_contents.append((transaction_data, None))
+                if len(currency_sample) < CURRENCY_SAMPLE_SIZE:
+                    currency_sample.append(transaction_data)
+                if row["txn_day"] is None:
+                    undated_count += 1
+            pending_rows.clear()
+        
+        try:
+            for position, transaction_data in enumerate(transactions_data):
+                # Add statement filename to ingested content for easy reference
+                transaction_data['statement_filename'] = statement.filename
                 
-            except IntegrityError as e:
-                # Handle unique constraint violation at database level
-                if "uq_transaction_statement_content" in str(e):
-                    logger.info(f"Transaction already exists (database constraint), skipping: {content_hash}")
-                    duplicate_count += 1
-                    db.rollback()
-                    continue
+                if content_hashes is not None:
+                    content_hash = content_hashes[position]
                 else:
-                    logger.error(f"Database integrity error: {str(e)}")
-                    db.rollback()
-                    continue
-            except Exception as e:
-                logger.error(f"Error saving transaction: {str(e)}")
-                db.rollback()
-                continue
+                    content_hash = self._hash_content(transaction_data)
+                
+                pending_rows.append({
+                    "statement_id": statement.id,
+                    "ingested_content": transaction_data,
+                    "ingested_content_hash": content_hash,
+                    "ingested_at": ingested_at,
+                    **date_columns(transaction_data, None)
+                })
+                
+                if len(pending_rows) >= INGEST_BATCH_SIZE:
+                    insert_pending()
+            
+            if pending_rows:
+                insert_pending()
+        except Exception as e:
+            logger.error(f"Error saving transactions for statement {statement.id}: {str(e)}")
+            db.rollback()
+            raise
         
-        # Update metadata once with all collected columns
-        if all_ingested_columns or all_computed_columns:
-            ingested_columns_dict = {col: True for col in all_ingested_columns}
-            computed_columns_dict = {col: True for col in all_computed_columns}
-            update_transaction_metadata(db, ingested_columns_dict, computed_columns_dict)
+        logger.info(f"Bulk insert for statement {statement.id}: {created_count} created, {duplicate_count} duplicates skipped")
+        if undated_count:
+            logger.warning(
+                f"Statement {statement.id}: {undated_count} rows without a parseable '{TRANSACTION_DATE_FIELD}' "
+                f"are excluded from report date ranges"
+            )
         
-        # Also update metadata with all existing transactions for this statement
-        self._update_metadata_from_existing_transactions(statement.id, db)
+        # Count the inserted rows into the column registry and report rollups
+        if created_count:
+            adjust_column_counts(db, ingested=dict(inserted_columns), sample_rows=currency_sample)
+            apply_rollup_changes(db, added=collect_rollup_cells(db, contents=inserted_contents))
         
         db.commit()
         return {
             "created_count": created_count,
-            "duplicate_count": duplicate_count
+            "duplicate_count": duplicate_count,
+            "undated_count": undated_count
         }
     
-    def _update_metadata_from_existing_transactions(self, statement_id: str, db: Session):
-        """Update metadata with all existing transactions for a statement."""
-        try:
-            # Get all existing transactions for this statement
-            existing_transactions = db.query(Transaction).filter(Transaction.statement_id == statement_id).all()
-            
-            if not existing_transactions:
-                return
-            
-            # Collect all unique columns from existing transactions
-            all_existing_ingested_columns = set()
-            all_existing_computed_columns = set()
-            for transaction in existing_transactions:
-                if transaction.ingested_content:
-                    all_existing_ingested_columns.update(transaction.ingested_content.keys())
-                if transaction.computed_content:
-                    all_existing_computed_columns.update(transaction.computed_content.keys())
-            
-            # Update metadata with existing columns
-            if all_existing_ingested_columns or all_existing_computed_columns:
-                ingested_columns_dict = {col: True for col in all_existing_ingested_columns}
-                computed_columns_dict = {col: True for col in all_existing_computed_columns}
-                update_transaction_metadata(db, ingested_columns_dict, computed_columns_dict)
-                
-        except Exception as e:
-            logger.error(f"Error updating metadata from existing transactions: {str(e)}")
-
     def get_transaction_summary(self, statement_id: str, db: Session) -> Dict[str, Any]:
         """Get summary of transactions for a statement."""
         transactions = db.query(Transaction).filter(Transaction.statement_id == statement_id).all()
@@ -391,4 +737,31 @@ class CSVProcessor:
                 for t in transactions
             ]
         }
- 
\ No newline at end of file
+ 
+
+
+def parse_statement_file(file_path: str, statement_filename: str, parsed_path: str) -> int:
+    """
+    Read, clean and hash every row of a statement file into a parsed file.
+    
+    Runs in batch processing worker processes, so it only touches files; rows
+    are streamed to ``parsed_path`` as JSON lines of [content hash, row] and
+    the parent process stores them with CSVProcessor.process_parsed_statement.
+    Neither side holds the whole statement in memory.
+    
+    Args:
+        file_path: Path to the statement file
+        statement_filename: Statement filename added to every row before hashing
+        parsed_path: File the hashed rows are written to
+        
+    Returns:
+        Number of rows written
+    """
+    row_count = 0
+    with open(parsed_path, 'w', encoding='utf-8') as parsed:
+        for row in CSVProcessor()._iter_rows(Path(file_path)):
+            content_hash = CSVProcessor._hash_content({**row, 'statement_filename': statement_filename})
+            parsed.write(json.dumps([content_hash, row]))
+            parsed.write('\n')
+            row_count += 1
+    return row_count
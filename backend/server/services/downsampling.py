@@ -0,0 +1,182 @@
+"""
+Point budgets for date series.
+
+Line and area charts over x_field 'date' can ask for at most max_points
+labels. The chart is first moved to the finest date bucket that fits
+(day, then week, then month), which keeps every value exact, and only when
+even months are too many does Largest-Triangle-Three-Buckets (LTTB) pick the
+points that best keep the shape of the line. Gap filling adds the periods
+without transactions between the first and last label, with value 0 like
+any missing group.
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from server.services.sql_functions import DATE_BUCKETS, parse_date, period_start
+
+
+def label_date(label: str, bucket: Optional[str]) -> Optional[date]:
+    """First day of the period a chart label stands for, None when it isn't a date"""
+    if bucket == 'month':
+        try:
+            return date.fromisoformat(f"{label}-01")
+        except ValueError:
+            return None
+    if bucket in DATE_BUCKETS:
+        return date.fromisoformat(label)
+    # Unbucketed labels are the stored date values
+    parsed = parse_date(label)
+    return parsed.date() if parsed else None
+
+
+def _next_period(day: date, bucket: str) -> date:
+    if bucket == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=7 if bucket == 'week' else 1)
+
+
+def period_labels(first: date, last: date, bucket: str) -> List[str]:
+    """Labels of every period of a bucket from the one holding ``first`` to the one holding ``last``"""
+    day = date.fromisoformat(period_start(first.isoformat(), 'week')) if bucket == 'week' else first
+    if bucket == 'month':
+        day = day.replace(day=1)
+    labels = []
+    while day <= last:
+        labels.append(period_start(day.isoformat(), bucket))
+        day = _next_period(day, bucket)
+    return labels
+
+
+def _is_day_series(labels: List[str], bucket: Optional[str]) -> bool:
+    """Whether labels are ISO days, weeks or months that gaps can be filled between"""
+    if bucket is not None:
+        return True
+    try:
+        return all(date.fromisoformat(label).isoformat() == label for label in labels)
+    except ValueError:
+        return False
+
+
+def fill_gaps(labels: List[str], bucket: Optional[str]) -> List[str]:
+    """Sorted labels with the missing periods between the first and last one added"""
+    if len(labels) < 2 or not _is_day_series(labels, bucket):
+        return labels
+    bucket = bucket or 'day'
+    return period_labels(label_date(labels[0], bucket), label_date(labels[-1], bucket), bucket)
+
+
+def point_count(labels: List[str], bucket: Optional[str], target: Optional[str], filled: bool) -> int:
+    """Number of labels the chart has when regrouped by ``target`` (``bucket`` itself for no change)"""
+    if target == bucket:
+        return len(fill_gaps(labels, bucket) if filled else labels)
+    days = [day for day in (label_date(label, bucket) for label in labels) if day is not None]
+    if not days:
+        return 0
+    if filled:
+        return len(period_labels(min(days), max(days), target))
+    return len({period_start(day.isoformat(), target) for day in days})
+
+
+def fitting_bucket(labels: List[str], bucket: Optional[str], max_points: int, filled: bool) -> Optional[str]:
+    """
+    Finest date bucket, no finer than ``bucket``, whose labels fit in ``max_points``.
+
+    Returns:
+        The bucket to group by, 'month' when none fits
+    """
+    finer = DATE_BUCKETS.index(bucket) if bucket in DATE_BUCKETS else 0
+    candidates = [bucket, *DATE_BUCKETS[finer + 1:]]
+    for target in candidates:
+        if point_count(labels, bucket, target, filled) <= max_points:
+            return target
+    return candidates[-1]
+
+
+def lttb(xs: List[float], ys: List[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are kept; the points between are split into
+    threshold - 2 buckets and each bucket keeps the point forming the largest
+    triangle with the previously kept point and the average of the next bucket.
+
+    Returns:
+        Indexes of the kept points, ascending
+    """
+    length = len(xs)
+    if threshold >= length or length <= 2:
+        return list(range(length))
+    if threshold < 3:
+        return [0, length - 1][:max(threshold, 1)]
+
+    kept = [0]
+    every = (length - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        following_end = min(int((bucket + 2) * every) + 1, length)
+        following = range(end, following_end) if end < following_end else range(length - 1, length)
+        average_x = sum(xs[index] for index in following) / len(following)
+        average_y = sum(ys[index] for index in following) / len(following)
+
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs(
+                (xs[previous] - average_x) * (ys[index] - ys[previous])
+                - (xs[previous] - xs[index]) * (average_y - ys[previous])
+            )
+            if area > best_area:
+                best, best_area = index, area
+        kept.append(best)
+        previous = best
+    kept.append(length - 1)
+    return kept
+
+
+def _select(result: Dict[str, Any], labels: List[str], pick) -> Dict[str, Any]:
+    """Copy of an aggregation response with its series mapped onto new labels"""
+    shaped = dict(result, labels=labels)
+    if result.get("split_by_currency"):
+        shaped["values_by_currency"] = {
+            currency: pick(values) for currency, values in result["values_by_currency"].items()
+        }
+    else:
+        shaped["values"] = pick(result["values"])
+    return shaped
+
+
+def fill_series_gaps(result: Dict[str, Any], bucket: Optional[str]) -> Dict[str, Any]:
+    """Aggregation response with 0 values for the periods missing between its labels"""
+    labels = fill_gaps(result["labels"], bucket)
+    if len(labels) == len(result["labels"]):
+        return result
+    positions = {label: index for index, label in enumerate(result["labels"])}
+    return _select(result, labels, lambda values: [
+        values[positions[label]] if label in positions else 0 for label in labels
+    ])
+
+
+def downsample_series(result: Dict[str, Any], bucket: Optional[str], max_points: int) -> Dict[str, Any]:
+    """
+    Aggregation response reduced to ``max_points`` labels with LTTB.
+
+    Currency series are reduced together, on their sum, so they keep the
+    same labels.
+    """
+    labels = result["labels"]
+    if len(labels) <= max_points:
+        return result
+    if result.get("split_by_currency"):
+        ys = [sum(values[index] for values in result["values_by_currency"].values()) for index in range(len(labels))]
+    else:
+        ys = result["values"]
+    days = [label_date(label, bucket) for label in labels]
+    # Unbucketed labels in mixed formats don't sort by date; space those evenly
+    xs = [day.toordinal() for day in days] if all(days) and days == sorted(days) else list(range(len(labels)))
+
+    kept = lttb(xs, ys, max_points)
+    shaped = _select(result, [labels[index] for index in kept], lambda values: [values[index] for index in kept])
+    shaped["downsampled"] = True
+    shaped["source_points"] = len(labels)
+    return shaped
@@ -0,0 +1,297 @@
+"""
+Embedded DuckDB mirror of the transactions for report aggregation.
+
+With REPORT_ENGINE=duckdb, reports group transactions in a local DuckDB
+file (DUCKDB_PATH) instead of running json_extract over every row in
+SQLite. The mirror flattens each transaction into typed columns: for every
+column of the metadata registry its x-axis label (VARCHAR), measure
+(DOUBLE) and normalized currency (VARCHAR), plus the date of
+TRANSACTION_DATE_FIELD (DATE) and its 'date' label. Values are derived with
+the same functions as the column store and the Python scan, so DuckDB
+returns the groups SQLite would.
+
+The mirror follows the data version of the transaction metadata: rows
+ingested or recomputed since the last sync are re-read and upserted, and a
+row count that doesn't match SQLite (rows were deleted) or new columns in
+the registry rebuild it. Charts with field filters, fields the registry
+doesn't know, another date field or median/p90/distinct_count are left to
+SQLite. Without the duckdb
+package the setting is ignored.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from server.models.main import Transaction, TransactionMetadata
+from server.services.column_store import Groups, report_values
+from server.services.filters import FilterTree
+from server.services.metadata import get_data_version
+from server.settings import DUCKDB_PATH, REPORT_ENGINE, TRANSACTION_DATE_FIELD
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Rows upserted into DuckDB per statement
+MIRROR_BATCH_SIZE = 5000
+
+# DuckDB aggregate of each aggregation it runs; sketches run in SQLite so results don't depend on the engine
+MIRROR_AGGREGATIONS = {'sum': 'SUM', 'avg': 'SUM', 'count': 'SUM', 'min': 'MIN', 'max': 'MAX'}
+
+# Labels of the date buckets, as produced by sql_functions.period_start
+_BUCKET_LABELS = {
+    'day': "strftime(txn_date, '%Y-%m-%d')",
+    'week': "strftime(date_trunc('week', txn_date), '%Y-%m-%d')",
+    'month': "strftime(txn_date, '%Y-%m')",
+}
+
+
+class DuckDBMirror:
+    """Typed copy of the transactions in a local DuckDB file"""
+
+    def __init__(
+        self,
+        path: str = DUCKDB_PATH,
+        enabled: bool = REPORT_ENGINE == 'duckdb',
+        date_field: str = TRANSACTION_DATE_FIELD
+    ):
+        if enabled and duckdb is None:
+            logger.warning("REPORT_ENGINE is duckdb but the duckdb package is not installed; using SQLite")
+        self.path = path
+        self.enabled = enabled and duckdb is not None
+        self.date_field = date_field
+        self._connection = None
+        self._lock = threading.Lock()
+        self.version: Optional[str] = None
+        # Latest ingested_at/computed_at read; rows changed since are re-read
+        self.watermark: Optional[datetime] = None
+        self.fields: List[str] = []
+        self.loads = 0
+        self.refreshes = 0
+        self.queries = 0
+        self.fallbacks = 0
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = duckdb.connect(self.path)
+            self._restore_state()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Mirror state, kept in the DuckDB file so a restart doesn't rebuild it
+
+    def _restore_state(self):
+        tables = {row[0] for row in self._connection.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+        if "mirror_state" not in tables or "transactions" not in tables:
+            return
+        row = self._connection.execute("SELECT data_version, watermark, fields, date_field FROM mirror_state").fetchone()
+        if row is None or row[3] != self.date_field:
+            return
+        self.version, self.watermark, self.fields = row[0], row[1], json.loads(row[2])
+
+    def _save_state(self):
+        self._connection.execute("CREATE TABLE IF NOT EXISTS mirror_state (data_version VARCHAR, watermark TIMESTAMP, fields VARCHAR, date_field VARCHAR)")
+        self._connection.execute("DELETE FROM mirror_state")
+        self._connection.execute(
+            "INSERT INTO mirror_state VALUES (?, ?, ?, ?)",
+            [self.version, self.watermark, json.dumps(self.fields), self.date_field]
+        )
+
+    # Loading
+
+    def _columns(self) -> List[str]:
+        columns = ["id", "txn_date", "date_label"]
+        for position in range(len(self.fields)):
+            columns += [f"c{position}_label", f"c{position}_value", f"c{position}_currency"]
+        return columns
+
+    def _create_table(self):
+        definitions = ["id VARCHAR PRIMARY KEY", "txn_date DATE", "date_label VARCHAR"]
+        for position in range(len(self.fields)):
+            definitions += [f"c{position}_label VARCHAR", f"c{position}_value DOUBLE", f"c{position}_currency VARCHAR"]
+        self._connection.execute("DROP TABLE IF EXISTS transactions")
+        self._connection.execute(f"CREATE TABLE transactions ({', '.join(definitions)})")
+
+    def _upsert(self, rows: List[List[Any]]):
+        if not rows:
+            return
+        batch = pd.DataFrame(rows, columns=self._columns(), dtype=object)
+        self._connection.register("mirror_batch", batch)
+        try:
+            self._connection.execute("DELETE FROM transactions WHERE id IN (SELECT id FROM mirror_batch)")
+            self._connection.execute("INSERT INTO transactions SELECT * FROM mirror_batch")
+        finally:
+            self._connection.unregister("mirror_batch")
+
+    def _copy(self, db: Session, since: Optional[datetime]):
+        """Upsert the rows changed since ``since`` (all rows when None)"""
+        query = db.query(
+            Transaction.id, Transaction.ingested_content, Transaction.computed_content,
+            Transaction.ingested_at, Transaction.computed_at
+        )
+        if since is not None:
+            query = query.filter(or_(Transaction.ingested_at >= since, Transaction.computed_at >= since))
+
+        rows = []
+        for transaction_id, ingested, computed, ingested_at, computed_at in query.yield_per(1000):
+            for stamp in (ingested_at, computed_at):
+                if stamp is not None and (self.watermark is None or stamp > self.watermark):
+                    self.watermark = stamp
+            (txn_date, _), label, values = report_values(ingested, computed, self.fields, self.date_field)
+            row = [transaction_id, txn_date, label]
+            for field in self.fields:
+                row.extend(values[field])
+            rows.append(row)
+            if len(rows) >= MIRROR_BATCH_SIZE:
+                self._upsert(rows)
+                rows = []
+        self._upsert(rows)
+
+    def sync(self, db: Session) -> bool:
+        """
+        Bring the mirror up to the current data version.
+
+        Returns:
+            Whether the mirror reflects the stored transactions
+        """
+        version = get_data_version(db)
+        if version is None:
+            return False
+        connection = self._connect()
+        if version == self.version:
+            return True
+
+        meta = db.query(TransactionMetadata).first()
+        fields = list(dict.fromkeys(list(meta.ingested_columns or {}) + list(meta.computed_columns or {})))
+        total = db.query(func.count(Transaction.id)).scalar() or 0
+
+        connection.begin()
+        try:
+            reload = self.version is None or not set(fields) <= set(self.fields)
+            if not reload:
+                self._copy(db, self.watermark)
+                # Rows were deleted
+                reload = connection.execute("SELECT count(*) FROM transactions").fetchone()[0] != total
+                if not reload:
+                    self.refreshes += 1
+            if reload:
+                self.fields = fields
+                self.watermark = None
+                self._create_table()
+                self._copy(db, None)
+                self.loads += 1
+            self.version = version
+            self._save_state()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            self.version = None
+            raise
+        return True
+
+    # Querying
+
+    def aggregate(
+        self,
+        db: Session,
+        x_field: str,
+        y_field: str,
+        aggregation: str,
+        date_from: Optional[date],
+        date_to: Optional[date],
+        date_field: str,
+        date_bucket: Optional[str],
+        currency_field: Optional[str],
+        filters: FilterTree
+    ) -> Optional[Groups]:
+        """
+        Group a chart in DuckDB.
+
+        Returns:
+            The chart's groups, None when the chart has to run in SQLite
+        """
+        if not self.enabled:
+            return None
+        date_ranged = bool(date_from or date_to)
+        if aggregation not in MIRROR_AGGREGATIONS or filters.active or ((x_field == 'date' or date_ranged) and date_field != self.date_field):
+            self.fallbacks += 1
+            return None
+
+        with self._lock:
+            if not self.sync(db):
+                self.fallbacks += 1
+                return None
+            positions = {field: position for position, field in enumerate(self.fields)}
+            needed = [y_field] + ([x_field] if x_field != 'date' else []) + ([currency_field] if currency_field else [])
+            if any(field not in positions for field in needed):
+                self.fallbacks += 1
+                return None
+
+            if x_field == 'date':
+                label = _BUCKET_LABELS.get(date_bucket, _BUCKET_LABELS['day']) if date_bucket else "date_label"
+            else:
+                label = f"c{positions[x_field]}_label"
+            currency = f"c{positions[currency_field]}_currency" if currency_field else "NULL"
+
+            conditions = ["label IS NOT NULL", "y IS NOT NULL"]
+            params: List[Any] = []
+            if date_ranged:
+                conditions.append("txn_date IS NOT NULL")
+            if date_from:
+                conditions.append("txn_date >= ?")
+                params.append(date_from)
+            if date_to:
+                conditions.append("txn_date <= ?")
+                params.append(date_to)
+
+            statement = (
+                f"SELECT label, currency, {MIRROR_AGGREGATIONS[aggregation]}(y), COUNT(y) FROM ("
+                f"SELECT {label} AS label, c{positions[y_field]}_value AS y, {currency} AS currency, txn_date "
+                f"FROM transactions"
+                f") AS grouped WHERE {' AND '.join(conditions)} GROUP BY label, currency"
+            )
+            self.queries += 1
+            return {
+                (label, currency): [total, count]
+                for label, currency, total, count in self._connection.execute(statement, params).fetchall()
+            }
+
+    # Diagnostics
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = None
+            if self.enabled and self.version is not None:
+                rows = self._connect().execute("SELECT count(*) FROM transactions").fetchone()[0]
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "fields": len(self.fields),
+                "rows": rows,
+                "data_version": self.version,
+                "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                "loads": self.loads,
+                "refreshes": self.refreshes,
+                "queries": self.queries,
+                "fallbacks": self.fallbacks
+            }
+
+
+# Shared mirror for report data endpoints
+duckdb_mirror = DuckDBMirror()
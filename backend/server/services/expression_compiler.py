@@ -0,0 +1,197 @@
+"""
+Closure compiler for rule expressions.
+
+compile_expression turns a parsed condition or formula into nested Python
+closures, so evaluating it against a transaction is a chain of direct calls:
+operators, whitelisted string methods and formula commands are resolved once
+when compiling instead of looked up for every node of every evaluation.
+
+The compiled expression behaves exactly like walking the tree: the same
+nodes, operators and methods are allowed, operands are evaluated in the same
+order and unsupported constructs raise the same errors when they are
+reached, not when compiling.
+"""
+import ast
+import operator
+from typing import Any, Callable, Dict, List
+
+from server.services.formula_commands import command_registry
+
+# Safe operators for conditions and formulas
+SAFE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda x, y: x in y,
+    ast.NotIn: lambda x, y: x not in y,
+    ast.And: operator.and_,
+    ast.Or: operator.or_,
+    ast.Not: operator.not_,
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+    ast.USub: operator.neg,  # Unary minus (e.g., -1)
+    ast.UAdd: operator.pos,  # Unary plus (e.g., +1)
+}
+
+# Whitelist of safe string methods, called as field.method(...)
+SAFE_STRING_METHODS = {
+    'contains': lambda s, substr: str(substr).lower() in str(s).lower(),
+    'startswith': lambda s, prefix: str(s).lower().startswith(str(prefix).lower()),
+    'endswith': lambda s, suffix: str(s).lower().endswith(str(suffix).lower()),
+    'lower': lambda s: str(s).lower(),
+    'upper': lambda s: str(s).upper(),
+    'strip': lambda s: str(s).strip(),
+}
+
+# A compiled expression: (transaction data, available command names) -> value
+Expression = Callable[[Dict[str, Any], List[str]], Any]
+
+
+def compile_expression(node: ast.AST) -> Expression:
+    """Compile an expression node into a closure over its compiled operands"""
+    compiler = _COMPILERS.get(type(node))
+    if compiler is None:
+        return _raising(f"Unsupported AST node type: {type(node).__name__}")
+    return compiler(node)
+
+
+def _raising(message: str, *operands: Expression) -> Expression:
+    """Expression evaluating its operands, like the tree walk does, then failing"""
+    def fail(data, commands):
+        for operand in operands:
+            operand(data, commands)
+        raise ValueError(message)
+    return fail
+
+
+def _constant(node: ast.Constant) -> Expression:
+    value = node.value
+    return lambda data, commands: value
+
+
+def _name(node: ast.Name) -> Expression:
+    name = node.id
+    message = f"Unknown variable: {name}"
+
+    def load(data, commands):
+        if name in data:
+            return data[name]
+        raise ValueError(message)
+    return load
+
+
+def _compare(node: ast.Compare) -> Expression:
+    left = compile_expression(node.left)
+    steps = [
+        (SAFE_OPERATORS.get(type(op)), f"Unsupported operator: {type(op).__name__}", compile_expression(comparator))
+        for op, comparator in zip(node.ops, node.comparators)
+    ]
+
+    if len(steps) == 1 and steps[0][0] is not None:
+        compare, _, right = steps[0]
+        return lambda data, commands: compare(left(data, commands), right(data, commands))
+
+    # Each comparison applies to the previous result, stopping at the first falsy one
+    def chain(data, commands):
+        result = left(data, commands)
+        for compare, message, right in steps:
+            value = right(data, commands)
+            if compare is None:
+                raise ValueError(message)
+            result = compare(result, value)
+            if not result:
+                break
+        return result
+    return chain
+
+
+def _bool_op(node: ast.BoolOp) -> Expression:
+    values = [compile_expression(value) for value in node.values]
+    if isinstance(node.op, ast.And):
+        def all_of(data, commands):
+            for value in values:
+                if not value(data, commands):
+                    return False
+            return True
+        return all_of
+    if isinstance(node.op, ast.Or):
+        def any_of(data, commands):
+            for value in values:
+                if value(data, commands):
+                    return True
+            return False
+        return any_of
+    return _raising(f"Unsupported boolean operator: {type(node.op).__name__}")
+
+
+def _unary_op(node: ast.UnaryOp) -> Expression:
+    operand = compile_expression(node.operand)
+    apply = SAFE_OPERATORS.get(type(node.op))
+    if apply is None:
+        return _raising(f"Unsupported unary operator: {type(node.op).__name__}", operand)
+    return lambda data, commands: apply(operand(data, commands))
+
+
+def _bin_op(node: ast.BinOp) -> Expression:
+    left = compile_expression(node.left)
+    right = compile_expression(node.right)
+    apply = SAFE_OPERATORS.get(type(node.op))
+    if apply is None:
+        return _raising(f"Unsupported binary operator: {type(node.op).__name__}", left, right)
+    return lambda data, commands: apply(left(data, commands), right(data, commands))
+
+
+def _call(node: ast.Call) -> Expression:
+    if isinstance(node.func, ast.Attribute):
+        # Method call like obj.method()
+        target = compile_expression(node.func.value)
+        args = [compile_expression(arg) for arg in node.args]
+        method = SAFE_STRING_METHODS.get(node.func.attr)
+        if method is None:
+            return _raising(f"Unsupported method: {node.func.attr}", target, *args)
+        return lambda data, commands: method(target(data, commands), *[arg(data, commands) for arg in args])
+
+    if isinstance(node.func, ast.Name):
+        # Formula command like amount_to_float(amount)
+        name = node.func.id
+        args = [compile_expression(arg) for arg in node.args]
+        command = command_registry.get_command(name)
+
+        def run_command(data, commands):
+            values = [arg(data, commands) for arg in args]
+            if name not in commands:
+                raise ValueError(f"Function not supported in conditions: {name}")
+            instance = command or command_registry.get_command(name)
+            if not instance:
+                raise ValueError(f"Formula command not found: {name}")
+            result = instance.execute(*values)
+            if result.success:
+                return result.value
+            raise ValueError(f"Formula command error: {result.error}")
+        return run_command
+
+    return _raising("Complex function calls not supported in conditions")
+
+
+def _attribute(node: ast.Attribute) -> Expression:
+    value = compile_expression(node.value)
+    name = node.attr
+    return lambda data, commands: getattr(value(data, commands), name, None)
+
+
+_COMPILERS: Dict[type, Callable[[Any], Expression]] = {
+    ast.Constant: _constant,
+    ast.Name: _name,
+    ast.Compare: _compare,
+    ast.BoolOp: _bool_op,
+    ast.UnaryOp: _unary_op,
+    ast.BinOp: _bin_op,
+    ast.Call: _call,
+    ast.Attribute: _attribute,
+}
@@ -1,11 +1,13 @@
 import os
 import hashlib
 import shutil
+import tempfile
 from pathlib import Path
 from datetime import datetime
+from typing import BinaryIO, Tuple
 import mimetypes
 
-from server.settings import ALLOWED_FILE_EXTENSIONS
+from server.settings import ALLOWED_FILE_EXTENSIONS, UPLOAD_CHUNK_SIZE
 
 class FileStorageService:
     """Service for managing file storage operations."""
@@ -27,10 +29,43 @@ class FileStorageService:
         """Calculates the hash of a file."""
         hash_func = hashlib.new(algorithm)
         with file_path.open("rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
                 hash_func.update(chunk)
         return hash_func.hexdigest()
 
+    def write_stream(self, source: BinaryIO, suffix: str = "", algorithm: str = "sha256") -> Tuple[Path, str]:
+        """Streams a file object into a staging file, hashing it in the same pass.
+
+        Only one chunk is held in memory at a time. The staging file lives
+        under the storage root (so it can be moved into place atomically) but
+        outside raw_data_dir; move it with commit_file or delete it.
+        """
+        incoming_dir = self.base_dir / "incoming"
+        incoming_dir.mkdir(parents=True, exist_ok=True)
+
+        hash_func = hashlib.new(algorithm)
+        fd, temp_name = tempfile.mkstemp(suffix=suffix, dir=incoming_dir)
+        temp_path = Path(temp_name)
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                    hash_func.update(chunk)
+                    temp_file.write(chunk)
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        return temp_path, hash_func.hexdigest()
+
+    def commit_file(self, temp_path: Path, file_name: str) -> Path:
+        """Moves a staged file into today's raw data directory and returns its path."""
+        target_dir = self.base_dir / "raw_data_dir" / datetime.utcnow().strftime("%Y-%m-%d")
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        final_path = target_dir / self.sanitize_filename(file_name)
+        os.replace(temp_path, final_path)
+        return final_path
+
     def get_mime_type(self, file_path: Path) -> str:
         """Gets the MIME type of a file."""
         mime_type, _ = mimetypes.guess_type(file_path)
@@ -0,0 +1,251 @@
+"""
+Field filters for transaction queries.
+
+Both the transactions list and the report endpoints take field filters as
+``filter_<index>_<field|operator|value>`` query parameters. They are parsed
+and compiled once per request into a FilterTree: a global and a local group
+of filters that must all match, combined with AND or OR. Filter values are
+parsed up front (numbers cast, strings lowered) and the tree emits either a
+SQL condition over the JSON content columns or a Python predicate over a
+transaction's merged content. Both evaluate filters with
+server.services.sql_functions.FilterValue, so they always agree.
+"""
+import math
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.services.sql_functions import FILTER_OPERATORS, ORDERING_OPERATORS, FieldSQL, FilterValue
+
+# Merged ingested/computed content -> whether the transaction passes
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+def parse_field_filters(query_params: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """
+    Collect field filters from ``filter_<index>_<field|operator|value>`` query parameters.
+
+    Returns:
+        Filter definitions keyed by index, e.g. {"0": {"field": ..., "operator": ..., "value": ...}}
+    """
+    filter_params = {}
+    for key, value in query_params.items():
+        if key.startswith('filter_') and '_' in key[7:]:
+            parts = key.split('_')
+            if len(parts) >= 3:
+                filter_index = parts[1]
+                filter_type = parts[2]
+
+                if filter_index not in filter_params:
+                    filter_params[filter_index] = {}
+                filter_params[filter_index][filter_type] = value
+    return filter_params
+
+
+class FieldFilter:
+    """One compiled field filter"""
+
+    def __init__(self, field: str, operator: str, value: str):
+        self.field = field
+        self.lowered_field = field.lower()
+        self.condition = FilterValue(operator, value)
+
+    @classmethod
+    def compile(cls, filter_data: Dict[str, str]) -> Optional["FieldFilter"]:
+        """Compile a filter definition; incomplete filters are ignored (None)"""
+        if 'field' not in filter_data or 'operator' not in filter_data or 'value' not in filter_data:
+            return None
+        if not filter_data['field'] or not filter_data['value']:
+            return None
+        return cls(filter_data['field'], filter_data['operator'], filter_data['value'])
+
+    def key(self) -> Tuple[str, str, str]:
+        return (self.field, self.condition.operator, self.condition.value)
+
+    def to_sql(self, sql: FieldSQL) -> str:
+        """Condition on the field's first non-null spelling (exact, then case variants)"""
+        if self.condition.operator in ORDERING_OPERATORS and self.condition.number is None:
+            return "0"
+        branches = []
+        for field in [self.field] + sql.variants(self.field):
+            json_type, value = sql.merged(field)
+            branches.append(f"WHEN {value} IS NOT NULL THEN {self._test_sql(sql, json_type, value)}")
+        return f"(CASE {' '.join(branches)} ELSE 0 END) = 1"
+
+    def _test_sql(self, sql: FieldSQL, json_type: str, value: str) -> str:
+        """
+        FilterValue.matches of a present field value. Text compared with a
+        number, floats and non-ASCII text compared as strings, objects, arrays
+        and NaN filter values (SQLite binds NaN as NULL) are matched in Python.
+        """
+        condition = self.condition
+        operator = condition.operator
+        nan = condition.number is not None and math.isnan(condition.number)
+        if operator in ORDERING_OPERATORS and not nan:
+            return f"COALESCE(moneta_float({value}) {ORDERING_OPERATORS[operator]} {sql.bind(condition.number)}, 0)"
+        if operator not in FILTER_OPERATORS:
+            return "0"
+        fallback = f"moneta_filter({json_type}, {value}, {sql.bind(operator)}, {sql.bind(condition.value)})"
+        if nan:
+            return fallback
+
+        if operator in ('equals', 'not_equals') and condition.number is not None:
+            # Numbers and booleans (1 and 0 in SQL) compare as numbers
+            test = f"{value} = {sql.bind(condition.number)}"
+            if operator == 'not_equals':
+                test = f"NOT ({test})"
+            return f"CASE WHEN {json_type} IN ('integer', 'real', 'true', 'false') THEN {test} ELSE {fallback} END"
+
+        # NULL when the value's lowered string is only known in Python
+        lowered = sql.lowered(json_type, value)
+        expected = sql.bind(condition.lowered)
+        if operator == 'equals':
+            test = f"{lowered} = {expected}"
+        elif operator == 'not_equals':
+            test = f"{lowered} != {expected}"
+        elif operator == 'contains':
+            test = f"instr({lowered}, {expected}) > 0"
+        elif operator == 'startswith':
+            test = f"substr({lowered}, 1, {len(condition.lowered)}) = {expected}"
+        else:
+            test = f"substr({lowered}, -{len(condition.lowered)}) = {expected}"
+        return f"COALESCE({test}, {fallback})"
+
+    def to_python(self) -> Predicate:
+        field = self.field
+        lowered = self.lowered_field
+        matches = self.condition.matches
+
+        def predicate(content: Dict[str, Any]) -> bool:
+            field_value = content.get(field)
+            if field_value is None:
+                for key, value in content.items():
+                    if value is not None and key.lower() == lowered:
+                        field_value = value
+                        break
+            return matches(field_value)
+
+        return predicate
+
+
+class FilterGroup:
+    """
+    Filters that must all match.
+
+    A group given only incomplete filters still counts as present and lets
+    every transaction through.
+    """
+
+    def __init__(self, filters: List[FieldFilter]):
+        self.filters = filters
+
+    @property
+    def active(self) -> bool:
+        return bool(self.filters)
+
+    def key(self) -> Tuple:
+        """Order-independent key of the group's filters"""
+        return tuple(sorted(f.key() for f in self.filters))
+
+    def to_sql(self, sql: FieldSQL) -> str:
+        if not self.filters:
+            return "1"
+        return f"({' AND '.join(f.to_sql(sql) for f in self.filters)})"
+
+    def to_python(self) -> Predicate:
+        predicates = [f.to_python() for f in self.filters]
+        if not predicates:
+            return lambda content: True
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda content: all(predicate(content) for predicate in predicates)
+
+
+class FilterTree:
+    """Global and local filter groups combined with AND or OR"""
+
+    def __init__(
+        self,
+        global_group: Optional[FilterGroup] = None,
+        local_group: Optional[FilterGroup] = None,
+        use_or: bool = False
+    ):
+        self.global_group = global_group
+        self.local_group = local_group
+        self.use_or = use_or
+
+    @property
+    def active(self) -> bool:
+        """Whether any complete filter restricts the transactions"""
+        return any(group.active for group in (self.global_group, self.local_group) if group)
+
+    @property
+    def combines(self) -> bool:
+        """Whether both groups are present, so the connector matters"""
+        return self.global_group is not None and self.local_group is not None
+
+    def key(self) -> Tuple:
+        """Cache key; groups and filter order that can't change the result are normalized away"""
+        return (
+            self.global_group.key() if self.global_group else None,
+            self.local_group.key() if self.local_group else None,
+            self.use_or if self.combines else None
+        )
+
+    def to_sql(self, sql: FieldSQL) -> str:
+        if self.combines:
+            joiner = " OR " if self.use_or else " AND "
+            return f"({self.global_group.to_sql(sql)}{joiner}{self.local_group.to_sql(sql)})"
+        group = self.global_group or self.local_group
+        return group.to_sql(sql) if group else "1"
+
+    def to_python(self) -> Predicate:
+        if self.combines:
+            global_pass = self.global_group.to_python()
+            local_pass = self.local_group.to_python()
+            if self.use_or:
+                return lambda content: global_pass(content) or local_pass(content)
+            return lambda content: global_pass(content) and local_pass(content)
+        group = self.global_group or self.local_group
+        return group.to_python() if group else (lambda content: True)
+
+
+def compile_filters(
+    filter_params: Optional[Dict[str, Dict[str, str]]] = None,
+    global_filter_count: int = 0,
+    global_local_connector: str = "AND"
+) -> FilterTree:
+    """
+    Compile parsed field filters into a FilterTree.
+
+    Args:
+        filter_params: Field filters as returned by parse_field_filters
+        global_filter_count: Number of global filters (index < count); the rest are local
+        global_local_connector: AND or OR between the global and local groups
+
+    Returns:
+        The compiled filters; groups without any filter definition are absent
+    """
+    global_filters: Optional[List[FieldFilter]] = None
+    local_filters: Optional[List[FieldFilter]] = None
+
+    for filter_index, filter_data in (filter_params or {}).items():
+        try:
+            is_global = int(filter_index) < global_filter_count
+        except ValueError:
+            # If index is not an integer, treat as global
+            is_global = True
+
+        compiled = FieldFilter.compile(filter_data)
+        if is_global:
+            global_filters = global_filters if global_filters is not None else []
+            if compiled:
+                global_filters.append(compiled)
+        else:
+            local_filters = local_filters if local_filters is not None else []
+            if compiled:
+                local_filters.append(compiled)
+
+    return FilterTree(
+        global_group=FilterGroup(global_filters) if global_filters is not None else None,
+        local_group=FilterGroup(local_filters) if local_filters is not None else None,
+        use_or=global_local_connector.upper() == 'OR'
+    )
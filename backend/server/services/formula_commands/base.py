@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Union, Type
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union, Type
 from pydantic import BaseModel, Field
 from enum import Enum
 import inspect
 
+import numpy as np
+
+# Argument types whose equal values always give a command the same result
+_MEMO_TYPES = (str, int, bool, float, type(None))
+
+
+def _memo_key(args: tuple) -> Optional[tuple]:
+    """Key of a row's arguments for reusing results, None when they can't be keyed"""
+    key = []
+    for arg in args:
+        arg_type = type(arg)
+        if arg_type not in _MEMO_TYPES:
+            return None
+        # 1 == 1.0 == True, and 0.0 == -0.0, but commands may tell them apart
+        key.append((arg_type, repr(arg)) if arg_type is float else (arg_type, arg))
+    return tuple(key)
+
 
 class DataType(Enum):
     """Supported data types for command inputs/outputs"""
@@ -77,6 +94,44 @@ class BaseCommand(ABC):
         except Exception as e:
             return CommandResult(success=False, error=str(e))
     
+    def execute_batch(self, *columns: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Execute the command for every row of equally long argument columns
+        
+        Gives each row the result of execute() on its arguments; rows with
+        the same arguments are executed once.
+        
+        Returns:
+            (values, failed): object array of the values, None where the
+            execution failed, and the mask of the failed rows
+        """
+        size = len(columns[0]) if columns else 0
+        values = np.empty(size, dtype=object)
+        failed = np.zeros(size, dtype=bool)
+        try:
+            # Every row has the same number of arguments
+            self._validate_args(columns, {})
+        except Exception:
+            failed[:] = True
+            return values, failed
+        
+        results = {}
+        for index, args in enumerate(zip(*columns)):
+            key = _memo_key(args)
+            outcome = results.get(key) if key is not None else None
+            if outcome is None:
+                try:
+                    outcome = (True, self._execute_impl(*args))
+                except Exception:
+                    outcome = (False, None)
+                if key is not None:
+                    results[key] = outcome
+            if outcome[0]:
+                values[index] = outcome[1]
+            else:
+                failed[index] = True
+        return values, failed
+    
     def _validate_args(self, args: tuple, kwargs: dict):
         """Validate command arguments against metadata"""
         provided_args = len(args) + len(kwargs)
@@ -106,11 +161,13 @@ class CommandRegistry:
     
     def __init__(self):
         self._commands: Dict[str, BaseCommand] = {}
+        self._names: Optional[List[str]] = None
     
     def register(self, command_class: Type[BaseCommand]) -> None:
         """Register a new command"""
         command = command_class()
         self._commands[command.metadata.name] = command
+        self._names = None
     
     def get_command(self, name: str) -> Optional[BaseCommand]:
         """Get a command by name"""
@@ -120,6 +177,12 @@ class CommandRegistry:
         """List all available commands"""
         return [cmd.metadata for cmd in self._commands.values()]
     
+    def command_names(self) -> List[str]:
+        """Names of all available commands, built once per registration; don't modify"""
+        if self._names is None:
+            self._names = list(self._commands)
+        return self._names
+    
     def get_commands_by_category(self, category: str) -> List[CommandMetadata]:
         """Get commands filtered by category"""
         return [cmd.metadata for cmd in self._commands.values() 
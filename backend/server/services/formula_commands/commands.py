@@ -4,7 +4,9 @@ Implementation of formula commands for transaction processing
 import re
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
-from typing import Union, Optional, List, Any
+from typing import Union, Optional, List, Any, Sequence, Tuple
+
+import numpy as np
 
 try:
     import dateinfer
@@ -19,6 +21,50 @@ except ImportError:
 from .base import BaseCommand, CommandMetadata, CommandParameter, DataType
 
 
+def _float_batch(
+    command: BaseCommand,
+    columns: Sequence[Sequence[Any]],
+    operation,
+    nonzero_divisor: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    execute_batch of a command computing ``operation`` on float(left), float(right)
+    
+    Rows where both operands are ints or floats (and the divisor isn't 0,
+    for division) are computed as float64 arrays, which round like Python
+    floats; the other rows are executed one by one.
+    """
+    if len(columns) != 2:
+        return BaseCommand.execute_batch(command, *columns)
+    left, right = columns
+    numeric = np.fromiter(
+        (type(a) in (int, float, bool) and type(b) in (int, float, bool) for a, b in zip(left, right)),
+        dtype=bool, count=len(left)
+    )
+    rows = np.flatnonzero(numeric)
+    try:
+        left_values = np.asarray([left[index] for index in rows], dtype=np.float64)
+        right_values = np.asarray([right[index] for index in rows], dtype=np.float64)
+    except OverflowError:
+        # Ints beyond float range fail like float() does, row by row
+        return BaseCommand.execute_batch(command, *columns)
+    if nonzero_divisor:
+        keep = right_values != 0
+        rows, left_values, right_values = rows[keep], left_values[keep], right_values[keep]
+    
+    others = np.ones(len(left), dtype=bool)
+    others[rows] = False
+    values, failed = np.empty(len(left), dtype=object), np.zeros(len(left), dtype=bool)
+    with np.errstate(all='ignore'):
+        values[rows] = operation(left_values, right_values).astype(object)
+    if others.any():
+        rest = np.flatnonzero(others)
+        values[rest], failed[rest] = BaseCommand.execute_batch(
+            command, [left[index] for index in rest], [right[index] for index in rest]
+        )
+    return values, failed
+
+
 class DateInferCommand(BaseCommand):
     """Command to infer and parse date/datetime strings using multiple parsing methods"""
     
@@ -214,6 +260,9 @@ class AddCommand(BaseCommand):
             examples=["add(10.5, 20.3)", "add(amount_to_float(money_in), amount_to_float(fee))"]
         )
     
+    def execute_batch(self, *columns: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        return _float_batch(self, columns, np.add)
+    
     def _execute_impl(self, left: Union[int, float], right: Union[int, float]) -> Optional[float]:
         """Add two numbers"""
         try:
@@ -240,6 +289,9 @@ class SubtractCommand(BaseCommand):
             examples=["subtract(100.0, 25.5)", "subtract(amount_to_float(money_in), amount_to_float(money_out))"]
         )
     
+    def execute_batch(self, *columns: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        return _float_batch(self, columns, np.subtract)
+    
     def _execute_impl(self, left: Union[int, float], right: Union[int, float]) -> Optional[float]:
         """Subtract right from left"""
         try:
@@ -266,6 +318,9 @@ class MultiplyCommand(BaseCommand):
             examples=["multiply(10.0, 1.5)", "multiply(amount_to_float(base), 0.1)"]
         )
     
+    def execute_batch(self, *columns: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        return _float_batch(self, columns, np.multiply)
+    
     def _execute_impl(self, left: Union[int, float], right: Union[int, float]) -> Optional[float]:
         """Multiply two numbers"""
         try:
@@ -292,6 +347,9 @@ class DivideCommand(BaseCommand):
             examples=["divide(100.0, 4.0)", "divide(amount_to_float(total), 12)"]
         )
     
+    def execute_batch(self, *columns: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        return _float_batch(self, columns, np.true_divide, nonzero_divisor=True)
+    
     def _execute_impl(self, dividend: Union[int, float], divisor: Union[int, float]) -> Optional[float]:
         """Divide dividend by divisor"""
         if dividend is None or divisor is None:
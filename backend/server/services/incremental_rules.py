@@ -0,0 +1,107 @@
+"""
+Incremental rule execution.
+
+A transaction executed with the full set of active rules records in its
+computed_content_hash the fingerprint of that rule set (RuleGraph.fingerprint)
+followed by a digest of its ingested_content_hash. The target field
+fingerprints of every rule set transactions were executed with are kept in
+rule_set_fingerprints, so an incremental execution can compare a
+transaction's rule set with the current one target by target:
+
+- transactions stamped with the current rule set and their current ingested
+  content are fresh and skipped;
+- transactions stamped with an earlier rule set are executed for the target
+  fields whose fingerprint changed only, which covers targets whose rules
+  changed and the targets computed from them;
+- new transactions, transactions whose ingested content changed and
+  transactions stamped with an unknown rule set are executed for every
+  target field.
+"""
+import hashlib
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from server.models.main import RuleSetFingerprint, Transaction
+from server.services.rule_graph import FINGERPRINT_LENGTH, RuleGraph
+
+# Transactions whose stamps are read at a time
+PLAN_CHUNK_SIZE = 5000
+
+
+def computed_content_stamp(rule_set: str, ingested_content_hash: str) -> str:
+    """computed_content_hash of a transaction executed with a rule set"""
+    ingested = hashlib.sha256(ingested_content_hash.encode()).hexdigest()[:FINGERPRINT_LENGTH]
+    return rule_set + ingested
+
+
+def save_rule_set(db: Session, graph: RuleGraph) -> str:
+    """Record the target fingerprints of a rule set; returns its fingerprint"""
+    fingerprint = graph.fingerprint()
+    if db.get(RuleSetFingerprint, fingerprint) is None:
+        db.add(RuleSetFingerprint(fingerprint=fingerprint, target_fingerprints=graph.target_fingerprints()))
+    return fingerprint
+
+
+class ExecutionPlan:
+    """Stale transactions grouped by the target fields they need executed"""
+
+    def __init__(self):
+        # Target fields (None for all) -> transaction ids
+        self.work: Dict[Optional[FrozenSet[str]], List[str]] = {}
+        self.skipped = 0
+
+    def add(self, transaction_id: str, targets: Optional[FrozenSet[str]]):
+        self.work.setdefault(targets, []).append(transaction_id)
+
+    @property
+    def stale(self) -> int:
+        return sum(len(ids) for ids in self.work.values())
+
+
+def plan_execution(db: Session, graph: RuleGraph, transaction_ids: Optional[List[str]] = None) -> ExecutionPlan:
+    """Plan which target fields each transaction needs executed for the rule set of ``graph``"""
+    rule_set = graph.fingerprint()
+    current = graph.target_fingerprints()
+    known: Dict[str, Dict[str, str]] = {
+        row.fingerprint: row.target_fingerprints for row in db.query(RuleSetFingerprint)
+    }
+    # Changed targets per earlier rule set, shared by its transactions
+    changed: Dict[str, FrozenSet[str]] = {}
+
+    query = db.query(Transaction.id, Transaction.ingested_content_hash, Transaction.computed_content_hash)
+    if transaction_ids:
+        query = query.filter(Transaction.id.in_(transaction_ids))
+
+    plan = ExecutionPlan()
+    for transaction_id, ingested_content_hash, stamp in query.yield_per(PLAN_CHUNK_SIZE):
+        if stamp and stamp == computed_content_stamp(rule_set, ingested_content_hash):
+            plan.skipped += 1
+            continue
+        previous = stamp[:FINGERPRINT_LENGTH] if stamp else None
+        if previous is None or stamp != computed_content_stamp(previous, ingested_content_hash):
+            # Never executed, ingested content changed since, or stamped some other way
+            plan.add(transaction_id, None)
+            continue
+        if previous not in known:
+            plan.add(transaction_id, None)
+            continue
+        if previous not in changed:
+            changed[previous] = frozenset(
+                target for target, fingerprint in current.items() if known[previous].get(target) != fingerprint
+            )
+        # No changed targets when only targets without rules any more differ: their values are
+        # kept as in a full run, and the transaction is only stamped with the current rule set
+        plan.add(transaction_id, changed[previous])
+    return plan
+
+
+def stale_transactions(
+    db: Session, plan: ExecutionPlan, chunk_size: int
+) -> Iterator[Tuple[Optional[FrozenSet[str]], List[Transaction]]]:
+    """Load the planned transactions in chunks, with the target fields each chunk needs"""
+    for targets, ids in plan.work.items():
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            transactions = db.query(Transaction).filter(Transaction.id.in_(chunk)).all()
+            yield targets, transactions
@@ -0,0 +1,250 @@
+"""
+Background statement processing jobs.
+
+Statement ingestion can take a long time for large files, so the API hands
+it to a bounded worker pool and returns a job id right away. A job processes
+one statement, or a batch of statements parsed in worker processes
+(server.services.batch_processing). Jobs live in memory only; they report
+progress while running and are pruned once enough newer jobs have finished.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from server.models.main import Statement
+from server.services.batch_processing import batch_message, batch_succeeded, process_statements_batch
+from server.services.csv_processor import CSVProcessor
+from server.services.database import get_db
+from server.settings import PROCESSING_WORKERS, PROCESSING_JOBS_RETAINED
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus:
+    """Lifecycle states of a processing job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    FINISHED = (COMPLETED, FAILED)
+
+
+@dataclass
+class ProcessingJob:
+    """Progress and outcome of processing a single statement or a batch"""
+    statement_id: Optional[str] = None
+    batch: bool = False
+    statement_ids: Optional[List[str]] = None  # Batch statements; None is every unprocessed statement
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = JobStatus.QUEUED
+    message: Optional[str] = None
+    error: Optional[str] = None
+    rows_parsed: int = 0
+    rows_inserted: int = 0
+    duplicates: int = 0
+    progress: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    _started_clock: Optional[float] = field(default=None, repr=False)
+    _finished_clock: Optional[float] = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in JobStatus.FINISHED
+
+    def mark_running(self):
+        with self._lock:
+            self.status = JobStatus.RUNNING
+            self.started_at = datetime.utcnow()
+            self._started_clock = time.monotonic()
+
+    def update_progress(self, progress: Dict[str, Any]):
+        """Progress callback for CSVProcessor.process_statement and process_statements_batch"""
+        with self._lock:
+            self.rows_parsed = progress.get("rows_parsed", self.rows_parsed)
+            self.rows_inserted = progress.get("rows_inserted", self.rows_inserted)
+            self.duplicates = progress.get("duplicates", self.duplicates)
+            self.progress = progress.get("progress")
+
+    def finish(self, result: Dict[str, Any]):
+        """Record the result dictionary of process_statement, or of a batch with its success and message"""
+        with self._lock:
+            self.result = result
+            self.message = result.get("message")
+            self.rows_parsed = result.get("transactions_processed", self.rows_parsed)
+            self.rows_inserted = result.get("transactions_created", self.rows_inserted)
+            self.duplicates = result.get("duplicates_skipped", self.duplicates)
+            if result.get("success"):
+                self.status = JobStatus.COMPLETED
+                self.progress = 1.0
+            else:
+                self.status = JobStatus.FAILED
+                self.error = result.get("message")
+            self._mark_finished()
+
+    def fail(self, error: str):
+        with self._lock:
+            self.status = JobStatus.FAILED
+            self.error = error
+            self.message = error
+            self._mark_finished()
+
+    def _mark_finished(self):
+        self.finished_at = datetime.utcnow()
+        self._finished_clock = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job, including throughput and ETA estimates"""
+        with self._lock:
+            elapsed = None
+            throughput = None
+            eta = None
+
+            if self._started_clock is not None:
+                end = self._finished_clock if self._finished_clock is not None else time.monotonic()
+                elapsed = end - self._started_clock
+                if elapsed > 0:
+                    throughput = self.rows_parsed / elapsed
+
+            if self.status == JobStatus.RUNNING and elapsed and self.progress:
+                eta = elapsed * (1 - self.progress) / self.progress
+            elif self.is_finished:
+                eta = 0.0
+
+            return {
+                "job_id": self.id,
+                "statement_id": self.statement_id,
+                "batch": self.batch,
+                "statement_ids": self.statement_ids,
+                "status": self.status,
+                "message": self.message,
+                "error": self.error,
+                "rows_parsed": self.rows_parsed,
+                "rows_inserted": self.rows_inserted,
+                "duplicates": self.duplicates,
+                "progress": round(self.progress, 4) if self.progress is not None else None,
+                "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+                "throughput_rows_per_second": round(throughput, 1) if throughput is not None else None,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "created_at": self.created_at.isoformat(),
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "result": self.result
+            }
+
+
+class JobManager:
+    """Runs statement processing jobs on a bounded thread pool"""
+
+    def __init__(self, max_workers: int = PROCESSING_WORKERS, retained_jobs: int = PROCESSING_JOBS_RETAINED):
+        self.max_workers = max(1, max_workers)
+        self.retained_jobs = retained_jobs
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, ProcessingJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit_statement(self, statement_id: str) -> ProcessingJob:
+        """
+        Queue a statement for processing.
+
+        If the statement already has a queued or running job, that job is
+        returned instead of processing the file twice.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.statement_id == statement_id and not job.is_finished:
+                    return job
+
+            job = ProcessingJob(statement_id=statement_id)
+            self._jobs[job.id] = job
+            self._prune()
+            self._submit(self._run, job)
+            return job
+
+    def submit_batch(self, statement_ids: Optional[List[str]], max_workers: Optional[int] = None) -> ProcessingJob:
+        """
+        Queue a batch of statements for processing.
+
+        The batch parses its statements in its own worker processes and writes
+        them from this pool's thread, like any other job.
+        """
+        with self._lock:
+            job = ProcessingJob(batch=True, statement_ids=statement_ids)
+            self._jobs[job.id] = job
+            self._prune()
+            self._submit(self._run_batch, job, max_workers)
+            return job
+
+    def get(self, job_id: str) -> Optional[ProcessingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, statement_id: Optional[str] = None) -> List[ProcessingJob]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if statement_id:
+            jobs = [job for job in jobs if job.statement_id == statement_id]
+        return jobs
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+    def _submit(self, run, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="statement-job")
+        self._executor.submit(run, *args)
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond the retention limit"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.retained_jobs)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: ProcessingJob):
+        job.mark_running()
+        db = get_db("main")
+        try:
+            statement = db.query(Statement).filter(Statement.id == job.statement_id).first()
+            if not statement:
+                job.fail("Statement not found")
+                return
+
+            processor = CSVProcessor()
+            result = processor.process_statement(statement, db, progress_callback=job.update_progress)
+            job.finish(result)
+        except Exception as e:
+            logger.exception(f"Processing job {job.id} for statement {job.statement_id} failed")
+            job.fail(f"Error processing statement: {str(e)}")
+        finally:
+            db.close()
+
+    def _run_batch(self, job: ProcessingJob, max_workers: Optional[int]):
+        job.mark_running()
+        db = get_db("main")
+        try:
+            results = process_statements_batch(
+                job.statement_ids, db, max_workers=max_workers, progress_callback=job.update_progress
+            )
+            job.finish({**results, "success": batch_succeeded(results), "message": batch_message(results)})
+        except Exception as e:
+            logger.exception("Batch processing job %s failed", job.id)
+            job.fail(f"Error processing statements: {str(e)}")
+        finally:
+            db.close()
+
+
+# Shared job manager used by the API
+job_manager = JobManager()
@@ -1,39 +1,249 @@
-from server.models.main import TransactionMetadata
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from server.models.main import Transaction, TransactionMetadata
 from datetime import datetime
 
+# Currency field detection: a column is a currency field if its name looks like
+# one or any sampled value is a currency code or symbol
+CURRENCY_NAME_PATTERNS = ('currency', 'curr', 'ccy', 'crncy')
+COMMON_CURRENCIES = {'USD', 'EUR', 'GBP', 'JPY', 'CHF', 'CAD', 'AUD', 'CNY', 'INR', 'RUB'}
+CURRENCY_SYMBOLS = {'$', '€', '£', '¥', '₹', '₽', 'R$', '₩', 'kr', 'zł', '฿', 'Rp', 'RM', '₱', 'R', '₺'}
+CURRENCY_SAMPLE_SIZE = 100
+
+
+def get_or_create_metadata(session) -> TransactionMetadata:
+    """Return the singleton metadata record, creating it if needed."""
+    meta = session.query(TransactionMetadata).first()
+
+    if not meta:
+        meta = TransactionMetadata(
+            id="1",
+            ingested_columns={},
+            computed_columns={},
+            ingested_column_counts={},
+            computed_column_counts={},
+            currency_fields=[]
+        )
+        session.add(meta)
+
+    return meta
+
+
+def bump_data_version(meta: TransactionMetadata):
+    """Mark the stored transactions as changed so cached report results are not reused."""
+    # A random token rather than a counter, so a recreated database can't repeat a version
+    meta.data_version = uuid.uuid4().hex
+
 
-def update_transaction_metadata(session, ingested: dict, computed: dict):
+def get_data_version(session) -> Optional[str]:
+    """Current data version, None when it is not known yet"""
+    row = session.query(TransactionMetadata.data_version).first()
+    return row[0] if row else None
+
+
+def count_columns(contents: Iterable[Optional[dict]]) -> Dict[str, int]:
+    """Count in how many of the given content dicts each key appears."""
+    counts = Counter()
+    for content in contents:
+        if content:
+            counts.update(content.keys())
+    return dict(counts)
+
+
+def is_currency_value(value: Any) -> bool:
+    """Check whether a value is a known currency code or symbol."""
+    return bool(value) and isinstance(value, str) and (value.upper() in COMMON_CURRENCIES or value in CURRENCY_SYMBOLS)
+
+
+def detect_currency_fields(columns: Iterable[str], rows: Iterable[Optional[dict]]) -> List[str]:
     """
-    Update transaction metadata using the provided session.
-    
+    Classify columns as currency fields by name or by sampled values.
+
+    Args:
+        columns: Column names to classify, in the order to report them
+        rows: Sample content dicts to look for currency codes/symbols in
+
+    Returns:
+        The columns that are currency fields
+    """
+    rows = [row for row in rows if row]
+    currency_fields = []
+
+    for column in columns:
+        if any(pattern in column.lower() for pattern in CURRENCY_NAME_PATTERNS):
+            currency_fields.append(column)
+        elif any(is_currency_value(row.get(column)) for row in rows):
+            currency_fields.append(column)
+
+    return currency_fields
+
+
+def _update_currency_fields(meta: TransactionMetadata, sample_rows: Iterable[Optional[dict]]):
+    """Drop vanished currency fields and classify the other columns against new rows."""
+    columns = list(meta.ingested_column_counts or {}) + list(meta.computed_column_counts or {})
+    present = set(columns)
+
+    currency_fields = [field for field in (meta.currency_fields or []) if field in present]
+    known = set(currency_fields)
+    candidates = [column for column in columns if column not in known]
+    currency_fields += [field for field in detect_currency_fields(candidates, sample_rows) if field not in known]
+
+    meta.currency_fields = list(dict.fromkeys(currency_fields))
+
+
+def refresh_currency_fields(session) -> TransactionMetadata:
+    """Reclassify every column against a sample of the stored transactions."""
+    meta = get_or_create_metadata(session)
+    transactions = session.query(Transaction).limit(CURRENCY_SAMPLE_SIZE).all()
+    sample_rows = [
+        {**(transaction.ingested_content or {}), **(transaction.computed_content or {})}
+        for transaction in transactions
+    ]
+
+    meta.currency_fields = []
+    _update_currency_fields(meta, sample_rows)
+    session.flush()
+    return meta
+
+
+def column_counts(session, statement_id: Optional[str] = None) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Count stored rows per ingested and computed column with SQLite's json_each.
+
+    Args:
+        session: Database session
+        statement_id: Only count the transactions of this statement
+
+    Returns:
+        (ingested_counts, computed_counts)
+    """
+    where = "AND t.statement_id = :statement_id" if statement_id else ""
+    params = {"statement_id": statement_id} if statement_id else {}
+
+    def run(column: str) -> Dict[str, int]:
+        # Content stored as JSON null would yield a single row with a NULL key
+        rows = session.execute(
+            text(
+                f"SELECT je.key, COUNT(*) FROM transactions AS t, json_each(t.{column}) AS je "
+                f"WHERE json_type(t.{column}) = 'object' {where} GROUP BY je.key"
+            ),
+            params
+        ).all()
+        return {key: count for key, count in rows}
+
+    return run("ingested_content"), run("computed_content")
+
+
+def _apply_deltas(counts: dict, deltas: Dict[str, int]) -> dict:
+    updated = dict(counts or {})
+    for column, delta in deltas.items():
+        total = updated.get(column, 0) + delta
+        if total > 0:
+            updated[column] = total
+        else:
+            updated.pop(column, None)
+    return updated
+
+
+def _columns_from_counts(existing: dict, counts: dict) -> dict:
+    # Keep whatever per-column info is already stored for surviving columns
+    existing = existing or {}
+    return {column: existing.get(column, True) for column in counts}
+
+
+def adjust_column_counts(
+    session,
+    ingested: Optional[Dict[str, int]] = None,
+    computed: Optional[Dict[str, int]] = None,
+    sample_rows: Optional[Iterable[Optional[dict]]] = None
+):
+    """
+    Apply per-column row count deltas to the metadata registry.
+
+    Call this after the rows it describes have been flushed: positive deltas
+    for newly stored columns, negative ones for deleted rows. Columns whose
+    count drops to zero disappear. Currency fields are kept in step: columns
+    not yet classified as currency fields are checked against
+    ``sample_rows``, a sample of the content just written. A registry created
+    before counts were tracked is rebuilt from the stored rows instead,
+    which already reflects the change.
+
     Args:
         session: Database session (should be passed from the calling context)
-        ingested: Dictionary of ingested column data
-        computed: Dictionary of computed column data
+        ingested: Row count delta per ingested column
+        computed: Row count delta per computed column
+        sample_rows: Up to CURRENCY_SAMPLE_SIZE of the written content dicts
     """
     try:
-        meta = session.query(TransactionMetadata).first()
-
-        if not meta:
-            meta = TransactionMetadata(id="1", ingested_columns={}, computed_columns={})
-            session.add(meta)
-        
-        def update_columns(existing: dict, new_data: dict):
-            for key, value in new_data.items():
-                if key in existing:
-                    existing[key] = value
-                else:
-                    existing[key] = value
-            return existing
-        
-        meta.ingested_columns = update_columns(meta.ingested_columns, ingested)
-        meta.computed_columns = update_columns(meta.computed_columns, computed)
-        
+        meta = get_or_create_metadata(session)
+
+        if meta.ingested_column_counts is None or meta.computed_column_counts is None:
+            rebuild_transaction_metadata(session)
+            return
+
+        if ingested:
+            meta.ingested_column_counts = _apply_deltas(meta.ingested_column_counts, ingested)
+            meta.ingested_columns = _columns_from_counts(meta.ingested_columns, meta.ingested_column_counts)
+        if computed:
+            meta.computed_column_counts = _apply_deltas(meta.computed_column_counts, computed)
+            meta.computed_columns = _columns_from_counts(meta.computed_columns, meta.computed_column_counts)
+
+        if meta.currency_fields is None:
+            refresh_currency_fields(session)
+        else:
+            _update_currency_fields(meta, sample_rows or [])
+
         # Update the updated_at timestamp
         meta.updated_at = datetime.utcnow()
-        
+        bump_data_version(meta)
+
         # Don't commit here - let the calling context handle the commit
         session.flush()  # Flush changes to the database without committing
     except Exception as e:
         session.rollback()
         raise e
+
+
+def rebuild_transaction_metadata(session) -> TransactionMetadata:
+    """
+    Recount every column from the stored transactions.
+
+    Column counts are a full scan done in SQL and currency fields are
+    reclassified against a sample. This is only needed to initialize or
+    repair the registry; normal writes keep it current with adjust_column_counts.
+    """
+    try:
+        meta = get_or_create_metadata(session)
+        session.flush()
+
+        ingested_counts, computed_counts = column_counts(session)
+        meta.ingested_column_counts = ingested_counts
+        meta.computed_column_counts = computed_counts
+        meta.ingested_columns = _columns_from_counts(meta.ingested_columns, ingested_counts)
+        meta.computed_columns = _columns_from_counts(meta.computed_columns, computed_counts)
+        refresh_currency_fields(session)
+        meta.updated_at = datetime.utcnow()
+        bump_data_version(meta)
+
+        session.flush()
+        return meta
+    except Exception as e:
+        session.rollback()
+        raise e
+
+
+def reset_transaction_metadata(session):
+    """Empty the registry after every transaction has been deleted."""
+    meta = get_or_create_metadata(session)
+    meta.ingested_columns = {}
+    meta.computed_columns = {}
+    meta.ingested_column_counts = {}
+    meta.computed_column_counts = {}
+    meta.currency_fields = []
+    meta.updated_at = datetime.utcnow()
+    bump_data_version(meta)
+    session.flush()
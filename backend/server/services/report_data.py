@@ -0,0 +1,149 @@
+"""
+Data for all widgets of a report.
+
+A report's filters hold the date range and the global field filters shared
+by its widgets, and each chart or stats widget adds its own fields, currency
+settings and local filters. The widgets are turned into the same chart
+queries their components send to /reports/data/aggregated/ and aggregated
+together with aggregate_charts, which reads the transactions once for all
+widgets sharing the report's scope.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from server.models.main import Report
+from server.services.aggregation import aggregate_charts
+
+# Widget types whose data comes from the aggregation endpoint
+DATA_WIDGET_TYPES = ('chart', 'stats')
+
+# Chart types drawn as a line over x_field 'date', and the most points they request
+TIME_SERIES_CHART_TYPES = ('line', 'multiline', 'area')
+TIME_SERIES_MAX_POINTS = 500
+
+
+def _field_filters(filters: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+    # Filters are only sent once both a field and a value are set
+    field_filters = (filters or {}).get('fieldFilters') or []
+    return [
+        {
+            'field': f['field'],
+            'operator': f.get('operator') or 'equals',
+            'value': f['value'],
+            'connector': f.get('connector') or 'AND'
+        }
+        for f in field_filters
+        if isinstance(f, dict) and f.get('field') and f.get('value')
+    ]
+
+
+def widget_chart(
+    widget: Dict[str, Any],
+    date_range: Dict[str, Any],
+    global_filters: List[Dict[str, str]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Build the aggregation a widget requests.
+
+    Args:
+        widget: Widget as stored in the report
+        date_range: Report date range ({from, to, dateField})
+        global_filters: Complete report-level field filters
+
+    Returns:
+        Keyword arguments of aggregate_transactions, or None when the widget
+        has no aggregated data
+    """
+    config = widget.get('config') or {}
+    widget_type = widget.get('type')
+    if widget_type not in DATA_WIDGET_TYPES or not config.get('y_field'):
+        return None
+
+    if widget_type == 'stats':
+        # Stats widgets total every category; averages are derived from the sum
+        aggregation = config.get('aggregation') or 'sum'
+        chart = {
+            'x_field': 'category',
+            'y_field': config['y_field'],
+            'aggregation': 'sum' if aggregation == 'avg' else aggregation
+        }
+        split = False
+    else:
+        if not config.get('x_field'):
+            return None
+        chart = {
+            'x_field': config['x_field'],
+            'y_field': config['y_field'],
+            'aggregation': config.get('aggregation') or 'sum'
+        }
+        split = bool(config.get('split_by_currency'))
+        if config.get('top_n'):
+            chart.update(top_n=int(config['top_n']), order_by=config.get('order_by'))
+        elif config['x_field'] == 'date' and config.get('chartType') in TIME_SERIES_CHART_TYPES:
+            chart.update(max_points=TIME_SERIES_MAX_POINTS, fill_gaps=bool(config.get('fill_gaps')))
+
+    chart.update(
+        date_from=date_range.get('from') or None,
+        date_to=date_range.get('to') or None,
+        date_field=date_range.get('dateField') or 'date'
+    )
+    if config.get('currency_mode') == 'field' and config.get('currency_field'):
+        chart.update(currency_field=config['currency_field'], split_by_currency=split)
+
+    local_filters = _field_filters(config.get('localFilters'))
+    chart['filter_params'] = {
+        str(index): filter_data for index, filter_data in enumerate(global_filters + local_filters)
+    }
+    chart['global_filter_count'] = len(global_filters)
+    chart['global_local_connector'] = config.get('filter_combine_mode') or 'AND'
+    return chart
+
+
+def compute_report_data(
+    db: Session,
+    report: Report,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    date_field: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Aggregate every data widget of a report.
+
+    Args:
+        db: Database session
+        report: Report to compute
+        date_from: Start date overriding the saved date range
+        date_to: End date overriding the saved date range
+        date_field: Date field overriding the saved date range
+
+    Returns:
+        Aggregated data per widget id, in the /reports/data/aggregated/ format
+    """
+    filters = report.filters if isinstance(report.filters, dict) else {}
+    widgets = report.widgets if isinstance(report.widgets, list) else []
+
+    date_range = dict(filters.get('dateRange') or {})
+    if date_from is not None:
+        date_range['from'] = date_from
+    if date_to is not None:
+        date_range['to'] = date_to
+    if date_field is not None:
+        date_range['dateField'] = date_field
+    global_filters = _field_filters(filters.get('globalFilters'))
+
+    widget_ids = []
+    charts = []
+    for index, widget in enumerate(widgets):
+        if not isinstance(widget, dict):
+            continue
+        chart = widget_chart(widget, date_range, global_filters)
+        if chart is not None:
+            widget_ids.append(str(widget.get('id', index)))
+            charts.append(chart)
+
+    results = aggregate_charts(db, charts) if charts else []
+    return {
+        "report_id": report.id,
+        "widgets": dict(zip(widget_ids, results))
+    }
@@ -0,0 +1,100 @@
+"""
+In-memory cache of report aggregation results.
+
+Results are keyed by a normalized query and the data version stored in the
+transaction metadata, which every write to transactions replaces. Entries of
+older versions can never be hit again and are dropped as soon as a newer
+version is seen. The cache is bounded by the size of the cached results'
+JSON encoding and evicts least recently used entries first.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from server.settings import REPORT_CACHE_MAX_BYTES
+
+
+class ResultCache:
+    """LRU cache with a memory budget and hit/miss counters"""
+
+    def __init__(self, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Any, int]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, version: str, key: Hashable) -> Optional[Any]:
+        """Return a copy of the cached result, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+    def put(self, version: str, key: Hashable, value: Any):
+        """Cache a result; results larger than the whole budget are not cached."""
+        size = len(json.dumps(value, default=str))
+        if not self.enabled or size > self.max_bytes:
+            return
+
+        with self._lock:
+            if version != self._version:
+                self._drop_other_versions(version)
+
+            previous = self._entries.pop((version, key), None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[(version, key)] = (copy.deepcopy(value), size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _drop_other_versions(self, version: str):
+        stale = [entry_key for entry_key in self._entries if entry_key[0] != version]
+        for entry_key in stale:
+            self._bytes -= self._entries.pop(entry_key)[1]
+        self.invalidations += len(stale)
+        self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "size_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "data_version": self._version
+            }
+
+
+# Shared cache for report data endpoints
+report_cache = ResultCache()
@@ -0,0 +1,352 @@
+"""
+Materialized rollups for report widgets.
+
+A rollup pre-aggregates one (dimension, measure, date field, currency field)
+combination into cells keyed by day, dimension value and currency, each
+holding the count, sum, min and max of the measure. Week and month buckets
+are summed from the day cells at query time.
+
+Rollups are created the first time an unfiltered chart asks for their
+combination, up to REPORT_ROLLUP_LIMIT of them, and are kept current on
+every write: ingested rows are added, rule executions swap the old content
+of changed rows for the new one and deleted rows are subtracted. Cell values
+are computed with the same SQL expressions as the live aggregation, so a
+rollup always answers exactly like a scan of the transactions would.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from server.models.main import ReportRollup, ReportRollupCell
+from server.services.sql_functions import FieldSQL, UnsupportedQuery, period_sql, prepare_sql
+from server.services.transaction_dates import transaction_date
+from server.settings import REPORT_ROLLUP_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# (day, label, currency) -> (row_count, value_sum, value_min, value_max)
+Cells = Dict[Tuple[str, str, str], Tuple[int, float, Optional[float], Optional[float]]]
+
+# Content rows sent to SQLite per query when collecting cells from content
+CONTENT_BATCH_SIZE = 2000
+
+_UPSERT_CELL = text(
+    "INSERT INTO report_rollup_cells "
+    "(rollup_id, day, label, currency, row_count, value_sum, value_min, value_max) "
+    "VALUES (:rollup_id, :day, :label, :currency, :row_count, :value_sum, :value_min, :value_max) "
+    "ON CONFLICT (rollup_id, day, label, currency) DO UPDATE SET "
+    "row_count = row_count + excluded.row_count, "
+    "value_sum = value_sum + excluded.value_sum, "
+    "value_min = min(value_min, excluded.value_min), "
+    "value_max = max(value_max, excluded.value_max)"
+)
+
+
+def _cell_select(sql: FieldSQL, rollup: ReportRollup, source: str, where: str = "1") -> str:
+    """SELECT producing the rollup's cells over the rows of ``source``"""
+    label = sql.label(rollup.dimension, rollup.date_field)
+    measure = sql.measure(rollup.measure)
+    currency = sql.currency(rollup.currency_field or None)
+    day = sql.date(rollup.date_field)
+    return (
+        f"SELECT COALESCE(txn_date, '') AS day, label, COALESCE(currency, '') AS currency, "
+        f"COUNT(y), SUM(y), MIN(y), MAX(y) FROM ("
+        f"SELECT {label} AS label, {measure} AS y, {currency} AS currency, {day} AS txn_date "
+        f"FROM {source} WHERE {where}"
+        f") AS cell_rows WHERE label IS NOT NULL AND y IS NOT NULL "
+        f"GROUP BY COALESCE(txn_date, ''), label, COALESCE(currency, '')"
+    )
+
+
+def _content_source(sql: FieldSQL, contents: List[Tuple[Optional[dict], Optional[dict]]]) -> str:
+    # Rows given as (ingested_content, computed_content, txn_date) triples, read back with json_each
+    rows = sql.bind(json.dumps(
+        [[ingested, computed, transaction_date(ingested, computed)[0]] for ingested, computed in contents],
+        default=str
+    ))
+    return (
+        f"(SELECT json_extract(value, '$[0]') AS ingested_content, "
+        f"json_extract(value, '$[1]') AS computed_content, "
+        f"json_extract(value, '$[2]') AS txn_date FROM json_each({rows}))"
+    )
+
+
+def _rollups(db: Session) -> List[ReportRollup]:
+    return db.query(ReportRollup).all()
+
+
+def find_rollup(
+    db: Session,
+    dimension: str,
+    measure: str,
+    date_field: str,
+    currency_field: Optional[str] = None
+) -> Optional[ReportRollup]:
+    """
+    Find a rollup covering a chart.
+
+    Without a currency field any rollup of the same dimension, measure and
+    date field will do, since its currencies can be summed together.
+    """
+    query = db.query(ReportRollup).filter(
+        ReportRollup.dimension == dimension,
+        ReportRollup.measure == measure,
+        ReportRollup.date_field == date_field
+    )
+    if currency_field:
+        query = query.filter(ReportRollup.currency_field == currency_field)
+    return query.order_by(ReportRollup.currency_field).first()
+
+
+def ensure_rollup(
+    db: Session,
+    dimension: str,
+    measure: str,
+    date_field: str,
+    currency_field: Optional[str] = None
+) -> Optional[ReportRollup]:
+    """
+    Return the rollup covering a chart, building and committing it if needed.
+
+    Returns None when rollups are disabled, the limit is reached or the
+    fields can't be rolled up in SQL.
+    """
+    rollup = find_rollup(db, dimension, measure, date_field, currency_field)
+    if rollup or REPORT_ROLLUP_LIMIT <= 0:
+        return rollup
+    if db.query(ReportRollup).count() >= REPORT_ROLLUP_LIMIT:
+        return None
+
+    rollup = ReportRollup(
+        dimension=dimension,
+        measure=measure,
+        date_field=date_field,
+        currency_field=currency_field or ""
+    )
+    try:
+        db.add(rollup)
+        db.flush()
+        build_rollup(db, rollup)
+        db.commit()
+    except UnsupportedQuery:
+        db.rollback()
+        return None
+    except IntegrityError:
+        # Built concurrently by another request
+        db.rollback()
+        return find_rollup(db, dimension, measure, date_field, currency_field)
+
+    logger.info(f"Built report rollup {rollup.id} for {measure} by {dimension}")
+    return rollup
+
+
+def build_rollup(db: Session, rollup: ReportRollup):
+    """(Re)compute every cell of a rollup from the stored transactions."""
+    sql = prepare_sql(db)
+    select = _cell_select(sql, rollup, "transactions")
+    db.query(ReportRollupCell).filter(ReportRollupCell.rollup_id == rollup.id).delete(synchronize_session=False)
+    db.execute(
+        text(
+            "INSERT INTO report_rollup_cells "
+            "(rollup_id, day, label, currency, row_count, value_sum, value_min, value_max) "
+            f"SELECT :rollup_id, * FROM ({select})"
+        ),
+        {**sql.params, "rollup_id": rollup.id}
+    )
+    rollup.updated_at = datetime.utcnow()
+    db.flush()
+
+
+def rebuild_rollups(db: Session):
+    """Recompute every rollup; used when the exact set of written rows is unknown."""
+    for rollup in _rollups(db):
+        build_rollup(db, rollup)
+
+
+def reset_rollups(db: Session):
+    """Empty every rollup after all transactions have been deleted."""
+    db.query(ReportRollupCell).delete(synchronize_session=False)
+    db.flush()
+
+
+def collect_rollup_cells(
+    db: Session,
+    contents: Optional[Iterable[Tuple[Optional[dict], Optional[dict]]]] = None,
+    statement_id: Optional[str] = None
+) -> Dict[str, Cells]:
+    """
+    Compute what some transactions contribute to each rollup.
+
+    Args:
+        db: Database session
+        contents: (ingested_content, computed_content) pairs of the rows
+        statement_id: Use the stored transactions of this statement instead
+
+    Returns:
+        Cells per rollup id, empty when there are no rollups
+    """
+    rollups = _rollups(db)
+    if not rollups:
+        return {}
+
+    sql = prepare_sql(db)
+    collected: Dict[str, Cells] = {}
+    batches = []
+    if statement_id is not None:
+        batches.append(("transactions", f"statement_id = {sql.bind(statement_id)}"))
+    else:
+        contents = list(contents or [])
+        for start in range(0, len(contents), CONTENT_BATCH_SIZE):
+            batches.append((_content_source(sql, contents[start:start + CONTENT_BATCH_SIZE]), "1"))
+
+    for rollup in rollups:
+        cells: Cells = {}
+        for source, where in batches:
+            for day, label, currency, count, total, low, high in db.execute(text(_cell_select(sql, rollup, source, where)), sql.params):
+                cells[(day, label, currency)] = _merge(cells.get((day, label, currency)), (count, total, low, high))
+        collected[rollup.id] = cells
+    return collected
+
+
+def _merge(existing, cell):
+    if existing is None:
+        return cell
+    return (
+        existing[0] + cell[0],
+        existing[1] + cell[1],
+        min(existing[2], cell[2]),
+        max(existing[3], cell[3])
+    )
+
+
+def apply_rollup_changes(
+    db: Session,
+    added: Optional[Dict[str, Cells]] = None,
+    removed: Optional[Dict[str, Cells]] = None
+):
+    """
+    Add and subtract cells collected with collect_rollup_cells.
+
+    Call this once the rows are written. Cells left without rows are
+    dropped. Removing a cell's current min or max can't be undone
+    arithmetically, so those extremes are recomputed from the stored rows.
+    """
+    added = added or {}
+    removed = removed or {}
+    if not added and not removed:
+        return
+
+    for rollup_id, cells in added.items():
+        if cells:
+            db.execute(_UPSERT_CELL, [
+                {
+                    "rollup_id": rollup_id, "day": day, "label": label, "currency": currency,
+                    "row_count": count, "value_sum": total, "value_min": low, "value_max": high
+                }
+                for (day, label, currency), (count, total, low, high) in cells.items()
+            ])
+
+    stale = defaultdict(set)
+    for rollup_id, cells in removed.items():
+        if not cells:
+            continue
+        stored = {
+            (cell.day, cell.label, cell.currency): cell
+            for cell in db.query(ReportRollupCell).filter(ReportRollupCell.rollup_id == rollup_id).populate_existing()
+        }
+        for key, (count, total, low, high) in cells.items():
+            cell = stored.get(key)
+            if cell is None:
+                continue
+            cell.row_count -= count
+            cell.value_sum -= total
+            if cell.row_count <= 0:
+                db.delete(cell)
+            elif low <= cell.value_min or high >= cell.value_max:
+                stale[rollup_id].add(key)
+
+    db.flush()
+    for rollup_id, keys in stale.items():
+        _repair_extremes(db, db.get(ReportRollup, rollup_id), keys)
+
+    touched = set(added) | set(removed)
+    for rollup in db.query(ReportRollup).filter(ReportRollup.id.in_(touched)):
+        rollup.updated_at = datetime.utcnow()
+    db.flush()
+
+
+def _repair_extremes(db: Session, rollup: ReportRollup, keys):
+    sql = prepare_sql(db)
+    current = {
+        (day, label, currency): (low, high)
+        for day, label, currency, _, _, low, high in db.execute(text(_cell_select(sql, rollup, "transactions")), sql.params)
+    }
+    cells = db.query(ReportRollupCell).filter(ReportRollupCell.rollup_id == rollup.id).populate_existing()
+    for cell in cells:
+        key = (cell.day, cell.label, cell.currency)
+        if key in keys and key in current:
+            cell.value_min, cell.value_max = current[key]
+
+
+def query_rollup(
+    db: Session,
+    rollup: ReportRollup,
+    date_from=None,
+    date_to=None,
+    date_bucket: Optional[str] = None,
+    split_by_currency: bool = False,
+    aggregation: str = "sum"
+) -> Dict[Tuple[str, Optional[str]], List[float]]:
+    """
+    Aggregate a rollup's cells into chart groups.
+
+    Args:
+        db: Database session
+        rollup: Rollup covering the chart
+        date_from: Optional first day (date), inclusive
+        date_to: Optional last day (date), inclusive
+        date_bucket: Group the 'date' dimension by day, week or month
+        split_by_currency: Keep currencies apart
+        aggregation: min and max read the cells' extremes, anything else their sums
+
+    Returns:
+        [value, count] per (label, currency); currency is None when not split
+    """
+    params: Dict[str, Any] = {"rollup_id": rollup.id}
+    conditions = ["rollup_id = :rollup_id"]
+    if date_from or date_to:
+        conditions.append("day != ''")
+        if date_from:
+            conditions.append("day >= :date_from")
+            params["date_from"] = date_from.isoformat()
+        if date_to:
+            conditions.append("day <= :date_to")
+            params["date_to"] = date_to.isoformat()
+
+    label = "label"
+    if rollup.dimension == 'date' and date_bucket:
+        label = period_sql("day", date_bucket)
+        conditions.append("day != ''")
+
+    currency = "currency" if split_by_currency else "NULL"
+    if aggregation == 'min':
+        value = "MIN(value_min)"
+    elif aggregation == 'max':
+        value = "MAX(value_max)"
+    else:
+        value = "SUM(value_sum)"
+    rows = db.execute(
+        text(
+            f"SELECT {label} AS group_label, {currency} AS group_currency, {value}, SUM(row_count) "
+            f"FROM report_rollup_cells WHERE {' AND '.join(conditions)} "
+            f"GROUP BY group_label, group_currency"
+        ),
+        params
+    )
+    return {(group_label, group_currency): [total, count] for group_label, group_currency, total, count in rows}
@@ -2,14 +2,17 @@
 Rule Engine Service
 
 Handles safe evaluation of rule conditions and actions using the formula command system.
-Supports formula expressions, model mappings, and value assignments.
+Supports formula expressions, model mappings, and value assignments. Rules are
+compiled into closures once per version (server.services.compiled_rules) and
+evaluated by calling them.
 """
 
 import re
 import ast
-import operator
 import logging
-from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
@@ -17,7 +20,13 @@ from decimal import Decimal
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Transactions executed together by execute_rules_for_batch
+RULE_BATCH_SIZE = 5000
+
 from server.services.formula_commands import command_registry, CommandResult
+from server.services.compiled_rules import CompiledRule, compile_action, compile_condition, compiled_rules, parse_literal
+from server.services.expression_compiler import SAFE_OPERATORS, compile_expression
+from server.services.batch_expressions import RuleBatch, row_values, truth
 from server.models.configurations import ComputedFieldRule
 
 
@@ -44,26 +53,7 @@ class SafeExpressionEvaluator:
     """Safe evaluator for rule expressions using AST parsing and formula commands"""
     
     # Safe operators for condition evaluation
-    SAFE_OPERATORS = {
-        ast.Eq: operator.eq,
-        ast.NotEq: operator.ne,
-        ast.Lt: operator.lt,
-        ast.LtE: operator.le,
-        ast.Gt: operator.gt,
-        ast.GtE: operator.ge,
-        ast.In: lambda x, y: x in y,
-        ast.NotIn: lambda x, y: x not in y,
-        ast.And: operator.and_,
-        ast.Or: operator.or_,
-        ast.Not: operator.not_,
-        ast.Add: operator.add,
-        ast.Sub: operator.sub,
-        ast.Mult: operator.mul,
-        ast.Div: operator.truediv,
-        ast.Mod: operator.mod,
-        ast.USub: operator.neg,  # Unary minus (e.g., -1)
-        ast.UAdd: operator.pos,  # Unary plus (e.g., +1)
-    }
+    SAFE_OPERATORS = SAFE_OPERATORS
     
     def __init__(self, context: RuleExecutionContext):
         self.context = context
@@ -78,13 +68,20 @@ class SafeExpressionEvaluator:
         Returns:
             (condition_result, error_message)
         """
-        if not condition_expr or not condition_expr.strip():
+        return self._evaluate_condition_node(*compile_condition(condition_expr))
+    
+    def evaluate_compiled_condition(self, compiled: CompiledRule) -> Tuple[bool, Optional[str]]:
+        """Evaluate the parsed condition of a compiled rule"""
+        return self._evaluate_condition_node(compiled.condition, compiled.condition_error)
+    
+    def _evaluate_condition_node(self, node: Optional[ast.AST], parse_error: Optional[str]) -> Tuple[bool, Optional[str]]:
+        if parse_error:
+            return False, parse_error
+        if node is None:
             return True, None  # Empty condition always matches
             
         try:
-            # Parse the expression into AST
-            tree = ast.parse(condition_expr.strip(), mode='eval')
-            result = self._evaluate_ast_node(tree.body)
+            result = node(self.context.transaction_data, self.context.available_commands)
             return bool(result), None
             
         except Exception as e:
@@ -101,148 +98,31 @@ class SafeExpressionEvaluator:
         Returns:
             (computed_value, error_message)
         """
+        return self._evaluate_action_value(rule_type, *compile_action(action_expr, rule_type))
+    
+    def evaluate_compiled_action(self, compiled: CompiledRule) -> Tuple[Any, Optional[str]]:
+        """Evaluate the parsed action of a compiled rule"""
+        return self._evaluate_action_value(compiled.rule_type, compiled.action, compiled.action_error)
+    
+    def _evaluate_action_value(self, rule_type: str, action: Any, parse_error: Optional[str]) -> Tuple[Any, Optional[str]]:
+        if parse_error:
+            return None, parse_error
+        if rule_type != "formula":
+            # Value assignments and model mappings were resolved when compiling
+            return action, None
+        
         try:
-            if rule_type == "value_assignment":
-                # Direct value assignment - parse as literal
-                return self._parse_literal_value(action_expr)
-                
-            elif rule_type == "model_mapping":
-                # Model mapping like Account('Cash') - handle specially
-                return self._evaluate_model_mapping(action_expr)
-                
-            elif rule_type == "formula":
-                # Formula expression using commands
-                return self._evaluate_formula_expression(action_expr)
-                
-            else:
-                return None, f"Unknown rule type: {rule_type}"
-                
+            return action(self.context.transaction_data, self.context.available_commands), None
         except Exception as e:
-            return None, f"Action evaluation error: {str(e)}"
+            return None, f"Formula evaluation error: {str(e)}"
     
     def _evaluate_ast_node(self, node: ast.AST) -> Any:
-        """Recursively evaluate AST nodes safely"""
-        if isinstance(node, ast.Constant):
-            return node.value
-            
-        elif isinstance(node, ast.Name):
-            # Variable lookup in transaction data
-            var_name = node.id
-            if var_name in self.context.transaction_data:
-                return self.context.transaction_data[var_name]
-            else:
-                raise ValueError(f"Unknown variable: {var_name}")
-                
-        elif isinstance(node, ast.Compare):
-            left = self._evaluate_ast_node(node.left)
-            result = left
-            
-            for i, (op, comparator) in enumerate(zip(node.ops, node.comparators)):
-                right = self._evaluate_ast_node(comparator)
-                if type(op) not in self.SAFE_OPERATORS:
-                    raise ValueError(f"Unsupported operator: {type(op).__name__}")
-                result = self.SAFE_OPERATORS[type(op)](result, right)
-                if not result:
-                    break
-            return result
-            
-        elif isinstance(node, ast.BoolOp):
-            op = node.op
-            if type(op) not in self.SAFE_OPERATORS:
-                raise ValueError(f"Unsupported boolean operator: {type(op).__name__}")
-                
-            if isinstance(op, ast.And):
-                return all(self._evaluate_ast_node(value) for value in node.values)
-            elif isinstance(op, ast.Or):
-                return any(self._evaluate_ast_node(value) for value in node.values)
-                
-        elif isinstance(node, ast.UnaryOp):
-            operand = self._evaluate_ast_node(node.operand)
-            if type(node.op) not in self.SAFE_OPERATORS:
-                raise ValueError(f"Unsupported unary operator: {type(node.op).__name__}")
-            return self.SAFE_OPERATORS[type(node.op)](operand)
-            
-        elif isinstance(node, ast.BinOp):
-            left = self._evaluate_ast_node(node.left)
-            right = self._evaluate_ast_node(node.right)
-            if type(node.op) not in self.SAFE_OPERATORS:
-                raise ValueError(f"Unsupported binary operator: {type(node.op).__name__}")
-            return self.SAFE_OPERATORS[type(node.op)](left, right)
-            
-        elif isinstance(node, ast.Call):
-            # Handle safe method calls like string.contains(), string.startswith(), etc.
-            return self._evaluate_method_call(node)
-            
-        elif isinstance(node, ast.Attribute):
-            # Handle attribute access like field.attribute
-            value = self._evaluate_ast_node(node.value)
-            attr_name = node.attr
-            
-            # For now, just return the attribute name - it will be used in method calls
-            return getattr(value, attr_name, None)
-            
-        else:
-            raise ValueError(f"Unsupported AST node type: {type(node).__name__}")
-    
-    def _evaluate_method_call(self, node: ast.Call) -> Any:
-        """Evaluate safe method calls"""
-        if isinstance(node.func, ast.Attribute):
-            # Method call like obj.method()
-            obj = self._evaluate_ast_node(node.func.value)
-            method_name = node.func.attr
-            args = [self._evaluate_ast_node(arg) for arg in node.args]
-            
-            # Whitelist of safe string methods
-            safe_string_methods = {
-                'contains': lambda s, substr: str(substr).lower() in str(s).lower(),
-                'startswith': lambda s, prefix: str(s).lower().startswith(str(prefix).lower()),
-                'endswith': lambda s, suffix: str(s).lower().endswith(str(suffix).lower()),
-                'lower': lambda s: str(s).lower(),
-                'upper': lambda s: str(s).upper(),
-                'strip': lambda s: str(s).strip(),
-            }
-            
-            if method_name in safe_string_methods:
-                return safe_string_methods[method_name](obj, *args)
-            else:
-                raise ValueError(f"Unsupported method: {method_name}")
-        elif isinstance(node.func, ast.Name):
-            # Function call like function_name()
-            func_name = node.func.id
-            args = [self._evaluate_ast_node(arg) for arg in node.args]
-            
-            # Support formula commands in conditions
-            if func_name in self.context.available_commands:
-                from server.services.formula_commands import command_registry
-                command_instance = command_registry.get_command(func_name)
-                if command_instance:
-                    result = command_instance.execute(*args)
-                    if result.success:
-                        return result.value
-                    else:
-                        raise ValueError(f"Formula command error: {result.error}")
-                else:
-                    raise ValueError(f"Formula command not found: {func_name}")
-            else:
-                raise ValueError(f"Function not supported in conditions: {func_name}")
-        else:
-            # Other function call types not supported
-            raise ValueError("Complex function calls not supported in conditions")
+        """Evaluate an AST node against the context's transaction"""
+        return compile_expression(node)(self.context.transaction_data, self.context.available_commands)
     
     def _parse_literal_value(self, value_expr: str) -> Tuple[Any, Optional[str]]:
         """Parse a literal value for direct assignment"""
-        value_expr = value_expr.strip()
-        
-        try:
-            # Try to parse as Python literal
-            tree = ast.parse(value_expr, mode='eval')
-            if isinstance(tree.body, ast.Constant):
-                return tree.body.value, None
-            else:
-                return value_expr, None  # Return as string if not a literal
-                
-        except:
-            return value_expr, None  # Return as string if parsing fails
+        return parse_literal(value_expr), None
     
     def _evaluate_model_mapping(self, mapping_expr: str) -> Tuple[Any, Optional[str]]:
         """Evaluate model mapping expression like Account('Cash')"""
@@ -252,14 +132,7 @@ class SafeExpressionEvaluator:
     
     def _evaluate_formula_expression(self, formula_expr: str) -> Tuple[Any, Optional[str]]:
         """Evaluate formula expression using command registry"""
-        try:
-            # Use AST parsing to handle nested function calls properly
-            parsed = ast.parse(formula_expr.strip(), mode='eval')
-            result = self._evaluate_ast_node(parsed.body)
-            return result, None
-                    
-        except Exception as e:
-            return None, f"Formula evaluation error: {str(e)}"
+        return self._evaluate_action_value("formula", *compile_action(formula_expr, "formula"))
     
     def _parse_command_args(self, args_str: str) -> List[Any]:
         """Parse command arguments from string"""
@@ -296,76 +169,92 @@ class RuleEngine:
     
     def evaluate_rule(
         self, 
-        rule: ComputedFieldRule, 
-        context: RuleExecutionContext
+        rule: Union[ComputedFieldRule, CompiledRule], 
+        context: RuleExecutionContext,
+        evaluator: Optional[SafeExpressionEvaluator] = None
     ) -> RuleEvaluationResult:
         """
         Evaluate a single rule against transaction context
         
         Args:
-            rule: The rule to evaluate
+            rule: The rule to evaluate, or its compiled form (see compile_rules)
             context: Transaction context with data and metadata
+            evaluator: Evaluator of the context, reused across the rules of a transaction
             
         Returns:
             Rule evaluation result
         """
-        logger.debug(f"Starting evaluation of rule '{rule.name}' (ID: {rule.id})")
+        compiled = rule if isinstance(rule, CompiledRule) else compiled_rules.get(rule)
+        target_field = compiled.target_field
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Evaluating rule %r (ID: %s)", compiled.name, compiled.rule_id)
         
-        if not rule.active:
-            logger.debug(f"Rule is not active, skipping")
+        if not compiled.active:
+            if debug:
+                logger.debug("Rule %s is not active, skipping", compiled.rule_id)
             return RuleEvaluationResult(
                 success=False,
                 condition_matched=False,
-                target_field=rule.target_field,
+                target_field=target_field,
                 error="Rule is not active"
             )
         
-        evaluator = SafeExpressionEvaluator(context)
+        if evaluator is None:
+            evaluator = SafeExpressionEvaluator(context)
         
         # Evaluate condition
-        logger.debug(f"Evaluating condition: '{rule.condition}'")
-        condition_matched, condition_error = evaluator.evaluate_condition(rule.condition)
-        logger.debug(f"Condition result: {condition_matched} (error: {condition_error})")
+        condition_matched, condition_error = evaluator.evaluate_compiled_condition(compiled)
+        if debug:
+            logger.debug("Condition %r: %s (error: %s)", compiled.source[0], condition_matched, condition_error)
         
         if condition_error:
             return RuleEvaluationResult(
                 success=False,
                 condition_matched=False,
-                target_field=rule.target_field,
+                target_field=target_field,
                 error=f"Condition error: {condition_error}"
             )
         
         if not condition_matched:
-            logger.debug(f"Condition not matched, skipping action evaluation")
             return RuleEvaluationResult(
                 success=True,
                 condition_matched=False,
-                target_field=rule.target_field
+                target_field=target_field
             )
         
         # Condition matched, evaluate action
-        logger.debug(f"Condition matched, evaluating action: '{rule.action}' (type: {rule.rule_type})")
-        computed_value, action_error = evaluator.evaluate_action(rule.action, rule.rule_type)
-        logger.debug(f"Action result: {computed_value} (error: {action_error})")
+        computed_value, action_error = evaluator.evaluate_compiled_action(compiled)
+        if debug:
+            logger.debug("Action %r (%s): %r (error: %s)", compiled.source[1], compiled.rule_type, computed_value, action_error)
         
         if action_error:
             return RuleEvaluationResult(
                 success=False,
                 condition_matched=True,
-                target_field=rule.target_field,
+                target_field=target_field,
                 error=f"Action error: {action_error}"
             )
         
         return RuleEvaluationResult(
             success=True,
             condition_matched=True,
-            target_field=rule.target_field,
+            target_field=target_field,
             computed_value=computed_value
         )
     
+    def compile_rules(self, rules: Sequence[Union[ComputedFieldRule, CompiledRule]]) -> List[CompiledRule]:
+        """
+        Compiled forms of rules, in order.
+        
+        Executing the returned list against many transactions skips the cache
+        lookups and ORM attribute reads of each rule for every transaction.
+        """
+        return compiled_rules.get_all(rules)
+    
     def execute_rules_for_transaction(
         self,
-        rules: List[ComputedFieldRule],
+        rules: Sequence[Union[ComputedFieldRule, CompiledRule]],
         transaction_data: Dict[str, Any],
         ingested_fields: List[str],
         computed_fields: List[str],
@@ -375,7 +264,7 @@ class RuleEngine:
         Execute rules for a single transaction
         
         Args:
-            rules: List of rules sorted by priority
+            rules: List of rules sorted by priority, or their compiled forms (see compile_rules)
             transaction_data: Combined ingested_content + computed_content
             ingested_fields: Available ingested field names
             computed_fields: Available computed field names
@@ -384,45 +273,35 @@ class RuleEngine:
         Returns:
             Dictionary of computed field values
         """
-        logger.info(f"Starting execution for {len(rules)} rules (force_reprocess={force_reprocess})")
-        logger.info(f"Transaction data keys: {list(transaction_data.keys())}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Executing %d rules (force_reprocess=%s) on fields %s", len(rules), force_reprocess, list(transaction_data))
         
         context = RuleExecutionContext(
             transaction_data=transaction_data,
             ingested_fields=ingested_fields,
             computed_fields=computed_fields,
-            available_commands=[cmd.name for cmd in command_registry.list_commands()]
+            available_commands=command_registry.command_names()
         )
         
+        evaluator = SafeExpressionEvaluator(context)
         computed_results = {}
         processed_targets = set()  # Track which target fields have been computed
         
-        logger.info(f"Available commands: {[cmd.name for cmd in command_registry.list_commands()]}")
-        
-        # Process rules in priority order (already sorted)
-        for i, rule in enumerate(rules):
-            logger.info(f"Processing rule {i+1}/{len(rules)}: {rule.name} (ID: {rule.id})")
-            logger.debug(f"  Target field: {rule.target_field}")
-            logger.debug(f"  Condition: {rule.condition}")
-            logger.debug(f"  Action: {rule.action}")
-            logger.debug(f"  Priority: {rule.priority}")
-            logger.debug(f"  Active: {rule.active}")
+        # Process rules in priority order (already sorted), resolving their compiled forms once
+        for rule in self.compile_rules(rules):
+            target_field = rule.target_field
             # Skip if we've already computed this target field (first successful rule wins)
             # BUT allow reprocessing if current value is None, empty, or we want to force reprocessing
             # OR if this is a different rule targeting the same field (rule chaining)
-            if rule.target_field in processed_targets:
-                current_value = context.transaction_data.get(rule.target_field)
-                last_rule_id = context.transaction_data.get(f"_{rule.target_field}_last_rule_id")
-                
-                logger.debug(f"  Field {rule.target_field} already processed by rule {last_rule_id}")
-                logger.debug(f"  Current value: {current_value} (type: {type(current_value)})")
-                logger.debug(f"  Force reprocess: {force_reprocess}")
+            if target_field in processed_targets:
+                current_value = context.transaction_data.get(target_field)
+                last_rule_id = context.transaction_data.get(f"_{target_field}_last_rule_id")
                 
                 # Allow reprocessing if value is None, empty string, or empty dict
                 if current_value is not None and current_value != "" and current_value != {}:
                     # Check if this is a different rule - if so, allow chaining
-                    if last_rule_id == rule.id:
-                        logger.debug(f"  SKIPPING - Same rule already processed this field")
+                    if last_rule_id == rule.rule_id:
+                        logger.debug("Skipping rule %s: it already computed %s", rule.rule_id, target_field)
                         continue  # Same rule, skip
                     
                     # Different rule targeting same field - check if we should allow chaining
@@ -435,61 +314,167 @@ class RuleEngine:
                     # while still allowing fallback patterns to work
                     # UNLESS force_reprocess is True, which should allow all rules to execute
                     if not force_reprocess:
-                        logger.debug(f"  SKIPPING - Field already has value from rule {last_rule_id} (first successful rule wins)")
+                        logger.debug(
+                            "Skipping rule %s: %s already has a value from rule %s (first successful rule wins)",
+                            rule.rule_id, target_field, last_rule_id
+                        )
                         continue
                     else:
-                        logger.info(f"  ALLOWING - Force reprocess enabled, allowing rule to overwrite field")
+                        logger.debug("Force reprocess: rule %s may overwrite %s", rule.rule_id, target_field)
                         # Remove from processed_targets so it can be reprocessed
-                        processed_targets.discard(rule.target_field)
-                        logger.debug(f"  Removed {rule.target_field} from processed targets for reprocessing")
-                else:
-                    # Field exists but has no meaningful value (None, empty string, empty dict)
-                    # Allow this rule to execute
-                    logger.debug(f"  ALLOWING - Current value is empty/None, allowing rule to execute")
-            else:
-                logger.debug(f"  Field {rule.target_field} not yet processed, allowing rule to execute")
+                        processed_targets.discard(target_field)
             
-            logger.debug(f"  Evaluating rule...")
-            result = self.evaluate_rule(rule, context)
-            
-            logger.debug(f"  Evaluation result:")
-            logger.debug(f"    Success: {result.success}")
-            logger.debug(f"    Condition matched: {result.condition_matched}")
-            logger.debug(f"    Computed value: {result.computed_value} (type: {type(result.computed_value)})")
+            result = self.evaluate_rule(rule, context, evaluator)
             if result.error:
-                logger.error(f"    Error: {result.error}")
+                logger.error("Rule %s failed: %s", rule.rule_id, result.error)
             
             if result.success and result.condition_matched:
                 # Rule matched and executed successfully
-                logger.info(f"  ✅ RULE EXECUTED SUCCESSFULLY")
-                logger.info(f"  Setting {rule.target_field} = {result.computed_value}")
+                rule_id = rule.rule_id
+                logger.debug("Rule %s set %s = %r", rule_id, target_field, result.computed_value)
                 
-                computed_results[rule.target_field] = result.computed_value
-                processed_targets.add(rule.target_field)
+                computed_results[target_field] = result.computed_value
+                processed_targets.add(target_field)
                 
                 # Update context with newly computed value for subsequent rules
-                context.transaction_data[rule.target_field] = result.computed_value
+                context.transaction_data[target_field] = result.computed_value
                 
                 # Track which rule last processed this field (for chaining detection)
-                context.transaction_data[f"_{rule.target_field}_last_rule_id"] = rule.id
-                
-                logger.debug(f"  Updated context with new value")
-                logger.debug(f"  Processed targets: {processed_targets}")
-            else:
-                logger.debug(f"  ❌ RULE NOT EXECUTED")
-                if not result.success:
-                    logger.debug(f"    Reason: Rule evaluation failed - {result.error}")
-                elif not result.condition_matched:
-                    logger.debug(f"    Reason: Condition not met")
-                else:
-                    logger.debug(f"    Reason: Unknown")
+                context.transaction_data[f"_{target_field}_last_rule_id"] = rule_id
+        
+        logger.debug("Computed results: %s", computed_results)
+        
+        return computed_results
+
+    
+    def execute_rules_for_batch(
+        self,
+        rules: Sequence[Union[ComputedFieldRule, CompiledRule]],
+        transactions_data: List[Dict[str, Any]],
+        ingested_fields: List[str],
+        computed_fields: List[str],
+        force_reprocess: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Execute rules for a batch of transactions at once
+        
+        Gives every transaction the result of execute_rules_for_transaction,
+        with each rule evaluated for all its transactions together: conditions
+        are evaluated as boolean masks over field columns, formulas as columns
+        of values, and the first-successful-rule-wins bookkeeping is kept as a
+        mask per target field. Rules without a batch form are evaluated row by
+        row for the transactions they apply to.
+        
+        Args:
+            rules: List of rules sorted by priority, or their compiled forms (see compile_rules)
+            transactions_data: Combined ingested_content + computed_content of each transaction
+            ingested_fields: Available ingested field names
+            computed_fields: Available computed field names
+            force_reprocess: If True, reprocess all fields even if already computed
+            
+        Returns:
+            Dictionary of computed field values of each transaction
+        """
+        available_commands = command_registry.command_names()
+        batch = RuleBatch(transactions_data, available_commands)
+        computed_results = [{} for _ in transactions_data]
+        processed_targets: Dict[str, np.ndarray] = {}  # target field -> rows that computed it
+        row_rules = 0
         
-        logger.info(f"Execution completed!")
-        logger.info(f"Final computed results: {computed_results}")
-        logger.debug(f"Processed targets: {processed_targets}")
-        logger.debug(f"Final transaction data: {context.transaction_data}")
+        for compiled in self.compile_rules(rules):
+            target = compiled.target_field
+            last_rule_field = f"_{target}_last_rule_id"
+            
+            # Rows the rule runs on, as in execute_rules_for_transaction
+            pending = np.ones(batch.size, dtype=bool)
+            processed = processed_targets.get(target)
+            if processed is not None and processed.any():
+                done = np.flatnonzero(processed)
+                values = batch.column(target)[0][done]
+                last_rule_ids = batch.column(last_rule_field)[0][done]
+                filled = np.fromiter(
+                    (value is not None and value != "" and value != {} for value in values), dtype=bool, count=len(done)
+                )
+                has_value = np.zeros(batch.size, dtype=bool)
+                has_value[done[filled]] = True
+                same_rule = np.zeros(batch.size, dtype=bool)
+                same_rule[done[filled & (last_rule_ids == compiled.rule_id)]] = True
+                if force_reprocess:
+                    processed &= ~(has_value & ~same_rule)
+                    pending = ~same_rule
+                else:
+                    pending = ~has_value
+            
+            positions = np.flatnonzero(pending)
+            if not compiled.active or not len(positions):
+                continue
+            
+            if compiled.vectorized:
+                positions, values = self._evaluate_rule_batch(compiled, batch, positions)
+            else:
+                row_rules += 1
+                positions, values = self._evaluate_rule_rows(compiled, batch, positions, ingested_fields, computed_fields)
+            if not len(positions):
+                continue
+            
+            batch.assign(target, positions, values)
+            batch.assign(last_rule_field, positions, [compiled.rule_id] * len(values))
+            for position, value in zip(positions.tolist(), values):
+                computed_results[position][target] = value
+            if processed is None:
+                processed = processed_targets[target] = np.zeros(batch.size, dtype=bool)
+            processed[positions] = True
         
+        logger.debug(
+            "Executed %d rules for %d transactions (%d rules row by row, force_reprocess=%s)",
+            len(rules), batch.size, row_rules, force_reprocess
+        )
         return computed_results
+    
+    def _evaluate_rule_batch(self, compiled: CompiledRule, batch: RuleBatch, positions: np.ndarray) -> Tuple[np.ndarray, List[Any]]:
+        """Rows of ``positions`` a vectorized rule computes a value for, and the values"""
+        if compiled.condition_error or compiled.action_error:
+            return positions[:0], []
+        if compiled.batch_condition is not None:
+            view = self._batch_view(batch, positions)
+            positions = positions[truth(compiled.batch_condition(view), view.size)]
+        if compiled.rule_type != "formula":
+            return positions, [compiled.action] * len(positions)
+        
+        view = self._batch_view(batch, positions)
+        values, errors = compiled.batch_action(view)
+        values = row_values(values, view.size)
+        if errors is not None:
+            values = [value for value, failed in zip(values, errors.tolist()) if not failed]
+            positions = positions[~errors]
+        return positions, values
+    
+    @staticmethod
+    def _batch_view(batch: RuleBatch, positions: np.ndarray):
+        return batch.view(positions if len(positions) < batch.size else None)
+    
+    def _evaluate_rule_rows(
+        self,
+        compiled: CompiledRule,
+        batch: RuleBatch,
+        positions: np.ndarray,
+        ingested_fields: List[str],
+        computed_fields: List[str]
+    ) -> Tuple[np.ndarray, List[Any]]:
+        """Rows of ``positions`` a rule computes a value for, evaluated one by one"""
+        matched, values = [], []
+        for position in positions.tolist():
+            context = RuleExecutionContext(
+                transaction_data=batch.rows[position],
+                ingested_fields=ingested_fields,
+                computed_fields=computed_fields,
+                available_commands=batch.available_commands
+            )
+            result = self.evaluate_rule(compiled, context)
+            if result.success and result.condition_matched:
+                matched.append(position)
+                values.append(result.computed_value)
+        return np.asarray(matched, dtype=np.intp), values
 
 
 # Global rule engine instance
@@ -0,0 +1,164 @@
+"""
+Dependency graph of computed field rules.
+
+Each rule reads the fields named in its condition and formula and writes its
+target_field. The rules writing one target field form a group evaluated in
+priority order, the first successful rule winning as before; a group depends
+on the groups writing the fields its rules read, other than its own target
+(a rule like ``amount = amount_to_float(amount)`` reads the value before
+it). schedule() orders the groups so each runs after the groups it depends
+on, keeping priority order wherever the dependencies allow, and rules are
+saved only when they leave the graph without cycles.
+
+Each group also has a fingerprint covering its rules and the fingerprints of
+the groups it reads, so a changed rule changes the fingerprint of its target
+and of every target computed from it.
+"""
+import ast
+import hashlib
+import heapq
+import json
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from server.models.configurations import ComputedFieldRule
+
+# Hex digits kept of rule set and target field fingerprints
+FINGERPRINT_LENGTH = 32
+
+
+@lru_cache(maxsize=4096)
+def expression_fields(expr: Optional[str]) -> FrozenSet[str]:
+    """Fields an expression reads; formula command names aren't fields"""
+    if not expr or not expr.strip():
+        return frozenset()
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return frozenset()
+    commands = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    return frozenset(
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and id(node) not in commands
+    )
+
+
+def rule_inputs(rule: ComputedFieldRule) -> FrozenSet[str]:
+    """Fields a rule reads; only formula actions read fields"""
+    inputs = expression_fields(rule.condition)
+    if rule.rule_type == "formula":
+        inputs |= expression_fields(rule.action)
+    return inputs
+
+
+class RuleGraph:
+    """Target field groups of a list of rules and the dependencies between them"""
+
+    def __init__(self, rules: List[ComputedFieldRule]):
+        # Rules of each target field in the given (priority) order, targets by their first rule
+        self.groups: Dict[str, List[ComputedFieldRule]] = {}
+        for rule in rules:
+            self.groups.setdefault(rule.target_field, []).append(rule)
+        # target -> targets of other groups its rules read
+        self.dependencies: Dict[str, Set[str]] = {
+            target: {
+                field for rule in group for field in rule_inputs(rule)
+                if field in self.groups and field != target
+            }
+            for target, group in self.groups.items()
+        }
+
+    def find_cycle(self) -> Optional[List[str]]:
+        """Targets forming a dependency cycle, first one repeated at the end; None without cycles"""
+        state: Dict[str, str] = {}  # target -> 'visiting' or 'done'
+        for start in self.groups:
+            if start in state:
+                continue
+            path = [start]
+            state[start] = 'visiting'
+            stack = [iter(sorted(self.dependencies[start]))]
+            while stack:
+                field = next(stack[-1], None)
+                if field is None:
+                    state[path.pop()] = 'done'
+                    stack.pop()
+                elif state.get(field) == 'visiting':
+                    return path[path.index(field):] + [field]
+                elif field not in state:
+                    state[field] = 'visiting'
+                    path.append(field)
+                    stack.append(iter(sorted(self.dependencies[field])))
+        return None
+
+    def schedule(self) -> List[ComputedFieldRule]:
+        """
+        Rules in evaluation order: each target's group after the groups it reads.
+
+        Among groups that are ready, the one whose first rule comes first in
+        priority order goes first. Groups left in a cycle follow in priority
+        order.
+        """
+        order = {target: index for index, target in enumerate(self.groups)}
+        waiting = {target: len(dependencies) for target, dependencies in self.dependencies.items()}
+        readers: Dict[str, List[str]] = {target: [] for target in self.groups}
+        for target, dependencies in self.dependencies.items():
+            for field in dependencies:
+                readers[field].append(target)
+
+        ready = [order[target] for target, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        targets = list(self.groups)
+        scheduled = []
+        while ready:
+            target = targets[heapq.heappop(ready)]
+            scheduled.append(target)
+            for reader in readers[target]:
+                waiting[reader] -= 1
+                if waiting[reader] == 0:
+                    heapq.heappush(ready, order[reader])
+        if len(scheduled) < len(targets):
+            done = set(scheduled)
+            scheduled.extend(target for target in targets if target not in done)
+        return [rule for target in scheduled for rule in self.groups[target]]
+
+    def target_fingerprints(self) -> Dict[str, str]:
+        """Fingerprint of each target: its rules in order and the fingerprints of the targets they read"""
+        fingerprints: Dict[str, str] = {}
+        for rule in self.schedule():
+            target = rule.target_field
+            if target in fingerprints:
+                continue
+            content = {
+                "rules": [
+                    [rule.id, rule.condition, rule.action, rule.rule_type]
+                    for rule in self.groups[target]
+                ],
+                # Targets read within a cycle aren't fingerprinted yet
+                "reads": {field: fingerprints.get(field) for field in sorted(self.dependencies[target])}
+            }
+            fingerprints[target] = _digest(content)
+        return fingerprints
+
+    def fingerprint(self) -> str:
+        """Fingerprint of the whole rule set"""
+        return _digest(sorted(self.target_fingerprints().items()))
+
+    def dependents(self, fields: Iterable[str]) -> Set[str]:
+        """Targets whose value can change when ``fields`` change, directly or through other targets"""
+        changed = set(fields)
+        affected: Set[str] = set()
+        pending = [
+            target for target, group in self.groups.items()
+            if any(rule_inputs(rule) & changed for rule in group)
+        ]
+        while pending:
+            target = pending.pop()
+            if target in affected:
+                continue
+            affected.add(target)
+            pending.extend(reader for reader, dependencies in self.dependencies.items() if target in dependencies)
+        return affected
+
+
+def _digest(content) -> str:
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:FINGERPRINT_LENGTH]
@@ -0,0 +1,453 @@
+"""
+Value semantics shared by SQL and in-memory report evaluation.
+
+Report queries read transaction fields out of the JSON content columns and
+convert them the way the original Python code did (``float()``, a handful of
+date formats, currency symbol mapping, case-insensitive filter matching).
+
+FieldSQL builds the SQL expressions that read fields out of a transaction's
+merged ingested/computed content. Labels, date buckets and filter comparisons
+are native SQLite expressions wherever SQLite converts the value exactly like
+Python (text, integers and booleans as strings, ASCII case folding, numeric
+equality). Parsing numbers and dates out of text, floats and objects as
+strings and currency normalization go through the functions below,
+registered as SQLite user functions, so a query pushed down to SQL produces
+exactly the values the Python path would. (A native float() or date parser
+would have to read the JSON value several times per row, which costs more
+than the one Python call.)
+"""
+import json
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from server.models.main import TransactionMetadata
+from server.services.aggregators import sqlite_aggregate
+from server.settings import TRANSACTION_DATE_FIELD
+
+# Date formats tried after ISO when parsing transaction dates
+DATE_FORMATS = [
+    '%Y-%m-%d',  # ISO format
+    '%m/%d/%Y',  # MM/DD/YYYY
+    '%d/%m/%Y',  # DD/MM/YYYY
+    '%Y/%m/%d',  # YYYY/MM/DD
+]
+
+# Common currency symbols mapped to codes for consistent grouping
+CURRENCY_SYMBOL_TO_CODE = {
+    '$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY',
+    '₹': 'INR', '₽': 'RUB', 'R$': 'BRL', '₩': 'KRW',
+    'kr': 'NOK', 'zł': 'PLN', '฿': 'THB', 'Rp': 'IDR',
+    'RM': 'MYR', '₱': 'PHP', 'R': 'ZAR', '₺': 'TRY'
+}
+
+UNKNOWN_CURRENCY = 'UNKNOWN'
+
+EPOCH = date(1970, 1, 1)
+
+
+class UnsupportedQuery(Exception):
+    """The query cannot be expressed in SQL for this database or field"""
+
+# Periods dates can be grouped into
+DATE_BUCKETS = ('day', 'week', 'month')
+
+
+def json_value(json_type: Optional[str], raw: Any) -> Any:
+    """Rebuild the Python value of a JSON field from SQLite's json_type/json_extract."""
+    if json_type is None or json_type == 'null':
+        return None
+    if json_type == 'true':
+        return True
+    if json_type == 'false':
+        return False
+    if json_type in ('object', 'array'):
+        return json.loads(raw)
+    return raw
+
+
+def to_float(value: Any) -> Optional[float]:
+    """float(value), or None where float() would raise."""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_date(value: Any) -> Optional[datetime]:
+    """Parse a transaction date string; ISO first, then DATE_FORMATS."""
+    if not isinstance(value, str):
+        return None
+
+    # Try ISO format first (handles YYYY-MM-DDTHH:MM:SS)
+    try:
+        return datetime.fromisoformat(value.split('T')[0])
+    except ValueError:
+        pass
+
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+
+    return None
+
+
+def epoch_day(day: date) -> int:
+    """Days since 1970-01-01"""
+    return (day - EPOCH).days
+
+
+def date_label(value: Any) -> Optional[str]:
+    """Label used when grouping by date: the date part of the stored value."""
+    if not value:
+        return None
+    return str(value).split('T')[0]
+
+
+def period_start(iso_date: Optional[str], bucket: str) -> Optional[str]:
+    """
+    Label of the period an ISO date falls in: the date itself for 'day', the
+    Monday of its week for 'week' and YYYY-MM for 'month'.
+    """
+    if not iso_date:
+        return None
+    day = date.fromisoformat(iso_date)
+    if bucket == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if bucket == 'month':
+        return day.isoformat()[:7]
+    return day.isoformat()
+
+
+def period_sql(iso_date: str, bucket: Optional[str]) -> str:
+    """SQL for period_start of an ISO date expression"""
+    if bucket == 'week':
+        return f"date({iso_date}, '-' || ((CAST(strftime('%w', {iso_date}) AS INTEGER) + 6) % 7) || ' days')"
+    if bucket == 'month':
+        return f"substr({iso_date}, 1, 7)"
+    return iso_date
+
+
+def normalize_currency(value: Any) -> str:
+    """Map currency symbols to codes and upper-case codes."""
+    if value is None:
+        return UNKNOWN_CURRENCY
+    if isinstance(value, str):
+        return CURRENCY_SYMBOL_TO_CODE.get(value, value.upper())
+    return str(value)
+
+
+def lookup_field(content: Dict[str, Any], field: str) -> Tuple[bool, Any]:
+    """Find a field exactly, else case-insensitively; returns (found, value)"""
+    if field in content:
+        return True, content[field]
+    lowered = field.lower()
+    for key, value in content.items():
+        if key.lower() == lowered:
+            return True, value
+    return False, None
+
+
+def content_label(content: Dict[str, Any], x_field: str) -> Optional[str]:
+    """A transaction's x-axis label for a field other than 'date'"""
+    found, value = lookup_field(content, x_field)
+    return str(value) if found else None
+
+
+def content_measure(content: Dict[str, Any], y_field: str) -> Optional[float]:
+    """A transaction's measure: the exact field, else the first numeric case variant"""
+    if y_field in content:
+        return to_float(content[y_field])
+    lowered = y_field.lower()
+    for key, value in content.items():
+        if key.lower() == lowered:
+            y_value = to_float(value)
+            if y_value is not None:
+                return y_value
+    return None
+
+
+# Operators a field filter can use
+FILTER_OPERATORS = ('equals', 'not_equals', 'contains', 'startswith', 'endswith', 'gt', 'gte', 'lt', 'lte')
+
+# Operators that only match numbers
+ORDERING_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class FilterValue:
+    """
+    A filter's operator and value, parsed once.
+
+    Values are compared numerically when both sides parse as floats and as
+    case-insensitive strings otherwise; ordering operators only match
+    numbers. A missing (None) field value never matches.
+    """
+
+    __slots__ = ('operator', 'value', 'lowered', 'number')
+
+    def __init__(self, operator: str, value: Any):
+        self.operator = operator
+        self.value = str(value)
+        self.lowered = self.value.lower()
+        self.number = to_float(value)
+
+    def matches(self, field_value: Any) -> bool:
+        if field_value is None:
+            return False
+
+        operator = self.operator
+        if operator in ORDERING_OPERATORS:
+            if self.number is None:
+                return False
+            field_number = to_float(field_value)
+            if field_number is None:
+                return False
+            if operator == 'gt':
+                return field_number > self.number
+            if operator == 'gte':
+                return field_number >= self.number
+            if operator == 'lt':
+                return field_number < self.number
+            return field_number <= self.number
+
+        if operator in ('equals', 'not_equals'):
+            field_number = to_float(field_value) if self.number is not None else None
+            if field_number is not None:
+                equal = field_number == self.number
+            else:
+                equal = str(field_value).lower() == self.lowered
+            return equal if operator == 'equals' else not equal
+        if operator == 'contains':
+            return self.lowered in str(field_value).lower()
+        if operator == 'startswith':
+            return str(field_value).lower().startswith(self.lowered)
+        if operator == 'endswith':
+            return str(field_value).lower().endswith(self.lowered)
+
+        return False
+
+
+@lru_cache(maxsize=1024)
+def parse_filter_value(operator: str, value: Any) -> FilterValue:
+    """Parsed filter value, cached for filters evaluated row by row in SQL."""
+    return FilterValue(operator, value)
+
+
+def filter_matches(field_value: Any, operator: str, filter_value: Any) -> bool:
+    """Evaluate a field filter against a field value (see FilterValue)."""
+    return parse_filter_value(operator, filter_value).matches(field_value)
+
+
+# SQLite wrappers: JSON fields arrive as (json_type, json_extract) pairs
+
+def _sql_float(raw):
+    return to_float(raw)
+
+
+def _sql_date(json_type, raw):
+    parsed = parse_date(json_value(json_type, raw))
+    return parsed.date().isoformat() if parsed else None
+
+
+def _sql_date_label(json_type, raw):
+    return date_label(json_value(json_type, raw))
+
+
+def _sql_label(json_type, raw):
+    return str(json_value(json_type, raw))
+
+
+def _sql_currency(json_type, raw):
+    return normalize_currency(json_value(json_type, raw))
+
+
+def _sql_filter(json_type, raw, operator, filter_value):
+    return 1 if filter_matches(json_value(json_type, raw), operator, filter_value) else 0
+
+
+SQLITE_FUNCTIONS = {
+    "moneta_float": (1, _sql_float),
+    "moneta_date": (2, _sql_date),
+    "moneta_date_label": (2, _sql_date_label),
+    "moneta_label": (2, _sql_label),
+    "moneta_currency": (2, _sql_currency),
+    "moneta_filter": (4, _sql_filter),
+}
+
+
+# Aggregate functions of the aggregations SQLite has no built-in for
+SQLITE_AGGREGATES = {
+    "moneta_median": sqlite_aggregate("median"),
+    "moneta_p90": sqlite_aggregate("p90"),
+    "moneta_distinct_count": sqlite_aggregate("distinct_count"),
+}
+
+
+def register_sqlite_functions(dbapi_connection) -> None:
+    """Register the report helpers as deterministic SQLite functions."""
+    for name, (arg_count, function) in SQLITE_FUNCTIONS.items():
+        dbapi_connection.create_function(name, arg_count, function, deterministic=True)
+    for name, aggregate in SQLITE_AGGREGATES.items():
+        dbapi_connection.create_aggregate(name, 1, aggregate)
+
+
+# SQL expressions over transaction content
+
+# Matches text with a character outside ASCII, which SQLite's lower() leaves alone
+NON_ASCII_GLOB = "*[^\x01-\x7f]*"
+
+
+class FieldSQL:
+    """Builds bound-parameter SQL for reading fields out of the merged content"""
+
+    def __init__(self, columns: List[str], dated_field: Optional[str] = None):
+        self.params: Dict[str, Any] = {}
+        self.constants: Dict[Any, str] = {}
+        self.columns = columns
+        # Date field whose parsed value is stored in the txn_date/txn_day columns
+        self.dated_field = dated_field
+
+    def bind(self, value: Any) -> str:
+        name = f"p{len(self.params)}"
+        self.params[name] = value
+        return f":{name}"
+
+    def constant(self, value: Any) -> str:
+        """Bind a value used throughout the query once"""
+        if value not in self.constants:
+            self.constants[value] = self.bind(value)
+        return self.constants[value]
+
+    def variants(self, field: str) -> List[str]:
+        """Other known spellings of a field that only differ in case"""
+        lowered = field.lower()
+        return [column for column in self.columns if column != field and column.lower() == lowered]
+
+    def merged(self, field: str) -> Tuple[str, str]:
+        """(json_type, value) expressions for a field; computed content wins over ingested"""
+        if '"' in field:
+            raise UnsupportedQuery(f"field name {field!r} cannot be used in a JSON path")
+        path = self.bind(f'$."{field}"')
+        json_type = f"COALESCE(json_type(computed_content, {path}), json_type(ingested_content, {path}))"
+        value = (
+            f"CASE WHEN json_type(computed_content, {path}) IS NOT NULL "
+            f"THEN json_extract(computed_content, {path}) "
+            f"ELSE json_extract(ingested_content, {path}) END"
+        )
+        return json_type, value
+
+    def date(self, date_field: str) -> str:
+        """The transaction date as an ISO date, NULL when it doesn't parse"""
+        if date_field == self.dated_field:
+            return "txn_date"
+        return self.parsed_date(date_field)
+
+    def parsed_date(self, date_field: str) -> str:
+        """The transaction date parsed from the content, ignoring the stored columns"""
+        return "moneta_date({}, {})".format(*self.merged(date_field))
+
+    def day_range(self, date_field: str, date_from: Optional[date], date_to: Optional[date]) -> Optional[str]:
+        """
+        Date range condition on the indexed txn_day column, or None when
+        date_field isn't the stored one.
+        """
+        if date_field != self.dated_field:
+            return None
+        conditions = ["txn_day IS NOT NULL"]
+        if date_from:
+            conditions.append(f"txn_day >= {self.bind(epoch_day(date_from))}")
+        if date_to:
+            conditions.append(f"txn_day <= {self.bind(epoch_day(date_to))}")
+        return " AND ".join(conditions)
+
+    def label(self, x_field: str, date_field: str, date_bucket: Optional[str] = None) -> str:
+        """The x-axis label; exact field first, then case variants"""
+        if x_field == 'date':
+            if date_bucket:
+                return period_sql(self.date(date_field), date_bucket)
+            json_type, value = self.merged(date_field)
+            # Empty text and text starting with T are labelled in Python
+            return (
+                f"CASE {json_type} "
+                f"WHEN 'text' THEN CASE instr({value} || 'T', 'T') WHEN 1 THEN moneta_date_label({json_type}, {value}) "
+                f"ELSE substr({value}, 1, instr({value} || 'T', 'T') - 1) END "
+                f"WHEN 'integer' THEN CAST(NULLIF({value}, 0) AS TEXT) WHEN 'null' THEN NULL WHEN 'false' THEN NULL "
+                f"ELSE moneta_date_label({json_type}, {value}) END"
+            )
+
+        return self.value_label(x_field)
+
+    def value_label(self, field: str) -> str:
+        """A field's value as a label string; exact field first, then case variants"""
+        branches = []
+        for variant in [field] + self.variants(field):
+            json_type, value = self.merged(variant)
+            branches.append(f"WHEN {json_type} IS NOT NULL THEN {self.text(json_type, value)}")
+        return f"CASE {' '.join(branches)} END"
+
+    def text(self, json_type: str, value: str) -> str:
+        """str() of a JSON value; floats, objects and arrays are formatted in Python"""
+        return (
+            f"CASE {json_type} WHEN 'text' THEN {value} WHEN 'integer' THEN CAST({value} AS TEXT) "
+            f"WHEN 'true' THEN 'True' WHEN 'false' THEN 'False' WHEN 'null' THEN 'None' "
+            f"ELSE moneta_label({json_type}, {value}) END"
+        )
+
+    def lowered(self, json_type: str, value: str) -> str:
+        """str().lower() of a JSON value, NULL where only Python can tell"""
+        return (
+            f"CASE {json_type} "
+            f"WHEN 'text' THEN CASE WHEN {value} NOT GLOB {self.constant(NON_ASCII_GLOB)} THEN lower({value}) END "
+            f"WHEN 'integer' THEN CAST({value} AS TEXT) WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' END"
+        )
+
+    def measure(self, y_field: str) -> str:
+        """The y value: the exact field when present, otherwise the first variant that is a number"""
+        y_type, y_value = self.merged(y_field)
+        y_variants = [f"moneta_float({self.merged(field)[1]})" for field in self.variants(y_field)]
+        if not y_variants:
+            y_fallback = "NULL"
+        elif len(y_variants) == 1:
+            y_fallback = y_variants[0]
+        else:
+            y_fallback = f"COALESCE({', '.join(y_variants)})"
+        return f"CASE WHEN {y_type} IS NOT NULL THEN moneta_float({y_value}) ELSE {y_fallback} END"
+
+    def currency(self, currency_field: Optional[str]) -> str:
+        """The normalized currency code, or NULL when not splitting by currency"""
+        if not currency_field:
+            return "NULL"
+        currency_type, currency_value = self.merged(currency_field)
+        return (
+            f"CASE WHEN {currency_type} IS NULL THEN 'UNKNOWN' "
+            f"ELSE moneta_currency({currency_type}, {currency_value}) END"
+        )
+
+
+def prepare_sql(db: Session) -> FieldSQL:
+    """
+    Register the report functions on the session's connection and return a
+    FieldSQL that knows the case variants of every stored column and reads
+    the configured date field from the stored date columns once they are
+    current.
+
+    Raises:
+        UnsupportedQuery: The database is not SQLite
+    """
+    connection = db.connection()
+    if connection.dialect.name != "sqlite":
+        raise UnsupportedQuery(f"{connection.dialect.name} has no report functions")
+    register_sqlite_functions(connection.connection.driver_connection)
+
+    meta = db.query(TransactionMetadata).first()
+    columns = []
+    dated_field = None
+    if meta:
+        columns = list(dict.fromkeys(list(meta.ingested_columns or {}) + list(meta.computed_columns or {})))
+        if meta.date_field == TRANSACTION_DATE_FIELD:
+            dated_field = meta.date_field
+    return FieldSQL(columns, dated_field)
@@ -0,0 +1,122 @@
+"""
+Normalized transaction dates.
+
+Every transaction stores the value of the configured date field
+(TRANSACTION_DATE_FIELD) parsed once, when it is written: txn_date holds the
+ISO date and the indexed txn_day the number of days since 1970-01-01, so
+report date ranges are an index range scan instead of parsing every row's
+date on every request. Rows are dated at ingestion and rule execution. The
+metadata registry records which field the stored dates come from; until it
+matches the configuration (after upgrading, or when the setting changes)
+reports parse dates from the content and the next report request recomputes
+them in a single statement.
+
+Transactions whose date is missing or doesn't parse keep NULL dates; they
+are counted by undated_transaction_count and reported alongside date-ranged
+report data and ingestion results.
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from server.models.main import Transaction, TransactionMetadata
+from server.services.metadata import get_or_create_metadata
+from server.services.sql_functions import UnsupportedQuery, epoch_day, parse_date, prepare_sql
+from server.settings import TRANSACTION_DATE_FIELD
+
+logger = logging.getLogger(__name__)
+
+# Rows updated per flush when dates are recomputed without SQLite
+DATE_REFRESH_BATCH_SIZE = 1000
+
+
+def transaction_date(
+    ingested: Optional[Dict[str, Any]],
+    computed: Optional[Dict[str, Any]],
+    date_field: str = TRANSACTION_DATE_FIELD
+) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Parse a transaction's date field; computed content wins over ingested content.
+
+    Returns:
+        (ISO date, days since 1970-01-01), both None when the date doesn't parse
+    """
+    if computed and date_field in computed:
+        value = computed[date_field]
+    else:
+        value = (ingested or {}).get(date_field)
+    parsed = parse_date(value)
+    if parsed is None:
+        return None, None
+    day = parsed.date()
+    return day.isoformat(), epoch_day(day)
+
+
+def date_columns(ingested: Optional[Dict[str, Any]], computed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """txn_date/txn_day values for a transaction row"""
+    txn_date, txn_day = transaction_date(ingested, computed)
+    return {"txn_date": txn_date, "txn_day": txn_day}
+
+
+def set_transaction_date(transaction: Transaction):
+    """Recompute a transaction's stored date after its content changed."""
+    transaction.txn_date, transaction.txn_day = transaction_date(
+        transaction.ingested_content, transaction.computed_content
+    )
+
+
+def refresh_transaction_dates(db: Session):
+    """Recompute every transaction's stored date from the configured date field."""
+    meta = get_or_create_metadata(db)
+    db.flush()
+    try:
+        sql = prepare_sql(db)
+        db.execute(
+            text(f"UPDATE transactions SET txn_date = {sql.parsed_date(TRANSACTION_DATE_FIELD)}"),
+            sql.params
+        )
+        db.execute(text(
+            "UPDATE transactions SET txn_day = CAST(julianday(txn_date) - julianday('1970-01-01') AS INTEGER)"
+        ))
+    except UnsupportedQuery:
+        ids = [transaction_id for (transaction_id,) in db.query(Transaction.id)]
+        for start in range(0, len(ids), DATE_REFRESH_BATCH_SIZE):
+            batch = ids[start:start + DATE_REFRESH_BATCH_SIZE]
+            for transaction in db.query(Transaction).filter(Transaction.id.in_(batch)):
+                set_transaction_date(transaction)
+            db.flush()
+
+    meta.date_field = TRANSACTION_DATE_FIELD
+    db.flush()
+    logger.info(f"Recomputed transaction dates from '{TRANSACTION_DATE_FIELD}'")
+
+
+def ensure_transaction_dates(db: Session) -> bool:
+    """
+    Recompute and commit the stored dates unless they match the configured field.
+
+    Does nothing before the metadata registry exists; reports parse dates
+    from the content until then.
+
+    Returns:
+        Whether the stored dates are current
+    """
+    meta = db.query(TransactionMetadata).first()
+    if meta is None:
+        return False
+    if meta.date_field == TRANSACTION_DATE_FIELD:
+        return True
+    try:
+        refresh_transaction_dates(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return True
+
+
+def undated_transaction_count(db: Session) -> int:
+    """Number of transactions without a parseable date in the configured field"""
+    return db.query(func.count(Transaction.id)).filter(Transaction.txn_day.is_(None)).scalar() or 0
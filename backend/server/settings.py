@@ -5,6 +5,39 @@ TESTING = os.getenv('TESTING', 'false').lower() == 'true'
 
 ALLOWED_FILE_EXTENSIONS = [".csv", ".xlsx", ".xls"]
 
+# Bytes read, hashed and written per step while streaming an upload to disk
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+
+# Number of transaction rows sent to the database per executemany during ingestion
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '5000'))
+
+# Number of rows streamed, inserted and committed together while processing a statement
+INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', '5000'))
+
+# .xlsx files at least this large are streamed with openpyxl's read-only mode
+EXCEL_STREAMING_THRESHOLD_BYTES = int(os.getenv('EXCEL_STREAMING_THRESHOLD_BYTES', str(20 * 1024 * 1024)))
+
+# Worker threads running background statement processing jobs
+PROCESSING_WORKERS = int(os.getenv('PROCESSING_WORKERS', '2'))
+
+# Finished processing jobs kept in memory for status lookups
+PROCESSING_JOBS_RETAINED = int(os.getenv('PROCESSING_JOBS_RETAINED', '200'))
+
+# Worker processes parsing statements in batch processing (0 = one per CPU)
+BATCH_PROCESSING_WORKERS = int(os.getenv('BATCH_PROCESSING_WORKERS', '0'))
+
+# Report rollups materialized on demand and kept current on every write (0 disables them)
+REPORT_ROLLUP_LIMIT = int(os.getenv('REPORT_ROLLUP_LIMIT', '50'))
+
+# Memory budget for cached report results, in bytes of their JSON encoding (0 disables the cache)
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Field parsed into each transaction's indexed date columns, used for report date ranges
+TRANSACTION_DATE_FIELD = os.getenv('TRANSACTION_DATE_FIELD', 'date')
+
+# Report fields loaded into the in-memory NumPy column store, comma-separated (empty disables the store)
+ANALYTICS_STORE_FIELDS = [field.strip() for field in os.getenv('ANALYTICS_STORE_FIELDS', '').split(',') if field.strip()]
+
 if TESTING:
     # Use separate test databases
     DATABASE_PATHS = {
@@ -22,6 +55,12 @@ else:
         'configurations': os.path.join(os.path.dirname(__file__), '..', 'data', 'configurations.db'),
     }
 
+# Engine grouping report data: 'sqlite' or 'duckdb' (an embedded DuckDB mirror of the transactions)
+REPORT_ENGINE = os.getenv('REPORT_ENGINE', 'sqlite').lower()
+
+# DuckDB file of the report mirror, next to the main database by default
+DUCKDB_PATH = os.getenv('DUCKDB_PATH', os.path.splitext(DATABASE_PATHS['main'])[0] + '.duckdb')
+
 alembic_convention = {
     "ix": "ix_%(column_0_label)s",
     "uq": "uq_%(table_name)s_%(column_0_name)s",
@@ -0,0 +1,178 @@
+"""
+Tests for the SQL report aggregation and its Python fallback
+"""
+from datetime import datetime
+
+import pytest
+
+from server.models.main import Statement, Transaction, TransactionMetadata
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.filters import parse_field_filters
+from server.services.result_cache import ResultCache
+
+
+ROWS = [
+    ({"date": "2024-01-05", "category": "Food", "amount": "10.5", "currency": "$"}, None),
+    ({"date": "2024-01-20T10:00:00", "category": "Food", "amount": 4, "currency": "usd"}, None),
+    ({"date": "01/25/2024", "category": "Rent", "amount": 1000, "currency": "€"}, None),
+    ({"date": "2024-02-01", "category": "Rent", "amount": "n/a", "currency": "EUR"}, None),
+    ({"date": "2024-02-03", "Category": "Travel", "Amount": 250, "currency": None}, None),
+    ({"date": "not a date", "category": "Food", "amount": 1}, {"category": "Groceries"}),
+    ({"category": "Salary", "amount": 3000}, {"amount": "3100"}),
+]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="aggregation.csv",
+        file_path="/tmp/aggregation.csv",
+        file_hash="aggregation-hash",
+        mime_type="text/csv",
+        processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, (ingested, computed) in enumerate(ROWS):
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content=ingested,
+            computed_content=computed,
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.add(TransactionMetadata(
+        id="1",
+        ingested_columns={"date": True, "category": True, "Category": True, "amount": True, "Amount": True, "currency": True},
+        computed_columns={"category": True, "amount": True}
+    ))
+    test_db.commit()
+    return test_db
+
+
+def _both(db, monkeypatch, **kwargs):
+    """Run an aggregation through SQL and through the Python fallback"""
+    def unsupported(*args, **kw):
+        raise aggregation.UnsupportedQuery("forced")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+        patch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+        from_sql = aggregate_transactions(db, **kwargs)
+        patch.setattr(aggregation, "_aggregate_sql", unsupported)
+        from_python = aggregate_transactions(db, **kwargs)
+    return from_sql, from_python
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"x_field": "category", "y_field": "amount"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "avg"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "count"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "min"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "max"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "median"},
+    {"x_field": "date", "y_field": "amount", "aggregation": "p90", "date_bucket": "month"},
+    {"x_field": "category", "y_field": "currency", "aggregation": "distinct_count"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "median",
+     "currency_field": "currency", "split_by_currency": True},
+    {"x_field": "date", "y_field": "amount"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "week"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "month", "date_from": "2024-01-10"},
+    {"x_field": "category", "y_field": "amount", "date_from": "2024-01-10", "date_to": "2024-01-31"},
+    {"x_field": "category", "y_field": "amount", "date_to": "2024-01-05"},
+    {"x_field": "category", "y_field": "amount", "date_from": "garbage"},
+    {"x_field": "category", "y_field": "amount", "currency_field": "currency", "split_by_currency": True},
+    {"x_field": "CATEGORY", "y_field": "AMOUNT"},
+    {"x_field": "category", "y_field": "amount", "top_n": 2},
+    {"x_field": "category", "y_field": "amount", "aggregation": "p90", "top_n": 2, "order_by": "value_asc"},
+    {"x_field": "category", "y_field": "amount", "top_n": 1,
+     "currency_field": "currency", "split_by_currency": True},
+])
+def test_sql_matches_python(transactions, monkeypatch, kwargs):
+    from_sql, from_python = _both(transactions, monkeypatch, **kwargs)
+    assert from_sql == from_python
+
+
+@pytest.mark.parametrize("params,count,connector", [
+    ({"filter_0_field": "category", "filter_0_operator": "equals", "filter_0_value": "food"}, 0, "AND"),
+    ({"filter_0_field": "amount", "filter_0_operator": "gte", "filter_0_value": "100"}, 0, "AND"),
+    ({"filter_0_field": "date", "filter_0_operator": "startswith", "filter_0_value": "2024-01"}, 0, "AND"),
+    ({"filter_0_field": "category", "filter_0_operator": "not_equals", "filter_0_value": "Rent",
+      "filter_1_field": "amount", "filter_1_operator": "lt", "filter_1_value": "5"}, 1, "AND"),
+    ({"filter_0_field": "category", "filter_0_operator": "equals", "filter_0_value": "Rent",
+      "filter_1_field": "category", "filter_1_operator": "contains", "filter_1_value": "sal"}, 1, "OR"),
+    ({"filter_0_field": "category", "filter_0_operator": "equals", "filter_0_value": ""}, 0, "AND"),
+])
+def test_filters_match_python(transactions, monkeypatch, params, count, connector):
+    from_sql, from_python = _both(
+        transactions, monkeypatch,
+        x_field="category", y_field="amount",
+        filter_params=parse_field_filters(params),
+        global_filter_count=count,
+        global_local_connector=connector
+    )
+    assert from_sql == from_python
+
+
+def test_aggregation_values(transactions):
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount")
+
+    # Computed content overrides ingested content, fields match case-insensitively
+    # and unparseable amounts are skipped
+    assert dict(zip(result["labels"], result["values"])) == {
+        "Food": 14.5, "Groceries": 1.0, "Rent": 1000.0, "Salary": 3100.0, "Travel": 250.0
+    }
+    assert result["total_records"] == len(ROWS)
+    assert result["filtered_records"] == 6
+
+
+def test_split_by_currency_normalizes_codes(transactions):
+    result = aggregate_transactions(
+        transactions, x_field="category", y_field="amount",
+        currency_field="currency", split_by_currency=True
+    )
+
+    assert result["currencies"] == ["EUR", "UNKNOWN", "USD"]
+    food = result["labels"].index("Food")
+    assert result["values_by_currency"]["USD"][food] == 14.5
+    assert result["values_by_currency"]["EUR"][food] == 0
+
+
+@pytest.mark.parametrize("kwargs,labels,values,other_groups", [
+    ({"top_n": 2}, ["Salary", "Rent", "Other"], [3100.0, 1000.0, 265.5], 3),
+    ({"top_n": 2, "order_by": "value_asc"}, ["Groceries", "Food", "Other"], [1.0, 14.5, 4350.0], 3),
+    ({"top_n": 2, "order_by": "label"}, ["Rent", "Salary", "Other"], [1000.0, 3100.0, 265.5], 3),
+    ({"top_n": 2, "aggregation": "avg"}, ["Salary", "Rent", "Other"], [3100.0, 1000.0, 66.38], 3),
+    ({"top_n": 2, "aggregation": "min"}, ["Salary", "Rent", "Other"], [3100.0, 1000.0, 1.0], 3),
+    # Medians don't combine, so the other labels are left out
+    ({"top_n": 2, "aggregation": "median"}, ["Salary", "Rent"], [3100.0, 1000.0], 3),
+    ({"top_n": 10}, ["Salary", "Rent", "Travel", "Food", "Groceries"], [3100.0, 1000.0, 250.0, 14.5, 1.0], 0),
+])
+def test_top_n_folds_other_labels(transactions, kwargs, labels, values, other_groups):
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount", **kwargs)
+    assert result["labels"] == labels
+    assert result["values"] == values
+    assert result["other_groups"] == other_groups
+    assert result["filtered_records"] == 6
+
+
+def test_order_by_value_keeps_every_label(transactions):
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount", order_by="value_asc")
+    assert result["labels"] == ["Groceries", "Food", "Travel", "Rent", "Salary"]
+    assert "other_groups" not in result
+
+
+def test_top_n_split_by_currency_ranks_labels_on_all_currencies(transactions):
+    result = aggregate_transactions(
+        transactions, x_field="category", y_field="amount", top_n=2,
+        currency_field="currency", split_by_currency=True
+    )
+    assert result["labels"] == ["Salary", "Rent", "Other"]
+    assert result["values_by_currency"]["USD"] == [0, 0, 14.5]
+    assert result["values_by_currency"]["UNKNOWN"] == [3100.0, 0, 251.0]
+
+
+def test_field_names_with_quotes_fall_back_to_python(transactions):
+    result = aggregate_transactions(transactions, x_field='cat"egory', y_field="amount")
+    assert result["labels"] == []
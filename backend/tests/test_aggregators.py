@@ -0,0 +1,70 @@
+"""
+Tests for the streaming report aggregators
+"""
+import random
+
+import numpy as np
+import pytest
+
+from server.services.aggregators import HyperLogLog, TDigest, make_aggregator
+
+
+@pytest.mark.parametrize("aggregation,expected", [
+    ("sum", 16.0),
+    ("min", -2.0),
+    ("max", 9.0),
+    ("median", 2.5),
+    ("p90", 6.0),
+    ("distinct_count", 5.0),
+])
+def test_small_groups_are_exact(aggregation, expected):
+    aggregator = make_aggregator(aggregation)
+    for value in [3.0, 9.0, -2.0, 3.0, 1.0, 2.0]:
+        aggregator.add(value)
+    assert aggregator.count == 6
+    assert aggregator.result() == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.9])
+def test_tdigest_estimates_large_groups(quantile):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1) for _ in range(50_000)]
+    digest = TDigest(quantile)
+    for value in values:
+        digest.add(value)
+
+    exact = float(np.quantile(values, quantile))
+    assert digest.result() == pytest.approx(exact, rel=0.01)
+    # State stays bounded by the compression, not the number of values
+    assert len(digest.centroids) <= 2 * digest.compression
+
+
+def test_tdigest_merge_matches_single_digest():
+    rng = random.Random(11)
+    values = [rng.uniform(0, 1000) for _ in range(20_000)]
+    whole = TDigest(0.5)
+    parts = [TDigest(0.5) for _ in range(4)]
+    for index, value in enumerate(values):
+        whole.add(value)
+        parts[index % 4].add(value)
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+
+    assert merged.count == len(values)
+    assert merged.result() == pytest.approx(whole.result(), rel=0.01)
+    assert merged.result() == pytest.approx(float(np.median(values)), rel=0.01)
+
+
+def test_hyperloglog_estimates_and_merges():
+    first, second = HyperLogLog(), HyperLogLog()
+    for value in range(30_000):
+        first.add(f"merchant-{value}")
+    for value in range(20_000, 50_000):
+        second.add(f"merchant-{value}")
+
+    assert first.result() == pytest.approx(30_000, rel=0.05)
+    first.merge(second)
+    assert first.result() == pytest.approx(50_000, rel=0.05)
+    assert first.count == 60_000
+    assert len(first.registers) == 4096
@@ -0,0 +1,137 @@
+"""
+Tests for parallel multi-statement processing
+"""
+import json
+import tempfile
+
+from server.models.main import Statement, Transaction
+from server.services.batch_processing import process_statements_batch
+from server.services.csv_processor import CSVProcessor, parse_statement_file
+
+
+def _make_statement(db, tmp_path, name, rows):
+    csv_file = tmp_path / name
+    csv_file.write_text("Date,Description,Amount\n" + "\n".join(rows) + "\n")
+    statement = Statement(
+        filename=name,
+        file_path=str(csv_file),
+        file_hash=f"hash-{name}",
+        mime_type="text/csv",
+        processed=False
+    )
+    db.add(statement)
+    db.commit()
+    db.refresh(statement)
+    return statement
+
+
+def test_batch_processes_statements_in_worker_processes(test_db, tmp_path):
+    """Statements parsed in a process pool are stored with per-statement results"""
+    statements = [
+        _make_statement(test_db, tmp_path, f"statement_{n}.csv", [f"2024-0{n}-01,Shop {i},{i}.00" for i in range(5)])
+        for n in range(1, 4)
+    ]
+    # A repeated row within a file is still reported as a duplicate
+    duplicate = _make_statement(test_db, tmp_path, "duplicate.csv", ["2024-05-01,Rent,900.00", "2024-05-01,Rent,900.00"])
+
+    results = process_statements_batch([s.id for s in statements + [duplicate]], test_db, max_workers=2)
+
+    assert results["successful_count"] == 4
+    assert results["failed_count"] == 0
+    assert results["transactions_created"] == 16
+    assert results["duplicates_skipped"] == 1
+    by_id = {item["statement_id"]: item for item in results["successful_statements"]}
+    assert by_id[duplicate.id]["transactions_processed"] == 2
+    assert by_id[duplicate.id]["transactions_created"] == 1
+
+    test_db.expire_all()
+    assert test_db.query(Transaction).count() == 16
+    assert all(statement.processed for statement in test_db.query(Statement).all())
+
+
+def test_parsed_files_stream_rows_to_the_writer(test_db, tmp_path, monkeypatch):
+    """Workers hand rows over through parsed files, which are gone once stored"""
+    statement = _make_statement(test_db, tmp_path, "parsed.csv", [f"2024-01-{i + 1:02d},Item {i},{i}.00" for i in range(7)])
+    parsed_path = tmp_path / "parsed.jsonl"
+    assert parse_statement_file(statement.file_path, statement.filename, str(parsed_path)) == 7
+
+    lines = [json.loads(line) for line in parsed_path.read_text().splitlines()]
+    assert lines[0] == [
+        CSVProcessor._hash_content({**lines[0][1], "statement_filename": "parsed.csv"}),
+        {"date": "2024-01-01", "description": "Item 0", "amount": "0.00"}
+    ]
+
+    result = CSVProcessor().process_parsed_statement(statement, str(parsed_path), test_db, chunk_size=3)
+    assert result["transactions_created"] == 7
+
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "spill"))
+    (tmp_path / "spill").mkdir()
+    more = [_make_statement(test_db, tmp_path, f"more_{n}.csv", [f"2024-02-0{n + 1},Item,{n}.00"]) for n in range(3)]
+    assert process_statements_batch([s.id for s in more], test_db, max_workers=2)["transactions_created"] == 3
+    assert list((tmp_path / "spill").iterdir()) == []
+
+
+def test_batch_reports_failures_and_defaults_to_unprocessed(test_db, tmp_path):
+    """Unknown statements fail individually and no ids means every unprocessed statement"""
+    statement = _make_statement(test_db, tmp_path, "statement.csv", ["2024-01-01,Coffee,3.50"])
+
+    results = process_statements_batch([statement.id, "missing-id"], test_db, max_workers=1)
+    assert results["successful_count"] == 1
+    assert results["failed_statements"] == [{"statement_id": "missing-id", "filename": None, "error": "Statement not found"}]
+
+    # Already processed, so nothing is left to do
+    assert process_statements_batch(None, test_db)["total_statements"] == 0
+
+
+def test_process_batch_endpoint(client, tmp_path):
+    """Test the batch processing endpoint"""
+    files = []
+    for n in range(2):
+        path = tmp_path / f"batch_{n}.csv"
+        path.write_text(f"Date,Description,Amount\n2023-0{n + 1}-01,Batch {n},{n}.50\n")
+        with open(path, "rb") as f:
+            response = client.post("/api/statements/upload", files={"file": (path.name, f, "text/csv")})
+        assert response.status_code == 201
+        files.append(response.json()["statement_id"])
+
+    response = client.post("/api/statements/process-batch?wait=true", json={"statement_ids": files + ["missing-id"]})
+
+    assert response.status_code == 207
+    assert response.json()["message"] == "Partial success: 2 processed, 1 failed"
+    results = response.json()["results"]
+    assert results["successful_count"] == 2
+    assert results["failed_count"] == 1
+    assert results["transactions_created"] == 2
+
+    response = client.post("/api/statements/process-batch", json={"statement_ids": []})
+    assert response.status_code == 400
+
+
+def test_process_batch_endpoint_queues_a_job(client, tmp_path):
+    """Without wait the batch runs as a background job that can be polled"""
+    import time
+
+    statement_ids = []
+    for n in range(2):
+        path = tmp_path / f"job_batch_{n}.csv"
+        path.write_text(f"Date,Description,Amount\n2023-0{n + 1}-02,Job batch {n},{n}.75\n")
+        with open(path, "rb") as f:
+            response = client.post("/api/statements/upload", files={"file": (path.name, f, "text/csv")})
+        statement_ids.append(response.json()["statement_id"])
+
+    response = client.post("/api/statements/process-batch", json={"statement_ids": statement_ids, "max_workers": 1})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    deadline = time.time() + 10
+    while True:
+        job = client.get(f"/api/statements/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed") or time.time() > deadline:
+            break
+        time.sleep(0.05)
+
+    assert job["status"] == "completed"
+    assert job["batch"] is True and job["statement_ids"] == statement_ids
+    assert (job["rows_parsed"], job["rows_inserted"], job["progress"]) == (2, 2, 1.0)
+    assert job["message"] == "All 2 statements processed successfully"
+    assert job["result"]["successful_count"] == 2
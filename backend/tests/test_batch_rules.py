@@ -0,0 +1,174 @@
+"""
+Tests for executing rules over batches of transactions
+"""
+import ast
+import asyncio
+import copy
+import logging
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from server.models.configurations import Base as ConfigBase, ComputedFieldRule
+from server.models.main import Statement, Transaction
+from server.routers.rules import RuleExecuteRequest, execute_rules
+from server.services.batch_expressions import RuleBatch, compile_batch_expression
+from server.services.compiled_rules import compile_rule
+from server.services.formula_commands import command_registry
+from server.services.rule_engine import RuleEngine
+
+COMMANDS = [command.name for command in command_registry.list_commands()]
+
+ROWS = [
+    {"amount": 20, "description": "Coffee Shop", "category": "food", "divisor": 4},
+    {"amount": "$1,200.50", "description": "RENT", "category": "home", "divisor": 0},
+    {"amount": 5.5, "description": None, "divisor": "x"},
+    {"amount": None, "description": "book shop", "category": "fun", "label": ""},
+    {"description": "  coffee  ", "category": 3, "label": "kept"},
+    {"amount": True, "description": 12, "category": "food", "divisor": 2.5},
+]
+
+
+def _rule(index, target, condition, action, rule_type="formula"):
+    return ComputedFieldRule(
+        id=f"rule-{index}", name=f"rule-{index}", target_field=target, condition=condition, action=action,
+        rule_type=rule_type, priority=index, active=True, updated_at=datetime(2024, 1, 1)
+    )
+
+
+RULES = [
+    _rule(1, "label", "description.contains('shop') and amount > 10", "'shop'", "value_assignment"),
+    _rule(2, "label", "category == 'food' or amount < 0", "description.upper()"),
+    _rule(3, "label", "", "'other'", "value_assignment"),
+    _rule(4, "amount_value", "", "amount_to_float(amount)"),
+    _rule(5, "share", "amount_value > 0", "divide(amount_value, divisor)"),
+    _rule(6, "share", "not label", "amount / divisor"),
+    # Chained comparisons have no batch form and run row by row
+    _rule(7, "band", "1 < amount_value < 100", "'small'", "value_assignment"),
+    _rule(8, "band", "label.startswith('SHOP') or label == 'kept'", "multiply(amount_value, 2)"),
+    _rule(9, "label", "label == 'kept'", "'replaced'", "value_assignment"),
+]
+
+
+def _row_results(rules, rows, force_reprocess=False):
+    engine = RuleEngine()
+    return [
+        engine.execute_rules_for_transaction(rules, copy.deepcopy(row), [], [], force_reprocess)
+        for row in rows
+    ]
+
+
+def _typed(results):
+    return [[(key, type(value), repr(value)) for key, value in computed.items()] for computed in results]
+
+
+@pytest.mark.parametrize("force_reprocess", [False, True])
+def test_batch_matches_row_execution(force_reprocess):
+    batch = RuleEngine().execute_rules_for_batch(RULES, copy.deepcopy(ROWS), [], [], force_reprocess)
+    assert _typed(batch) == _typed(_row_results(RULES, ROWS, force_reprocess))
+
+
+def test_first_successful_rule_wins():
+    results = RuleEngine().execute_rules_for_batch(RULES, copy.deepcopy(ROWS), [], [])
+    assert [computed.get("label") for computed in results] == ["shop", "other", "other", "other", "other", "12"]
+    assert [computed.get("share") for computed in results] == [5.0, None, None, None, None, 0.4]
+    assert [computed.get("band") for computed in results] == ["small", "small", "small", None, None, None]
+
+    forced = RuleEngine().execute_rules_for_batch(RULES, copy.deepcopy(ROWS), [], [], force_reprocess=True)
+    # Every matching rule overwrites the label, the catch-all last
+    assert {computed["label"] for computed in forced} == {"other"}
+
+
+@pytest.mark.parametrize("expression,vectorized", [
+    ("amount > 10 and description.contains('x')", True),
+    ("not amount in 'abc'", True),
+    ("amount_to_float(amount) * 2", True),
+    ("1 < amount < 3", False),
+    ("amount ** 2", False),
+    ("description.replace('a', 'b')", False),
+    ("[amount]", False),
+])
+def test_batch_forms(expression, vectorized):
+    assert (compile_batch_expression(ast.parse(expression, mode='eval').body) is not None) == vectorized
+    rule = _rule(1, "target", expression, "amount")
+    assert compile_rule(rule).vectorized == vectorized
+
+
+def test_rows_fail_individually():
+    batch = RuleBatch(copy.deepcopy(ROWS), COMMANDS)
+    expression = compile_batch_expression(ast.parse("amount > 10", mode='eval').body)
+    values, errors = expression(batch.view())
+    # Strings, None and a missing amount can't be compared with 10
+    assert errors.tolist() == [False, True, False, True, True, False]
+    assert [values[index] for index in (0, 2, 5)] == [True, False, False]
+
+
+def test_commands_execute_once_per_distinct_arguments(monkeypatch):
+    command = command_registry.get_command("default_if_none")
+    calls = []
+    original = command._execute_impl
+    monkeypatch.setattr(command, "_execute_impl", lambda *args: calls.append(args) or original(*args))
+
+    column = np.array([None, 1, 1.0, True, None, 1], dtype=object)
+    values, failed = command.execute_batch(column, np.array(["d"] * 6, dtype=object))
+    assert values.tolist() == ["d", 1, 1.0, True, "d", 1]
+    assert [type(value) for value in values.tolist()[1:4]] == [int, float, bool]
+    assert len(calls) == 4
+    assert not failed.any()
+
+
+def test_math_commands_in_batches():
+    divide = command_registry.get_command("divide")
+    dividends = np.array([10, 7.5, 1, "9", None, 3], dtype=object)
+    divisors = np.array([4, 2.5, 0, "3", 2, "x"], dtype=object)
+    values, failed = divide.execute_batch(dividends, divisors)
+    assert failed.tolist() == [False, False, True, False, False, True]
+    for index in (0, 1, 3, 4):
+        expected = divide.execute(dividends[index], divisors[index])
+        assert values[index] == expected.value and type(values[index]) is type(expected.value)
+
+
+@pytest.fixture
+def rules_db(test_db, test_engine):
+    ConfigBase.metadata.create_all(bind=test_engine)
+    statement = Statement(
+        filename="rules.csv", file_path="/tmp/rules.csv", file_hash="rules-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, row in enumerate(ROWS):
+        test_db.add(Transaction(
+            statement_id=statement.id, ingested_content=row, ingested_content_hash=f"rules-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.add_all(copy.deepcopy(RULES))
+    test_db.commit()
+    yield test_db
+    ConfigBase.metadata.drop_all(bind=test_engine)
+
+
+def test_execute_endpoint_modes_agree(rules_db):
+    def run(vectorized):
+        request = RuleExecuteRequest(dry_run=True, vectorized=vectorized)
+        return asyncio.run(execute_rules(request, config_db=rules_db, main_db=rules_db))
+
+    vectorized, row_by_row = run(True), run(False)
+    assert vectorized.success and vectorized.processed_transactions == len(ROWS)
+    assert vectorized.dry_run_results == row_by_row.dry_run_results
+    assert vectorized.updated_fields == row_by_row.updated_fields
+
+
+def test_failed_batches_fall_back_to_rows(rules_db, monkeypatch, caplog):
+    def fail(*args, **kwargs):
+        raise RuntimeError("batch engine bug")
+
+    monkeypatch.setattr(RuleEngine, "execute_rules_for_batch", fail)
+    with caplog.at_level(logging.ERROR, logger="server.routers.rules"):
+        result = asyncio.run(execute_rules(RuleExecuteRequest(dry_run=True), config_db=rules_db, main_db=rules_db))
+
+    assert result.success and result.processed_transactions == len(ROWS)
+    assert list(result.dry_run_results.values()) == [computed for computed in _row_results(RULES, ROWS) if computed]
+    [record] = [record for record in caplog.records if "row by row" in record.getMessage()]
+    assert record.exc_info[1].args == ("batch engine bug",)
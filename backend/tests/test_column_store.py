@@ -0,0 +1,153 @@
+"""
+Tests for the NumPy column store
+"""
+from datetime import datetime
+
+import pytest
+
+from server.models.main import Statement, Transaction
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.column_store import ColumnStore
+from server.services.metadata import bump_data_version, get_or_create_metadata, rebuild_transaction_metadata
+from server.services.result_cache import ResultCache
+
+
+ROWS = [
+    ({"date": "2024-01-05", "category": "Food", "amount": "10.5", "currency": "$"}, None),
+    ({"date": "01/20/2024", "Category": "Food", "amount": 4, "currency": "eur"}, None),
+    ({"date": "2024-01-25T08:00:00", "category": "Rent", "amount": 1000}, {"category": "Housing"}),
+    ({"date": "2024-02-03", "category": "Travel", "amount": "n/a", "Amount": 250, "currency": "USD"}, None),
+    ({"date": "garbage", "category": "Food", "amount": 7, "currency": "USD"}, None),
+    ({"category": None, "amount": 3}, {"date": "2024-03-01"}),
+]
+
+FIELDS = ["category", "amount", "currency"]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="store.csv", file_path="/tmp/store.csv", file_hash="store-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, (ingested, computed) in enumerate(ROWS):
+        _add(test_db, statement.id, index, ingested, computed)
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+def _add(db, statement_id, index, ingested, computed=None):
+    transaction = Transaction(
+        statement_id=statement_id,
+        ingested_content=ingested,
+        computed_content=computed,
+        ingested_content_hash=f"hash-{index}",
+        ingested_at=datetime.utcnow()
+    )
+    db.add(transaction)
+    return transaction
+
+
+def _changed(db):
+    bump_data_version(get_or_create_metadata(db))
+    db.commit()
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ColumnStore(FIELDS)
+    monkeypatch.setattr(aggregation, "column_store", store)
+    monkeypatch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+    monkeypatch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+    return store
+
+
+def _scanned(db, monkeypatch, **kwargs):
+    """The same aggregation through the Python scan"""
+    def unsupported(*args, **kw):
+        raise aggregation.UnsupportedQuery("forced")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(aggregation, "column_store", ColumnStore([]))
+        patch.setattr(aggregation, "_aggregate_sql", unsupported)
+        return aggregate_transactions(db, **kwargs)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"x_field": "category", "y_field": "amount"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "avg"},
+    {"x_field": "currency", "y_field": "amount", "aggregation": "count"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "min"},
+    {"x_field": "date", "y_field": "amount", "aggregation": "max", "date_bucket": "month"},
+    {"x_field": "date", "y_field": "amount"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "week"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "month", "date_from": "2024-01-10"},
+    {"x_field": "category", "y_field": "amount", "date_from": "2024-01-10", "date_to": "2024-01-31"},
+    {"x_field": "category", "y_field": "amount", "date_from": "2025-01-01"},
+    {"x_field": "category", "y_field": "amount", "currency_field": "currency", "split_by_currency": True},
+])
+def test_store_matches_scan(transactions, store, monkeypatch, kwargs):
+    result = aggregate_transactions(transactions, **kwargs)
+    assert store.queries == 1
+    assert result == _scanned(transactions, monkeypatch, **kwargs)
+
+
+def test_unloaded_fields_and_filters_fall_back(transactions, store, monkeypatch):
+    for kwargs in [
+        {"x_field": "description", "y_field": "amount"},
+        {"x_field": "category", "y_field": "amount", "date_from": "2024-01-01", "date_field": "posted"},
+        {"x_field": "category", "y_field": "amount",
+         "filter_params": {"0": {"field": "category", "operator": "equals", "value": "Food"}}},
+    ]:
+        assert aggregate_transactions(transactions, **kwargs) == _scanned(transactions, monkeypatch, **kwargs)
+    assert store.queries == 0
+    assert store.fallbacks == 3
+
+
+def test_refreshes_incrementally(transactions, store):
+    aggregate_transactions(transactions, x_field="category", y_field="amount")
+    assert store.loads == 1
+
+    statement_id = transactions.query(Transaction).first().statement_id
+    _add(transactions, statement_id, 10, {"date": "2024-04-01", "category": "Food", "amount": 100})
+    changed = transactions.query(Transaction).filter(Transaction.ingested_content_hash == "hash-0").one()
+    changed.computed_content = {"category": "Books"}
+    changed.computed_at = datetime.utcnow()
+    _changed(transactions)
+
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount")
+    assert (store.loads, store.refreshes) == (1, 1)
+    assert dict(zip(result["labels"], result["values"]))["Books"] == 10.5
+    assert dict(zip(result["labels"], result["values"]))["Food"] == 111
+    assert store.stats()["rows"] == len(ROWS) + 1
+
+
+def test_deleted_rows_reload(transactions, store):
+    aggregate_transactions(transactions, x_field="category", y_field="amount")
+    transactions.query(Transaction).filter(Transaction.ingested_content_hash == "hash-4").delete()
+    _changed(transactions)
+
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount")
+    assert store.loads == 2
+    assert dict(zip(result["labels"], result["values"]))["Food"] == 14.5
+
+
+def test_memory_footprint(transactions, store):
+    aggregate_transactions(transactions, x_field="category", y_field="amount")
+
+    stats = store.stats()
+    assert stats["rows"] == len(ROWS)
+    # int32 days and date labels, then label/currency codes and float64 measures per field
+    assert stats["array_bytes"] == len(ROWS) * (4 + 4 + len(FIELDS) * (4 + 4 + 8))
+    assert stats["size_bytes"] == stats["array_bytes"] + stats["dictionary_bytes"] + stats["index_bytes"]
+
+
+def test_store_stats_endpoint(client):
+    response = client.get("/api/reports/data/store/")
+    assert response.status_code == 200
+    assert response.json()["enabled"] is False
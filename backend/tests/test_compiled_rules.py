@@ -0,0 +1,122 @@
+"""
+Tests for compiling rules once per rule version
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from server.models.configurations import ComputedFieldRule
+from server.services.compiled_rules import CompiledRuleCache, compile_rule
+from server.services.formula_commands import command_registry
+from server.services.rule_engine import RuleEngine, RuleExecutionContext, SafeExpressionEvaluator
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = CompiledRuleCache()
+    monkeypatch.setattr("server.services.rule_engine.compiled_rules", cache)
+    return cache
+
+
+def _rule(rule_id="rule-1", condition="amount > 10", action="amount * 2", rule_type="formula"):
+    return ComputedFieldRule(
+        id=rule_id, name=rule_id, target_field="doubled", condition=condition, action=action,
+        rule_type=rule_type, priority=10, active=True, updated_at=datetime(2024, 1, 1)
+    )
+
+
+def _context(data):
+    return RuleExecutionContext(
+        transaction_data=dict(data), ingested_fields=list(data), computed_fields=[],
+        available_commands=[command.name for command in command_registry.list_commands()]
+    )
+
+
+def test_rules_compile_once_across_transactions(cache, monkeypatch):
+    compiles = []
+    monkeypatch.setattr(
+        "server.services.compiled_rules.compile_rule",
+        lambda rule: compiles.append(rule.id) or compile_rule(rule)
+    )
+    rules = [_rule("double"), _rule("label", condition="", action="'big'", rule_type="value_assignment")]
+    rules[1].target_field = "label"
+    engine = RuleEngine()
+
+    results = [
+        engine.execute_rules_for_transaction(rules, {"amount": amount}, ["amount"], [])
+        for amount in range(5, 25)
+    ]
+
+    assert compiles == ["double", "label"]
+    assert cache.stats()["hits"] == 2 * 20 - 2
+    assert results[0] == {"label": "big"}
+    assert results[-1] == {"doubled": 48, "label": "big"}
+
+
+def test_new_version_or_changed_expression_recompiles(cache):
+    engine = RuleEngine()
+    rule = _rule()
+    assert engine.evaluate_rule(rule, _context({"amount": 20})).computed_value == 40
+
+    rule.action = "amount * 3"
+    assert engine.evaluate_rule(rule, _context({"amount": 20})).computed_value == 60
+
+    rule.updated_at += timedelta(seconds=1)
+    rule.condition = "amount > 100"
+    assert not engine.evaluate_rule(rule, _context({"amount": 20})).condition_matched
+    assert cache.stats()["misses"] == 3
+    assert cache.stats()["rules"] == 1
+
+
+def test_precompiled_rules_skip_the_cache(cache):
+    rules = [_rule("double"), _rule("inactive", action="amount * 3")]
+    rules[1].target_field = "tripled"
+    rules[1].active = False
+    engine = RuleEngine()
+    compiled = engine.compile_rules(rules)
+    assert [(rule.rule_id, rule.target_field, rule.active) for rule in compiled] == [
+        ("double", "doubled", True), ("inactive", "tripled", False)
+    ]
+
+    results = [engine.execute_rules_for_transaction(compiled, {"amount": amount}, ["amount"], []) for amount in (5, 20)]
+
+    assert results == [{}, {"doubled": 40}]
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hits"] == 0
+
+    # The snapshot follows the rule: reactivating it compiles it again
+    rules[1].active = True
+    assert engine.execute_rules_for_transaction(rules, {"amount": 20}, ["amount"], []) == {"doubled": 40, "tripled": 60}
+    assert cache.stats()["misses"] == 3
+
+
+def test_invalidate_and_eviction():
+    cache = CompiledRuleCache(max_rules=2)
+    for rule_id in ("a", "b", "c"):
+        cache.get(_rule(rule_id))
+    assert cache.stats()["rules"] == 2
+    assert cache.stats()["evictions"] == 1
+
+    cache.invalidate("c")
+    cache.invalidate("missing")
+    assert cache.stats()["rules"] == 1
+    assert cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.parametrize("condition,action,rule_type", [
+    ("amount >", "amount", "formula"),
+    ("amount > 10", "amount *", "formula"),
+    ("unknown_field == 1", "amount", "formula"),
+    ("amount > 10", "missing_field + 1", "formula"),
+    ("", "  42 ", "value_assignment"),
+    ("", "Account('Cash') ", "model_mapping"),
+    ("", "amount", "lookup"),
+    (None, None, "value_assignment"),
+])
+def test_compiled_evaluation_matches_direct_evaluation(cache, condition, action, rule_type):
+    context = _context({"amount": 20})
+    evaluator = SafeExpressionEvaluator(context)
+    compiled = cache.get(_rule(condition=condition, action=action, rule_type=rule_type))
+
+    assert evaluator.evaluate_compiled_condition(compiled) == evaluator.evaluate_condition(condition)
+    assert evaluator.evaluate_compiled_action(compiled) == evaluator.evaluate_action(action, rule_type)
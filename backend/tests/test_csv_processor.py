@@ -0,0 +1,271 @@
+"""
+Tests for the CSV/Excel ingestion service
+"""
+import pytest
+
+from server.models.main import Statement, Transaction
+from server.services.csv_processor import CSVProcessor
+
+
+def _make_statement(db, file_path, filename="statement.csv"):
+    statement = Statement(
+        filename=filename,
+        file_path=str(file_path),
+        file_hash=f"hash-{filename}",
+        mime_type="text/csv",
+        processed=False
+    )
+    db.add(statement)
+    db.commit()
+    db.refresh(statement)
+    return statement
+
+
+class TestBulkSave:
+    """Test the set-based bulk insert path"""
+
+    def test_bulk_insert_counts_created_and_duplicates(self, test_db, tmp_path, monkeypatch):
+        """Rows are inserted in batches and in-file duplicates are reported"""
+        monkeypatch.setattr("server.services.csv_processor.INGEST_BATCH_SIZE", 7)
+
+        rows = [f"2024-01-{i % 28 + 1:02d},Shop {i},{i}.00" for i in range(50)]
+        rows.append(rows[0])  # duplicate row in the same file
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n" + "\n".join(rows) + "\n")
+
+        statement = _make_statement(test_db, csv_file)
+        result = CSVProcessor().process_statement(statement, test_db)
+
+        assert result["success"] is True
+        assert result["transactions_processed"] == 51
+        assert result["transactions_created"] == 50
+        assert result["duplicates_skipped"] == 1
+        assert test_db.query(Transaction).filter(Transaction.statement_id == statement.id).count() == 50
+
+    def test_only_inserted_rows_are_counted(self, test_db, tmp_path, monkeypatch):
+        """Duplicates dropped by the conflict clause don't reach the column registry"""
+        from server.models.main import TransactionMetadata
+
+        monkeypatch.setattr("server.services.csv_processor.INGEST_BATCH_SIZE", 3)
+        rows = ["2024-01-01,Coffee,3.50", "2024-01-01,Coffee,3.50", "2024-01-02,Lunch,12.00", "2024-01-01,Coffee,3.50"]
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n" + "\n".join(rows) + "\n")
+
+        statement = _make_statement(test_db, csv_file)
+        processor = CSVProcessor()
+        result = processor.process_statement(statement, test_db)
+        assert (result["transactions_created"], result["duplicates_skipped"]) == (2, 2)
+        assert processor.process_statement(statement, test_db)["duplicates_skipped"] == 4
+
+        counts = test_db.query(TransactionMetadata).first().ingested_column_counts
+        assert counts["description"] == 2
+
+    def test_reprocessing_skips_existing_rows(self, test_db, tmp_path):
+        """Reprocessing a statement only reports duplicates"""
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n2024-01-01,Coffee,3.50\n2024-01-02,Lunch,12.00\n")
+
+        statement = _make_statement(test_db, csv_file)
+        processor = CSVProcessor()
+        processor.process_statement(statement, test_db)
+        result = processor.process_statement(statement, test_db)
+
+        assert result["transactions_created"] == 0
+        assert result["duplicates_skipped"] == 2
+        assert test_db.query(Transaction).count() == 2
+
+
+class TestStreamingPipeline:
+    """Test chunked streaming ingestion"""
+
+    def test_rows_are_streamed_in_chunks(self, test_db, tmp_path, monkeypatch):
+        """Each chunk is saved separately and duplicates across chunks are still caught"""
+        rows = [f"2024-02-{i % 28 + 1:02d},Store {i},{i}.25" for i in range(10)]
+        rows.append(rows[1])  # duplicate lands in a later chunk
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n" + "\n".join(rows) + "\n")
+
+        processor = CSVProcessor()
+        chunk_sizes = []
+        original_save = processor._save_transactions
+
+        def recording_save(statement, chunk, db, **kwargs):
+            chunk_sizes.append(len(chunk))
+            return original_save(statement, chunk, db, **kwargs)
+
+        monkeypatch.setattr(processor, "_save_transactions", recording_save)
+
+        statement = _make_statement(test_db, csv_file)
+        result = processor.process_statement(statement, test_db, chunk_size=4)
+
+        assert chunk_sizes == [4, 4, 3]
+        assert result["transactions_processed"] == 11
+        assert result["transactions_created"] == 10
+        assert result["duplicates_skipped"] == 1
+        assert statement.processed is True
+        assert statement.columns["total_processed"] == 11
+
+    def test_chunks_are_written_under_the_ingest_lock(self, test_db, tmp_path, monkeypatch):
+        """Concurrent ingestion in the process can't interleave chunk writes"""
+        from server.services.csv_processor import INGEST_WRITE_LOCK
+
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n" + "\n".join(f"2024-01-0{i + 1},Shop,{i}.00" for i in range(5)) + "\n")
+
+        processor = CSVProcessor()
+        held = []
+        original_save = processor._save_transactions
+
+        def recording_save(statement, chunk, db, **kwargs):
+            held.append(INGEST_WRITE_LOCK.locked())
+            return original_save(statement, chunk, db, **kwargs)
+
+        monkeypatch.setattr(processor, "_save_transactions", recording_save)
+        processor.process_statement(_make_statement(test_db, csv_file), test_db, chunk_size=2)
+
+        assert held == [True, True, True]
+        assert not INGEST_WRITE_LOCK.locked()
+
+    def test_iter_csv_rows_is_lazy(self, tmp_path):
+        """Rows are produced one at a time from the file"""
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n2024-01-01,Coffee,3.50\n2024-01-02,Lunch,12.00\n")
+
+        rows = CSVProcessor()._iter_csv_rows(csv_file)
+        assert next(rows) == {"date": "2024-01-01", "description": "Coffee", "amount": "3.50"}
+        assert next(rows)["description"] == "Lunch"
+        assert next(rows, None) is None
+
+    def test_progress_callback_reports_each_chunk(self, test_db, tmp_path):
+        """Progress is reported after every chunk and reaches the end of the file"""
+        rows = [f"2024-03-{i % 28 + 1:02d},Shop {i},{i}.10" for i in range(9)]
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("Date,Description,Amount\n" + "\n".join(rows) + "\n")
+
+        updates = []
+        statement = _make_statement(test_db, csv_file)
+        CSVProcessor().process_statement(statement, test_db, chunk_size=4, progress_callback=updates.append)
+
+        assert [update["rows_parsed"] for update in updates] == [4, 8, 9]
+        assert updates[-1]["rows_inserted"] == 9
+        assert updates[-1]["duplicates"] == 0
+        assert updates[-1]["progress"] == 1.0
+
+
+class TestExcelIngestion:
+    """Test the vectorized and streaming Excel readers"""
+
+    @pytest.fixture
+    def excel_file(self, tmp_path):
+        import pandas as pd
+
+        path = tmp_path / "statement.xlsx"
+        pd.DataFrame({
+            "Date": ["2024-01-01", "2024-01-02", None, "2024-01-04"],
+            "Description ": ["  Coffee ", "Lunch", None, "Taxi"],
+            "Amount ($)": [3.5, 12.0, None, 20.25],
+            "Category": ["Food", None, None, "Transport"],
+        }).to_excel(path, index=False)
+        return path
+
+    def test_vectorized_rows(self, excel_file, monkeypatch):
+        """Headers are normalized, values stripped and empty cells nulled"""
+        monkeypatch.setattr("server.services.csv_processor.EXCEL_STREAMING_THRESHOLD_BYTES", 10 ** 12)
+
+        rows = list(CSVProcessor()._iter_excel_rows(excel_file))
+
+        assert len(rows) == 3  # the blank row is dropped
+        assert rows[0] == {"date": "2024-01-01", "description": "Coffee", "amount": "3.5", "category": "Food"}
+        assert rows[1]["category"] is None
+
+    def test_streaming_rows(self, excel_file, monkeypatch):
+        """Large workbooks are read with openpyxl in read-only mode"""
+        monkeypatch.setattr("server.services.csv_processor.EXCEL_STREAMING_THRESHOLD_BYTES", 0)
+
+        rows = list(CSVProcessor()._iter_excel_rows(excel_file))
+
+        assert len(rows) == 3
+        assert rows[0] == {"date": "2024-01-01", "description": "Coffee", "amount": "3.5", "category": "Food"}
+        assert rows[2]["amount"] == "20.25"
+
+    def test_both_readers_produce_the_same_rows(self, tmp_path, monkeypatch):
+        """The reader picked by file size doesn't change rows or content hashes"""
+        import datetime
+        import openpyxl
+
+        path = tmp_path / "cells.xlsx"
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Amount", "Amount", None, "Booked", "Settled", "Time", "Flag", "Note", "Ref"])
+        sheet.append([100, 3.5, "x", datetime.date(2024, 1, 2), datetime.datetime(2024, 1, 2, 10, 30, 0, 500000),
+                      datetime.time(9, 15), True, "  a ", 5])
+        sheet.append([None] * 9)
+        sheet.append([None, 2.25, None, datetime.date(2024, 1, 3), datetime.datetime(2024, 1, 3),
+                      datetime.time(0, 0), False, "b", "x-1"])
+        sheet.append([200, None, None, None, None, None, None, None, None])
+        workbook.save(path)
+
+        def read(threshold):
+            monkeypatch.setattr("server.services.csv_processor.EXCEL_STREAMING_THRESHOLD_BYTES", threshold)
+            return list(CSVProcessor()._iter_excel_rows(path))
+
+        vectorized, streamed = read(10 ** 12), read(0)
+        assert vectorized == streamed
+        assert [CSVProcessor._hash_content(row) for row in vectorized] == [CSVProcessor._hash_content(row) for row in streamed]
+        assert vectorized[0] == {
+            "amount": "100", "amount_2": "3.5", "unnamed_2": "x", "booked": "2024-01-02 00:00:00",
+            "settled": "2024-01-02 10:30:00.500000", "time": "09:15:00", "flag": "True", "note": "a", "ref": "5"
+        }
+        # Integer columns with blanks stay integers
+        assert [row["amount"] for row in vectorized] == ["100", None, "200"]
+
+    def test_columns_are_cleaned_like_cells(self):
+        """Column-wise cleaning matches cleaning each cell on its own"""
+        import datetime
+
+        import pandas as pd
+        from server.services.csv_processor import _excel_cell_text
+
+        columns = [
+            ["  a ", 1, 2.5, 0.1, True, None, float("nan"), "", " ", 1e16, 10 ** 20],
+            [datetime.date(2024, 1, 1), datetime.datetime(2024, 1, 1, 10, 30), datetime.time(9, 15), 7, None, " b"],
+            [None, None],
+        ]
+        for cells in columns:
+            column = pd.Series(cells, dtype=object, index=range(3, 3 + len(cells)))
+            cleaned = CSVProcessor._clean_excel_column(column)
+            assert list(cleaned.index) == list(column.index)
+            assert cleaned.tolist() == [_excel_cell_text(value) for value in cells]
+
+
+class TestHeaderPlan:
+    """Test per-file header normalization"""
+
+    def test_plan_normalizes_each_header_once(self):
+        """Headers map to normalized names by column index"""
+        plan = CSVProcessor.build_header_plan(["Date", "Amount ($)", None, "Description"])
+
+        assert plan == [(0, "date"), (1, "amount"), (3, "description")]
+
+    def test_colliding_headers_are_disambiguated(self):
+        """Headers that normalize to the same name get a numeric suffix"""
+        plan = CSVProcessor.build_header_plan(["Amount", "amount ", "AMOUNT (EUR)"])
+
+        assert [name for _, name in plan] == ["amount", "amount_2", "amount_3"]
+
+    def test_csv_rows_follow_plan(self, tmp_path):
+        """Short rows are padded with None, extra cells and blank rows are dropped"""
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text(
+            "Date,Amount,Amount ($)\n"
+            "2024-01-01,3.50,USD,extra\n"
+            ",,\n"
+            "2024-01-02,12.00\n"
+        )
+
+        rows = list(CSVProcessor()._iter_csv_rows(csv_file))
+
+        assert rows == [
+            {"date": "2024-01-01", "amount": "3.50", "amount_2": "USD"},
+            {"date": "2024-01-02", "amount": "12.00", "amount_2": None},
+        ]
@@ -0,0 +1,153 @@
+"""
+Tests for point budgets and gap filling of date series
+"""
+import math
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from server.models.main import Statement, Transaction
+from server.services import aggregation
+from server.services.aggregation import aggregate_charts, aggregate_transactions
+from server.services.downsampling import fill_gaps, fitting_bucket, lttb
+from server.services.metadata import rebuild_transaction_metadata
+from server.services.report_data import TIME_SERIES_MAX_POINTS, widget_chart
+from server.services.result_cache import ResultCache
+
+START = date(2023, 1, 2)
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="series.csv", file_path="/tmp/series.csv", file_hash="series-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    # Two years of daily spending, skipping every seventh day
+    for index in range(730):
+        if index % 7 == 6:
+            continue
+        day = START + timedelta(days=index)
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content={
+                "date": day.isoformat(), "amount": round(100 + 50 * math.sin(index / 20), 2),
+                "currency": "USD" if index % 2 else "EUR"
+            },
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+@pytest.fixture(autouse=True)
+def no_shortcuts(monkeypatch):
+    monkeypatch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+    monkeypatch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+
+
+def test_lttb_keeps_ends_and_peaks():
+    xs = list(range(1000))
+    ys = [0.0] * 1000
+    ys[500] = 100.0
+    kept = lttb(xs, ys, 20)
+    assert len(kept) == 20
+    assert kept[0] == 0 and kept[-1] == 999
+    assert kept == sorted(kept)
+    assert 500 in kept
+    assert lttb(xs[:10], ys[:10], 20) == list(range(10))
+
+
+def test_fill_gaps_per_bucket():
+    assert fill_gaps(["2024-01-30", "2024-02-02"], None) == ["2024-01-30", "2024-01-31", "2024-02-01", "2024-02-02"]
+    assert fill_gaps(["2024-01-01", "2024-01-22"], "week") == ["2024-01-01", "2024-01-08", "2024-01-15", "2024-01-22"]
+    assert fill_gaps(["2023-11", "2024-02"], "month") == ["2023-11", "2023-12", "2024-01", "2024-02"]
+    # Stored values that aren't ISO dates are left alone
+    assert fill_gaps(["01/20/2024", "2024-01-05"], None) == ["01/20/2024", "2024-01-05"]
+
+
+def test_fitting_bucket_picks_finest_that_fits():
+    days = [(START + timedelta(days=index)).isoformat() for index in range(0, 90, 2)]
+    assert fitting_bucket(days, None, 100, False) is None
+    assert fitting_bucket(days, None, 80, True) == "week"
+    assert fitting_bucket(days, "day", 20, False) == "week"
+    assert fitting_bucket(days, "day", 5, False) == "month"
+    assert fitting_bucket(days, "day", 2, False) == "month"
+
+
+def test_long_series_moves_to_coarser_bucket(transactions):
+    result = aggregate_transactions(transactions, x_field="date", y_field="amount", max_points=120)
+    weekly = aggregate_transactions(transactions, x_field="date", y_field="amount", date_bucket="week")
+    assert result["date_bucket"] == "week"
+    assert result["downsampled"] is False
+    assert (result["labels"], result["values"]) == (weekly["labels"], weekly["values"])
+
+    result = aggregate_transactions(transactions, x_field="date", y_field="amount", max_points=30)
+    monthly = aggregate_transactions(transactions, x_field="date", y_field="amount", date_bucket="month")
+    assert result["date_bucket"] == "month"
+    assert result["values"] == monthly["values"]
+
+
+def test_series_beyond_months_is_downsampled(transactions):
+    monthly = aggregate_transactions(transactions, x_field="date", y_field="amount", date_bucket="month")
+    result = aggregate_transactions(transactions, x_field="date", y_field="amount", max_points=10)
+    assert result["downsampled"] is True
+    assert result["source_points"] == len(monthly["labels"])
+    assert len(result["labels"]) == 10
+    assert result["labels"][0] == monthly["labels"][0] and result["labels"][-1] == monthly["labels"][-1]
+    values = dict(zip(monthly["labels"], monthly["values"]))
+    assert all(values[label] == value for label, value in zip(result["labels"], result["values"]))
+    assert result["filtered_records"] == monthly["filtered_records"]
+
+
+def test_split_series_keep_shared_labels(transactions):
+    result = aggregate_transactions(
+        transactions, x_field="date", y_field="amount", date_bucket="week",
+        currency_field="currency", split_by_currency=True, max_points=40
+    )
+    assert result["date_bucket"] == "month"
+    assert len(result["labels"]) <= 40
+    assert all(len(values) == len(result["labels"]) for values in result["values_by_currency"].values())
+
+
+def test_fill_gaps_adds_empty_days(transactions):
+    plain = aggregate_transactions(transactions, x_field="date", y_field="amount", date_to="2023-01-31")
+    filled = aggregate_transactions(transactions, x_field="date", y_field="amount", date_to="2023-01-31", fill_gaps=True)
+    assert len(plain["labels"]) == 26
+    assert filled["labels"] == [(START + timedelta(days=index)).isoformat() for index in range(30)]
+    assert filled["values"][6] == 0
+    assert sum(filled["values"]) == pytest.approx(sum(plain["values"]))
+
+
+def test_other_charts_are_not_shaped(transactions):
+    result = aggregate_transactions(transactions, x_field="currency", y_field="amount", max_points=1, fill_gaps=True)
+    assert result["labels"] == ["EUR", "USD"]
+    assert "date_bucket" not in result
+
+
+def test_shaped_and_plain_charts_together(transactions):
+    charts = [
+        dict(x_field="date", y_field="amount", max_points=30),
+        dict(x_field="date", y_field="amount"),
+        dict(x_field="date", y_field="amount", aggregation="count", max_points=120, fill_gaps=True),
+    ]
+    shaped, plain, counted = aggregate_charts(transactions, charts)
+    assert shaped["date_bucket"] == "month"
+    assert len(plain["labels"]) == 626
+    assert counted["date_bucket"] == "week"
+    assert sum(counted["values"]) == 626
+
+
+def test_time_series_widgets_request_a_budget():
+    chart = widget_chart(
+        {"type": "chart", "config": {"chartType": "line", "x_field": "date", "y_field": "amount", "fill_gaps": True}},
+        {}, []
+    )
+    assert (chart["max_points"], chart["fill_gaps"]) == (TIME_SERIES_MAX_POINTS, True)
+    chart = widget_chart({"type": "chart", "config": {"chartType": "bar", "x_field": "date", "y_field": "amount"}}, {}, [])
+    assert "max_points" not in chart
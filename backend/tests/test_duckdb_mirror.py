@@ -0,0 +1,130 @@
+"""
+Tests for the DuckDB report mirror
+"""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from server.models.main import Statement, Transaction
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.duckdb_mirror import DuckDBMirror
+from server.services.metadata import bump_data_version, get_or_create_metadata, rebuild_transaction_metadata
+from server.services.result_cache import ResultCache
+
+
+ROWS = [
+    ({"date": "2024-01-05", "category": "Food", "amount": "10.5", "currency": "$"}, None),
+    ({"date": "01/20/2024", "Category": "Food", "amount": 4, "currency": "eur"}, None),
+    ({"date": "2024-01-25T08:00:00", "category": "Rent", "amount": 1000}, {"category": "Housing"}),
+    ({"date": "2024-02-03", "category": "Travel", "amount": "n/a", "Amount": 250, "currency": "USD"}, None),
+    ({"date": "garbage", "category": "Food", "amount": 7, "currency": "USD"}, None),
+    ({"category": 12, "amount": 3, "flag": True}, {"date": "2024-03-01"}),
+]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="mirror.csv", file_path="/tmp/mirror.csv", file_hash="mirror-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, (ingested, computed) in enumerate(ROWS):
+        _add(test_db, statement.id, index, ingested, computed)
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+def _add(db, statement_id, index, ingested, computed=None):
+    db.add(Transaction(
+        statement_id=statement_id,
+        ingested_content=ingested,
+        computed_content=computed,
+        ingested_content_hash=f"hash-{index}",
+        ingested_at=datetime.utcnow()
+    ))
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    mirror = DuckDBMirror(path=str(tmp_path / "mirror.duckdb"), enabled=True)
+    monkeypatch.setattr(aggregation, "duckdb_mirror", mirror)
+    monkeypatch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+    monkeypatch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+    yield mirror
+    mirror.close()
+
+
+def _in_sqlite(db, monkeypatch, **kwargs):
+    with monkeypatch.context() as patch:
+        patch.setattr(aggregation, "duckdb_mirror", DuckDBMirror(enabled=False))
+        return aggregate_transactions(db, **kwargs)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"x_field": "category", "y_field": "amount"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "avg"},
+    {"x_field": "currency", "y_field": "amount", "aggregation": "count"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "min"},
+    {"x_field": "date", "y_field": "amount", "aggregation": "max", "date_bucket": "month"},
+    {"x_field": "flag", "y_field": "amount"},
+    {"x_field": "date", "y_field": "amount"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "day"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "week"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "month", "date_from": "2024-01-10"},
+    {"x_field": "category", "y_field": "amount", "date_from": "2024-01-10", "date_to": "2024-01-31"},
+    {"x_field": "category", "y_field": "amount", "currency_field": "currency", "split_by_currency": True},
+])
+def test_duckdb_matches_sqlite(transactions, mirror, monkeypatch, kwargs):
+    result = aggregate_transactions(transactions, **kwargs)
+    assert mirror.queries == 1
+    assert result == _in_sqlite(transactions, monkeypatch, **kwargs)
+
+
+def test_filters_and_unknown_fields_stay_in_sqlite(transactions, mirror, monkeypatch):
+    for kwargs in [
+        {"x_field": "description", "y_field": "amount"},
+        {"x_field": "category", "y_field": "amount",
+         "filter_params": {"0": {"field": "category", "operator": "equals", "value": "Food"}}},
+    ]:
+        assert aggregate_transactions(transactions, **kwargs) == _in_sqlite(transactions, monkeypatch, **kwargs)
+    assert mirror.queries == 0
+
+
+def test_syncs_incrementally(transactions, mirror, monkeypatch):
+    aggregate_transactions(transactions, x_field="category", y_field="amount")
+
+    statement_id = transactions.query(Transaction).first().statement_id
+    _add(transactions, statement_id, 10, {"date": "2024-04-01", "category": "Food", "amount": 100})
+    bump_data_version(get_or_create_metadata(transactions))
+    transactions.commit()
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount")
+    assert (mirror.loads, mirror.refreshes) == (1, 1)
+    assert result == _in_sqlite(transactions, monkeypatch, x_field="category", y_field="amount")
+
+    transactions.query(Transaction).filter(Transaction.ingested_content_hash == "hash-4").delete()
+    bump_data_version(get_or_create_metadata(transactions))
+    transactions.commit()
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount")
+    assert mirror.loads == 2
+    assert result == _in_sqlite(transactions, monkeypatch, x_field="category", y_field="amount")
+    assert mirror.stats()["rows"] == len(ROWS)
+
+
+def test_state_survives_restart(transactions, mirror, tmp_path):
+    aggregate_transactions(transactions, x_field="category", y_field="amount")
+    mirror.close()
+
+    reopened = DuckDBMirror(path=mirror.path, enabled=True)
+    try:
+        assert reopened.sync(transactions)
+        assert reopened.loads == 0
+        assert reopened.version == mirror.version
+    finally:
+        reopened.close()
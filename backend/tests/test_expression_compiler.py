@@ -0,0 +1,64 @@
+"""
+Tests for compiling rule expressions into closures
+"""
+import ast
+
+import pytest
+
+from server.services.expression_compiler import compile_expression
+from server.services.formula_commands import command_registry
+
+COMMANDS = [command.name for command in command_registry.list_commands()]
+DATA = {"amount": 20, "description": "Coffee Shop", "category": "food"}
+
+
+def _run(expression, data=DATA, commands=COMMANDS):
+    return compile_expression(ast.parse(expression, mode='eval').body)(dict(data), commands)
+
+
+@pytest.mark.parametrize("expression,expected", [
+    ("amount > 10", True),
+    ("1 < amount < 30", True),
+    ("1 < amount > 30", False),
+    ("amount % 3 + 1 - 2 * 4 / 2", -1.0),
+    ("-amount", -20),
+    ("not amount", False),
+    ("amount > 30 or category == 'food'", True),
+    ("amount and 0", False),
+    ("description.contains('SHOP') and description.startswith('coffee')", True),
+    ("description.upper()", "COFFEE SHOP"),
+    ("'Shop' in description", True),
+    ("amount_to_float(amount) > 10", True),
+])
+def test_expressions(expression, expected):
+    assert _run(expression) == expected
+
+
+@pytest.mark.parametrize("expression,error", [
+    ("missing > 1", "Unknown variable: missing"),
+    ("amount ** 2", "Unsupported binary operator: Pow"),
+    ("amount is None", "Unsupported operator: Is"),
+    ("~amount", "Unsupported unary operator: Invert"),
+    ("description.replace('a', 'b')", "Unsupported method: replace"),
+    ("no_such_command(amount)", "Function not supported in conditions: no_such_command"),
+    ("(lambda: 1)()", "Complex function calls not supported in conditions"),
+    ("[amount]", "Unsupported AST node type: List"),
+])
+def test_unsupported_expressions_fail_when_evaluated(expression, error):
+    # Compiling succeeds; the error is raised like walking the tree would
+    compiled = compile_expression(ast.parse(expression, mode='eval').body)
+    with pytest.raises(ValueError, match=error.replace("(", r"\(")):
+        compiled(dict(DATA), COMMANDS)
+
+
+def test_operands_are_evaluated_before_failing():
+    with pytest.raises(ValueError, match="Unknown variable: missing"):
+        _run("missing ** 2")
+    with pytest.raises(ValueError, match="Unknown variable: missing"):
+        _run("amount_to_float(missing)", commands=[])
+
+
+def test_commands_follow_the_available_list():
+    assert _run("amount_to_float(amount)") == 20.0
+    with pytest.raises(ValueError, match="Function not supported in conditions"):
+        _run("amount_to_float(amount)", commands=[])
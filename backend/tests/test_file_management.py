@@ -0,0 +1,28 @@
+"""
+Tests for the file storage service
+"""
+import hashlib
+import io
+
+from server.services.file_management import FileStorageService
+
+
+def test_write_stream_hashes_while_writing(tmp_path, monkeypatch):
+    """Uploads are copied chunk by chunk and hashed in the same pass"""
+    monkeypatch.setattr("server.services.file_management.UPLOAD_CHUNK_SIZE", 7)
+    storage = FileStorageService(base_dir=str(tmp_path))
+    content = b"Date,Description,Amount\n2024-01-01,Coffee,3.50\n" * 10
+
+    temp_path, file_hash = storage.write_stream(io.BytesIO(content), ".csv")
+
+    assert temp_path.read_bytes() == content
+    assert file_hash == hashlib.sha256(content).hexdigest()
+    assert file_hash == storage.calculate_file_hash(temp_path)
+    assert not (tmp_path / "raw_data_dir").exists()
+
+    final_path = storage.commit_file(temp_path, "my statement?.csv")
+
+    assert final_path.parent.parent == tmp_path / "raw_data_dir"
+    assert final_path.name == "my statement.csv"
+    assert final_path.read_bytes() == content
+    assert not temp_path.exists()
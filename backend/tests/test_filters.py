@@ -0,0 +1,123 @@
+"""
+Tests for compiled field filters
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from server.models.main import Statement, Transaction
+from server.services.filters import compile_filters, parse_field_filters
+from server.services.metadata import rebuild_transaction_metadata
+from server.services.sql_functions import prepare_sql
+
+
+ROWS = [
+    ({"merchant": "Amazon", "amount": "12.50", "note": "Books"}, None),
+    ({"merchant": "amazon", "amount": 100, "note": "Prime"}, {"amount": 90}),
+    ({"Merchant": "Grocer", "amount": -5, "note": None}, None),
+    ({"merchant": "Airline", "amount": "n/a"}, {"note": "Refund pending"}),
+    ({"amount": 7}, None),
+]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="filters.csv", file_path="/tmp/filters.csv", file_hash="filters-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, (ingested, computed) in enumerate(ROWS):
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content=ingested,
+            computed_content=computed,
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+def _matching_hashes(db, filters):
+    """Hashes of the matching rows through SQL and through the Python predicate"""
+    sql = prepare_sql(db)
+    from_sql = {
+        row[0] for row in db.execute(
+            text(f"SELECT ingested_content_hash FROM transactions WHERE {filters.to_sql(sql)}"), sql.params
+        )
+    }
+    passes = filters.to_python()
+    from_python = {
+        t.ingested_content_hash for t in db.query(Transaction)
+        if passes({**(t.ingested_content or {}), **(t.computed_content or {})})
+    }
+    return from_sql, from_python
+
+
+@pytest.mark.parametrize("params,count,connector", [
+    ({"filter_0_field": "merchant", "filter_0_operator": "equals", "filter_0_value": "AMAZON"}, 0, "AND"),
+    ({"filter_0_field": "amount", "filter_0_operator": "gt", "filter_0_value": "10"}, 0, "AND"),
+    ({"filter_0_field": "amount", "filter_0_operator": "lte", "filter_0_value": "abc"}, 0, "AND"),
+    ({"filter_0_field": "amount", "filter_0_operator": "not_equals", "filter_0_value": "90.0"}, 0, "AND"),
+    ({"filter_0_field": "note", "filter_0_operator": "contains", "filter_0_value": "END"}, 0, "AND"),
+    ({"filter_0_field": "merchant", "filter_0_operator": "startswith", "filter_0_value": "a",
+      "filter_1_field": "amount", "filter_1_operator": "lt", "filter_1_value": "50"}, 1, "AND"),
+    ({"filter_0_field": "merchant", "filter_0_operator": "endswith", "filter_0_value": "cer",
+      "filter_1_field": "note", "filter_1_operator": "equals", "filter_1_value": "books"}, 1, "OR"),
+    ({"filter_0_field": "merchant", "filter_0_operator": "equals", "filter_0_value": "",
+      "filter_1_field": "amount", "filter_1_operator": "gte", "filter_1_value": "7"}, 1, "OR"),
+    ({"filter_0_field": "merchant", "filter_0_operator": "bogus", "filter_0_value": "x"}, 0, "AND"),
+])
+def test_sql_matches_python(transactions, params, count, connector):
+    filters = compile_filters(parse_field_filters(params), count, connector)
+    from_sql, from_python = _matching_hashes(transactions, filters)
+    assert from_sql == from_python
+
+
+def test_filter_semantics(transactions):
+    filters = compile_filters(parse_field_filters({
+        "filter_0_field": "MERCHANT", "filter_0_operator": "equals", "filter_0_value": "amazon"
+    }))
+    assert _matching_hashes(transactions, filters)[0] == {"hash-0", "hash-1"}
+
+    # Computed content wins over ingested content
+    filters = compile_filters({"0": {"field": "amount", "operator": "gte", "value": "95"}})
+    assert _matching_hashes(transactions, filters)[0] == set()
+
+
+def test_incomplete_groups_let_everything_through():
+    filters = compile_filters({"0": {"field": "merchant", "operator": "equals", "value": ""}})
+    assert not filters.active
+    assert filters.to_python()({"merchant": "anything"})
+
+
+def test_key_ignores_filter_order():
+    first = compile_filters({
+        "0": {"field": "a", "operator": "equals", "value": "1"},
+        "1": {"field": "b", "operator": "gt", "value": "2"},
+    })
+    second = compile_filters({
+        "0": {"field": "b", "operator": "gt", "value": "2"},
+        "1": {"field": "a", "operator": "equals", "value": "1"},
+    })
+    assert first.key() == second.key()
+
+    # The connector only matters when both groups are present
+    only_global = {"0": {"field": "a", "operator": "equals", "value": "1"}}
+    assert compile_filters(only_global, 1, "OR").key() == compile_filters(only_global, 1, "AND").key()
+
+
+def test_filtered_transactions_endpoint(client, transactions):
+    response = client.get("/api/transactions/filtered", params={
+        "filter_0_field": "merchant", "filter_0_operator": "equals", "filter_0_value": "amazon",
+        "filter_1_field": "amount", "filter_1_operator": "gt", "filter_1_value": "50",
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    assert data["transactions"][0]["computed_content"] == {"amount": 90}
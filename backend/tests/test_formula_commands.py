@@ -34,6 +34,19 @@ class TestFormulaCommands:
         for expected_cmd in expected_commands:
             assert expected_cmd in command_names, f"Command {expected_cmd} not found in registry"
     
+    def test_command_names_follow_registrations(self):
+        """Command names are built once and rebuilt when a command is registered"""
+        from server.services.formula_commands.base import CommandRegistry
+        
+        registry = CommandRegistry()
+        assert registry.command_names() == []
+        registry.register(type(command_registry.get_command('add')))
+        names = registry.command_names()
+        assert names == ['add'] and registry.command_names() is names
+        registry.register(type(command_registry.get_command('divide')))
+        assert registry.command_names() == ['add', 'divide']
+        assert command_registry.command_names() == [cmd.name for cmd in command_registry.list_commands()]
+    
     def test_date_infer_command(self):
         """Test date_infer command with various date formats"""
         command = command_registry.get_command('date_infer')
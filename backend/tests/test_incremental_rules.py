@@ -0,0 +1,170 @@
+"""
+Tests for incremental rule execution
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from server.models.configurations import Base as ConfigBase, ComputedFieldRule
+from server.models.main import RuleSetFingerprint, Statement, Transaction
+from server.routers.rules import RuleExecuteRequest, execute_rules
+from server.services.incremental_rules import computed_content_stamp, plan_execution
+from server.services.rule_graph import RuleGraph
+
+
+def _rule(name, target, condition="", action="1", rule_type="formula", priority=10):
+    return ComputedFieldRule(
+        id=name, name=name, target_field=target, condition=condition, action=action,
+        rule_type=rule_type, priority=priority, active=True, updated_at=datetime(2024, 1, 1)
+    )
+
+
+def test_target_fingerprints_follow_dependencies():
+    rules = [
+        _rule("amount", "amount_value", action="amount_to_float(amount)"),
+        _rule("fee", "fee", action="amount_value * 0.1"),
+        _rule("label", "label", condition="description == 'x'", action="'x'", rule_type="value_assignment"),
+    ]
+    before = RuleGraph(rules).target_fingerprints()
+    assert before == RuleGraph(rules).target_fingerprints()
+
+    rules[0].action = "amount_to_float(amount) * 2"
+    after = RuleGraph(rules).target_fingerprints()
+    # The fee reads the amount, so its fingerprint changes with it
+    assert {target for target in after if after[target] != before[target]} == {"amount_value", "fee"}
+
+
+@pytest.fixture
+def rules_db(test_db, test_engine):
+    ConfigBase.metadata.create_all(bind=test_engine)
+    statement = Statement(
+        filename="incremental.csv", file_path="/tmp/incremental.csv", file_hash="incremental-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, amount in enumerate(["$10.00", "$250.00", "$40.00"]):
+        test_db.add(Transaction(
+            statement_id=statement.id, ingested_content={"amount": amount, "description": f"row {index}"},
+            ingested_content_hash=f"incremental-{index}", ingested_at=datetime.utcnow()
+        ))
+    test_db.add_all([
+        _rule("amount", "amount_value", action="amount_to_float(amount)", priority=1),
+        _rule("fee", "fee", condition="amount_value > 20", action="amount_value * 0.1", priority=2),
+        _rule("label", "label", action="'row'", rule_type="value_assignment", priority=3),
+    ])
+    test_db.commit()
+    yield test_db
+    test_db.rollback()
+    ConfigBase.metadata.drop_all(bind=test_engine)
+
+
+def _execute(db, **options):
+    return asyncio.run(execute_rules(RuleExecuteRequest(**options), config_db=db, main_db=db))
+
+
+def _contents(db):
+    return {
+        transaction.ingested_content_hash: transaction.computed_content
+        for transaction in db.query(Transaction).all()
+    }
+
+
+def test_fresh_transactions_are_skipped(rules_db):
+    first = _execute(rules_db, incremental=True)
+    assert first.success and first.processed_transactions == 3 and first.skipped_transactions == 0
+    assert _contents(rules_db)["incremental-1"]["fee"] == 25.0
+
+    rule_set = RuleGraph(rules_db.query(ComputedFieldRule).order_by(ComputedFieldRule.priority).all()).fingerprint()
+    assert rules_db.get(RuleSetFingerprint, rule_set) is not None
+    for transaction in rules_db.query(Transaction).all():
+        assert transaction.computed_content_hash == computed_content_stamp(rule_set, transaction.ingested_content_hash)
+
+    second = _execute(rules_db, incremental=True)
+    assert second.processed_transactions == 0 and second.skipped_transactions == 3
+    assert second.updated_fields == {}
+
+
+def test_full_runs_stamp_transactions(rules_db):
+    _execute(rules_db)
+    assert _execute(rules_db, incremental=True).skipped_transactions == 3
+
+    # Runs limited to some rules don't stamp
+    rules_db.query(Transaction).update({Transaction.computed_content_hash: None})
+    rules_db.commit()
+    _execute(rules_db, target_fields=["label"])
+    assert {transaction.computed_content_hash for transaction in rules_db.query(Transaction).all()} == {None}
+
+
+def test_changed_rule_recomputes_its_targets(rules_db):
+    _execute(rules_db, incremental=True)
+    rules_db.get(ComputedFieldRule, "fee").action = "amount_value * 0.5"
+    rules_db.commit()
+
+    graph = RuleGraph(rules_db.query(ComputedFieldRule).order_by(ComputedFieldRule.priority).all())
+    plan = plan_execution(rules_db, graph)
+    assert list(plan.work) == [frozenset({"fee"})] and plan.stale == 3
+
+    result = _execute(rules_db, incremental=True)
+    assert result.processed_transactions == 3
+    # Only the fee of the rows the rule matches changes
+    assert result.updated_fields == {"fee": 2}
+    assert {key: content["fee"] for key, content in _contents(rules_db).items() if "fee" in content} == {
+        "incremental-1": 125.0, "incremental-2": 20.0
+    }
+    assert _execute(rules_db, incremental=True).skipped_transactions == 3
+
+
+def test_changed_input_recomputes_dependents(rules_db):
+    _execute(rules_db, incremental=True)
+    rules_db.get(ComputedFieldRule, "amount").action = "amount_to_float(amount) * 2"
+    rules_db.commit()
+
+    graph = RuleGraph(rules_db.query(ComputedFieldRule).order_by(ComputedFieldRule.priority).all())
+    assert list(plan_execution(rules_db, graph).work) == [frozenset({"amount_value", "fee"})]
+    result = _execute(rules_db, incremental=True)
+    assert result.updated_fields["amount_value"] == 3
+    assert "label" not in result.updated_fields
+    assert _contents(rules_db)["incremental-2"]["fee"] == 8.0
+
+
+def test_removed_target_keeps_its_values(rules_db):
+    _execute(rules_db, incremental=True)
+    rules_db.get(ComputedFieldRule, "label").active = False
+    rules_db.commit()
+
+    result = _execute(rules_db, incremental=True)
+    assert result.success and result.processed_transactions == 3 and result.updated_fields == {}
+    assert {content["label"] for content in _contents(rules_db).values()} == {"row"}
+    assert _execute(rules_db, incremental=True).skipped_transactions == 3
+
+
+def test_new_and_changed_transactions_run_every_rule(rules_db):
+    _execute(rules_db, incremental=True)
+    statement = rules_db.query(Statement).first()
+    rules_db.add(Transaction(
+        statement_id=statement.id, ingested_content={"amount": "$90.00"},
+        ingested_content_hash="incremental-new", ingested_at=datetime.utcnow()
+    ))
+    changed = rules_db.query(Transaction).filter(Transaction.ingested_content_hash == "incremental-0").one()
+    changed.ingested_content = {"amount": "$30.00"}
+    changed.ingested_content_hash = "incremental-0-edited"
+    rules_db.commit()
+
+    graph = RuleGraph(rules_db.query(ComputedFieldRule).order_by(ComputedFieldRule.priority).all())
+    plan = plan_execution(rules_db, graph)
+    assert list(plan.work) == [None] and plan.stale == 2 and plan.skipped == 2
+
+    result = _execute(rules_db, incremental=True)
+    assert result.processed_transactions == 2 and result.skipped_transactions == 2
+    contents = _contents(rules_db)
+    assert contents["incremental-new"]["label"] == "row"
+    assert contents["incremental-0-edited"]["fee"] == 3.0
+
+
+def test_incremental_runs_every_rule(rules_db):
+    with pytest.raises(HTTPException) as error:
+        _execute(rules_db, incremental=True, target_fields=["fee"])
+    assert error.value.status_code == 400
@@ -0,0 +1,127 @@
+"""
+Tests for the incremental column metadata registry
+"""
+from server.models.main import Statement, Transaction, TransactionMetadata
+from server.services.csv_processor import CSVProcessor
+from server.services.metadata import adjust_column_counts, rebuild_transaction_metadata
+
+
+def _process(db, tmp_path, name, content):
+    csv_file = tmp_path / name
+    csv_file.write_text(content)
+    statement = Statement(
+        filename=name,
+        file_path=str(csv_file),
+        file_hash=f"hash-{name}",
+        mime_type="text/csv",
+        processed=False
+    )
+    db.add(statement)
+    db.commit()
+    db.refresh(statement)
+    CSVProcessor().process_statement(statement, db)
+    return statement
+
+
+def test_ingestion_counts_columns(test_db, tmp_path):
+    """Each stored row is counted once per column; duplicates are not counted"""
+    _process(test_db, tmp_path, "a.csv", "Date,Amount\n2024-01-01,1\n2024-01-02,2\n2024-01-02,2\n")
+    _process(test_db, tmp_path, "b.csv", "Date,Amount,Currency\n2024-01-03,3,EUR\n")
+
+    meta = test_db.query(TransactionMetadata).one()
+    assert meta.ingested_column_counts == {"date": 3, "amount": 3, "currency": 1, "statement_filename": 3}
+    assert set(meta.ingested_columns) == {"date", "amount", "currency", "statement_filename"}
+    assert meta.computed_column_counts == {}
+
+
+def test_negative_deltas_drop_columns(test_db, tmp_path):
+    """Columns disappear once no stored row carries them"""
+    _process(test_db, tmp_path, "b.csv", "Date,Amount,Currency\n2024-01-03,3,EUR\n2024-01-04,4,USD\n")
+    adjust_column_counts(test_db, computed={"category": 2})
+
+    adjust_column_counts(test_db, ingested={"currency": -2}, computed={"category": -1})
+
+    meta = test_db.query(TransactionMetadata).one()
+    assert "currency" not in meta.ingested_columns
+    assert meta.ingested_column_counts["amount"] == 2
+    assert meta.computed_column_counts == {"category": 1}
+    assert set(meta.computed_columns) == {"category"}
+
+
+def test_legacy_registry_is_rebuilt(test_db, tmp_path):
+    """A registry without counts is recounted from the stored rows"""
+    _process(test_db, tmp_path, "a.csv", "Date,Amount\n2024-01-01,1\n2024-01-02,2\n")
+    transaction = test_db.query(Transaction).first()
+    transaction.computed_content = {"category": "Food"}
+    meta = test_db.query(TransactionMetadata).one()
+    meta.ingested_column_counts = None
+    meta.computed_column_counts = None
+    test_db.commit()
+
+    rebuild_transaction_metadata(test_db)
+
+    assert meta.ingested_column_counts == {"date": 2, "amount": 2, "statement_filename": 2}
+    assert meta.computed_column_counts == {"category": 1}
+    assert meta.computed_columns == {"category": True}
+
+
+def test_deleting_statement_updates_metadata_endpoint(client, tmp_path):
+    """Deleting a statement removes the columns only it had"""
+    ids = []
+    for name, content in (
+        ("meta_a.csv", b"Date,Amount\n2023-06-01,1.00\n"),
+        ("meta_b.csv", b"Date,Amount,Reference\n2023-06-02,2.00,INV-1\n"),
+    ):
+        upload = client.post("/api/statements/upload", files={"file": (name, content, "text/csv")})
+        assert upload.status_code == 201
+        ids.append(upload.json()["statement_id"])
+        assert client.post(f"/api/statements/{ids[-1]}/process?wait=true").status_code == 200
+
+    data = client.get("/api/transactions/metadata").json()
+    assert data["ingested_column_counts"]["amount"] == 2
+    assert data["ingested_column_counts"]["reference"] == 1
+
+    assert client.delete(f"/api/statements/{ids[1]}").status_code == 200
+
+    data = client.get("/api/transactions/metadata").json()
+    assert "reference" not in data["ingested_columns"]
+    assert data["ingested_column_counts"]["amount"] == 1
+
+    assert client.delete("/api/transactions/").status_code == 200
+    data = client.get("/api/transactions/metadata").json()
+    assert data["ingested_columns"] == {}
+
+
+def test_currency_fields_detected_on_write(test_db, tmp_path):
+    """Currency fields are classified by name and by values while ingesting"""
+    _process(test_db, tmp_path, "a.csv", "Date,Amount,Unit\n2024-01-01,1,EUR\n")
+    meta = test_db.query(TransactionMetadata).one()
+    assert meta.currency_fields == ["unit"]
+
+    _process(test_db, tmp_path, "b.csv", "Date,Amount,Account Currency\n2024-01-02,2,n/a\n")
+    assert meta.currency_fields == ["unit", "account_currency"]
+
+    # A computed field picks up currency values during rule execution
+    adjust_column_counts(test_db, computed={"fx": 1}, sample_rows=[{"fx": "£"}])
+    assert meta.currency_fields == ["unit", "account_currency", "fx"]
+
+    adjust_column_counts(test_db, ingested={"unit": -1})
+    assert meta.currency_fields == ["account_currency", "fx"]
+
+
+def test_metadata_refresh_endpoint(client, tmp_path):
+    """The refresh endpoint reclassifies currency fields from stored rows"""
+    upload = client.post(
+        "/api/statements/upload",
+        files={"file": ("fx.csv", b"Date,Amount,Code\n2023-07-01,1.00,USD\n", "text/csv")}
+    )
+    statement_id = upload.json()["statement_id"]
+    assert client.post(f"/api/statements/{statement_id}/process?wait=true").status_code == 200
+
+    assert client.get("/api/transactions/metadata").json()["currency_fields"] == ["code"]
+
+    response = client.post("/api/transactions/metadata/refresh")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["currency_fields"] == ["code"]
+    assert data["ingested_column_counts"]["code"] == 1
@@ -0,0 +1,148 @@
+"""
+Tests for computing all widgets of a report together
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from server.models.main import Report, Statement, Transaction
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.metadata import rebuild_transaction_metadata
+from server.services.report_data import compute_report_data, widget_chart
+from server.services.result_cache import ResultCache
+
+
+ROWS = [
+    {"date": "2024-01-05", "category": "Food", "amount": 10.5, "currency": "USD", "account": "checking"},
+    {"date": "2024-01-20", "category": "Food", "amount": 4, "currency": "EUR", "account": "savings"},
+    {"date": "2024-01-25", "category": "Rent", "amount": 1000, "currency": "EUR", "account": "checking"},
+    {"date": "2024-02-03", "category": "Travel", "amount": 250, "currency": "USD", "account": "card"},
+    {"date": "2024-03-01", "category": "Food", "amount": 7, "currency": "USD", "account": "card"},
+]
+
+FOOD = {"field": "category", "operator": "equals", "value": "Food"}
+CHECKING = {"field": "account", "operator": "equals", "value": "checking"}
+
+WIDGETS = [
+    {"id": "by-category", "type": "chart", "config": {"x_field": "category", "y_field": "amount"}},
+    {"id": "monthly", "type": "chart", "config": {"x_field": "date", "y_field": "amount", "aggregation": "avg"}},
+    {"id": "split", "type": "chart", "config": {
+        "x_field": "category", "y_field": "amount", "currency_mode": "field",
+        "currency_field": "currency", "split_by_currency": True
+    }},
+    {"id": "checking-only", "type": "chart", "config": {
+        "x_field": "category", "y_field": "amount", "aggregation": "count",
+        "localFilters": {"fieldFilters": [CHECKING]}
+    }},
+    {"id": "food-or-checking", "type": "chart", "config": {
+        "x_field": "account", "y_field": "amount",
+        "localFilters": {"fieldFilters": [CHECKING]}, "filter_combine_mode": "OR"
+    }},
+    {"id": "total", "type": "stats", "config": {"y_field": "amount", "aggregation": "avg"}},
+    {"id": "notes", "type": "text", "config": {"content": "Not aggregated"}},
+]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="report-data.csv", file_path="/tmp/report-data.csv", file_hash="report-data-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, row in enumerate(ROWS):
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content=row,
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+@pytest.fixture(autouse=True)
+def no_shortcuts(monkeypatch):
+    # Every widget is computed from the transactions
+    monkeypatch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+    monkeypatch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+
+
+def _report(db, filters):
+    report = Report(name="Dashboard", widgets=WIDGETS, filters=filters)
+    db.add(report)
+    db.commit()
+    return report
+
+
+def _expected(report):
+    date_range = report.filters.get("dateRange", {})
+    global_filters = report.filters.get("globalFilters", {}).get("fieldFilters", [])
+    return {
+        str(widget["id"]): chart
+        for widget in WIDGETS
+        if (chart := widget_chart(widget, date_range, global_filters)) is not None
+    }
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"dateRange": {"from": "2024-01-10", "to": "2024-02-28", "dateField": "date"}},
+    {"globalFilters": {"fieldFilters": [FOOD]}},
+    {"dateRange": {"from": "2024-01-01"}, "globalFilters": {"fieldFilters": [FOOD, {"field": "amount", "value": ""}]}},
+])
+def test_report_widgets_match_single_charts(transactions, filters):
+    report = _report(transactions, filters)
+    data = compute_report_data(transactions, report)
+
+    expected = _expected(report)
+    assert set(data["widgets"]) == set(expected)
+    for widget_id, chart in expected.items():
+        assert data["widgets"][widget_id] == aggregate_transactions(transactions, **chart), widget_id
+
+
+def test_widgets_share_one_scan(transactions):
+    report = _report(transactions, {"globalFilters": {"fieldFilters": [FOOD]}})
+    scans = []
+
+    def count_scans(conn, cursor, statement, parameters, context, executemany):
+        # The total record count is answered from the primary key index
+        if "FROM transactions" in statement and not statement.startswith("SELECT count("):
+            scans.append(statement)
+
+    engine = transactions.get_bind()
+    event.listen(engine, "before_cursor_execute", count_scans)
+    try:
+        compute_report_data(transactions, report)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_scans)
+
+    assert len(scans) == 1
+
+
+def test_stats_widget_mirrors_its_request(transactions):
+    chart = widget_chart(WIDGETS[5], {"from": "2024-01-01"}, [])
+    assert chart["x_field"] == "category"
+    assert chart["aggregation"] == "sum"
+    assert chart["date_from"] == "2024-01-01"
+
+
+def test_report_data_endpoint(client, transactions):
+    report = _report(transactions, {"dateRange": {"from": "2024-01-01", "to": "2024-01-31"}})
+
+    response = client.get(f"/api/reports/{report.id}/data")
+    assert response.status_code == 200
+    widgets = response.json()["widgets"]
+    assert widgets["by-category"]["labels"] == ["Food", "Rent"]
+    assert widgets["by-category"]["values"] == [14.5, 1000]
+
+    # Query parameters override the saved date range
+    response = client.get(f"/api/reports/{report.id}/data", params={"date_from": "2024-02-01", "date_to": ""})
+    assert response.json()["widgets"]["by-category"]["labels"] == ["Food", "Travel"]
+
+    assert client.get("/api/reports/missing/data").status_code == 404
@@ -459,6 +459,30 @@ class TestEdgeCases:
         # Current implementation defaults to sum
         assert response.status_code == 200
 
+    def test_aggregate_top_n(self, client, sample_transactions):
+        """Test keeping the largest groups and folding the rest into Other"""
+        response = client.get("/api/reports/data/aggregated/", params={
+            "x_field": "category",
+            "y_field": "amount",
+            "top_n": 1
+        })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["labels"] == ["Food", "Other"]
+        assert data["values"] == [250.5, 125.25]
+        assert data["other_groups"] == 2
+
+    def test_aggregate_invalid_order_by(self, client, sample_transactions):
+        """Test aggregation with an unknown label order"""
+        response = client.get("/api/reports/data/aggregated/", params={
+            "x_field": "category",
+            "y_field": "amount",
+            "order_by": "random"
+        })
+
+        assert response.status_code == 400
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
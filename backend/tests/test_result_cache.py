@@ -0,0 +1,128 @@
+"""
+Tests for the versioned report result cache
+"""
+from datetime import datetime
+
+import pytest
+
+from server.models.main import Statement, Transaction
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.metadata import adjust_column_counts, get_data_version, rebuild_transaction_metadata
+from server.services.result_cache import ResultCache
+
+
+def test_lru_eviction_within_budget():
+    cache = ResultCache(max_bytes=40)
+    cache.put("v1", "a", {"values": [1]})
+    cache.put("v1", "b", {"values": [2]})
+    assert cache.get("v1", "a") == {"values": [1]}
+
+    # "b" is now least recently used
+    cache.put("v1", "c", {"values": [3]})
+    assert cache.get("v1", "b") is None
+    assert cache.get("v1", "a") == {"values": [1]}
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["size_bytes"] <= 40
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_new_version_drops_old_entries():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("v1", "a", {"values": [1]})
+    cache.put("v2", "a", {"values": [2]})
+
+    assert cache.get("v1", "a") is None
+    assert cache.get("v2", "a") == {"values": [2]}
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cached_results_are_copies():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("v1", "a", {"values": [1]})
+    cache.get("v1", "a")["values"].append(2)
+    assert cache.get("v1", "a") == {"values": [1]}
+
+
+def test_oversized_results_are_not_cached():
+    cache = ResultCache(max_bytes=10)
+    cache.put("v1", "a", {"values": list(range(100))})
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResultCache(max_bytes=1024 * 1024)
+    monkeypatch.setattr(aggregation, "report_cache", cache)
+    # Rows are written by hand below, without rollup maintenance
+    monkeypatch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+    return cache
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="cache.csv", file_path="/tmp/cache.csv", file_hash="cache-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, amount in enumerate([10, 20, 30]):
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content={"category": "Food", "amount": amount},
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return statement
+
+
+def test_repeated_queries_hit_the_cache(test_db, transactions, cache):
+    first = aggregate_transactions(test_db, x_field="category", y_field="amount")
+    second = aggregate_transactions(test_db, x_field="category", y_field="amount")
+
+    assert first == second
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_filter_order_does_not_matter(test_db, transactions, cache):
+    food = {"field": "category", "operator": "equals", "value": "Food"}
+    large = {"field": "amount", "operator": "gt", "value": "15"}
+    aggregate_transactions(test_db, x_field="category", y_field="amount", filter_params={"0": food, "1": large})
+    aggregate_transactions(test_db, x_field="category", y_field="amount", filter_params={"0": large, "1": food})
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_writes_invalidate_cached_results(test_db, transactions, cache):
+    version = get_data_version(test_db)
+    assert aggregate_transactions(test_db, x_field="category", y_field="amount")["values"] == [60]
+
+    test_db.add(Transaction(
+        statement_id=transactions.id,
+        ingested_content={"category": "Food", "amount": 5},
+        ingested_content_hash="hash-new",
+        ingested_at=datetime.utcnow()
+    ))
+    test_db.flush()
+    adjust_column_counts(test_db, ingested={"category": 1, "amount": 1})
+    test_db.commit()
+
+    assert get_data_version(test_db) != version
+    assert aggregate_transactions(test_db, x_field="category", y_field="amount")["values"] == [65]
+    assert cache.hits == 0
+
+
+def test_cache_stats_endpoint(client):
+    response = client.get("/api/reports/data/cache/")
+    assert response.status_code == 200
+    assert {"entries", "size_bytes", "max_bytes", "hits", "misses", "evictions"} <= set(response.json())
+
+    response = client.delete("/api/reports/data/cache/")
+    assert response.status_code == 200
+    assert response.json()["entries"] == 0
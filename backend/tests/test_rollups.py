@@ -0,0 +1,166 @@
+"""
+Tests for report rollups and their incremental maintenance
+"""
+from datetime import datetime
+
+import pytest
+
+from server.models.main import ReportRollup, ReportRollupCell, Statement, Transaction
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.result_cache import ResultCache
+from server.services.csv_processor import CSVProcessor
+from server.services.metadata import rebuild_transaction_metadata
+from server.services.rollups import apply_rollup_changes, collect_rollup_cells, reset_rollups
+
+
+ROWS = [
+    {"date": "2024-01-01", "category": "Food", "amount": 10.5, "currency": "USD"},
+    {"date": "2024-01-02", "category": "Food", "amount": 4.25, "currency": "$"},
+    {"date": "2024-01-09", "category": "Rent", "amount": 1000, "currency": "EUR"},
+    {"date": "01/31/2024", "category": "Food", "amount": "2.5", "currency": "EUR"},
+    {"date": "2024-02-14", "category": "Travel", "amount": 250},
+    {"date": "unknown", "category": "Food", "amount": 8},
+]
+
+
+@pytest.fixture
+def statement(test_db):
+    statement = Statement(
+        filename="rollups.csv",
+        file_path="/tmp/rollups.csv",
+        file_hash="rollups-hash",
+        mime_type="text/csv",
+        processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, row in enumerate(ROWS):
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content=row,
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return statement
+
+
+@pytest.fixture(autouse=True)
+def no_result_cache(monkeypatch):
+    # Rollups are maintained by hand here, without bumping the data version
+    monkeypatch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+
+
+def _scan(db, monkeypatch, **kwargs):
+    """Aggregate straight from the transactions, bypassing rollups"""
+    with monkeypatch.context() as patch:
+        patch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+        return aggregate_transactions(db, **kwargs)
+
+
+CHARTS = [
+    {"x_field": "category", "y_field": "amount"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "avg"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "count"},
+    {"x_field": "category", "y_field": "amount", "aggregation": "min"},
+    {"x_field": "date", "y_field": "amount", "aggregation": "max", "date_bucket": "month"},
+    {"x_field": "category", "y_field": "amount", "date_from": "2024-01-02", "date_to": "2024-01-31"},
+    {"x_field": "date", "y_field": "amount"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "week"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "month"},
+    {"x_field": "category", "y_field": "amount", "currency_field": "currency", "split_by_currency": True},
+]
+
+
+@pytest.mark.parametrize("kwargs", CHARTS)
+def test_rollup_matches_scan(test_db, statement, monkeypatch, kwargs):
+    from_rollup = aggregate_transactions(test_db, **kwargs)
+    assert test_db.query(ReportRollup).count() == 1
+    assert from_rollup == _scan(test_db, monkeypatch, **kwargs)
+
+
+def test_unsplit_charts_share_a_currency_rollup(test_db, statement):
+    aggregate_transactions(test_db, x_field="category", y_field="amount", currency_field="currency", split_by_currency=True)
+    aggregate_transactions(test_db, x_field="category", y_field="amount")
+    assert test_db.query(ReportRollup).count() == 1
+
+
+def test_filtered_charts_skip_rollups(test_db, statement):
+    aggregate_transactions(
+        test_db, x_field="category", y_field="amount",
+        filter_params={"0": {"field": "category", "operator": "equals", "value": "Food"}}
+    )
+    assert test_db.query(ReportRollup).count() == 0
+
+
+def test_rollup_follows_ingestion(test_db, statement, monkeypatch, tmp_path):
+    for kwargs in CHARTS:
+        aggregate_transactions(test_db, **kwargs)
+
+    csv_file = tmp_path / "more.csv"
+    csv_file.write_text("Date,Category,Amount,Currency\n2024-01-02,Food,1.5,USD\n2024-03-01,Books,20,GBP\n")
+    new_statement = Statement(
+        filename="more.csv", file_path=str(csv_file), file_hash="more-hash",
+        mime_type="text/csv", processed=False
+    )
+    test_db.add(new_statement)
+    test_db.commit()
+    CSVProcessor().process_statement(new_statement, test_db)
+
+    for kwargs in CHARTS:
+        assert aggregate_transactions(test_db, **kwargs) == _scan(test_db, monkeypatch, **kwargs)
+
+
+def test_rollup_follows_computed_changes(test_db, statement, monkeypatch):
+    kwargs = {"x_field": "category", "y_field": "amount", "currency_field": "currency", "split_by_currency": True}
+    aggregate_transactions(test_db, **kwargs)
+
+    # Move the largest amount to another category, the way rule execution does
+    transaction = test_db.query(Transaction).filter(Transaction.ingested_content_hash == "hash-2").one()
+    previous = [(transaction.ingested_content, transaction.computed_content)]
+    transaction.computed_content = {"category": "Housing", "amount": "999.5"}
+    test_db.flush()
+    apply_rollup_changes(
+        test_db,
+        added=collect_rollup_cells(test_db, contents=[(transaction.ingested_content, transaction.computed_content)]),
+        removed=collect_rollup_cells(test_db, contents=previous)
+    )
+    test_db.commit()
+
+    assert aggregate_transactions(test_db, **kwargs) == _scan(test_db, monkeypatch, **kwargs)
+    assert test_db.query(ReportRollupCell).filter(ReportRollupCell.label == "Rent").count() == 0
+
+
+def test_rollup_repairs_extremes_on_delete(test_db, statement):
+    test_db.add(Transaction(
+        statement_id=statement.id,
+        ingested_content={"date": "2024-01-01", "category": "Food", "amount": 3},
+        ingested_content_hash="hash-extra",
+        ingested_at=datetime.utcnow()
+    ))
+    test_db.commit()
+    aggregate_transactions(test_db, x_field="category", y_field="amount")
+
+    cell = test_db.query(ReportRollupCell).filter_by(day="2024-01-01", label="Food").one()
+    assert (cell.row_count, cell.value_min, cell.value_max) == (2, 3, 10.5)
+
+    # Deleting the cell's maximum recomputes it from the remaining rows
+    transaction = test_db.query(Transaction).filter(Transaction.ingested_content_hash == "hash-0").one()
+    removed = collect_rollup_cells(test_db, contents=[(transaction.ingested_content, transaction.computed_content)])
+    test_db.delete(transaction)
+    test_db.flush()
+    apply_rollup_changes(test_db, removed=removed)
+    test_db.commit()
+
+    cell = test_db.query(ReportRollupCell).filter_by(day="2024-01-01", label="Food").one()
+    assert (cell.row_count, cell.value_sum, cell.value_min, cell.value_max) == (1, 3, 3, 3)
+
+
+def test_reset_rollups(test_db, statement):
+    aggregate_transactions(test_db, x_field="category", y_field="amount")
+    reset_rollups(test_db)
+    assert test_db.query(ReportRollupCell).count() == 0
+    assert test_db.query(ReportRollup).count() == 1
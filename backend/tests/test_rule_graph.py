@@ -0,0 +1,127 @@
+"""
+Tests for rule dependencies and scheduling
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from server.models.configurations import Base as ConfigBase, ComputedFieldRule
+from server.models.main import Statement, Transaction
+from server.routers.rules import RuleCreate, RuleExecuteRequest, RuleUpdate, create_rule, execute_rules, update_rule
+from server.services.rule_graph import RuleGraph, expression_fields
+
+
+def _rule(name, target, condition="", action="1", rule_type="formula", priority=10):
+    return ComputedFieldRule(
+        id=name, name=name, target_field=target, condition=condition, action=action,
+        rule_type=rule_type, priority=priority, active=True, updated_at=datetime(2024, 1, 1)
+    )
+
+
+def test_expression_fields():
+    assert expression_fields("amount_to_float(amount) * rate") == {"amount", "rate"}
+    assert expression_fields("description.contains(keyword) and not flag") == {"description", "keyword", "flag"}
+    assert expression_fields("'constant'") == set()
+    assert expression_fields("amount >") == set()
+    assert expression_fields(None) == set()
+
+
+def test_schedule_runs_readers_after_writers():
+    rules = [
+        _rule("total-fee", "total", action="amount_value + fee"),
+        _rule("label", "label", action="'x'", rule_type="value_assignment"),
+        _rule("amount-parse", "amount_value", action="amount_to_float(amount)"),
+        _rule("total-default", "total", condition="not amount_value", action="0"),
+        _rule("amount-default", "amount_value", action="0"),
+        _rule("fee", "fee", condition="amount_value > 100", action="amount_value * 0.01"),
+    ]
+    scheduled = [rule.id for rule in RuleGraph(rules).schedule()]
+    assert scheduled == ["label", "amount-parse", "amount-default", "fee", "total-fee", "total-default"]
+
+
+def test_independent_rules_keep_priority_order():
+    rules = [_rule(f"rule-{index}", f"field-{index % 3}", action="amount") for index in range(6)]
+    scheduled = RuleGraph(rules).schedule()
+    assert [rule.id for rule in scheduled] == ["rule-0", "rule-3", "rule-1", "rule-4", "rule-2", "rule-5"]
+
+
+def test_cycles():
+    # Reading its own target isn't a cycle
+    assert RuleGraph([_rule("parse", "amount", action="amount_to_float(amount)")]).find_cycle() is None
+
+    rules = [
+        _rule("a", "a", action="b + 1"),
+        _rule("b", "b", condition="c > 0", action="1"),
+        _rule("c", "c", action="a * 2"),
+        _rule("d", "d", action="a"),
+    ]
+    graph = RuleGraph(rules)
+    assert graph.find_cycle() == ["a", "b", "c", "a"]
+    # Rules in the cycle still all run, in priority order
+    assert [rule.id for rule in graph.schedule()] == ["a", "b", "c", "d"]
+
+
+def test_dependents():
+    rules = [
+        _rule("amount", "amount_value", action="amount_to_float(amount)"),
+        _rule("fee", "fee", action="amount_value * rate"),
+        _rule("total", "total", action="amount_value + fee"),
+        _rule("label", "label", condition="category == 'x'", action="'x'", rule_type="value_assignment"),
+    ]
+    graph = RuleGraph(rules)
+    assert graph.dependents(["rate"]) == {"fee", "total"}
+    assert graph.dependents(["amount"]) == {"amount_value", "fee", "total"}
+    assert graph.dependents(["description"]) == set()
+
+
+@pytest.fixture
+def rules_db(test_db, test_engine):
+    ConfigBase.metadata.create_all(bind=test_engine)
+    yield test_db
+    test_db.rollback()
+    ConfigBase.metadata.drop_all(bind=test_engine)
+
+
+def test_saving_a_cycle_is_rejected(rules_db):
+    def create(name, target, action, active=True):
+        rule = RuleCreate(name=name, target_field=target, action=action, rule_type="formula", active=active)
+        return asyncio.run(create_rule(rule, db=rules_db))
+
+    first = create("a", "a", "b + 1")
+    with pytest.raises(HTTPException) as error:
+        create("b", "b", "a * 2")
+    assert error.value.status_code == 400
+    assert error.value.detail.endswith("a -> b -> a")
+
+    # Inactive rules aren't executed, so they can't close a cycle until they're activated
+    inactive = create("b", "b", "a * 2", active=False)
+    with pytest.raises(HTTPException):
+        asyncio.run(update_rule(inactive.id, RuleUpdate(active=True), db=rules_db))
+    assert rules_db.get(ComputedFieldRule, inactive.id).active is False
+
+    asyncio.run(update_rule(first.id, RuleUpdate(action="amount + 1"), db=rules_db))
+    asyncio.run(update_rule(inactive.id, RuleUpdate(active=True), db=rules_db))
+
+
+def test_execute_uses_the_schedule(rules_db):
+    statement = Statement(
+        filename="graph.csv", file_path="/tmp/graph.csv", file_hash="graph-hash",
+        mime_type="text/csv", processed=True
+    )
+    rules_db.add(statement)
+    rules_db.flush()
+    rules_db.add(Transaction(
+        statement_id=statement.id, ingested_content={"amount": "$250.00"},
+        ingested_content_hash="graph-1", ingested_at=datetime.utcnow()
+    ))
+    # The fee rule comes first by priority but reads the amount the second rule computes
+    rules_db.add_all([
+        _rule("fee", "fee", action="amount_value * 0.1", priority=1),
+        _rule("amount", "amount_value", action="amount_to_float(amount)", priority=2),
+    ])
+    rules_db.commit()
+
+    result = asyncio.run(execute_rules(RuleExecuteRequest(dry_run=True), config_db=rules_db, main_db=rules_db))
+    assert list(result.dry_run_results.values()) == [{"amount_value": 250.0, "fee": 25.0}]
@@ -0,0 +1,122 @@
+"""
+Tests for the SQL field expressions and their Python semantics
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from server.models.main import Statement, Transaction
+from server.services import sql_functions
+from server.services.filters import FieldFilter
+from server.services.metadata import rebuild_transaction_metadata
+from server.services.sql_functions import (
+    FilterValue,
+    date_label,
+    parse_date,
+    period_sql,
+    period_start,
+    prepare_sql,
+    to_float,
+)
+
+
+VALUES = [
+    "12.50", "-.5", "5.", ".", "-", "-0.0", "1e3", " 7 ", "1_000", "inf", "NaN", "1-2", "$1,234.50",
+    "12345678901234.5", "1234567890123456", "0.1", "", "Tomorrow", "2024-01-05", "2024-01-05T10:00:00",
+    "2024-02-30", "2024-02-29", "0000-01-01", "01/25/2024", "2024-01-05 10:00", "ÉCOLE", "K", "١٢",
+    0, 7, -3, 2 ** 60, 1.5, 100.0, 1e-05, 1e16, True, False, None, {"a": 1}, [1, 2],
+]
+
+FILTERS = [
+    ("equals", "12.5"), ("equals", "école"), ("equals", "k"), ("equals", "true"), ("equals", "1"),
+    ("not_equals", "100"), ("not_equals", "nan"), ("contains", "2"), ("contains", "É"),
+    ("startswith", "20"), ("endswith", "0"), ("endswith", "a very long suffix"),
+    ("gt", "5"), ("lte", "0.1"), ("gte", "inf"), ("lt", "nan"), ("bogus", "x"),
+]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="values.csv", file_path="/tmp/values.csv", file_hash="values-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, value in enumerate(VALUES):
+        test_db.add(Transaction(
+            statement_id=statement.id, ingested_content={"value": value},
+            ingested_content_hash=f"value-{index}", ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+def _select(db, expression):
+    """Evaluate an expression built by FieldSQL for every value, in VALUES order"""
+    sql = prepare_sql(db)
+    rows = db.execute(
+        text(f"SELECT ingested_content_hash, {expression(sql)} FROM transactions"), sql.params
+    ).all()
+    by_hash = dict(rows)
+    return [by_hash[f"value-{index}"] for index in range(len(VALUES))]
+
+
+def test_expressions_match_python(transactions):
+    # SQLite has no NaN, it returns NULL
+    assert _select(transactions, lambda sql: sql.measure("value")) == [
+        None if value == "NaN" else to_float(value) for value in VALUES
+    ]
+    assert _select(transactions, lambda sql: sql.value_label("value")) == [str(value) for value in VALUES]
+    assert _select(transactions, lambda sql: sql.label("date", "value")) == [date_label(value) for value in VALUES]
+    assert _select(transactions, lambda sql: sql.parsed_date("value")) == [
+        parsed.date().isoformat() if (parsed := parse_date(value)) else None for value in VALUES
+    ]
+
+
+@pytest.mark.parametrize("operator,value", FILTERS)
+def test_filters_match_python(transactions, operator, value):
+    field_filter = FieldFilter("value", operator, value)
+    matches = FilterValue(operator, value).matches
+    assert _select(transactions, lambda sql: f"({field_filter.to_sql(sql)})") == [
+        1 if matches(field_value) else 0 for field_value in VALUES
+    ]
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+def test_periods_match_python(test_db, bucket):
+    days = ["2024-01-01", "2024-01-07", "2024-03-31", "2023-01-01", "0999-06-15"]
+    labels = [test_db.execute(text(f"SELECT {period_sql(':day', bucket)}"), {"day": day}).scalar() for day in days]
+    assert labels == [period_start(day, bucket) for day in days]
+
+
+@pytest.mark.parametrize("expression,values", [
+    (lambda sql: sql.value_label("value"), ["ÉCOLE", "Tomorrow", 7, True, None]),
+    (lambda sql: sql.label("date", "value"), ["2024-01-05T10:00:00", "2024-01-05", 0, 7, None]),
+    (lambda sql: FieldFilter("value", "equals", "12.5").to_sql(sql), [7, 1.5, True, None]),
+    (lambda sql: FieldFilter("value", "contains", "a").to_sql(sql), ["$1,234.50", "Tomorrow", 7, False]),
+])
+def test_common_values_stay_in_sql(transactions, monkeypatch, expression, values):
+    calls = []
+
+    def counted(name, function):
+        def wrapper(*args):
+            calls.append(name)
+            return function(*args)
+        return wrapper
+
+    for name, (arg_count, function) in list(sql_functions.SQLITE_FUNCTIONS.items()):
+        monkeypatch.setitem(sql_functions.SQLITE_FUNCTIONS, name, (arg_count, counted(name, function)))
+
+    sql = prepare_sql(transactions)
+    hashes = ", ".join(
+        f"'value-{index}'" for index, stored in enumerate(VALUES)
+        if any(type(stored) is type(value) and stored == value for value in values)
+    )
+    transactions.execute(
+        text(f"SELECT {expression(sql)} FROM transactions WHERE ingested_content_hash IN ({hashes})"), sql.params
+    ).all()
+    assert calls == []
@@ -233,3 +233,86 @@ def test_upload_multiple_too_many_files(client):
 
 if __name__ == "__main__":
     pytest.main([__file__])
+
+def test_process_statement_job(client):
+    """Test processing a statement in the background and polling its job."""
+    import time
+    
+    test_content = "Date,Description,Amount\n2023-03-01,Job Transaction 1,10.00\n2023-03-02,Job Transaction 2,20.00"
+    
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
+        f.write(test_content)
+        temp_file_path = f.name
+    
+    try:
+        with open(temp_file_path, 'rb') as f:
+            upload_response = client.post(
+                "/api/statements/upload",
+                files={"file": ("job_statement.csv", f, "text/csv")}
+            )
+        
+        assert upload_response.status_code == 201
+        statement_id = upload_response.json()["statement_id"]
+        
+        # Processing is queued and returns a job id right away
+        response = client.post(f"/api/statements/{statement_id}/process")
+        assert response.status_code == 202
+        data = response.json()
+        assert data["statement_id"] == statement_id
+        job_id = data["job_id"]
+        
+        # Poll until the job finishes
+        deadline = time.time() + 10
+        while True:
+            job_response = client.get(f"/api/statements/jobs/{job_id}")
+            assert job_response.status_code == 200
+            job = job_response.json()
+            if job["status"] in ("completed", "failed") or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        
+        assert job["status"] == "completed"
+        assert job["rows_parsed"] == 2
+        assert job["rows_inserted"] == 2
+        assert job["duplicates"] == 0
+        assert job["progress"] == 1.0
+        assert job["eta_seconds"] == 0.0
+        
+        list_response = client.get(f"/api/statements/jobs?statement_id={statement_id}")
+        assert list_response.status_code == 200
+        assert [j["job_id"] for j in list_response.json()["jobs"]] == [job_id]
+        
+        statement = client.get(f"/api/statements/{statement_id}").json()
+        assert statement["processed"] == True
+        
+    finally:
+        # Clean up
+        os.unlink(temp_file_path)
+
+def test_get_unknown_processing_job(client):
+    """Test getting a job that does not exist."""
+    response = client.get("/api/statements/jobs/non-existent-job")
+    assert response.status_code == 404
+
+def test_upload_duplicate_statement_is_not_stored(client):
+    """Test that a duplicate upload is rejected before it reaches storage."""
+    from server.routers.statements import file_storage
+    
+    test_content = b"Date,Description,Amount\n2023-04-01,Duplicate Check,42.00"
+    
+    first = client.post(
+        "/api/statements/upload",
+        files={"file": ("original.csv", test_content, "text/csv")}
+    )
+    assert first.status_code == 201
+    
+    duplicate = client.post(
+        "/api/statements/upload",
+        files={"file": ("duplicate_copy.csv", test_content, "text/csv")}
+    )
+    assert duplicate.status_code == 409
+    assert duplicate.json()["statement_id"] == first.json()["statement_id"]
+    
+    stored_names = {path.name for path in (file_storage.base_dir / "raw_data_dir").rglob("*")}
+    assert "duplicate_copy.csv" not in stored_names
+    assert list((file_storage.base_dir / "incoming").iterdir()) == []
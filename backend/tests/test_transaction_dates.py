@@ -0,0 +1,146 @@
+"""
+Tests for the stored, indexed transaction dates
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from server.models.main import Statement, Transaction, TransactionMetadata
+from server.services import aggregation
+from server.services.aggregation import aggregate_transactions
+from server.services.csv_processor import CSVProcessor
+from server.services.metadata import rebuild_transaction_metadata
+from server.services.result_cache import ResultCache
+from server.services.sql_functions import prepare_sql
+from server.services.transaction_dates import (
+    ensure_transaction_dates,
+    transaction_date,
+    undated_transaction_count,
+)
+
+
+ROWS = [
+    ({"date": "2024-01-05", "category": "Food", "amount": 10}, None),
+    ({"date": "01/20/2024", "category": "Food", "amount": 4}, None),
+    ({"date": "2024-02-03T10:30:00", "category": "Travel", "amount": 250}, None),
+    ({"date": "not a date", "category": "Rent", "amount": 1000}, None),
+    ({"category": "Rent", "amount": 5}, {"date": "2024-01-25"}),
+    ({"date": "2024-03-01", "category": "Food", "amount": 7}, {"date": None}),
+]
+
+
+@pytest.fixture
+def transactions(test_db):
+    statement = Statement(
+        filename="dates.csv", file_path="/tmp/dates.csv", file_hash="dates-hash",
+        mime_type="text/csv", processed=True
+    )
+    test_db.add(statement)
+    test_db.flush()
+    for index, (ingested, computed) in enumerate(ROWS):
+        test_db.add(Transaction(
+            statement_id=statement.id,
+            ingested_content=ingested,
+            computed_content=computed,
+            ingested_content_hash=f"hash-{index}",
+            ingested_at=datetime.utcnow()
+        ))
+    test_db.flush()
+    rebuild_transaction_metadata(test_db)
+    test_db.commit()
+    return test_db
+
+
+@pytest.fixture(autouse=True)
+def no_shortcuts(monkeypatch):
+    monkeypatch.setattr(aggregation, "report_cache", ResultCache(max_bytes=0))
+    monkeypatch.setattr(aggregation, "ensure_rollup", lambda *args: None)
+
+
+def test_transaction_date():
+    assert transaction_date({"date": "2024-01-02"}, None) == ("2024-01-02", 19724)
+    # Computed content wins, even when it clears the date
+    assert transaction_date({"date": "2024-01-02"}, {"date": "2024-01-03"})[0] == "2024-01-03"
+    assert transaction_date({"date": "2024-01-02"}, {"date": None}) == (None, None)
+    assert transaction_date({"date": "garbage"}, None) == (None, None)
+
+
+def test_backfill_on_first_report(transactions):
+    meta = transactions.query(TransactionMetadata).first()
+    assert meta.date_field is None
+
+    aggregate_transactions(transactions, x_field="category", y_field="amount")
+
+    transactions.refresh(meta)
+    assert meta.date_field == "date"
+    stored = {
+        t.ingested_content_hash: t.txn_date
+        for t in transactions.query(Transaction)
+    }
+    assert stored == {
+        "hash-0": "2024-01-05", "hash-1": "2024-01-20", "hash-2": "2024-02-03",
+        "hash-3": None, "hash-4": "2024-01-25", "hash-5": None,
+    }
+    assert undated_transaction_count(transactions) == 2
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"x_field": "category", "y_field": "amount", "date_from": "2024-01-10", "date_to": "2024-01-31"},
+    {"x_field": "category", "y_field": "amount", "date_from": "2024-02-01"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "month", "date_to": "2024-02-28"},
+    {"x_field": "date", "y_field": "amount", "date_bucket": "week"},
+])
+def test_stored_dates_match_python(transactions, monkeypatch, kwargs):
+    ensure_transaction_dates(transactions)
+    from_sql = aggregate_transactions(transactions, **kwargs)
+
+    def unsupported(*args, **kw):
+        raise aggregation.UnsupportedQuery("forced")
+
+    monkeypatch.setattr(aggregation, "_aggregate_sql", unsupported)
+    assert aggregate_transactions(transactions, **kwargs) == from_sql
+
+
+def test_undated_records_reported(transactions):
+    result = aggregate_transactions(transactions, x_field="category", y_field="amount", date_from="2024-01-01")
+    assert result["undated_records"] == 2
+    assert result["filtered_records"] == 4
+
+    # Not reported without a date range or for another date field
+    assert "undated_records" not in aggregate_transactions(transactions, x_field="category", y_field="amount")
+    assert "undated_records" not in aggregate_transactions(
+        transactions, x_field="category", y_field="amount", date_from="2024-01-01", date_field="other"
+    )
+
+
+def test_date_range_uses_index(transactions):
+    ensure_transaction_dates(transactions)
+    sql = prepare_sql(transactions)
+    condition = sql.day_range("date", datetime(2024, 1, 1).date(), datetime(2024, 1, 31).date())
+    plan = " ".join(
+        str(row[-1]) for row in transactions.execute(
+            text(f"EXPLAIN QUERY PLAN SELECT id FROM transactions WHERE {condition}"), sql.params
+        )
+    )
+    assert "ix_transactions_txn_day" in plan
+
+
+def test_ingestion_stores_dates(test_db, tmp_path):
+    csv_file = tmp_path / "statement.csv"
+    csv_file.write_text("Date,Description,Amount\n2024-01-05,Shop,1.00\nsoon,Cafe,2.00\n")
+    statement = Statement(
+        filename="statement.csv", file_path=str(csv_file), file_hash="hash-ingest",
+        mime_type="text/csv", processed=False
+    )
+    test_db.add(statement)
+    test_db.commit()
+
+    result = CSVProcessor().process_statement(statement, test_db)
+
+    assert result["transactions_undated"] == 1
+    days = sorted(
+        (day for (day,) in test_db.query(Transaction.txn_day)),
+        key=lambda day: (day is None, day)
+    )
+    assert days == [19727, None]
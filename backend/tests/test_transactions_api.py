@@ -43,7 +43,7 @@ def test_list_transactions_with_statement_filter(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement to create transactions
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         
         # List transactions for this statement
@@ -77,7 +77,7 @@ def test_get_transaction(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement to create transactions
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         
         # Get transactions for this statement
@@ -127,7 +127,7 @@ def test_delete_transaction(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement to create transactions
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         
         # Get transactions for this statement
@@ -179,7 +179,7 @@ def test_get_transactions_by_statement(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement to create transactions
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         
         # Get transactions by statement
@@ -223,7 +223,7 @@ def test_search_transactions_by_content(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement to create transactions
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         
         # Search transactions by content
@@ -267,7 +267,7 @@ def test_process_statement_endpoint(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement
-        response = client.post(f"/api/statements/{statement_id}/process")
+        response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert response.status_code == 200
         data = response.json()
         assert "message" in data
@@ -312,7 +312,7 @@ def test_get_statement_transactions_endpoint(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         
         # Get statement transactions
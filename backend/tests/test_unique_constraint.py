@@ -24,7 +24,7 @@ def test_unique_constraint_prevents_duplicates(client):
         statement_id = upload_response.json()["statement_id"]
         
         # Process statement - should only create 1 transaction despite 2 identical rows
-        process_response = client.post(f"/api/statements/{statement_id}/process")
+        process_response = client.post(f"/api/statements/{statement_id}/process?wait=true")
         assert process_response.status_code == 200
         data = process_response.json()
         
@@ -74,11 +74,11 @@ def test_unique_constraint_allows_same_transaction_different_statements(client):
         statement_id2 = upload_response2.json()["statement_id"]
         
         # Process both statements
-        process_response1 = client.post(f"/api/statements/{statement_id1}/process")
+        process_response1 = client.post(f"/api/statements/{statement_id1}/process?wait=true")
         assert process_response1.status_code == 200
         assert process_response1.json()["transactions_created"] == 2
         
-        process_response2 = client.post(f"/api/statements/{statement_id2}/process")
+        process_response2 = client.post(f"/api/statements/{statement_id2}/process?wait=true")
         assert process_response2.status_code == 200
         assert process_response2.json()["transactions_created"] == 2
         
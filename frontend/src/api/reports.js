@@ -26,6 +26,11 @@ export const reportsApi = {
     return axios.delete(`/reports/${id}/`)
   },
 
+  // Get the data of every widget of a report in one request
+  getReportData(id, params) {
+    return axios.get(`/reports/${id}/data`, { params })
+  },
+
   // Get aggregated data for charts
   getAggregatedData(params) {
     return axios.get('/reports/data/aggregated/', { params })
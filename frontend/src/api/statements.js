@@ -66,11 +66,41 @@ export const statementsApi = {
 
   /**
    * Process a statement file
+   * Queues a background job and waits for it to finish
    * @param {string} statementId - The statement ID to process
+   * @param {Function} onProgress - Optional callback receiving job status updates
    * @returns {Promise} Response data
    */
-  async processStatement(statementId) {
+  async processStatement(statementId, onProgress = null) {
     const response = await api.post(`/statements/${statementId}/process`)
+    let job = await this.getProcessingJob(response.data.job_id)
+    
+    while (job.status === 'queued' || job.status === 'running') {
+      if (onProgress) onProgress(job)
+      await new Promise(resolve => setTimeout(resolve, 500))
+      job = await this.getProcessingJob(job.job_id)
+    }
+    
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Statement processing failed')
+    }
+    
+    return {
+      message: job.message,
+      statement_id: job.statement_id,
+      transactions_processed: job.rows_parsed,
+      transactions_created: job.rows_inserted,
+      processed: true
+    }
+  },
+
+  /**
+   * Get the status of a statement processing job
+   * @param {string} jobId - The job ID
+   * @returns {Promise} Response data
+   */
+  async getProcessingJob(jobId) {
+    const response = await api.get(`/statements/jobs/${jobId}`)
     return response.data
   },
 
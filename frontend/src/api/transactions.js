@@ -119,5 +119,14 @@ export const transactionsApi = {
   async getTransactionMetadata() {
     const response = await api.get('/transactions/metadata')
     return response.data
+  },
+
+  /**
+   * Rebuild transaction metadata (column counts and currency fields)
+   * @returns {Promise} Response data with the refreshed metadata
+   */
+  async refreshTransactionMetadata() {
+    const response = await api.post('/transactions/metadata/refresh')
+    return response.data
   }
 }